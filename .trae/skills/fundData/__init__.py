@@ -18,10 +18,17 @@ from smart_fund_data import (
 
 from risk_metrics_calculator import (
     calculate_fund_risk_metrics,
+    calculate_fund_risk_metrics_batch,
+    calculate_universe_risk_metrics,
     calculate_portfolio_risk_metrics,
     compare_with_xueqiu,
 )
 
+from risk_stream import (
+    update_risk_metrics_incremental,
+    check_risk_stream_consistency,
+)
+
 from portfolio_manager import (
     create_portfolio,
     list_portfolios,
@@ -43,8 +50,12 @@ __all__ = [
     'get_value_averaging_report_text',
     # 风险指标计算
     'calculate_fund_risk_metrics',
+    'calculate_fund_risk_metrics_batch',
+    'calculate_universe_risk_metrics',
     'calculate_portfolio_risk_metrics',
     'compare_with_xueqiu',
+    'update_risk_metrics_incremental',
+    'check_risk_stream_consistency',
     # 组合管理
     'create_portfolio',
     'list_portfolios',
@@ -0,0 +1,273 @@
+"""
+复权净值模块
+由单位净值、分红（fund_dividend）和拆分折算（fund_split）计算复权净值，
+维护在 fund_adjusted_nav 表中，供风险指标、回撤和止盈收益率使用全收益口径
+
+复权口径（分红再投资）：
+    - 除息日 t 每份分红 d：份额按除息日净值再投资，复权因子 × (nav_t + d) / nav_t
+    - 拆分折算日 t 折算比例 k（1份变k份）：复权因子 × k
+    - 复权净值 = 单位净值 × 累计复权因子；事件日不是净值日时在其后首个净值日生效，
+      早于首个净值日的事件忽略
+
+增量维护：
+    fund_adjusted_nav_state 记录每只基金已处理到的最后净值日期、该日复权因子、
+    已处理净值条数和已生效事件的签名。更新时若历史净值条数和已生效事件均未变化，
+    只对新增净值从上次的复权因子继续计算；否则（历史净值修订、补录历史分红）整只重建
+"""
+import sys
+import os
+import hashlib
+import sqlite3
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import fetch_by_codes
+
+
+def compute_adjustment_factors(dates: List[str],
+                               navs: np.ndarray,
+                               dividends: List[Tuple[str, float]] = None,
+                               splits: List[Tuple[str, float]] = None,
+                               base_factor: float = 1.0,
+                               prior_date: Optional[str] = None) -> np.ndarray:
+    """
+    计算累计复权因子（向量化）
+
+    Args:
+        dates: 净值日期（升序）
+        navs: 单位净值数组
+        dividends: [(除息日, 每份分红)]
+        splits: [(折算日, 折算比例)]
+        base_factor: 首个净值之前的累计复权因子（增量计算时为上次的因子）
+        prior_date: dates之前最后一个已处理的净值日期（增量计算时），
+                    晚于它的事件在首个净值日生效，不晚于它的事件已计入base_factor
+
+    Returns:
+        与navs等长的累计复权因子数组
+    """
+    dates = np.asarray(dates, dtype=str)
+    navs = np.asarray(navs, dtype=np.float64)
+    multipliers = np.ones(navs.size)
+    if navs.size == 0:
+        return multipliers
+
+    def positions(events):
+        event_dates = np.array([e[0] for e in events], dtype=str)
+        values = np.array([e[1] for e in events], dtype=np.float64)
+        pos = np.searchsorted(dates, event_dates, side='left')
+        if prior_date is None:
+            keep = pos >= 1
+        else:
+            keep = event_dates > prior_date
+        keep &= (pos < dates.size) & (values > 0)
+        return pos[keep], values[keep]
+
+    if dividends:
+        pos, amount = positions(dividends)
+        np.multiply.at(multipliers, pos, (navs[pos] + amount) / navs[pos])
+    if splits:
+        pos, ratio = positions(splits)
+        np.multiply.at(multipliers, pos, ratio)
+
+    return base_factor * np.cumprod(multipliers)
+
+
+def _event_signature(dividends: List[Tuple[str, float]], splits: List[Tuple[str, float]], until: str) -> str:
+    """已生效（不晚于until）事件的签名，用于判断历史事件是否被补录或修订"""
+    items = sorted([f"D{d}:{v:.6f}" for d, v in dividends if d <= until] +
+                   [f"S{d}:{v:.6f}" for d, v in splits if d <= until])
+    return hashlib.md5('|'.join(items).encode('utf-8')).hexdigest()
+
+
+def _load_events(cursor, fund_codes: Optional[List[str]]):
+    """批量读取分红和拆分事件：({基金: [(日期, 分红)]}, {基金: [(日期, 比例)]})"""
+    dividends, splits = {}, {}
+    for code, date, amount in fetch_by_codes(cursor, '''
+        SELECT fund_code, COALESCE(ex_dividend_date, record_date), dividend_per_share
+        FROM fund_dividend
+        WHERE {codes} AND dividend_per_share > 0
+    ''', fund_codes):
+        if date:
+            dividends.setdefault(code, []).append((date, float(amount)))
+    for code, date, ratio in fetch_by_codes(cursor, '''
+        SELECT fund_code, split_date, split_ratio FROM fund_split
+        WHERE {codes} AND split_ratio > 0
+    ''', fund_codes):
+        if date:
+            splits.setdefault(code, []).append((date, float(ratio)))
+    return dividends, splits
+
+
+def update_adjusted_nav(fund_codes: List[str] = None, force: bool = False) -> Dict[str, Any]:
+    """
+    增量更新复权净值
+
+    Args:
+        fund_codes: 基金代码列表，None表示 fund_nav 中的全部基金
+        force: 是否全部重建
+
+    Returns:
+        {'success': True, 'appended': 增量追加的净值条数, 'rebuilt': [重建的基金],
+         'unchanged': 无新数据的基金数}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+
+        if fund_codes is None:
+            cursor.execute("SELECT DISTINCT fund_code FROM fund_nav ORDER BY fund_code")
+            codes = [row[0] for row in cursor.fetchall()]
+        else:
+            codes = list(dict.fromkeys(fund_codes))
+
+        states = {} if force else {
+            row[0]: row[1:] for row in fetch_by_codes(cursor, '''
+                SELECT fund_code, last_nav_date, last_factor, nav_count, event_signature
+                FROM fund_adjusted_nav_state WHERE {codes}
+            ''', fund_codes)
+        }
+        dividends, splits = _load_events(cursor, fund_codes)
+
+        # 已处理区间内的净值条数（检测历史净值修订）和新增净值，均一次查询
+        counts = dict(fetch_by_codes(cursor, '''
+            SELECT n.fund_code, COUNT(*) FROM fund_nav n
+            JOIN fund_adjusted_nav_state s ON s.fund_code = n.fund_code
+            WHERE {codes} AND n.nav_date <= s.last_nav_date AND n.unit_nav > 0
+            GROUP BY n.fund_code
+        ''', fund_codes, 'n.fund_code')) if states else {}
+        new_rows = {}
+        if states:
+            for code, date, nav in fetch_by_codes(cursor, '''
+                SELECT n.fund_code, n.nav_date, n.unit_nav FROM fund_nav n
+                JOIN fund_adjusted_nav_state s ON s.fund_code = n.fund_code
+                WHERE {codes} AND n.nav_date > s.last_nav_date AND n.unit_nav > 0
+                ORDER BY n.fund_code, n.nav_date
+            ''', fund_codes, 'n.fund_code'):
+                new_rows.setdefault(code, []).append((date, nav))
+
+        appended = 0
+        rebuilt = []
+        unchanged = 0
+        for code in codes:
+            divs, spls = dividends.get(code, []), splits.get(code, [])
+            state = states.get(code)
+            incremental = (state is not None
+                           and counts.get(code, 0) == state[2]
+                           and _event_signature(divs, spls, state[0]) == state[3])
+
+            if incremental:
+                rows = new_rows.get(code, [])
+                if not rows:
+                    unchanged += 1
+                    continue
+                base_factor, prior_date, nav_count = state[1], state[0], state[2]
+            else:
+                cursor.execute('''
+                    SELECT nav_date, unit_nav FROM fund_nav
+                    WHERE fund_code = ? AND unit_nav > 0
+                    ORDER BY nav_date
+                ''', (code,))
+                rows = cursor.fetchall()
+                cursor.execute("DELETE FROM fund_adjusted_nav WHERE fund_code = ?", (code,))
+                if not rows:
+                    cursor.execute("DELETE FROM fund_adjusted_nav_state WHERE fund_code = ?", (code,))
+                    continue
+                base_factor, prior_date, nav_count = 1.0, None, 0
+                rebuilt.append(code)
+
+            dates, navs = zip(*rows)
+            navs = np.array(navs, dtype=np.float64)
+            factors = compute_adjustment_factors(dates, navs, divs, spls, base_factor, prior_date)
+
+            cursor.executemany('''
+                INSERT OR REPLACE INTO fund_adjusted_nav
+                (fund_code, nav_date, unit_nav, adj_factor, adjusted_nav, update_time)
+                VALUES (?, ?, ?, ?, ?, datetime('now'))
+            ''', zip([code] * len(dates), dates, navs.tolist(), factors.tolist(), (navs * factors).tolist()))
+            cursor.execute('''
+                INSERT OR REPLACE INTO fund_adjusted_nav_state
+                (fund_code, last_nav_date, last_factor, nav_count, event_signature, update_time)
+                VALUES (?, ?, ?, ?, ?, datetime('now'))
+            ''', (code, dates[-1], float(factors[-1]), nav_count + len(dates),
+                  _event_signature(divs, spls, dates[-1])))
+            if incremental:
+                appended += len(dates)
+
+        conn.commit()
+
+    return {
+        'success': True,
+        'fund_count': len(codes),
+        'appended': appended,
+        'rebuilt': rebuilt,
+        'unchanged': unchanged
+    }
+
+
+def load_adjusted_nav_arrays(cursor, fund_code: str, limit: int = None) -> Tuple[List[str], np.ndarray]:
+    """
+    按列读取复权净值，格式同 risk_metrics_calculator.load_nav_arrays
+
+    Returns:
+        (日期列表, 复权净值数组)，按时间升序
+    """
+    cursor.row_factory = None
+    try:
+        if limit:
+            cursor.execute('''
+                SELECT nav_date, adjusted_nav FROM (
+                    SELECT nav_date, adjusted_nav FROM fund_adjusted_nav
+                    WHERE fund_code = ?
+                    ORDER BY nav_date DESC
+                    LIMIT ?
+                ) ORDER BY nav_date ASC
+            ''', (fund_code, limit))
+        else:
+            cursor.execute('''
+                SELECT nav_date, adjusted_nav FROM fund_adjusted_nav
+                WHERE fund_code = ?
+                ORDER BY nav_date ASC
+            ''', (fund_code,))
+        rows = cursor.fetchall()
+    finally:
+        cursor.row_factory = sqlite3.Row
+
+    if not rows:
+        return [], np.empty(0, dtype=np.float64)
+
+    dates, navs = zip(*rows)
+    return list(dates), np.array(navs, dtype=np.float64)
+
+
+def get_adjustment_ratio(fund_code: str, since_date: str, conn=None) -> float:
+    """
+    since_date 之后（不含当日）分红再投资和拆分带来的份额倍数
+
+    即 最新复权因子 / since_date 当日（或之前最近净值日）的复权因子；
+    持有期收益率 = 当前净值 × 倍数 / 买入净值 - 1。无复权数据时返回1.0
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return get_adjustment_ratio(fund_code, since_date, new_conn)
+
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT last_factor FROM fund_adjusted_nav_state WHERE fund_code = ?
+    ''', (fund_code,))
+    latest = cursor.fetchone()
+    if not latest or not since_date:
+        return 1.0
+
+    cursor.execute('''
+        SELECT adj_factor FROM fund_adjusted_nav
+        WHERE fund_code = ? AND nav_date <= ?
+        ORDER BY nav_date DESC LIMIT 1
+    ''', (fund_code, since_date))
+    base = cursor.fetchone()
+    if not base or not base[0]:
+        return 1.0
+    return float(latest[0]) / float(base[0])
@@ -0,0 +1,371 @@
+"""
+基准回归指标模块
+基于本地 index_price 行情，对基金日收益率相对基准指数日收益率做OLS回归，
+批量计算 alpha、beta、R²、相关系数、跟踪误差和信息比率，并存入 fund_benchmark_regression
+
+实现：
+    1. 每只基金的基准指数由 fund_info.benchmark（业绩比较基准）中首个出现的指数名称确定，
+       可通过参数统一指定；使用同一基准的基金作为一组
+    2. 每组取基准最近window个交易日，把各基金净值对齐到该日期轴得到收益率矩阵 F（日期 × 基金），
+       基准收益率 b 为列向量；两者都有效的日期参与回归
+    3. 所有基金的回归量由掩码矩阵上的列求和一次得到（Σf、Σf²、Σf·b、Σb、Σb²），
+       不逐基金循环：
+         beta  = cov(f, b) / var(b)
+         alpha = [(mean_f - rf_d) - beta·(mean_b - rf_d)] × 252
+         TE    = std(f - b) × sqrt(252)，  IR = (mean_f - mean_b) × 252 / TE
+    4. 保存的结果带数据版本（基金净值版本 + 基准指数行情版本），查询时版本不一致视为过期并重算
+"""
+import sys
+import os
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import load_nav_panel, load_nav_versions, SQL_IN_BATCH_SIZE
+
+
+# 业绩比较基准关键字 -> 指数代码（按关键字在基准描述中首次出现的位置选取）
+BENCHMARK_KEYWORDS = {
+    '沪深300': '000300',
+    '中证500': '000905',
+    '中证1000': '000852',
+    '创业板': '399006',
+    '上证综合': '000001',
+    '上证指数': '000001',
+}
+
+# 无法识别业绩比较基准时使用的指数
+DEFAULT_BENCHMARK_INDEX = '000300'
+
+# 共同有效收益率少于该天数时不计算回归指标
+MIN_REGRESSION_OBSERVATIONS = 20
+
+REGRESSION_FIELDS = ['alpha', 'beta', 'r_squared', 'correlation', 'tracking_error', 'information_ratio']
+
+SAVE_REGRESSION_SQL = '''
+    INSERT OR REPLACE INTO fund_benchmark_regression
+    (fund_code, index_code, window_days, alpha, beta, r_squared, correlation,
+     tracking_error, information_ratio, observations, start_date, end_date, data_version, update_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+'''
+
+
+def resolve_benchmark_index(benchmark: Optional[str]) -> str:
+    """
+    根据业绩比较基准描述确定基准指数代码
+
+    如"沪深300指数收益率×80%+中债综合指数收益率×20%"返回'000300'；
+    描述为空或无法识别时返回 DEFAULT_BENCHMARK_INDEX
+    """
+    if not benchmark:
+        return DEFAULT_BENCHMARK_INDEX
+    found = [(benchmark.find(k), code) for k, code in BENCHMARK_KEYWORDS.items() if k in benchmark]
+    return min(found)[1] if found else DEFAULT_BENCHMARK_INDEX
+
+
+def load_index_prices(index_code: str,
+                      start_date: str = None,
+                      end_date: str = None,
+                      conn=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    从 index_price 读取指数/ETF收盘价
+
+    Returns:
+        (日期数组, 收盘价数组)，按日期升序
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return load_index_prices(index_code, start_date, end_date, new_conn)
+
+    conditions = ['index_code = ?', 'close_price IS NOT NULL', 'close_price > 0']
+    params = [index_code]
+    if start_date:
+        conditions.append('trade_date >= ?')
+        params.append(start_date)
+    if end_date:
+        conditions.append('trade_date <= ?')
+        params.append(end_date)
+
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT trade_date, close_price FROM index_price
+        WHERE {' AND '.join(conditions)}
+        ORDER BY trade_date
+    ''', params)
+    rows = cursor.fetchall()
+    if not rows:
+        return np.empty(0, dtype=str), np.empty(0)
+    dates, closes = zip(*rows)
+    return np.array(dates, dtype=str), np.array(closes, dtype=np.float64)
+
+
+def load_index_versions(index_codes: List[str], conn) -> Dict[str, str]:
+    """
+    获取指数行情数据版本（最新交易日 + 行情条数），与 load_nav_versions 口径一致
+
+    Returns:
+        {指数代码: 版本字符串}，无行情的指数不在结果中
+    """
+    cursor = conn.cursor()
+    versions = {}
+    for i in range(0, len(index_codes), SQL_IN_BATCH_SIZE):
+        batch = index_codes[i:i + SQL_IN_BATCH_SIZE]
+        placeholders = ','.join(['?' for _ in batch])
+        cursor.execute(f'''
+            SELECT index_code, MAX(trade_date), COUNT(*) FROM index_price
+            WHERE index_code IN ({placeholders})
+            GROUP BY index_code
+        ''', list(batch))
+        for code, latest, count in cursor.fetchall():
+            versions[code] = f"{latest}:{count}"
+    return versions
+
+
+def _data_version(nav_version: Optional[str], index_version: Optional[str]) -> str:
+    """回归结果的数据版本：基金净值版本|基准指数行情版本"""
+    return f"{nav_version}|{index_version}"
+
+
+def regress_on_benchmark(fund_returns: np.ndarray,
+                         bench_returns: np.ndarray,
+                         risk_free_rate: float = 0.025,
+                         periods_per_year: int = 252,
+                         min_observations: int = MIN_REGRESSION_OBSERVATIONS) -> Dict[str, np.ndarray]:
+    """
+    批量OLS回归：每列基金收益率对同一基准收益率
+
+    Args:
+        fund_returns: 基金日收益率矩阵 (日期 × 基金)，缺失为NaN
+        bench_returns: 基准日收益率 (日期,)，缺失为NaN
+        risk_free_rate: 无风险利率（年化）
+        periods_per_year: 每年交易日数
+        min_observations: 最少共同有效天数
+
+    Returns:
+        各指标数组 (基金,)：alpha / tracking_error 为年化小数，
+        observations 为共同有效天数，样本不足处为NaN
+    """
+    mask = ~np.isnan(fund_returns) & ~np.isnan(bench_returns)[:, None]
+    m = mask.astype(np.float64)
+    f = np.where(mask, fund_returns, 0.0)
+    b = np.where(mask, np.nan_to_num(bench_returns)[:, None], 0.0)
+
+    n = m.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_f = f.sum(axis=0) / n
+        mean_b = b.sum(axis=0) / n
+        df, db = np.where(mask, f - mean_f, 0.0), np.where(mask, b - mean_b, 0.0)
+        var_f = (df * df).sum(axis=0) / (n - 1)
+        var_b = (db * db).sum(axis=0) / (n - 1)
+        cov = (df * db).sum(axis=0) / (n - 1)
+
+        beta = cov / var_b
+        rf_daily = risk_free_rate / periods_per_year
+        alpha = ((mean_f - rf_daily) - beta * (mean_b - rf_daily)) * periods_per_year
+        correlation = np.clip(cov / np.sqrt(var_f * var_b), -1.0, 1.0)
+        tracking_error = np.sqrt(np.maximum(var_f + var_b - 2 * cov, 0.0)) * np.sqrt(periods_per_year)
+        information_ratio = (mean_f - mean_b) * periods_per_year / tracking_error
+
+    information_ratio[tracking_error == 0] = np.nan
+    result = {
+        'alpha': alpha,
+        'beta': beta,
+        'r_squared': correlation ** 2,
+        'correlation': correlation,
+        'tracking_error': tracking_error,
+        'information_ratio': information_ratio,
+    }
+    enough = n >= min_observations
+    for name in REGRESSION_FIELDS:
+        result[name] = np.where(enough, result[name], np.nan)
+    result['observations'] = n.astype(np.int64)
+    return result
+
+
+def _align_returns(panel, axis: np.ndarray) -> np.ndarray:
+    """把净值面板对齐到基准日期轴并计算日收益率（相邻两日净值都存在时有效）"""
+    navs = np.full((axis.size, len(panel.fund_codes)), np.nan)
+    own = np.asarray(panel.dates, dtype=str)
+    if own.size and axis.size:
+        pos = np.clip(np.searchsorted(axis, own), 0, axis.size - 1)
+        on_axis = axis[pos] == own
+        navs[pos[on_axis]] = panel.values[on_axis]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return navs[1:] / navs[:-1] - 1
+
+
+def _load_fund_benchmarks(fund_codes: List[str], conn) -> Dict[str, str]:
+    """读取基金业绩比较基准描述"""
+    cursor = conn.cursor()
+    benchmarks = {}
+    for i in range(0, len(fund_codes), SQL_IN_BATCH_SIZE):
+        batch = fund_codes[i:i + SQL_IN_BATCH_SIZE]
+        placeholders = ','.join(['?' for _ in batch])
+        cursor.execute(f"SELECT fund_code, benchmark FROM fund_info WHERE fund_code IN ({placeholders})", batch)
+        benchmarks.update({row[0]: row[1] for row in cursor.fetchall()})
+    return benchmarks
+
+
+def _round_or_none(value, digits=4):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def compute_benchmark_regression(fund_codes: List[str] = None,
+                                 index_code: str = None,
+                                 window: int = 252,
+                                 risk_free_rate: float = 0.025,
+                                 save: bool = True) -> Dict[str, Any]:
+    """
+    批量计算基金相对基准指数的回归指标
+
+    Args:
+        fund_codes: 基金代码列表，None表示 fund_nav 中的全部基金
+        index_code: 统一指定的基准指数代码，None则按各基金业绩比较基准识别
+        window: 窗口（基准最近N个交易日的收益率）
+        risk_free_rate: 无风险利率
+        save: 是否写入 fund_benchmark_regression
+
+    Returns:
+        {'success': True, 'results': [{fund_code, index_code, alpha, beta, ...}],
+         'missing_index': [本地无行情的指数代码], 'saved': 保存条数}
+        alpha、tracking_error 为年化百分比
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if fund_codes is None:
+            cursor.execute("SELECT DISTINCT fund_code FROM fund_nav ORDER BY fund_code")
+            fund_codes = [row[0] for row in cursor.fetchall()]
+        fund_codes = list(dict.fromkeys(fund_codes))
+        if not fund_codes:
+            return {'success': False, 'error': '没有需要计算的基金'}
+
+        if index_code:
+            groups = {index_code: fund_codes}
+        else:
+            benchmarks = _load_fund_benchmarks(fund_codes, conn)
+            groups = {}
+            for code in fund_codes:
+                groups.setdefault(resolve_benchmark_index(benchmarks.get(code)), []).append(code)
+
+        results = []
+        missing_index = []
+        rows = []
+        index_versions = load_index_versions(list(groups.keys()), conn)
+        for bench_code, codes in groups.items():
+            bench_dates, closes = load_index_prices(bench_code, conn=conn)
+            if bench_dates.size < 2:
+                missing_index.append(bench_code)
+                continue
+            axis = bench_dates[-(window + 1):]
+            closes = closes[-(window + 1):]
+
+            panel = load_nav_panel(codes, start_date=str(axis[0]), end_date=str(axis[-1]), conn=conn)
+            metrics = regress_on_benchmark(_align_returns(panel, axis), closes[1:] / closes[:-1] - 1,
+                                           risk_free_rate)
+            nav_versions = load_nav_versions(list(panel.fund_codes), conn)
+
+            for j, code in enumerate(panel.fund_codes):
+                item = {
+                    'fund_code': code,
+                    'index_code': bench_code,
+                    'window': window,
+                    'alpha': _round_or_none(metrics['alpha'][j] * 100),
+                    'beta': _round_or_none(metrics['beta'][j]),
+                    'r_squared': _round_or_none(metrics['r_squared'][j]),
+                    'correlation': _round_or_none(metrics['correlation'][j]),
+                    'tracking_error': _round_or_none(metrics['tracking_error'][j] * 100),
+                    'information_ratio': _round_or_none(metrics['information_ratio'][j]),
+                    'observations': int(metrics['observations'][j]),
+                    'start_date': str(axis[1]),
+                    'end_date': str(axis[-1]),
+                }
+                results.append(item)
+                if item['beta'] is not None:
+                    rows.append((code, bench_code, window, item['alpha'], item['beta'], item['r_squared'],
+                                 item['correlation'], item['tracking_error'], item['information_ratio'],
+                                 item['observations'], item['start_date'], item['end_date'],
+                                 _data_version(nav_versions.get(code), index_versions.get(bench_code))))
+
+        if save and rows:
+            cursor.executemany(SAVE_REGRESSION_SQL, rows)
+            conn.commit()
+
+    return {
+        'success': True,
+        'results': results,
+        'missing_index': missing_index,
+        'saved': len(rows) if save else 0
+    }
+
+
+def get_benchmark_regression(fund_codes: List[str],
+                             index_code: str = None,
+                             window: int = 252,
+                             refresh: bool = False) -> Dict[str, Any]:
+    """
+    查询已保存的基准回归指标，未保存或已过期的基金即时计算并保存
+
+    保存后基金净值或基准指数行情有更新（数据版本变化）的结果视为过期
+
+    Args:
+        fund_codes: 基金代码列表
+        index_code: 基准指数代码，None表示各基金最近一次计算所用的基准
+        window: 窗口（交易日）
+        refresh: 是否忽略已保存结果全部重算
+
+    Returns:
+        {'success': True, 'results': {基金代码: {...}}, 'computed': [本次计算的基金]}
+    """
+    fund_codes = list(dict.fromkeys(fund_codes))
+    stored = {}
+    versions = {}
+    if not refresh:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            for i in range(0, len(fund_codes), SQL_IN_BATCH_SIZE):
+                batch = fund_codes[i:i + SQL_IN_BATCH_SIZE]
+                placeholders = ','.join(['?' for _ in batch])
+                sql = f'''
+                    SELECT * FROM fund_benchmark_regression
+                    WHERE window_days = ? AND fund_code IN ({placeholders})
+                '''
+                params = [window] + batch
+                if index_code:
+                    sql += ' AND index_code = ?'
+                    params.append(index_code)
+                cursor.execute(sql + ' ORDER BY update_time', params)
+                for row in cursor.fetchall():
+                    stored[row['fund_code']] = {
+                        'fund_code': row['fund_code'],
+                        'index_code': row['index_code'],
+                        'window': row['window_days'],
+                        **{name: row[name] for name in REGRESSION_FIELDS},
+                        'observations': row['observations'],
+                        'start_date': row['start_date'],
+                        'end_date': row['end_date'],
+                        'update_time': row['update_time'],
+                    }
+                    versions[row['fund_code']] = row['data_version']
+
+            nav_versions = load_nav_versions(list(stored.keys()), conn)
+            index_versions = load_index_versions(sorted({item['index_code'] for item in stored.values()}), conn)
+            for code, item in list(stored.items()):
+                current = _data_version(nav_versions.get(code), index_versions.get(item['index_code']))
+                if versions[code] != current:
+                    del stored[code]
+
+    pending = [code for code in fund_codes if code not in stored]
+    if pending:
+        computed = compute_benchmark_regression(pending, index_code, window)
+        if computed.get('success'):
+            for item in computed['results']:
+                stored[item['fund_code']] = item
+
+    return {
+        'success': True,
+        'results': {code: stored[code] for code in fund_codes if code in stored},
+        'computed': pending
+    }
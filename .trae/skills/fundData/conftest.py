@@ -0,0 +1,51 @@
+"""
+测试公共夹具
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# funddb 导入时即初始化 DB_PATH 指向的库，须在首次导入前切换到临时库，测试不触碰真实数据库
+_session_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+_session_db.close()
+os.environ['FUND_DATA_DB_PATH'] = _session_db.name
+
+import pytest
+
+import funddb
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if os.path.exists(_session_db.name):
+        os.remove(_session_db.name)
+
+
+@pytest.fixture
+def temp_db_factory(monkeypatch):
+    """
+    新建并初始化临时数据库，funddb.DB_PATH 切换到新库，返回其路径
+
+    可多次调用（如需要与另一个库比对的测试），测试结束后恢复 DB_PATH 并删除创建的临时库
+    """
+    paths = []
+
+    def create() -> str:
+        tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        tmp.close()
+        paths.append(tmp.name)
+        monkeypatch.setattr(funddb, 'DB_PATH', tmp.name)
+        funddb.init_database()
+        return tmp.name
+
+    yield create
+    monkeypatch.undo()
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@pytest.fixture
+def temp_db(temp_db_factory):
+    """已初始化的临时数据库路径（funddb.DB_PATH 指向该库）"""
+    return temp_db_factory()
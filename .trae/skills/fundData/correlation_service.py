@@ -0,0 +1,269 @@
+"""
+相关性/协方差矩阵服务
+为组合成分基金或筛选出的基金集合计算两两日收益率相关系数和协方差矩阵
+
+实现：
+    1. 在交易日历对齐的净值面板上取最近window个交易日，日收益率仅在相邻两日净值都存在时有效
+    2. 成对缺失（pairwise complete）：每对基金只用两者收益率都有效的日期，
+       全部成对统计量用矩阵乘法一次得到：
+         N = Mᵀ·M，  SX = Xᵀ·M，  SXX = Xᵀ·X，  SX2 = (X²)ᵀ·M
+       其中 X 为收益率矩阵（无效处为0），M 为有效性矩阵
+    3. 结果按 (基金集合, 窗口) 缓存并记录各基金数据版本；
+       向已缓存集合新增一只基金时只计算新增的一行一列（O(T·F)）
+"""
+import sys
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import load_nav_panel, load_nav_versions
+
+
+# 两只基金共同有效收益率少于该天数时不计算相关系数
+DEFAULT_MIN_PERIODS = 20
+
+# 进程内缓存上限（按基金集合×窗口计）
+CORRELATION_CACHE_SIZE = 64
+
+_correlation_cache: 'OrderedDict[tuple, CorrelationState]' = OrderedDict()
+
+
+@dataclass
+class CorrelationState:
+    """基金集合的对齐收益率及成对累加量"""
+    fund_codes: List[str]
+    versions: Dict[str, str]
+    nav_dates: List[str]          # 净值日期轴（window+1个），收益率日期为其后window个
+    returns: np.ndarray           # X：收益率矩阵 (日期 × 基金)，无效处为0
+    mask: np.ndarray              # M：有效性矩阵（float64，0/1）
+    n: np.ndarray                 # 共同有效天数
+    sx: np.ndarray                # sx[i, j]：i与j共同有效日上i的收益率之和
+    sxx: np.ndarray               # sxx[i, j]：共同有效日上 x_i·x_j 之和
+    sx2: np.ndarray               # sx2[i, j]：共同有效日上 x_i² 之和
+
+    @classmethod
+    def build(cls, fund_codes, versions, nav_dates, returns, mask) -> 'CorrelationState':
+        x2 = returns * returns
+        return cls(fund_codes, versions, nav_dates, returns, mask,
+                   mask.T @ mask, returns.T @ mask, returns.T @ returns, x2.T @ mask)
+
+    @property
+    def dates(self) -> List[str]:
+        return self.nav_dates[1:]
+
+    def add_fund(self, fund_code: str, version: str, ret: np.ndarray, valid: np.ndarray) -> 'CorrelationState':
+        """新增一只基金（收益率已对齐到本状态的日期轴），只计算新增行列"""
+        x, m = ret, valid
+        X, M = self.returns, self.mask
+
+        def grow(old, col, row, corner):
+            out = np.empty((old.shape[0] + 1, old.shape[1] + 1))
+            out[:-1, :-1] = old
+            out[:-1, -1] = col
+            out[-1, :-1] = row
+            out[-1, -1] = corner
+            return out
+
+        return CorrelationState(
+            self.fund_codes + [fund_code],
+            {**self.versions, fund_code: version},
+            self.nav_dates,
+            np.column_stack([X, x]),
+            np.column_stack([M, m]),
+            grow(self.n, M.T @ m, m @ M, m @ m),
+            grow(self.sx, X.T @ m, x @ M, x @ m),
+            grow(self.sxx, X.T @ x, x @ X, x @ x),
+            grow(self.sx2, (X * X).T @ m, (x * x) @ M, (x * x) @ m),
+        )
+
+    def matrices(self, min_periods: int = DEFAULT_MIN_PERIODS):
+        """由成对累加量计算协方差（日）和相关系数矩阵，共同天数不足处为NaN"""
+        n = self.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = (self.sxx - self.sx * self.sx.T / n) / (n - 1)
+            var_i = (self.sx2 - self.sx * self.sx / n) / (n - 1)
+            corr = cov / np.sqrt(var_i * var_i.T)
+        enough = n >= min_periods
+        cov = np.where(enough, cov, np.nan)
+        corr = np.clip(np.where(enough, corr, np.nan), -1.0, 1.0)
+        np.fill_diagonal(corr, np.where(np.diag(enough), 1.0, np.nan))
+        return cov, corr
+
+
+def _window_returns(panel, window: int):
+    """取面板最后window+1个日期，返回 (净值日期, 收益率矩阵, 有效性矩阵)"""
+    values = panel.values[-(window + 1):]
+    dates = panel.dates[-(window + 1):]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = values[1:] / values[:-1] - 1
+    valid = ~np.isnan(returns)
+    return dates, np.where(valid, returns, 0.0), valid.astype(np.float64)
+
+
+def _window_start(conn, versions: Dict[str, str], window: int) -> Optional[str]:
+    """按交易日历估算窗口起始日期，用于限制净值读取范围（日历缺失时返回None读取全部）"""
+    latest = max(v.split(':')[0] for v in versions.values())
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT trade_date FROM trade_calendar
+        WHERE is_trade_day = 1 AND trade_date <= ?
+        ORDER BY trade_date DESC
+        LIMIT 1 OFFSET ?
+    ''', (latest, window + 1))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _build_state(fund_codes: List[str], versions: Dict[str, str], window: int, conn) -> CorrelationState:
+    panel = load_nav_panel(fund_codes, start_date=_window_start(conn, versions, window), conn=conn)
+    nav_dates, returns, mask = _window_returns(panel, window)
+    return CorrelationState.build(list(panel.fund_codes), {c: versions[c] for c in panel.fund_codes},
+                                  nav_dates, returns, mask)
+
+
+def _extend_state(state: CorrelationState, fund_code: str, version: str, conn) -> CorrelationState:
+    """把新基金的净值对齐到已缓存状态的日期轴后增量加入"""
+    axis = np.asarray(state.nav_dates, dtype=str)
+    navs = np.full(axis.size, np.nan)
+    if axis.size:
+        panel = load_nav_panel([fund_code], start_date=state.nav_dates[0], end_date=state.nav_dates[-1], conn=conn)
+        own = np.asarray(panel.dates, dtype=str)
+        pos = np.searchsorted(own, axis)
+        found = pos < own.size
+        found[found] = own[pos[found]] == axis[found]
+        navs[found] = panel.values[pos[found], 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ret = navs[1:] / navs[:-1] - 1
+    valid = ~np.isnan(ret)
+    return state.add_fund(fund_code, version, np.where(valid, ret, 0.0), valid.astype(np.float64))
+
+
+def get_correlation_matrix(fund_codes: List[str],
+                           window: int = 252,
+                           min_periods: int = DEFAULT_MIN_PERIODS) -> Dict[str, Any]:
+    """
+    计算基金集合的日收益率相关系数和协方差矩阵
+
+    Args:
+        fund_codes: 基金代码列表（至少2只）
+        window: 窗口（最近N个交易日的收益率）
+        min_periods: 两只基金共同有效天数下限
+
+    Returns:
+        {'success': True, 'fund_codes': [...], 'correlation': [[...]], 'covariance': [[...]],
+         'annual_covariance': [[...]], 'observations': [[...]], 'start_date', 'end_date',
+         'missing': [无净值数据的基金], 'from_cache': bool, 'incremental': bool}
+    """
+    fund_codes = list(dict.fromkeys(fund_codes))
+    if len(fund_codes) < 2:
+        return {'success': False, 'error': '至少需要2只基金'}
+
+    with get_db_connection() as conn:
+        versions = load_nav_versions(fund_codes, conn)
+        codes = [c for c in fund_codes if c in versions]
+        missing = [c for c in fund_codes if c not in versions]
+        if len(codes) < 2:
+            return {'success': False, 'error': '有净值数据的基金不足2只', 'missing': missing}
+
+        key = (tuple(sorted(codes)), window)
+        state = _correlation_cache.get(key)
+        from_cache = state is not None and state.versions == {c: versions[c] for c in codes}
+        incremental = False
+
+        if not from_cache:
+            state = None
+            for code in codes:
+                base_key = (tuple(sorted(c for c in codes if c != code)), window)
+                base = _correlation_cache.get(base_key)
+                # 新基金的最新净值晚于缓存窗口末日时窗口需要后移，只能全量重算
+                if (base is not None and base.nav_dates
+                        and all(base.versions.get(c) == versions[c] for c in base_key[0])
+                        and versions[code].split(':')[0] <= base.nav_dates[-1]):
+                    state = _extend_state(base, code, versions[code], conn)
+                    incremental = True
+                    break
+            if state is None:
+                state = _build_state(codes, versions, window, conn)
+
+            _correlation_cache[key] = state
+            while len(_correlation_cache) > CORRELATION_CACHE_SIZE:
+                _correlation_cache.popitem(last=False)
+        _correlation_cache.move_to_end(key)
+
+    cov, corr = state.matrices(min_periods)
+    order = [state.fund_codes.index(c) for c in codes]
+    idx = np.ix_(order, order)
+
+    def to_lists(matrix, digits=6):
+        return [[None if np.isnan(v) else round(float(v), digits) for v in row] for row in matrix]
+
+    return {
+        'success': True,
+        'fund_codes': codes,
+        'window': window,
+        'start_date': state.dates[0] if state.dates else None,
+        'end_date': state.dates[-1] if state.dates else None,
+        'correlation': to_lists(corr[idx], 4),
+        'covariance': to_lists(cov[idx], 8),
+        'annual_covariance': to_lists(cov[idx] * 252, 6),
+        'observations': state.n[idx].astype(int).tolist(),
+        'missing': missing,
+        'from_cache': from_cache,
+        'incremental': incremental
+    }
+
+
+def get_portfolio_correlation(portfolio_id: int,
+                              window: int = 252,
+                              min_periods: int = DEFAULT_MIN_PERIODS) -> Dict[str, Any]:
+    """
+    计算组合成分基金的相关系数矩阵，并给出平均相关系数和高相关基金对
+
+    Args:
+        portfolio_id: 组合ID
+        window: 窗口（交易日）
+        min_periods: 两只基金共同有效天数下限
+
+    Returns:
+        get_correlation_matrix 的结果，附加 fund_names、avg_correlation、high_correlation_pairs
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT fund_code, fund_name FROM portfolio_fund
+            WHERE portfolio_id = ?
+            ORDER BY fund_code
+        ''', (portfolio_id,))
+        rows = cursor.fetchall()
+
+    if not rows:
+        return {'success': False, 'error': '组合中没有基金'}
+
+    result = get_correlation_matrix([r['fund_code'] for r in rows], window, min_periods)
+    if not result.get('success'):
+        return result
+
+    names = {r['fund_code']: r['fund_name'] for r in rows}
+    codes = result['fund_codes']
+    corr = result['correlation']
+
+    pairs = []
+    for i in range(len(codes)):
+        for j in range(i + 1, len(codes)):
+            if corr[i][j] is not None:
+                pairs.append((corr[i][j], codes[i], codes[j]))
+
+    result['portfolio_id'] = portfolio_id
+    result['fund_names'] = [names.get(c) for c in codes]
+    result['avg_correlation'] = round(sum(p[0] for p in pairs) / len(pairs), 4) if pairs else None
+    result['high_correlation_pairs'] = [
+        {'fund_a': a, 'fund_b': b, 'name_a': names.get(a), 'name_b': names.get(b), 'correlation': c}
+        for c, a, b in sorted(pairs, reverse=True) if c >= 0.8
+    ]
+    return result
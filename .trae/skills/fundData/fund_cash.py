@@ -0,0 +1,157 @@
+"""
+成分基金可用现金余额模块
+可用现金 = 卖出获得金额 - 买入投入金额，物化在 portfolio_fund_cash 表中：
+买入、卖出、波段捡回写入交易记录时在同一事务内累加，修改/删除历史交易时按该基金的交易记录重算，
+查询可用现金只需按主键读取，不再每次对 portfolio_transaction 求和
+
+对账：
+    reconcile_fund_cash 按交易记录重新汇总并与余额表比对，列出不一致的基金并修正
+    （绕过交易接口直接改表的修数脚本等情况）
+"""
+import sys
+import os
+from typing import List, Dict, Any
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+
+
+# 金额比对容差（元）
+CASH_TOLERANCE = 0.005
+
+_LEDGER_SUMS = '''
+    SELECT portfolio_id, fund_code,
+           COALESCE(SUM(CASE WHEN transaction_type = 'BUY' THEN amount ELSE 0 END), 0),
+           COALESCE(SUM(CASE WHEN transaction_type = 'SELL' THEN amount ELSE 0 END), 0),
+           COUNT(*)
+    FROM portfolio_transaction
+'''
+
+
+def apply_fund_cash(cursor, portfolio_id: int, fund_code: str,
+                    buy_amount: float = 0, sell_amount: float = 0):
+    """
+    记录一笔交易对余额的影响（调用方负责提交事务，与交易记录一起生效）
+    """
+    buy_amount = float(buy_amount or 0)
+    sell_amount = float(sell_amount or 0)
+    cursor.execute('''
+        UPDATE portfolio_fund_cash SET
+            total_buy_amount = total_buy_amount + ?,
+            total_sell_amount = total_sell_amount + ?,
+            available_cash = available_cash + ?,
+            transaction_count = transaction_count + 1,
+            update_time = CURRENT_TIMESTAMP
+        WHERE portfolio_id = ? AND fund_code = ?
+    ''', (buy_amount, sell_amount, sell_amount - buy_amount, portfolio_id, fund_code))
+    if cursor.rowcount == 0:
+        # 首笔交易，或旧库中尚无余额：按交易记录（已包含本笔）汇总生成
+        refresh_fund_cash(cursor, portfolio_id, fund_code)
+
+
+def refresh_fund_cash(cursor, portfolio_id: int, fund_code: str):
+    """按交易记录重算一只基金的余额（修改、删除历史交易后调用）"""
+    cursor.execute(_LEDGER_SUMS + ' WHERE portfolio_id = ? AND fund_code = ?', (portfolio_id, fund_code))
+    _, _, total_buy, total_sell, count = cursor.fetchone()
+    if not count:
+        cursor.execute("DELETE FROM portfolio_fund_cash WHERE portfolio_id = ? AND fund_code = ?",
+                       (portfolio_id, fund_code))
+        return
+    total_buy, total_sell = float(total_buy), float(total_sell)
+    cursor.execute('''
+        INSERT OR REPLACE INTO portfolio_fund_cash
+        (portfolio_id, fund_code, total_buy_amount, total_sell_amount, available_cash, transaction_count, update_time)
+        VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (portfolio_id, fund_code, total_buy, total_sell, total_sell - total_buy, count))
+
+
+def get_fund_cash(portfolio_id: int, fund_codes: List[str] = None, conn=None) -> Dict[str, Dict[str, float]]:
+    """
+    读取成分基金可用现金余额
+
+    Returns:
+        {基金代码: {'total_buy_amount', 'total_sell_amount', 'available_cash'}}，
+        指定 fund_codes 时没有交易记录的基金余额为0
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return get_fund_cash(portfolio_id, fund_codes, new_conn)
+
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute('''
+        SELECT fund_code, total_buy_amount, total_sell_amount, available_cash
+        FROM portfolio_fund_cash WHERE portfolio_id = ?
+    ''', (portfolio_id,))
+    balances = {
+        code: {'total_buy_amount': buy or 0, 'total_sell_amount': sell or 0, 'available_cash': cash or 0}
+        for code, buy, sell, cash in cursor.fetchall()
+    }
+    if fund_codes is None:
+        return balances
+    empty = {'total_buy_amount': 0, 'total_sell_amount': 0, 'available_cash': 0}
+    return {code: balances.get(code, dict(empty)) for code in fund_codes}
+
+
+def reconcile_fund_cash(portfolio_id: int = None, fix: bool = True) -> Dict[str, Any]:
+    """
+    对账：按交易记录汇总的金额与余额表比对
+
+    Args:
+        portfolio_id: 组合ID，None表示全部组合
+        fix: 是否修正不一致的余额（含缺失和多余的记录）
+
+    Returns:
+        {'success': True, 'checked': 比对的基金数, 'mismatches': [{'portfolio_id', 'fund_code',
+         'expected_available_cash', 'actual_available_cash', ...}], 'fixed': 修正数}
+    """
+    where = ' WHERE portfolio_id = ?' if portfolio_id is not None else ''
+    params = (portfolio_id,) if portfolio_id is not None else ()
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(_LEDGER_SUMS + where + ' GROUP BY portfolio_id, fund_code', params)
+        expected = {(pid, code): (float(buy), float(sell), count) for pid, code, buy, sell, count in cursor.fetchall()}
+
+        cursor.execute('''
+            SELECT portfolio_id, fund_code, total_buy_amount, total_sell_amount, available_cash, transaction_count
+            FROM portfolio_fund_cash
+        ''' + where, params)
+        actual = {(pid, code): tuple(rest) for pid, code, *rest in cursor.fetchall()}
+
+        mismatches = []
+        for key in sorted(set(expected) | set(actual)):
+            buy, sell, count = expected.get(key, (0.0, 0.0, 0))
+            stored = actual.get(key)
+            if stored is not None:
+                s_buy, s_sell, s_cash, s_count = [v or 0 for v in stored]
+                if (abs(s_buy - buy) <= CASH_TOLERANCE and abs(s_sell - sell) <= CASH_TOLERANCE
+                        and abs(s_cash - (sell - buy)) <= CASH_TOLERANCE and s_count == count):
+                    continue
+            mismatches.append({
+                'portfolio_id': key[0],
+                'fund_code': key[1],
+                'expected_buy_amount': round(buy, 2),
+                'expected_sell_amount': round(sell, 2),
+                'expected_available_cash': round(sell - buy, 2),
+                'actual_available_cash': round(stored[2] or 0, 2) if stored is not None else None,
+            })
+
+        if fix:
+            for item in mismatches:
+                key = (item['portfolio_id'], item['fund_code'])
+                if key in expected:
+                    refresh_fund_cash(cursor, *key)
+                else:
+                    # 已没有交易记录的基金
+                    cursor.execute("DELETE FROM portfolio_fund_cash WHERE portfolio_id = ? AND fund_code = ?", key)
+            conn.commit()
+
+    return {
+        'success': True,
+        'checked': len(set(expected) | set(actual)),
+        'mismatches': mismatches,
+        'fixed': len(mismatches) if fix else 0,
+    }
@@ -33,6 +33,7 @@ from syncers import (
     sync_fund_company,
     sync_fund_dividend,
     sync_fund_split,
+    sync_index_price,
     sync_all_global_data,
     sync_group_nav,
     sync_group_holdings,
@@ -142,6 +143,21 @@ class FundDataSkill:
             'errors': result.errors
         }
     
+    def sync_index_price(self, index_codes: List[str] = None) -> Dict[str, Any]:
+        """
+        增量同步指数/ETF日行情
+        
+        Args:
+            index_codes: 指数/ETF代码列表，不传则同步默认的主要指数和ETF
+        """
+        result = sync_index_price(index_codes)
+        return {
+            'success': result.success,
+            'message': result.message,
+            'record_count': result.record_count,
+            'errors': result.errors
+        }
+    
     def sync_all_global_data(self) -> Dict[str, Any]:
         """
         同步所有全局数据
@@ -159,6 +175,86 @@ class FundDataSkill:
             for name, r in results.items()
         }
     
+    def calculate_manager_metrics(self, years: float = 3) -> Dict[str, Any]:
+        """
+        批量计算全部基金经理的汇总指标（写入 manager_metrics，供经理排名使用）
+        
+        Args:
+            years: 评估区间（最近N年）
+        """
+        from manager_metrics import calculate_manager_metrics
+        result = calculate_manager_metrics(years=years)
+        if not result['success']:
+            return {'success': False, 'message': result['error']}
+        return {
+            'success': True,
+            'message': f"计算完成: {result['evaluated_manager_count']}/{result['manager_count']}位基金经理",
+            'record_count': result['manager_count']
+        }
+    
+    def calculate_holding_changes(self, fund_codes: List[str] = None) -> Dict[str, Any]:
+        """
+        重算持仓季度变动和换手率（写入 holding_change / holding_turnover）
+        
+        Args:
+            fund_codes: 基金代码列表，不传则全部基金
+        """
+        from holding_changes import update_holding_changes
+        result = update_holding_changes(fund_codes)
+        return {
+            'success': True,
+            'message': f"计算完成: {result['fund_count']}只基金, {result['period_count']}个季度",
+            'record_count': result['change_count']
+        }
+    
+    def calculate_monthly_returns(self, fund_codes: List[str] = None, force: bool = False) -> Dict[str, Any]:
+        """
+        增量汇总基金月收益率（写入 fund_monthly_return，供市值定投按阶段统计）
+        
+        Args:
+            fund_codes: 基金代码列表，不传则全部基金
+            force: 是否全部重算
+        """
+        from monthly_return import update_monthly_returns
+        result = update_monthly_returns(fund_codes, force=force)
+        return {
+            'success': True,
+            'message': f"计算完成: {result['fund_count']}只基金, {result['month_count']}个月份",
+            'record_count': result['month_count']
+        }
+    
+    def detect_market_phase(self, index_code: str = None) -> Dict[str, Any]:
+        """
+        根据本地指数行情重新识别市场阶段（写入 market_phase_record）
+        
+        Args:
+            index_code: 识别所用指数代码，不传则使用沪深300
+        """
+        from market_phase import refresh_phase_calendar, PHASE_INDEX_CODE
+        result = refresh_phase_calendar(index_code or PHASE_INDEX_CODE)
+        if not result['success']:
+            return {'success': False, 'message': result['error']}
+        return {
+            'success': True,
+            'message': f"识别完成: {len(result['phases'])}个阶段, 当前阶段: {result['current_phase']}",
+            'record_count': len(result['phases'])
+        }
+    
+    def reconcile_fund_cash(self, portfolio_id: int = None) -> Dict[str, Any]:
+        """
+        对账成分基金可用现金余额（按交易记录汇总比对 portfolio_fund_cash，并修正不一致）
+        
+        Args:
+            portfolio_id: 组合ID，不传则对账全部组合
+        """
+        from fund_cash import reconcile_fund_cash
+        result = reconcile_fund_cash(portfolio_id)
+        return {
+            'success': True,
+            'message': f"对账完成: 检查{result['checked']}只基金, 修正{result['fixed']}只",
+            'record_count': result['fixed']
+        }
+    
     # ==================== 分组数据同步接口 ====================
     
     def sync_group_nav(self, fund_codes: List[str]) -> Dict[str, Any]:
@@ -349,7 +445,15 @@ def print_help():
   同步基金公司             - 同步基金公司信息
   同步基金分红 [年份]       - 同步分红数据（默认当年）
   同步基金拆分 [年份]       - 同步拆分数据（默认当年）
+  同步指数行情 [代码列表]    - 增量同步指数/ETF日行情
   同步所有全局数据          - 批量同步所有全局数据
+  计算基金经理指标 [年数]    - 批量计算基金经理汇总指标和排名
+  计算持仓变动 [代码列表]    - 重算持仓季度变动和换手率
+  计算月收益率 [代码列表]    - 增量汇总基金月收益率
+  识别市场阶段 [指数代码]    - 按指数行情重新识别牛熊市阶段
+
+【组合维护命令】
+  对账可用现金 [组合ID]      - 按交易记录校验并修正成分基金可用现金余额
 
 【分组数据同步命令】
   同步分组净值 [代码列表]    - 同步指定基金的历史净值
@@ -413,6 +517,36 @@ def main():
         result = skill.sync_fund_split(year)
         print(f"结果: {result['message']}")
     
+    elif command == "sync_index_price":
+        index_codes = sys.argv[2].split(',') if len(sys.argv) > 2 else None
+        result = skill.sync_index_price(index_codes)
+        print(f"结果: {result['message']}")
+    
+    elif command == "calc_manager_metrics":
+        years = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+        result = skill.calculate_manager_metrics(years)
+        print(f"结果: {result['message']}")
+    
+    elif command == "calc_holding_changes":
+        fund_codes = sys.argv[2].split(',') if len(sys.argv) > 2 else None
+        result = skill.calculate_holding_changes(fund_codes)
+        print(f"结果: {result['message']}")
+    
+    elif command == "calc_monthly_returns":
+        fund_codes = sys.argv[2].split(',') if len(sys.argv) > 2 else None
+        result = skill.calculate_monthly_returns(fund_codes)
+        print(f"结果: {result['message']}")
+    
+    elif command == "detect_market_phase":
+        index_code = sys.argv[2] if len(sys.argv) > 2 else None
+        result = skill.detect_market_phase(index_code)
+        print(f"结果: {result['message']}")
+    
+    elif command == "reconcile_fund_cash":
+        portfolio_id = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        result = skill.reconcile_fund_cash(portfolio_id)
+        print(f"结果: {result['message']}")
+    
     elif command == "sync_all_global":
         results = skill.sync_all_global_data()
         for name, r in results.items():
@@ -0,0 +1,339 @@
+"""
+基金筛选引擎
+把 fund_info、fund_risk_metrics、fund_performance、fund_rating、fund_manager
+按基金代码关联为列式NumPy快照，复合条件筛选和排序都在数组掩码上完成
+
+快照：
+    - 每个字段一列（数值列为float64，缺失为NaN；文本列为object数组），行为基金
+    - 各来源表的 (记录数, 最大update_time) 作为数据版本，版本变化时重建快照；
+      版本检查间隔 SNAPSHOT_CHECK_SECONDS，期间直接使用内存快照
+
+筛选条件：
+    {'field': 字段, 'op': 运算符, 'value': 值}
+    运算符：> >= < <= == != between in not_in contains top_pct bottom_pct
+    top_pct / bottom_pct 为分位条件（如 value=10 表示前10%），在满足其余条件的基金中按该字段排名，
+    字段缺失的基金不参与排名
+"""
+import sys
+import os
+import time
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+
+
+# 风险指标/业绩周期 -> 字段后缀
+PERIOD_SUFFIX = {
+    '近1月': '1m',
+    '近6月': '6m',
+    '近1年': '1y',
+    '近3年': '3y',
+    '近5年': '5y',
+    '成立以来': 'all',
+}
+
+TEXT_FIELDS = ['fund_code', 'fund_name', 'fund_type', 'company_name', 'manager_name']
+
+DEFAULT_RESULT_FIELDS = [
+    'fund_code', 'fund_name', 'fund_type', 'company_name', 'manager_name',
+    'return_1y', 'max_drawdown_1y', 'sharpe_1y', 'volatility_1y', 'rating_max', 'manager_tenure_years'
+]
+
+SOURCE_TABLES = ['fund_info', 'fund_risk_metrics', 'fund_performance', 'fund_rating', 'fund_manager']
+
+# 快照数据版本检查间隔（秒）
+SNAPSHOT_CHECK_SECONDS = 5
+
+_snapshot: Optional['ScreenerSnapshot'] = None
+_snapshot_lock = threading.Lock()
+
+
+@dataclass
+class ScreenerSnapshot:
+    fund_codes: np.ndarray
+    columns: Dict[str, np.ndarray]
+    version: tuple
+    build_seconds: float = 0.0
+    checked_at: float = field(default_factory=time.time)
+
+    def __len__(self):
+        return int(self.fund_codes.size)
+
+    @property
+    def numeric_fields(self) -> List[str]:
+        return [name for name, col in self.columns.items() if col.dtype.kind == 'f']
+
+
+def _table_version(cursor) -> tuple:
+    """各来源表的 (记录数, 最大更新时间)"""
+    version = []
+    for table in SOURCE_TABLES:
+        cursor.execute(f"SELECT COUNT(*), MAX(update_time) FROM {table}")
+        version.append(tuple(cursor.fetchone()))
+    return tuple(version)
+
+
+def _scatter(index: Dict[str, int], n: int, rows, value_pos: int = 1) -> np.ndarray:
+    """把 (fund_code, value) 行写入按基金对齐的float列"""
+    col = np.full(n, np.nan)
+    if rows:
+        pos = np.array([index.get(r[0], -1) for r in rows])
+        vals = np.array([np.nan if r[value_pos] is None else r[value_pos] for r in rows], dtype=np.float64)
+        known = pos >= 0
+        col[pos[known]] = vals[known]
+    return col
+
+
+def _to_day(value) -> np.datetime64:
+    """日期文本 -> datetime64[D]，无法解析时为NaT"""
+    try:
+        return np.datetime64(str(value)[:10], 'D') if value else np.datetime64('NaT')
+    except ValueError:
+        return np.datetime64('NaT')
+
+
+def _parse_rank_pct(rank: Optional[str]) -> Optional[float]:
+    """'12/345' -> 排名百分位 3.48"""
+    try:
+        a, b = str(rank).split('/')
+        return float(a) / float(b) * 100
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def build_snapshot() -> ScreenerSnapshot:
+    """从数据库构建列式快照"""
+    start = time.time()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        version = _table_version(cursor)
+
+        cursor.execute('''
+            SELECT fund_code, fund_name, fund_type, company_name, establish_date, manage_fee_rate
+            FROM fund_info ORDER BY fund_code
+        ''')
+        info = cursor.fetchall()
+        codes = [r[0] for r in info]
+        index = {code: i for i, code in enumerate(codes)}
+        n = len(codes)
+
+        columns: Dict[str, np.ndarray] = {
+            'fund_code': np.array(codes, dtype=object),
+            'fund_name': np.array([r[1] or '' for r in info], dtype=object),
+            'fund_type': np.array([r[2] or '' for r in info], dtype=object),
+            'company_name': np.array([r[3] or '' for r in info], dtype=object),
+            'manage_fee_rate': _scatter(index, n, [(r[0], r[5]) for r in info]),
+        }
+
+        today = np.datetime64(datetime.now().strftime('%Y-%m-%d'))
+        establish = np.array([_to_day(r[4]) for r in info], dtype='datetime64[D]')
+        columns['fund_age_years'] = np.where(np.isnat(establish), np.nan,
+                                             (today - establish).astype(np.float64) / 365.25)
+
+        cursor.execute('''
+            SELECT fund_code, period, period_return, max_drawdown, sharpe_ratio, annual_volatility
+            FROM fund_risk_metrics
+        ''')
+        risk = cursor.fetchall()
+        for period, suffix in PERIOD_SUFFIX.items():
+            rows = [r for r in risk if r[1] == period]
+            columns[f'return_{suffix}'] = _scatter(index, n, rows, 2)
+            columns[f'max_drawdown_{suffix}'] = _scatter(index, n, rows, 3)
+            columns[f'sharpe_{suffix}'] = _scatter(index, n, rows, 4)
+            columns[f'volatility_{suffix}'] = _scatter(index, n, rows, 5)
+
+        cursor.execute('''
+            SELECT fund_code, period, period_return, max_drawdown, rank_in_category
+            FROM fund_performance WHERE performance_type = '阶段业绩'
+        ''')
+        perf = cursor.fetchall()
+        for period, suffix in PERIOD_SUFFIX.items():
+            rows = [(r[0], r[2], r[3], _parse_rank_pct(r[4])) for r in perf if r[1] == period]
+            if rows:
+                columns[f'perf_return_{suffix}'] = _scatter(index, n, rows, 1)
+                columns[f'perf_max_drawdown_{suffix}'] = _scatter(index, n, rows, 2)
+                columns[f'perf_rank_pct_{suffix}'] = _scatter(index, n, rows, 3)
+
+        cursor.execute('''
+            SELECT fund_code, rating_sh, rating_zs, rating_ja, rating_morningstar, rating_5star_count
+            FROM fund_rating
+        ''')
+        rating = cursor.fetchall()
+        for k, name in enumerate(['rating_sh', 'rating_zs', 'rating_ja', 'rating_morningstar', 'rating_5star_count'], 1):
+            columns[name] = _scatter(index, n, rating, k)
+        # 各评级机构中的最高评级（全部缺失时为NaN）
+        columns['rating_max'] = np.fmax.reduce(
+            [columns[c] for c in ('rating_sh', 'rating_zs', 'rating_ja', 'rating_morningstar')])
+
+        # 多位基金经理时取任职最久的一位
+        cursor.execute('''
+            SELECT fund_code, manager_name, tenure_days FROM fund_manager
+            WHERE fund_code IS NOT NULL
+            ORDER BY fund_code, tenure_days
+        ''')
+        managers = {code: (name, days) for code, name, days in cursor.fetchall()}
+        columns['manager_name'] = np.array([managers.get(c, ('', None))[0] or '' for c in codes], dtype=object)
+        columns['manager_tenure_years'] = _scatter(index, n, [(c, m[1]) for c, m in managers.items()]) / 365.25
+
+    return ScreenerSnapshot(np.array(codes, dtype=object), columns, version, time.time() - start)
+
+
+def get_snapshot(force_refresh: bool = False) -> ScreenerSnapshot:
+    """获取快照（数据版本变化时重建）"""
+    global _snapshot
+    with _snapshot_lock:
+        now = time.time()
+        if _snapshot is not None and not force_refresh:
+            if now - _snapshot.checked_at < SNAPSHOT_CHECK_SECONDS:
+                return _snapshot
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                if _table_version(cursor) == _snapshot.version:
+                    _snapshot.checked_at = now
+                    return _snapshot
+        _snapshot = build_snapshot()
+        return _snapshot
+
+
+def _predicate_mask(col: np.ndarray, op: str, value) -> np.ndarray:
+    """单个非分位条件的掩码；数值列缺失值不满足任何比较"""
+    if op == 'contains':
+        return np.array([str(value) in str(v) for v in col], dtype=bool)
+    if op == 'in':
+        return np.isin(col, list(value))
+    if op == 'not_in':
+        return ~np.isin(col, list(value))
+    if op == '==':
+        return col == value
+    if op == '!=':
+        return col != value
+
+    with np.errstate(invalid='ignore'):
+        if op == '>':
+            return col > value
+        if op == '>=':
+            return col >= value
+        if op == '<':
+            return col < value
+        if op == '<=':
+            return col <= value
+        if op == 'between':
+            lo, hi = value
+            return (col >= lo) & (col <= hi)
+    raise ValueError(f"不支持的运算符: {op}")
+
+
+def _quantile_mask(col: np.ndarray, base: np.ndarray, op: str, pct: float) -> np.ndarray:
+    """在base范围内按col取前/后pct%"""
+    candidates = base & ~np.isnan(col)
+    count = int(candidates.sum())
+    keep = int(np.ceil(count * pct / 100.0))
+    mask = np.zeros(col.size, dtype=bool)
+    if keep <= 0:
+        return mask
+    idx = np.nonzero(candidates)[0]
+    values = col[idx] if op == 'bottom_pct' else -col[idx]
+    chosen = idx[np.argpartition(values, keep - 1)[:keep]] if keep < count else idx
+    mask[chosen] = True
+    return mask
+
+
+def screen_funds(filters: List[Dict[str, Any]] = None,
+                 sort_by: str = None,
+                 sort_dir: str = 'desc',
+                 page: int = 1,
+                 page_size: int = 50,
+                 fields: List[str] = None) -> Dict[str, Any]:
+    """
+    复合条件筛选基金
+
+    Args:
+        filters: 条件列表，如 [{'field': 'fund_type', 'op': 'contains', 'value': '股票'},
+                 {'field': 'return_1y', 'op': '>', 'value': 10}, {'field': 'sharpe_1y', 'op': 'top_pct', 'value': 10}]
+        sort_by: 排序字段（缺失值排在最后）
+        sort_dir: asc / desc
+        page: 页码（从1开始）
+        page_size: 每页条数
+        fields: 返回字段，默认 DEFAULT_RESULT_FIELDS
+
+    Returns:
+        {'success': True, 'total': 命中数, 'items': [...], 'elapsed_ms': 筛选耗时, 'snapshot_size': 快照基金数}
+    """
+    snapshot = get_snapshot()
+    start = time.perf_counter()
+    columns = snapshot.columns
+    filters = filters or []
+    fields = fields or DEFAULT_RESULT_FIELDS
+
+    unknown = [f['field'] for f in filters if f['field'] not in columns]
+    unknown += [name for name in fields + ([sort_by] if sort_by else []) if name not in columns]
+    if unknown:
+        return {'success': False, 'error': f"未知字段: {', '.join(dict.fromkeys(unknown))}"}
+
+    mask = np.ones(len(snapshot), dtype=bool)
+    quantile_filters = []
+    try:
+        for f in filters:
+            if f['op'] in ('top_pct', 'bottom_pct'):
+                quantile_filters.append(f)
+            else:
+                mask &= _predicate_mask(columns[f['field']], f['op'], f['value'])
+    except (ValueError, TypeError) as e:
+        return {'success': False, 'error': str(e)}
+
+    # 分位条件在满足其余条件的集合上排名，多个分位条件同时满足
+    base = mask
+    for f in quantile_filters:
+        mask = mask & _quantile_mask(columns[f['field']], base, f['op'], float(f['value']))
+
+    idx = np.nonzero(mask)[0]
+    if sort_by:
+        col = columns[sort_by][idx]
+        if col.dtype.kind == 'f':
+            key = -col if sort_dir.lower() == 'desc' else col
+            order = np.lexsort((key, np.isnan(col)))
+        else:
+            order = np.argsort(col.astype(str), kind='stable')
+            if sort_dir.lower() == 'desc':
+                order = order[::-1]
+        idx = idx[order]
+
+    total = int(idx.size)
+    page_idx = idx[(page - 1) * page_size:page * page_size]
+
+    def to_value(v):
+        if isinstance(v, float):
+            return None if np.isnan(v) else round(float(v), 4)
+        return v
+
+    items = [{name: to_value(columns[name][i]) for name in fields} for i in page_idx]
+
+    return {
+        'success': True,
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'items': items,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+        'snapshot_size': len(snapshot)
+    }
+
+
+def get_screen_fields() -> Dict[str, Any]:
+    """可用筛选字段（文本字段与数值字段）"""
+    snapshot = get_snapshot()
+    return {
+        'text_fields': [name for name in TEXT_FIELDS if name in snapshot.columns],
+        'numeric_fields': snapshot.numeric_fields,
+        'snapshot_size': len(snapshot),
+        'build_seconds': round(snapshot.build_seconds, 3)
+    }
@@ -8,8 +8,8 @@ from contextlib import contextmanager
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
-# 数据库路径
-DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fund_data.db")
+# 数据库路径（可用环境变量 FUND_DATA_DB_PATH 指定，如测试时使用临时库）
+DB_PATH = os.getenv('FUND_DATA_DB_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), "fund_data.db")
 
 
 @contextmanager
@@ -110,7 +110,38 @@ def init_database():
                 UNIQUE(manager_name, fund_code)
             )
         ''')
-        
+
+        # 4.1 基金经理汇总指标（批量计算，现任基金等权汇总）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS manager_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                manager_name VARCHAR(50) NOT NULL,
+                company_name VARCHAR(100) NOT NULL DEFAULT '',
+                fund_count INTEGER,
+                evaluated_count INTEGER,
+                fund_codes TEXT,
+                career_years DECIMAL(8,2),
+                window_start DATE,
+                window_end DATE,
+                avg_period_return DECIMAL(10,4),
+                best_period_return DECIMAL(10,4),
+                worst_period_return DECIMAL(10,4),
+                avg_annual_return DECIMAL(10,4),
+                avg_volatility DECIMAL(10,4),
+                avg_sharpe DECIMAL(10,4),
+                avg_max_drawdown DECIMAL(10,4),
+                worst_max_drawdown DECIMAL(10,4),
+                positive_fund_ratio DECIMAL(8,2),
+                consistency_score DECIMAL(8,2),
+                consistency_grade VARCHAR(2),
+                composite_score DECIMAL(8,2),
+                rank_overall INTEGER,
+                total_scale DECIMAL(15,4),
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(manager_name, company_name)
+            )
+        ''')
+
         # 5. 全局数据表 - 基金公司
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS fund_company (
@@ -199,6 +230,49 @@ def init_database():
             )
         ''')
         
+        # 9.1 复权净值表（分红再投资、拆分折算调整后的净值）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fund_adjusted_nav (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code VARCHAR(10) NOT NULL,
+                nav_date DATE NOT NULL,
+                unit_nav DECIMAL(10,4),
+                adj_factor REAL NOT NULL,
+                adjusted_nav REAL NOT NULL,
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(fund_code, nav_date)
+            )
+        ''')
+        
+        # 9.2 复权净值维护状态（增量更新用）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fund_adjusted_nav_state (
+                fund_code VARCHAR(10) PRIMARY KEY,
+                last_nav_date DATE,
+                last_factor REAL,
+                nav_count INTEGER,
+                event_signature VARCHAR(64),
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 9.3 基金月收益率表（由 fund_nav 按月增量汇总）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fund_monthly_return (
+                fund_code VARCHAR(10) NOT NULL,
+                month VARCHAR(7) NOT NULL,
+                first_date DATE,
+                first_nav REAL,
+                last_date DATE,
+                last_nav REAL,
+                nav_count INTEGER,
+                monthly_return REAL,
+                nav_update_time DATETIME,
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (fund_code, month)
+            )
+        ''')
+        
         # 10. 分组数据表 - 股票持仓
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS fund_stock_holding (
@@ -215,7 +289,46 @@ def init_database():
                 UNIQUE(fund_code, report_date, stock_code)
             )
         ''')
-        
+
+        # 10.1 股票持仓季度环比变动（新进/退出/增持/减持）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS holding_change (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code VARCHAR(10) NOT NULL,
+                quarter VARCHAR(10) NOT NULL,
+                prev_quarter VARCHAR(10),
+                stock_code VARCHAR(10) NOT NULL,
+                stock_name VARCHAR(50),
+                current_weight DECIMAL(8,4),
+                previous_weight DECIMAL(8,4),
+                weight_change DECIMAL(8,4),
+                current_shares DECIMAL(15,4),
+                previous_shares DECIMAL(15,4),
+                change_type VARCHAR(10),
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(fund_code, quarter, stock_code)
+            )
+        ''')
+
+        # 10.2 股票持仓季度换手率
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS holding_turnover (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code VARCHAR(10) NOT NULL,
+                quarter VARCHAR(10) NOT NULL,
+                prev_quarter VARCHAR(10),
+                turnover DECIMAL(8,4),
+                stock_count INTEGER,
+                prev_stock_count INTEGER,
+                num_added INTEGER,
+                num_removed INTEGER,
+                num_increased INTEGER,
+                num_decreased INTEGER,
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(fund_code, quarter)
+            )
+        ''')
+
         # 11. 分组数据表 - 债券持仓
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS fund_bond_holding (
@@ -289,7 +402,87 @@ def init_database():
             cursor.execute("ALTER TABLE fund_risk_metrics ADD COLUMN period_return DECIMAL(8,4)")
         except:
             pass
-        
+
+        # 13.1 风险指标增量累加器状态（每只基金每个滑动窗口一行）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fund_risk_stream_state (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code VARCHAR(10) NOT NULL,
+                period VARCHAR(20) NOT NULL,
+                window_size INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                nav_count INTEGER NOT NULL,
+                sum_ret REAL,
+                sum_ret_sq REAL,
+                peak_nav REAL,
+                peak_seq INTEGER,
+                max_dd REAL,
+                dd_peak_seq INTEGER,
+                dd_trough_seq INTEGER,
+                last_date DATE,
+                nav_buffer BLOB,
+                date_buffer TEXT,
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(fund_code, period)
+            )
+        ''')
+
+        # 13.2 基准回归指标（基金日收益率对基准指数日收益率的OLS回归）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fund_benchmark_regression (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code VARCHAR(10) NOT NULL,
+                index_code VARCHAR(10) NOT NULL,
+                window_days INTEGER NOT NULL,
+                alpha DECIMAL(10,4),
+                beta DECIMAL(10,4),
+                r_squared DECIMAL(10,4),
+                correlation DECIMAL(10,4),
+                tracking_error DECIMAL(10,4),
+                information_ratio DECIMAL(10,4),
+                observations INTEGER,
+                start_date DATE,
+                end_date DATE,
+                data_version VARCHAR(64),
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(fund_code, index_code, window_days)
+            )
+        ''')
+        # 兼容旧表：添加数据版本字段
+        try:
+            cursor.execute("ALTER TABLE fund_benchmark_regression ADD COLUMN data_version VARCHAR(64)")
+        except:
+            pass
+
+        # 13.3 风险指标 - 复权净值口径（全收益），与 fund_risk_metrics 分表保存，避免同一周期互相覆盖
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fund_risk_metrics_adj (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code VARCHAR(10) NOT NULL,
+                period VARCHAR(20) NOT NULL,
+                annual_volatility DECIMAL(8,4),
+                sharpe_ratio DECIMAL(8,4),
+                max_drawdown DECIMAL(8,4),
+                data_source VARCHAR(20) DEFAULT 'calculated_adj',
+                calc_start_date DATE,
+                calc_end_date DATE,
+                trading_days INTEGER,
+                period_return DECIMAL(8,4),
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(fund_code, period)
+            )
+        ''')
+        # 兼容旧数据：复权口径结果曾写入 fund_risk_metrics，迁移到独立表
+        cursor.execute('''
+            INSERT OR IGNORE INTO fund_risk_metrics_adj
+            (fund_code, period, annual_volatility, sharpe_ratio, max_drawdown, data_source,
+             calc_start_date, calc_end_date, trading_days, period_return, update_time)
+            SELECT fund_code, period, annual_volatility, sharpe_ratio, max_drawdown, data_source,
+                   calc_start_date, calc_end_date, trading_days, period_return, update_time
+            FROM fund_risk_metrics WHERE data_source = 'calculated_adj'
+        ''')
+        cursor.execute("DELETE FROM fund_risk_metrics WHERE data_source = 'calculated_adj'")
+
         # 14. 分组数据表 - 业绩表现
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS fund_performance (
@@ -338,20 +531,41 @@ def init_database():
             )
         ''')
         
-        # 18. 指数参考基准表 - 市值定投用
+        # 18. 指数参考基准表已由 va_return_cache（18.2）取代，不再创建和读取（已有的旧表保留不动）
+
+        # 18.2 市值定投阶段平均月收益率缓存（基金自身 / 指数参考基准）
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS index_benchmark (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                index_code VARCHAR(10) NOT NULL,
-                index_name VARCHAR(50),
+            CREATE TABLE IF NOT EXISTS va_return_cache (
+                subject_type VARCHAR(10) NOT NULL,
+                subject_code VARCHAR(10) NOT NULL,
                 market_phase VARCHAR(20) NOT NULL,
-                avg_monthly_return DECIMAL(8,4),
-                monthly_return_std DECIMAL(8,4),
+                subject_name VARCHAR(50),
+                avg_monthly_return REAL,
+                monthly_return_std REAL,
                 sample_months INTEGER,
                 data_start_date DATE,
                 data_end_date DATE,
+                cache_version INTEGER NOT NULL,
+                source_version VARCHAR(64),
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (subject_type, subject_code, market_phase)
+            )
+        ''')
+
+        # 18.1 指数/ETF日行情表（增量同步）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS index_price (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                index_code VARCHAR(10) NOT NULL,
+                trade_date DATE NOT NULL,
+                open_price DECIMAL(12,4),
+                close_price DECIMAL(12,4) NOT NULL,
+                high_price DECIMAL(12,4),
+                low_price DECIMAL(12,4),
+                volume DECIMAL(20,2),
+                data_source VARCHAR(20),
                 update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(index_code, market_phase)
+                UNIQUE(index_code, trade_date)
             )
         ''')
         
@@ -481,7 +695,65 @@ def init_database():
             cursor.execute("ALTER TABLE portfolio_transaction ADD COLUMN confirmed_nav DECIMAL(10,4)")
         except:
             pass
-        
+        # 波段捡回买入对应的卖出记录ID（回放时据此扣减组合现金）
+        try:
+            cursor.execute("ALTER TABLE portfolio_transaction ADD COLUMN buy_back_of INTEGER")
+            # 新增字段时一次性回填旧的捡回记录：备注为"波段捡回 - 对应卖出记录#ID"，无法识别卖出记录时记为0
+            cursor.execute('''
+                UPDATE portfolio_transaction
+                SET buy_back_of = CASE WHEN instr(notes, '#') > 0
+                                       THEN CAST(substr(notes, instr(notes, '#') + 1) AS INTEGER) ELSE 0 END
+                WHERE transaction_type = 'BUY' AND notes LIKE '波段捡回%'
+            ''')
+        except:
+            pass
+
+        # 22.1 交易流水回放检查点（每只基金每隔若干笔交易保存一次回放状态，seq=0为期初基线）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ledger_checkpoint (
+                portfolio_id INTEGER NOT NULL,
+                fund_code VARCHAR(10) NOT NULL,
+                seq INTEGER NOT NULL,                   -- 已回放的交易笔数
+                transaction_date DATE NOT NULL,         -- 最后一笔已回放交易的日期（基线为空串）
+                transaction_id INTEGER NOT NULL,        -- 最后一笔已回放交易的ID（基线为0）
+                shares DECIMAL(15,4),
+                buy_nav DECIMAL(10,4),                  -- 摊薄成本
+                available_cash DECIMAL(15,2),           -- 卖出获得金额 - 买入投入金额
+                cash_delta DECIMAL(15,2),               -- 对组合现金的影响：卖出获得金额 - 捡回投入金额
+                create_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (portfolio_id, fund_code, seq),
+                FOREIGN KEY (portfolio_id) REFERENCES portfolio(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # 22.2 成分基金可用现金余额（随交易记录在同一事务内维护）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS portfolio_fund_cash (
+                portfolio_id INTEGER NOT NULL,
+                fund_code VARCHAR(10) NOT NULL,
+                total_buy_amount DECIMAL(15,2) DEFAULT 0,   -- 买入投入金额合计
+                total_sell_amount DECIMAL(15,2) DEFAULT 0,  -- 卖出获得金额合计
+                available_cash DECIMAL(15,2) DEFAULT 0,     -- 卖出获得金额 - 买入投入金额
+                transaction_count INTEGER DEFAULT 0,
+                update_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (portfolio_id, fund_code),
+                FOREIGN KEY (portfolio_id) REFERENCES portfolio(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # 兼容旧库：补齐尚未生成余额的基金（已有余额由对账任务校验）
+        cursor.execute('''
+            INSERT OR IGNORE INTO portfolio_fund_cash
+            (portfolio_id, fund_code, total_buy_amount, total_sell_amount, available_cash, transaction_count)
+            SELECT portfolio_id, fund_code,
+                   COALESCE(SUM(CASE WHEN transaction_type = 'BUY' THEN amount ELSE 0 END), 0),
+                   COALESCE(SUM(CASE WHEN transaction_type = 'SELL' THEN amount ELSE 0 END), 0),
+                   COALESCE(SUM(CASE transaction_type WHEN 'SELL' THEN amount WHEN 'BUY' THEN -amount ELSE 0 END), 0),
+                   COUNT(*)
+            FROM portfolio_transaction
+            GROUP BY portfolio_id, fund_code
+        ''')
+
         # 23. 止盈参数模板表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS take_profit_template (
@@ -564,8 +836,11 @@ def init_database():
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_fund_nav_code ON fund_nav(fund_code)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_fund_nav_date ON fund_nav(nav_date)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_fund_holding_code ON fund_stock_holding(fund_code)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_holding_change_stock ON holding_change(stock_code, quarter)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_holding_turnover_quarter ON holding_turnover(quarter, turnover)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_fund_rating_code ON fund_rating(fund_code)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_fund_manager_code ON fund_manager(fund_code)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_manager_metrics_rank ON manager_metrics(rank_overall)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_holding_history_portfolio_fund ON holding_history(portfolio_id, fund_code)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_holding_history_date ON holding_history(record_date)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_fund_portfolio ON portfolio_fund(portfolio_id)')
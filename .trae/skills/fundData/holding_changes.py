@@ -0,0 +1,265 @@
+"""
+持仓变动与换手率模块
+对 fund_stock_holding 中全部基金做季度环比：新进、退出、增持、减持和换手率，
+结果写入 holding_change / holding_turnover 表，供"哪些基金上季度买入了某只股票"、
+"换手率最高的基金"等查询直接读表
+
+口径与 fund_analyzer.PortfolioAnalyzer.detect_position_changes 一致：
+    - 权重为占净值比例（%），本期有、上期无为新进，上期有、本期无为退出，
+      其余变动绝对值不小于阈值（默认1个百分点）的为增持/减持
+    - 季度换手率 = Σ|本期权重 - 上期权重| / 2，低于阈值的小幅变动不计入
+    - 上期为该基金有披露的前一个季度（不要求相邻），同一季度有多份报告时取最新一份
+
+实现：
+    全部持仓一次读入DataFrame，按 (基金, 季度) 分组求出上期，
+    本期与上期持仓按 (基金, 季度, 股票) 外连接后整体计算变动和分组汇总，不逐基金循环
+"""
+import sys
+import os
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import SQL_IN_BATCH_SIZE
+from holdings_lookthrough import normalize_quarter
+
+
+# 增持/减持判定阈值（占净值比例，百分点）
+CHANGE_THRESHOLD = 1.0
+
+CHANGE_TYPES = ['added', 'removed', 'increased', 'decreased', 'unchanged']
+
+HOLDING_COLUMNS = ['fund_code', 'report_date', 'stock_code', 'stock_name', 'hold_ratio', 'hold_shares']
+
+
+def compute_holding_changes(holdings: pd.DataFrame,
+                            change_threshold: float = CHANGE_THRESHOLD) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    计算季度环比持仓变动和换手率（向量化）
+
+    Args:
+        holdings: 持仓明细，列为 HOLDING_COLUMNS
+        change_threshold: 增持/减持阈值（百分点）
+
+    Returns:
+        (changes, turnover)
+        changes: 每行一个 (基金, 季度, 股票)，含 prev_quarter, current_weight, previous_weight,
+                 weight_change, current_shares, previous_shares, change_type
+        turnover: 每行一个 (基金, 季度)，含 prev_quarter, turnover, stock_count, prev_stock_count
+                  及各变动类型的股票数 num_added / num_removed / num_increased / num_decreased
+    """
+    df = holdings.copy()
+    df['quarter'] = df['report_date'].map(normalize_quarter)
+    df = df[df['quarter'].notna() & df['stock_code'].notna() & (df['stock_code'] != '')]
+    df = df[df['report_date'] == df.groupby(['fund_code', 'quarter'])['report_date'].transform('max')]
+    df = (df.assign(hold_ratio=df['hold_ratio'].fillna(0.0), hold_shares=df['hold_shares'].fillna(0.0))
+          .groupby(['fund_code', 'quarter', 'stock_code'], as_index=False)
+          .agg(stock_name=('stock_name', 'last'), weight=('hold_ratio', 'sum'), shares=('hold_shares', 'sum')))
+
+    periods = df[['fund_code', 'quarter']].drop_duplicates().sort_values(['fund_code', 'quarter'])
+    periods['prev_quarter'] = periods.groupby('fund_code')['quarter'].shift(1)
+    periods = periods.dropna(subset=['prev_quarter'])
+
+    keys = ['fund_code', 'quarter', 'prev_quarter', 'stock_code']
+    current = df.merge(periods, on=['fund_code', 'quarter'])
+    previous = df.rename(columns={'quarter': 'prev_quarter'}).merge(periods, on=['fund_code', 'prev_quarter'])
+    changes = current.merge(previous, on=keys, how='outer', suffixes=('', '_prev'))
+
+    changes['stock_name'] = changes['stock_name'].fillna(changes['stock_name_prev'])
+    current_weight = changes['weight'].fillna(0.0).to_numpy(dtype=np.float64)
+    previous_weight = changes['weight_prev'].fillna(0.0).to_numpy(dtype=np.float64)
+    delta = current_weight - previous_weight
+    changes = pd.DataFrame({
+        'fund_code': changes['fund_code'],
+        'quarter': changes['quarter'],
+        'prev_quarter': changes['prev_quarter'],
+        'stock_code': changes['stock_code'],
+        'stock_name': changes['stock_name'],
+        'current_weight': current_weight,
+        'previous_weight': previous_weight,
+        'weight_change': delta,
+        'current_shares': changes['shares'].fillna(0.0).to_numpy(dtype=np.float64),
+        'previous_shares': changes['shares_prev'].fillna(0.0).to_numpy(dtype=np.float64),
+        'change_type': np.select(
+            [(previous_weight == 0) & (current_weight > 0),
+             (previous_weight > 0) & (current_weight == 0),
+             (np.abs(delta) >= change_threshold) & (delta > 0),
+             (np.abs(delta) >= change_threshold) & (delta < 0)],
+            CHANGE_TYPES[:4], default='unchanged'),
+    }).sort_values(['fund_code', 'quarter', 'stock_code'], ignore_index=True)
+
+    flags = pd.DataFrame({f'num_{t}': changes['change_type'] == t for t in CHANGE_TYPES[:4]})
+    turnover = (pd.concat([changes[['fund_code', 'quarter', 'prev_quarter']], flags], axis=1)
+                .assign(turnover=changes['weight_change'].abs().where(changes['change_type'] != 'unchanged', 0.0) / 2,
+                        stock_count=changes['current_weight'] > 0,
+                        prev_stock_count=changes['previous_weight'] > 0)
+                .groupby(['fund_code', 'quarter', 'prev_quarter'], as_index=False)
+                .sum())
+    count_columns = [f'num_{t}' for t in CHANGE_TYPES[:4]] + ['stock_count', 'prev_stock_count']
+    turnover[count_columns] = turnover[count_columns].astype(np.int64)
+
+    return changes, turnover
+
+
+def _load_holdings(cursor, fund_codes: Optional[List[str]]) -> pd.DataFrame:
+    sql = f"SELECT {', '.join(HOLDING_COLUMNS)} FROM fund_stock_holding"
+    if fund_codes is None:
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+    else:
+        rows = []
+        for i in range(0, len(fund_codes), SQL_IN_BATCH_SIZE):
+            batch = fund_codes[i:i + SQL_IN_BATCH_SIZE]
+            cursor.execute(f"{sql} WHERE fund_code IN ({','.join('?' * len(batch))})", batch)
+            rows.extend(cursor.fetchall())
+    return pd.DataFrame([tuple(r) for r in rows], columns=HOLDING_COLUMNS)
+
+
+def update_holding_changes(fund_codes: List[str] = None,
+                           change_threshold: float = CHANGE_THRESHOLD) -> Dict[str, Any]:
+    """
+    重算持仓变动和换手率并写入数据库（指定基金的旧结果整体替换）
+
+    Args:
+        fund_codes: 基金代码列表，None表示全部基金
+        change_threshold: 增持/减持阈值（百分点）
+
+    Returns:
+        {'success': True, 'fund_count', 'period_count', 'change_count'}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        holdings = _load_holdings(cursor, fund_codes)
+        changes, turnover = compute_holding_changes(holdings, change_threshold)
+
+        if fund_codes is None:
+            cursor.execute("DELETE FROM holding_change")
+            cursor.execute("DELETE FROM holding_turnover")
+        else:
+            for i in range(0, len(fund_codes), SQL_IN_BATCH_SIZE):
+                batch = fund_codes[i:i + SQL_IN_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                cursor.execute(f"DELETE FROM holding_change WHERE fund_code IN ({placeholders})", batch)
+                cursor.execute(f"DELETE FROM holding_turnover WHERE fund_code IN ({placeholders})", batch)
+
+        cursor.executemany('''
+            INSERT OR REPLACE INTO holding_change
+            (fund_code, quarter, prev_quarter, stock_code, stock_name, current_weight, previous_weight,
+             weight_change, current_shares, previous_shares, change_type, update_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        ''', changes.round({'current_weight': 4, 'previous_weight': 4, 'weight_change': 4})
+             .itertuples(index=False, name=None))
+        cursor.executemany('''
+            INSERT OR REPLACE INTO holding_turnover
+            (fund_code, quarter, prev_quarter, turnover, stock_count, prev_stock_count,
+             num_added, num_removed, num_increased, num_decreased, update_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        ''', [(r.fund_code, r.quarter, r.prev_quarter, round(float(r.turnover), 4), int(r.stock_count),
+               int(r.prev_stock_count), int(r.num_added), int(r.num_removed), int(r.num_increased),
+               int(r.num_decreased)) for r in turnover.itertuples(index=False)])
+        conn.commit()
+
+    print(f"[HoldingChange] {turnover['fund_code'].nunique()}只基金, {len(turnover)}个季度, {len(changes)}条变动")
+    return {
+        'success': True,
+        'fund_count': int(turnover['fund_code'].nunique()),
+        'period_count': len(turnover),
+        'change_count': len(changes)
+    }
+
+
+def get_stock_buyers(stock_code: str,
+                     quarter: str = None,
+                     include_increased: bool = True,
+                     limit: int = 100) -> Dict[str, Any]:
+    """
+    查询某季度新进（及增持）某只股票的基金
+
+    Args:
+        stock_code: 股票代码
+        quarter: 季度（'YYYYQn' 或报告期文本），None表示该股票有记录的最新季度
+        include_increased: 是否包含增持
+        limit: 返回条数
+
+    Returns:
+        {'success': True, 'quarter', 'total', 'items': [...按权重变动降序]}
+    """
+    types = ['added', 'increased'] if include_increased else ['added']
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if quarter:
+            quarter = normalize_quarter(quarter)
+        else:
+            cursor.execute("SELECT MAX(quarter) FROM holding_change WHERE stock_code = ?", (stock_code,))
+            quarter = cursor.fetchone()[0]
+        if not quarter:
+            return {'success': True, 'stock_code': stock_code, 'quarter': None, 'total': 0, 'items': []}
+
+        placeholders = ','.join('?' * len(types))
+        cursor.execute(f'''
+            SELECT COUNT(*) FROM holding_change
+            WHERE stock_code = ? AND quarter = ? AND change_type IN ({placeholders})
+        ''', [stock_code, quarter] + types)
+        total = cursor.fetchone()[0]
+        cursor.execute(f'''
+            SELECT c.fund_code, f.fund_name, c.stock_name, c.change_type, c.prev_quarter,
+                   c.current_weight, c.previous_weight, c.weight_change, c.current_shares, c.previous_shares
+            FROM holding_change c
+            LEFT JOIN fund_info f ON f.fund_code = c.fund_code
+            WHERE c.stock_code = ? AND c.quarter = ? AND c.change_type IN ({placeholders})
+            ORDER BY c.weight_change DESC, c.fund_code
+            LIMIT ?
+        ''', [stock_code, quarter] + types + [limit])
+        items = [dict(row) for row in cursor.fetchall()]
+
+    return {'success': True, 'stock_code': stock_code, 'quarter': quarter, 'total': total, 'items': items}
+
+
+def get_top_turnover_funds(quarter: str = None,
+                           fund_type: str = None,
+                           min_stocks: int = 1,
+                           limit: int = 50) -> Dict[str, Any]:
+    """
+    查询某季度换手率最高的基金
+
+    Args:
+        quarter: 季度（'YYYYQn' 或报告期文本），None表示最新季度
+        fund_type: 基金类型（模糊匹配）
+        min_stocks: 本期最少持股数
+        limit: 返回条数
+
+    Returns:
+        {'success': True, 'quarter', 'items': [...按换手率降序]}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if quarter:
+            quarter = normalize_quarter(quarter)
+        else:
+            cursor.execute("SELECT MAX(quarter) FROM holding_turnover")
+            quarter = cursor.fetchone()[0]
+        if not quarter:
+            return {'success': True, 'quarter': None, 'items': []}
+
+        conditions = ['t.quarter = ?', 't.stock_count >= ?']
+        params: List[Any] = [quarter, min_stocks]
+        if fund_type:
+            conditions.append('f.fund_type LIKE ?')
+            params.append(f'%{fund_type}%')
+        cursor.execute(f'''
+            SELECT t.fund_code, f.fund_name, f.fund_type, t.prev_quarter, t.turnover,
+                   t.stock_count, t.prev_stock_count, t.num_added, t.num_removed,
+                   t.num_increased, t.num_decreased
+            FROM holding_turnover t
+            LEFT JOIN fund_info f ON f.fund_code = t.fund_code
+            WHERE {' AND '.join(conditions)}
+            ORDER BY t.turnover DESC, t.fund_code
+            LIMIT ?
+        ''', params + [limit])
+        items = [dict(row) for row in cursor.fetchall()]
+
+    return {'success': True, 'quarter': quarter, 'items': items}
@@ -0,0 +1,253 @@
+"""
+组合穿透持仓模块
+把组合成分基金的重仓股按市值权重穿透到个股和行业层面，并计算成分基金两两持仓重叠度
+
+实现：
+    1. 持仓按 (基金下标, 股票下标, 占净值比例) 三元组读入，只为组合实际持有的股票分配列，
+       填入稠密的 基金×股票 权重矩阵 W（行为基金，列为被持有股票的并集；
+       组合成分基金数量有限，列数即持股并集大小，稠密存储即可）
+    2. 组合市值权重 w（成分基金市值占比）：个股穿透敞口 = wᵀ·W，行业敞口同理
+    3. 持仓重叠度 overlap(i, j) = Σ_s min(W[i, s], W[j, s])，共同持股数 = B·Bᵀ（B为持有标记矩阵）
+    4. 各基金取不晚于目标季度的最新一期报告；结果按 (组合, 季度) 缓存，
+       成分基金市值或持仓数据变化时失效
+"""
+import sys
+import os
+import re
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import SQL_IN_BATCH_SIZE
+
+
+# 进程内结果缓存上限（按组合×季度计）
+LOOKTHROUGH_CACHE_SIZE = 128
+
+# 返回的个股敞口条数
+TOP_EXPOSURE_COUNT = 30
+
+_lookthrough_cache: 'OrderedDict[tuple, Dict[str, Any]]' = OrderedDict()
+
+_QUARTER_PATTERNS = [
+    (re.compile(r'(\d{4})年(\d)季度'), lambda m: (m.group(1), int(m.group(2)))),
+    (re.compile(r'(\d{4})-(\d{2})-\d{2}'), lambda m: (m.group(1), (int(m.group(2)) - 1) // 3 + 1)),
+]
+
+
+def normalize_quarter(report_date: Optional[str]) -> Optional[str]:
+    """
+    报告期文本统一为 'YYYYQn'
+
+    如 '2024年3季度股票投资明细' -> '2024Q3'，'2024-09-30' -> '2024Q3'，无法识别时返回None
+    """
+    if not report_date:
+        return None
+    text = str(report_date)
+    if re.fullmatch(r'\d{4}Q[1-4]', text):
+        return text
+    for pattern, parse in _QUARTER_PATTERNS:
+        m = pattern.search(text)
+        if m:
+            year, quarter = parse(m)
+            return f"{year}Q{quarter}"
+    return None
+
+
+def _fetch_in(cursor, sql: str, fund_codes: List[str]) -> List[tuple]:
+    rows = []
+    for i in range(0, len(fund_codes), SQL_IN_BATCH_SIZE):
+        batch = fund_codes[i:i + SQL_IN_BATCH_SIZE]
+        placeholders = ','.join(['?' for _ in batch])
+        cursor.execute(sql.format(placeholders=placeholders), batch)
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def _latest_per_fund(rows: List[tuple], quarter: Optional[str]) -> Tuple[List[tuple], Dict[str, str]]:
+    """
+    每只基金只保留不晚于quarter的最新一期（rows首列为基金代码，第二列为报告期）
+
+    Returns:
+        (保留的行, {基金代码: 使用的季度})
+    """
+    latest: Dict[str, str] = {}
+    keyed = []
+    for row in rows:
+        q = normalize_quarter(row[1])
+        if q is None or (quarter and q > quarter):
+            continue
+        keyed.append((q, row))
+        if q > latest.get(row[0], ''):
+            latest[row[0]] = q
+    return [row for q, row in keyed if latest[row[0]] == q], latest
+
+
+def _weight_matrix(rows: List[tuple], fund_codes: List[str], key_pos: int, value_pos: int):
+    """
+    (基金, 键, 比例) 三元组 -> 稠密的 基金×键 权重矩阵（比例转为小数），只为出现过的键分配列
+
+    Returns:
+        (矩阵, 键列表)
+    """
+    fund_index = {code: i for i, code in enumerate(fund_codes)}
+    keys = sorted({row[key_pos] for row in rows if row[key_pos]})
+    key_index = {k: j for j, k in enumerate(keys)}
+    matrix = np.zeros((len(fund_codes), len(keys)))
+    triples = [(fund_index[row[0]], key_index[row[key_pos]], row[value_pos] or 0.0)
+               for row in rows if row[key_pos] and row[0] in fund_index]
+    if triples:
+        i, j, v = (np.array(t) for t in zip(*triples))
+        # 同一报告期重复披露的股票（如A/H股）累加
+        np.add.at(matrix, (i.astype(np.int64), j.astype(np.int64)), v.astype(np.float64) / 100.0)
+    return matrix, keys
+
+
+def compute_overlap(weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    两两持仓重叠度
+
+    Args:
+        weights: 基金×股票 权重矩阵（小数）
+
+    Returns:
+        (重叠度矩阵 Σ min(w_i, w_j)，共同持股数矩阵)
+    """
+    overlap = np.minimum(weights[:, None, :], weights[None, :, :]).sum(axis=2)
+    held = (weights > 0).astype(np.float64)
+    return overlap, held @ held.T
+
+
+def _portfolio_weights(cursor, portfolio_id: int) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """成分基金及市值权重（优先current_value，否则 份额×最新净值）"""
+    cursor.execute('''
+        SELECT pf.fund_code, pf.fund_name, pf.shares, pf.current_value,
+               (SELECT unit_nav FROM fund_nav n WHERE n.fund_code = pf.fund_code
+                ORDER BY nav_date DESC LIMIT 1) AS latest_nav
+        FROM portfolio_fund pf
+        WHERE pf.portfolio_id = ?
+        ORDER BY pf.fund_code
+    ''', (portfolio_id,))
+    funds = []
+    for row in cursor.fetchall():
+        value = row['current_value']
+        if not value and row['shares'] and row['latest_nav']:
+            value = row['shares'] * row['latest_nav']
+        funds.append({'fund_code': row['fund_code'], 'fund_name': row['fund_name'], 'market_value': value or 0.0})
+    values = np.array([f['market_value'] for f in funds], dtype=np.float64)
+    total = values.sum()
+    return funds, (values / total if total > 0 else values)
+
+
+def _holdings_version(cursor, fund_codes: List[str]) -> tuple:
+    version = []
+    for table in ('fund_stock_holding', 'fund_industry_allocation'):
+        rows = _fetch_in(cursor, f'''
+            SELECT COUNT(*), MAX(update_time) FROM {table} WHERE fund_code IN ({{placeholders}})
+        ''', fund_codes)
+        version.append(tuple(tuple(r) for r in rows))
+    return tuple(version)
+
+
+def _round(value, digits=4):
+    return round(float(value), digits)
+
+
+def get_portfolio_lookthrough(portfolio_id: int, quarter: str = None) -> Dict[str, Any]:
+    """
+    组合穿透分析：个股敞口、行业敞口和成分基金持仓重叠度
+
+    Args:
+        portfolio_id: 组合ID
+        quarter: 目标季度（'YYYYQn' 或原始报告期文本），None表示各基金最新一期
+
+    Returns:
+        {'success': True, 'quarter', 'funds': [...含权重和使用的报告期],
+         'stock_exposure': [{stock_code, stock_name, exposure, fund_count}],
+         'industry_exposure': [{industry_name, exposure}],
+         'overlap': {'fund_codes', 'matrix', 'common_stocks'}, 'concentration': {...}, 'from_cache'}
+        敞口为占组合总市值的百分比（仅覆盖披露的重仓股）
+    """
+    quarter = normalize_quarter(quarter) if quarter else None
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        funds, weights = _portfolio_weights(cursor, portfolio_id)
+        if not funds:
+            return {'success': False, 'error': '组合中没有基金'}
+        codes = [f['fund_code'] for f in funds]
+
+        version = (tuple(round(w, 8) for w in weights), _holdings_version(cursor, codes))
+        key = (portfolio_id, quarter)
+        cached = _lookthrough_cache.get(key)
+        if cached is not None and cached['version'] == version:
+            _lookthrough_cache.move_to_end(key)
+            return {**cached['result'], 'from_cache': True}
+
+        stock_rows, stock_quarters = _latest_per_fund(_fetch_in(cursor, '''
+            SELECT fund_code, report_date, stock_code, stock_name, hold_ratio
+            FROM fund_stock_holding WHERE fund_code IN ({placeholders})
+        ''', codes), quarter)
+        industry_rows, industry_quarters = _latest_per_fund(_fetch_in(cursor, '''
+            SELECT fund_code, report_date, industry_name, allocation_ratio
+            FROM fund_industry_allocation WHERE fund_code IN ({placeholders})
+        ''', codes), quarter)
+
+    stock_w, stock_codes = _weight_matrix(stock_rows, codes, 2, 4)
+    industry_w, industries = _weight_matrix(industry_rows, codes, 2, 3)
+    stock_names = {row[2]: row[3] for row in stock_rows}
+
+    stock_exposure = weights @ stock_w
+    fund_count = (stock_w > 0).sum(axis=0)
+    industry_exposure = weights @ industry_w
+    overlap, common = compute_overlap(stock_w)
+
+    stock_order = np.argsort(-stock_exposure, kind='stable')
+    industry_order = np.argsort(-industry_exposure, kind='stable')
+    total = float(stock_exposure.sum())
+    hhi = float(((stock_exposure / total) ** 2).sum()) if total > 0 else 0.0
+
+    result = {
+        'success': True,
+        'portfolio_id': portfolio_id,
+        'quarter': quarter or max(stock_quarters.values(), default=None),
+        'funds': [{
+            **f,
+            'weight': _round(weights[i] * 100),
+            'holding_quarter': stock_quarters.get(f['fund_code']),
+            'industry_quarter': industry_quarters.get(f['fund_code']),
+            'disclosed_stock_ratio': _round(stock_w[i].sum() * 100),
+        } for i, f in enumerate(funds)],
+        'stock_exposure': [{
+            'stock_code': stock_codes[j],
+            'stock_name': stock_names.get(stock_codes[j]),
+            'exposure': _round(stock_exposure[j] * 100),
+            'fund_count': int(fund_count[j]),
+        } for j in stock_order[:TOP_EXPOSURE_COUNT]],
+        'industry_exposure': [{
+            'industry_name': industries[j],
+            'exposure': _round(industry_exposure[j] * 100),
+        } for j in industry_order],
+        'overlap': {
+            'fund_codes': codes,
+            'matrix': [[_round(v * 100) for v in row] for row in overlap],
+            'common_stocks': common.astype(int).tolist(),
+        },
+        'concentration': {
+            'stock_count': int((stock_exposure > 0).sum()),
+            'disclosed_exposure': _round(total * 100),
+            'top10_exposure': _round(stock_exposure[stock_order[:10]].sum() * 100),
+            'hhi': _round(hhi, 6),
+            'effective_n': _round(1 / hhi, 2) if hhi > 0 else 0,
+        },
+    }
+
+    _lookthrough_cache[key] = {'version': version, 'result': result}
+    while len(_lookthrough_cache) > LOOKTHROUGH_CACHE_SIZE:
+        _lookthrough_cache.popitem(last=False)
+
+    return {**result, 'from_cache': False}
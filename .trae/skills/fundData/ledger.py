@@ -0,0 +1,440 @@
+"""
+交易流水回放模块
+由 portfolio_transaction 按 (交易日期, ID) 顺序回放推导各基金的持仓份额、摊薄成本和现金，
+修改或删除历史交易后只需从最近的检查点重新回放，不再手工修数
+
+回放规则（与 record_buy_transaction / record_sell_transaction / execute_buy_back_transaction 一致）：
+    买入：新份额 = 原份额 + 买入份额，新成本 = (原份额 × 原成本 + 买入金额) / 新份额
+    卖出：新份额 = 原份额 - 卖出份额，新成本 = (原份额 × 原成本 - 卖出金额) / 新份额（不低于0），
+          全部卖出时成本清空；卖出金额计入组合现金
+    捡回：同买入，另从组合现金扣除买入金额
+    可用现金 = 卖出获得金额 - 买入投入金额
+
+检查点（ledger_checkpoint）：
+    - seq=0 为期初基线：交易记录之外的持仓（导入、手工添加），首次回放时生成。持仓从未清仓（回放中
+      份额没有降到0、成本没有触底）时由当前持仓减去全部交易反推；否则清仓前的成本已无法反推，
+      取首笔交易之前最近一期持仓快照（份额，成本按快照净值），没有快照时为空仓
+    - 每回放 LEDGER_CHECKPOINT_INTERVAL 笔交易保存一次状态
+    - 修改日期为D的交易时，删除最后交易日期 >= D 的检查点，从剩下最近的检查点开始回放
+"""
+import sys
+import os
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from fund_cash import refresh_fund_cash
+
+
+# 每回放多少笔交易保存一个检查点
+LEDGER_CHECKPOINT_INTERVAL = 50
+
+# 小于该份额视为清仓
+SHARE_TOLERANCE = 1e-4
+
+# 允许修改的交易字段
+EDITABLE_FIELDS = ('transaction_date', 'shares', 'amount', 'nav', 'fee', 'notes')
+
+
+
+@dataclass
+class LedgerState:
+    """单只基金的回放状态"""
+    shares: float = 0.0
+    buy_nav: float = 0.0
+    available_cash: float = 0.0
+    cash_delta: float = 0.0
+    seq: int = 0
+    transaction_date: str = ''
+    transaction_id: int = 0
+
+    def apply(self, transaction_id: int, transaction_date: str, kind: str, shares: float,
+              amount: float, nav: Optional[float], is_buy_back: bool):
+        """回放一笔交易"""
+        shares = float(shares or 0)
+        amount = float(amount or 0)
+        if kind == 'SELL':
+            new_shares = self.shares - shares
+            if new_shares > SHARE_TOLERANCE:
+                self.buy_nav = max((self.shares * self.buy_nav - amount) / new_shares, 0.0)
+                self.shares = new_shares
+            else:
+                self.shares, self.buy_nav = 0.0, 0.0
+            self.available_cash += amount
+            self.cash_delta += amount
+        else:
+            if self.shares > SHARE_TOLERANCE:
+                new_shares = self.shares + shares
+                self.buy_nav = (self.shares * self.buy_nav + amount) / new_shares
+                self.shares = new_shares
+            else:
+                self.shares = shares
+                self.buy_nav = nav if nav else (amount / shares if shares > 0 else 0.0)
+            self.available_cash -= amount
+            if is_buy_back:
+                self.cash_delta -= amount
+        self.seq += 1
+        self.transaction_date = transaction_date
+        self.transaction_id = transaction_id
+
+
+def _save_checkpoint(cursor, portfolio_id: int, fund_code: str, state: LedgerState):
+    cursor.execute('''
+        INSERT OR REPLACE INTO ledger_checkpoint
+        (portfolio_id, fund_code, seq, transaction_date, transaction_id, shares, buy_nav, available_cash, cash_delta)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (portfolio_id, fund_code, state.seq, state.transaction_date, state.transaction_id,
+          state.shares, state.buy_nav, state.available_cash, state.cash_delta))
+
+
+def _crosses_zero(transactions: List[tuple], opening: LedgerState) -> bool:
+    """
+    从期初状态回放是否经过非线性的情形：卖出后清仓、成本触底（被截为0）、清仓后再买入（成本按净值重置）
+    """
+    state = LedgerState(shares=opening.shares, buy_nav=opening.buy_nav)
+    for kind, shares, amount, nav in transactions:
+        shares, amount = float(shares or 0), float(amount or 0)
+        if kind == 'SELL':
+            if (state.shares - shares <= SHARE_TOLERANCE
+                    or state.shares * state.buy_nav - amount < -1e-9):
+                return True
+        elif state.seq > 0 and state.shares <= SHARE_TOLERANCE:
+            return True
+        state.apply(0, '', kind, shares, amount, nav, False)
+    return False
+
+
+def _snapshot_baseline(cursor, portfolio_id: int, fund_code: str, first_date: Optional[str]) -> LedgerState:
+    """首笔交易之前最近一期持仓快照（成本按快照净值），没有快照时为空仓"""
+    if first_date is None:
+        return LedgerState()
+    cursor.execute('''
+        SELECT shares, nav FROM holding_history
+        WHERE portfolio_id = ? AND fund_code = ? AND record_date < ?
+        ORDER BY record_date DESC LIMIT 1
+    ''', (portfolio_id, fund_code, first_date))
+    row = cursor.fetchone()
+    if row is None or float(row[0] or 0) <= SHARE_TOLERANCE:
+        return LedgerState()
+    return LedgerState(shares=float(row[0]), buy_nav=float(row[1] or 0))
+
+
+def _derive_baseline(cursor, portfolio_id: int, fund_code: str) -> LedgerState:
+    """
+    期初基线
+
+    持仓从未清仓时份额、持仓成本总额对买入/卖出都是线性的，由当前持仓反推：
+    期初份额 = 当前份额 - Σ买入份额 + Σ卖出份额，期初成本总额 = 当前成本总额 - Σ买入金额 + Σ卖出金额；
+    回放中出现清仓、成本触底时反推不成立，改用首笔交易之前的持仓快照
+    """
+    cursor.execute('''
+        SELECT shares, buy_nav FROM portfolio_fund WHERE portfolio_id = ? AND fund_code = ?
+    ''', (portfolio_id, fund_code))
+    row = cursor.fetchone()
+    shares = float(row[0] or 0) if row else 0.0
+    cost = shares * float(row[1] or 0) if row else 0.0
+
+    cursor.execute('''
+        SELECT transaction_date, transaction_type, shares, amount, nav FROM portfolio_transaction
+        WHERE portfolio_id = ? AND fund_code = ?
+        ORDER BY transaction_date, id
+    ''', (portfolio_id, fund_code))
+    rows = cursor.fetchall()
+    first_date = rows[0][0] if rows else None
+    transactions = [row[1:] for row in rows]
+    net_shares = sum(-float(r[1] or 0) if r[0] == 'SELL' else float(r[1] or 0) for r in transactions)
+    net_amount = sum(-float(r[2] or 0) if r[0] == 'SELL' else float(r[2] or 0) for r in transactions)
+
+    opening_shares = shares - net_shares
+    if opening_shares < -SHARE_TOLERANCE:
+        return _snapshot_baseline(cursor, portfolio_id, fund_code, first_date)
+    if opening_shares <= SHARE_TOLERANCE:
+        opening = LedgerState()
+    else:
+        opening = LedgerState(shares=opening_shares, buy_nav=(cost - net_amount) / opening_shares)
+    if opening.buy_nav < 0 or _crosses_zero(transactions, opening):
+        return _snapshot_baseline(cursor, portfolio_id, fund_code, first_date)
+    return opening
+
+
+def _load_checkpoint(cursor, portfolio_id: int, fund_code: str) -> LedgerState:
+    """最近的检查点，没有基线时先生成"""
+    cursor.execute('''
+        SELECT shares, buy_nav, available_cash, cash_delta, seq, transaction_date, transaction_id
+        FROM ledger_checkpoint WHERE portfolio_id = ? AND fund_code = ?
+        ORDER BY seq DESC LIMIT 1
+    ''', (portfolio_id, fund_code))
+    row = cursor.fetchone()
+    if row is None:
+        state = _derive_baseline(cursor, portfolio_id, fund_code)
+        _save_checkpoint(cursor, portfolio_id, fund_code, state)
+        return state
+    return LedgerState(*[row[i] for i in range(7)])
+
+
+def invalidate_checkpoints(cursor, portfolio_id: int, fund_code: str, from_date: str):
+    """删除最后交易日期不早于 from_date 的检查点（基线保留）"""
+    cursor.execute('''
+        DELETE FROM ledger_checkpoint
+        WHERE portfolio_id = ? AND fund_code = ? AND seq > 0 AND transaction_date >= ?
+    ''', (portfolio_id, fund_code, from_date))
+
+
+def replay_fund(cursor, portfolio_id: int, fund_code: str,
+                from_date: str = None) -> Tuple[LedgerState, int, List[Tuple[str, float]]]:
+    """
+    回放一只基金的交易
+
+    Args:
+        from_date: 该日期及之后的交易有变化（None表示检查点都有效）
+
+    Returns:
+        (最终状态, 起点检查点seq, [(交易日期, 交易后份额)] 本次回放的份额轨迹)
+    """
+    if from_date is not None:
+        invalidate_checkpoints(cursor, portfolio_id, fund_code, from_date)
+    state = _load_checkpoint(cursor, portfolio_id, fund_code)
+    start_seq = state.seq
+
+    cursor.execute('''
+        SELECT id, transaction_date, transaction_type, shares, amount, nav, buy_back_of
+        FROM portfolio_transaction
+        WHERE portfolio_id = ? AND fund_code = ?
+          AND (transaction_date > ? OR (transaction_date = ? AND id > ?))
+        ORDER BY transaction_date, id
+    ''', (portfolio_id, fund_code, state.transaction_date, state.transaction_date, state.transaction_id))
+
+    trail = []
+    for tid, date, kind, shares, amount, nav, buy_back_of in cursor.fetchall():
+        state.apply(tid, date, kind, shares, amount, nav, buy_back_of is not None)
+        trail.append((date, state.shares))
+        if state.seq % LEDGER_CHECKPOINT_INTERVAL == 0:
+            _save_checkpoint(cursor, portfolio_id, fund_code, state)
+    return state, start_seq, trail
+
+
+def _fund_name(cursor, fund_code: str) -> Optional[str]:
+    cursor.execute("SELECT fund_name FROM fund_info WHERE fund_code = ?", (fund_code,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _write_holdings(cursor, portfolio_id: int, fund_code: str, state: LedgerState,
+                    trail: List[Tuple[str, float]], from_date: str, start_shares: float):
+    """回放结果写回 portfolio_fund，并校正区间内已有的持仓快照"""
+    if state.shares > SHARE_TOLERANCE:
+        cursor.execute('''
+            UPDATE portfolio_fund SET shares = ?, buy_nav = ?, update_time = CURRENT_TIMESTAMP
+            WHERE portfolio_id = ? AND fund_code = ?
+        ''', (state.shares, state.buy_nav, portfolio_id, fund_code))
+        if cursor.rowcount == 0:
+            cursor.execute('''
+                INSERT INTO portfolio_fund (portfolio_id, fund_code, fund_name, shares, buy_nav, buy_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (portfolio_id, fund_code, _fund_name(cursor, fund_code), state.shares, state.buy_nav,
+                  trail[0][0] if trail else None))
+    else:
+        # 全部卖出，与卖出交易一致删除成分基金记录
+        cursor.execute("DELETE FROM portfolio_fund WHERE portfolio_id = ? AND fund_code = ?",
+                       (portfolio_id, fund_code))
+
+    # 快照份额改为回放得到的当日持仓（全量回放时首笔交易之前的导入快照不动）
+    lower = from_date or (trail[0][0] if trail else None)
+    if lower is None:
+        return
+    cursor.execute('''
+        SELECT record_date FROM holding_history
+        WHERE portfolio_id = ? AND fund_code = ? AND record_date >= ?
+    ''', (portfolio_id, fund_code, lower))
+    updates = []
+    for (record_date,) in cursor.fetchall():
+        shares = start_shares
+        for date, after in trail:
+            if date > record_date:
+                break
+            shares = after
+        updates.append((shares, portfolio_id, fund_code, record_date))
+    cursor.executemany('''
+        UPDATE holding_history SET shares = ? WHERE portfolio_id = ? AND fund_code = ? AND record_date = ?
+    ''', updates)
+
+
+def _rebuild(cursor, portfolio_id: int, fund_code: str, from_date: str,
+             previous: LedgerState) -> Dict[str, Any]:
+    """从 from_date 起重新回放，写回持仓并按现金影响的变化调整组合现金"""
+    cursor.execute('''
+        SELECT shares FROM ledger_checkpoint
+        WHERE portfolio_id = ? AND fund_code = ? AND (seq = 0 OR transaction_date < ?)
+        ORDER BY seq DESC LIMIT 1
+    ''', (portfolio_id, fund_code, from_date))
+    row = cursor.fetchone()
+    state, start_seq, trail = replay_fund(cursor, portfolio_id, fund_code, from_date)
+    refresh_fund_cash(cursor, portfolio_id, fund_code)
+    _write_holdings(cursor, portfolio_id, fund_code, state, trail, from_date, float(row[0]) if row else 0.0)
+
+    cash_change = state.cash_delta - previous.cash_delta
+    if abs(cash_change) > 1e-9:
+        cursor.execute('''
+            UPDATE portfolio SET cash = COALESCE(cash, 0) + ?, update_time = CURRENT_TIMESTAMP WHERE id = ?
+        ''', (cash_change, portfolio_id))
+    return {
+        'fund_code': fund_code,
+        'from_checkpoint': start_seq,
+        'replayed': len(trail),
+        'shares': round(state.shares, 4),
+        'buy_nav': round(state.buy_nav, 4),
+        'available_cash': round(state.available_cash, 2),
+        'cash_change': round(cash_change, 2),
+    }
+
+
+def _load_transaction(cursor, transaction_id: int, portfolio_id: int = None):
+    sql = "SELECT id, portfolio_id, fund_code, transaction_type, transaction_date, buy_back_of FROM portfolio_transaction WHERE id = ?"
+    params = [transaction_id]
+    if portfolio_id is not None:
+        sql += " AND portfolio_id = ?"
+        params.append(portfolio_id)
+    cursor.execute(sql, params)
+    return cursor.fetchone()
+
+
+def update_transaction(transaction_id: int, portfolio_id: int = None, **changes) -> Dict[str, Any]:
+    """
+    修改历史交易并从最近的检查点重新回放
+
+    Args:
+        transaction_id: 交易记录ID
+        portfolio_id: 组合ID（可选，用于校验交易归属）
+        **changes: 要修改的字段（transaction_date, shares, amount, nav, fee, notes）
+
+    Returns:
+        {'success': True, 'transaction_id', 'from_checkpoint', 'replayed', 'shares', 'buy_nav',
+         'available_cash', 'cash_change'}
+    """
+    changes = {k: v for k, v in changes.items() if v is not None}
+    unknown = set(changes) - set(EDITABLE_FIELDS)
+    if unknown:
+        return {'success': False, 'error': f"不支持修改字段: {', '.join(sorted(unknown))}"}
+    if not changes:
+        return {'success': False, 'error': '没有要修改的字段'}
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        transaction = _load_transaction(cursor, transaction_id, portfolio_id)
+        if not transaction:
+            return {'success': False, 'error': '交易记录不存在'}
+        _, pid, fund_code, _, old_date, _ = transaction
+
+        # 修改前的状态（同时保证期初基线按修改前的交易反推）
+        previous, _, _ = replay_fund(cursor, pid, fund_code)
+
+        assignments = ', '.join(f"{field} = ?" for field in changes)
+        cursor.execute(f"UPDATE portfolio_transaction SET {assignments} WHERE id = ?",
+                       list(changes.values()) + [transaction_id])
+
+        from_date = min(old_date, changes.get('transaction_date', old_date))
+        result = _rebuild(cursor, pid, fund_code, from_date, previous)
+        conn.commit()
+
+    return {'success': True, 'transaction_id': transaction_id, **result}
+
+
+def delete_transaction(transaction_id: int, portfolio_id: int = None) -> Dict[str, Any]:
+    """
+    删除历史交易并重新回放；删除的是波段捡回买入时，对应卖出记录恢复为未回收
+
+    Returns:
+        同 update_transaction
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        transaction = _load_transaction(cursor, transaction_id, portfolio_id)
+        if not transaction:
+            return {'success': False, 'error': '交易记录不存在'}
+        _, pid, fund_code, _, date, buy_back_of = transaction
+
+        previous, _, _ = replay_fund(cursor, pid, fund_code)
+        cursor.execute("DELETE FROM portfolio_transaction WHERE id = ?", (transaction_id,))
+        if buy_back_of is not None:
+            cursor.execute("UPDATE portfolio_transaction SET is_recovered = 0 WHERE id = ?", (buy_back_of,))
+
+        result = _rebuild(cursor, pid, fund_code, date, previous)
+        conn.commit()
+
+    return {'success': True, 'transaction_id': transaction_id, **result}
+
+
+def get_ledger_state(portfolio_id: int, fund_code: str = None) -> Dict[str, Any]:
+    """
+    由交易流水回放得到的持仓状态（不修改持仓）
+
+    Returns:
+        {'success': True, 'portfolio_id', 'funds': [{'fund_code', 'shares', 'buy_nav', 'available_cash',
+         'cash_delta', 'transaction_count'}]}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute("SELECT id FROM portfolio WHERE id = ?", (portfolio_id,))
+        if not cursor.fetchone():
+            return {'success': False, 'error': '组合不存在'}
+
+        if fund_code:
+            codes = [fund_code]
+        else:
+            cursor.execute('''
+                SELECT fund_code FROM portfolio_transaction WHERE portfolio_id = ?
+                UNION SELECT fund_code FROM portfolio_fund WHERE portfolio_id = ?
+                ORDER BY fund_code
+            ''', (portfolio_id, portfolio_id))
+            codes = [row[0] for row in cursor.fetchall()]
+
+        funds = []
+        for code in codes:
+            state, _, _ = replay_fund(cursor, portfolio_id, code)
+            item = asdict(state)
+            funds.append({
+                'fund_code': code,
+                'shares': round(item['shares'], 4),
+                'buy_nav': round(item['buy_nav'], 4),
+                'available_cash': round(item['available_cash'], 2),
+                'cash_delta': round(item['cash_delta'], 2),
+                'transaction_count': item['seq'],
+            })
+        # 生成的基线和检查点一并保存
+        conn.commit()
+
+    return {'success': True, 'portfolio_id': portfolio_id, 'funds': funds}
+
+
+def rebuild_portfolio_ledger(portfolio_id: int) -> Dict[str, Any]:
+    """
+    丢弃检查点（基线保留），按全部交易重新回放组合内所有基金并写回持仓和持仓快照；
+    组合现金按回放前后现金影响的差额调整
+
+    Returns:
+        {'success': True, 'portfolio_id', 'funds': [每只基金的回放结果]}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute("SELECT id FROM portfolio WHERE id = ?", (portfolio_id,))
+        if not cursor.fetchone():
+            return {'success': False, 'error': '组合不存在'}
+
+        cursor.execute('''
+            SELECT DISTINCT fund_code FROM portfolio_transaction WHERE portfolio_id = ? ORDER BY fund_code
+        ''', (portfolio_id,))
+        codes = [row[0] for row in cursor.fetchall()]
+
+        funds = []
+        for code in codes:
+            previous, _, _ = replay_fund(cursor, portfolio_id, code)
+            funds.append(_rebuild(cursor, portfolio_id, code, '', previous))
+        conn.commit()
+
+    return {'success': True, 'portfolio_id': portfolio_id, 'funds': funds}
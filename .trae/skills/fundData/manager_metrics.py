@@ -0,0 +1,390 @@
+"""
+基金经理批量评估模块
+对 fund_manager 中全部基金经理的现任基金，在净值面板上一次性计算任内表现、回撤和稳定性，
+按经理汇总后写入 manager_metrics 表，排名查询直接读表，不在请求时计算
+
+口径：
+    - fund_manager 只有累计从业天数（tenure_days，相对同步时间），没有逐只基金的任职日期，
+      评估区间取 最近N年 与 从业开始日期 的较晚者，到最新净值日为止
+    - 单只基金的收益、年化、波动率、夏普、最大回撤与 risk_metrics_calculator 的面板计算口径一致
+    - 稳定性评分与 fund_analyzer.ManagerEvaluator.calculate_consistency_score 一致：
+      正收益日占比×0.4 + (1 - 63日滚动胜率的标准差)×0.3 + min(1/(63日滚动波动率的标准差)/10, 1)×0.3
+    - 经理汇总为各现任基金等权平均，综合评分为年化收益、夏普、最大回撤、稳定性
+      四项横截面百分位的均值（0~100）
+"""
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import load_nav_panel, SQL_IN_BATCH_SIZE
+from risk_metrics_calculator import calculate_panel_risk_metrics
+from rolling_analytics import pack_columns
+
+
+# 稳定性评分的滚动窗口（交易日）
+CONSISTENCY_WINDOW = 63
+
+# 排名可用的排序字段
+RANKING_FIELDS = [
+    'composite_score', 'consistency_score', 'avg_annual_return', 'avg_period_return',
+    'avg_sharpe', 'avg_max_drawdown', 'worst_max_drawdown', 'avg_volatility',
+    'positive_fund_ratio', 'career_years', 'fund_count', 'total_scale'
+]
+
+SAVE_MANAGER_METRICS_SQL = '''
+    INSERT OR REPLACE INTO manager_metrics
+    (manager_name, company_name, fund_count, evaluated_count, fund_codes, career_years,
+     window_start, window_end, avg_period_return, best_period_return, worst_period_return,
+     avg_annual_return, avg_volatility, avg_sharpe, avg_max_drawdown, worst_max_drawdown,
+     positive_fund_ratio, consistency_score, consistency_grade, composite_score, rank_overall,
+     total_scale, update_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+'''
+
+
+def consistency_grade(score: float) -> Optional[str]:
+    """稳定性评级，与 ManagerEvaluator 一致"""
+    if score is None or np.isnan(score):
+        return None
+    return 'A' if score >= 80 else 'B' if score >= 60 else 'C' if score >= 40 else 'D'
+
+
+def _nan_std(values: np.ndarray) -> np.ndarray:
+    """按列的样本标准差（忽略NaN，有效值少于2个时为NaN）"""
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, values, 0).sum(axis=0) / count
+        var = np.where(valid, (values - mean) ** 2, 0).sum(axis=0) / (count - 1)
+    var[count < 2] = np.nan
+    return np.sqrt(var)
+
+
+def calculate_panel_consistency(values: np.ndarray, window: int = CONSISTENCY_WINDOW) -> Dict[str, np.ndarray]:
+    """
+    在净值面板上对所有列同时计算稳定性评分
+
+    Args:
+        values: 净值矩阵 (日期 × 基金)，缺失为NaN
+        window: 滚动窗口（日收益率个数）
+
+    Returns:
+        各项数组（长度为基金数）：consistency_score, positive_ratio, win_stability, vol_stability
+
+    实现：
+        各列有效净值左对齐后计算日收益率（等价于逐只 pct_change().dropna()），
+        滚动胜率和滚动标准差用前缀和相减得到，不逐只调用pandas rolling
+    """
+    n_funds = values.shape[1]
+    packed, _, counts = pack_columns(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = packed[1:] / packed[:-1] - 1
+    ret_valid = ~np.isnan(returns)
+    n_returns = ret_valid.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        positive_ratio = (returns > 0).sum(axis=0) / n_returns
+
+    win_std = np.full(n_funds, np.nan)
+    vol_std = np.full(n_funds, np.nan)
+    if returns.shape[0] >= window:
+        r = np.where(ret_valid, returns, 0.0)
+        col_mean = r.sum(axis=0) / np.maximum(n_returns, 1)
+        centered = np.where(ret_valid, r - col_mean, 0.0)
+        zero = np.zeros((1, n_funds))
+        c_pos = np.concatenate([zero, np.cumsum(returns > 0, axis=0)])
+        c1 = np.concatenate([zero, np.cumsum(centered, axis=0)])
+        c2 = np.concatenate([zero, np.cumsum(centered * centered, axis=0)])
+
+        # 窗口 returns[t-window+1 .. t]，左对齐后窗口完整即窗口末端有效
+        full = ret_valid[window - 1:]
+        rolling_win = np.where(full, (c_pos[window:] - c_pos[:-window]) / window, np.nan)
+        s1 = c1[window:] - c1[:-window]
+        s2 = c2[window:] - c2[:-window]
+        rolling_vol = np.where(full, np.sqrt(np.maximum((s2 - s1 * s1 / window) / (window - 1), 0.0)), np.nan)
+
+        win_std = _nan_std(rolling_win)
+        vol_std = _nan_std(rolling_vol)
+
+    win_stability = np.where(np.isnan(win_std), 0.0, 1 - win_std)
+    vol_stability = np.where(np.isnan(vol_std), 0.0, 1 / (vol_std + 1e-6))
+    score = (positive_ratio * 0.4 + win_stability * 0.3 + np.minimum(vol_stability / 10, 1) * 0.3) * 100
+    score[n_returns < 1] = np.nan
+
+    return {
+        'consistency_score': score,
+        'positive_ratio': positive_ratio,
+        'win_stability': win_stability,
+        'vol_stability': vol_stability,
+    }
+
+
+def _group_reduce(values: np.ndarray, groups: np.ndarray, n_groups: int, how: str) -> np.ndarray:
+    """按组聚合（忽略NaN），how 为 'mean' / 'max' / 'min'，组内无有效值时为NaN"""
+    ok = ~np.isnan(values)
+    g, v = groups[ok], values[ok]
+    if how == 'mean':
+        counts = np.bincount(g, minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = np.bincount(g, weights=v, minlength=n_groups) / counts
+        return out
+    out = np.full(n_groups, -np.inf if how == 'max' else np.inf)
+    (np.maximum if how == 'max' else np.minimum).at(out, g, v)
+    out[np.isinf(out)] = np.nan
+    return out
+
+
+def _percentile_rank(values: np.ndarray, higher_is_better: bool = True) -> np.ndarray:
+    """横截面百分位（0~1，最好为1），NaN保持NaN"""
+    out = np.full(values.size, np.nan)
+    ok = np.nonzero(~np.isnan(values))[0]
+    if ok.size == 0:
+        return out
+    x = values[ok] if higher_is_better else -values[ok]
+    order = np.argsort(x, kind='stable')
+    ranks = np.empty(ok.size)
+    ranks[order] = np.arange(ok.size)
+    out[ok] = ranks / max(ok.size - 1, 1) if ok.size > 1 else 1.0
+    return out
+
+
+def _round(value, digits: int = 4) -> Optional[float]:
+    if value is None or np.isnan(value):
+        return None
+    return round(float(value), digits)
+
+
+def _load_manager_funds(cursor) -> List[tuple]:
+    cursor.execute('''
+        SELECT manager_name, COALESCE(company_name, ''), fund_code, tenure_days, total_scale, update_time
+        FROM fund_manager
+        WHERE fund_code IS NOT NULL AND fund_code != ''
+        ORDER BY manager_name, company_name, fund_code
+    ''')
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def calculate_manager_metrics(years: float = 3,
+                              risk_free_rate: float = 0.025,
+                              chunk_size: int = 2000,
+                              save: bool = True) -> Dict[str, Any]:
+    """
+    批量计算全部基金经理的汇总指标
+
+    Args:
+        years: 评估区间（最近N年，不早于经理从业开始日期）
+        risk_free_rate: 无风险利率
+        chunk_size: 每块（经理, 基金）对数，控制峰值内存
+        save: 是否写入 manager_metrics（全量替换）
+
+    Returns:
+        计算汇总（经理数、有净值的基金数、评估区间、耗时），save=False时附带 records
+    """
+    start_time = time.time()
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        pairs = _load_manager_funds(cursor)
+        if not pairs:
+            return {'success': False, 'error': '没有基金经理数据，请先同步基金经理'}
+
+        fund_codes = sorted({p[2] for p in pairs})
+        end_date = None
+        cursor.row_factory = None
+        for i in range(0, len(fund_codes), SQL_IN_BATCH_SIZE):
+            batch = fund_codes[i:i + SQL_IN_BATCH_SIZE]
+            cursor.execute(f"SELECT MAX(nav_date) FROM fund_nav WHERE fund_code IN ({','.join('?' * len(batch))})", batch)
+            latest = cursor.fetchone()[0]
+            if latest and (end_date is None or latest > end_date):
+                end_date = latest
+        if end_date is None:
+            return {'success': False, 'error': '经理现任基金没有净值数据'}
+
+        window_start = (datetime.strptime(end_date[:10], '%Y-%m-%d') - timedelta(days=int(years * 365.25))).strftime('%Y-%m-%d')
+        panel = load_nav_panel(fund_codes, start_date=window_start, end_date=end_date, conn=conn)
+
+    dates = np.array(panel.dates, dtype=str)
+    manager_keys = list(dict.fromkeys((p[0], p[1]) for p in pairs))
+    manager_index = {key: i for i, key in enumerate(manager_keys)}
+    n_managers = len(manager_keys)
+
+    groups = np.array([manager_index[(p[0], p[1])] for p in pairs], dtype=np.int64)
+    cols = np.array([panel.code_index[p[2]] for p in pairs], dtype=np.int64)
+
+    # 从业开始日期：同步日期 - 累计从业天数
+    career_days = np.array([p[3] or 0 for p in pairs], dtype=np.float64)
+    starts = []
+    for p in pairs:
+        synced = str(p[5])[:10] if p[5] else end_date[:10]
+        career_start = (datetime.strptime(synced, '%Y-%m-%d') - timedelta(days=int(p[3] or 0))).strftime('%Y-%m-%d')
+        starts.append(max(career_start, window_start) if p[3] else window_start)
+    starts = np.array(starts, dtype=str)
+
+    metric_names = ['period_return', 'annual_return', 'annual_volatility', 'sharpe_ratio', 'max_drawdown',
+                    'consistency_score']
+    pair_metrics = {name: np.full(len(pairs), np.nan) for name in metric_names}
+    for lo in range(0, len(pairs), chunk_size):
+        block = panel.values[:, cols[lo:lo + chunk_size]].copy()
+        block[dates[:, None] < starts[None, lo:lo + chunk_size]] = np.nan
+        enough = (~np.isnan(block)).sum(axis=0) >= 20
+        risk = calculate_panel_risk_metrics(panel.dates, block, '成立以来', risk_free_rate)
+        consistency = calculate_panel_consistency(block)
+        for name in metric_names:
+            source = consistency if name == 'consistency_score' else risk
+            pair_metrics[name][lo:lo + chunk_size] = np.where(enough, source[name], np.nan)
+
+    evaluated = ~np.isnan(pair_metrics['period_return'])
+    agg = {
+        'avg_period_return': _group_reduce(pair_metrics['period_return'], groups, n_managers, 'mean'),
+        'best_period_return': _group_reduce(pair_metrics['period_return'], groups, n_managers, 'max'),
+        'worst_period_return': _group_reduce(pair_metrics['period_return'], groups, n_managers, 'min'),
+        'avg_annual_return': _group_reduce(pair_metrics['annual_return'], groups, n_managers, 'mean'),
+        'avg_volatility': _group_reduce(pair_metrics['annual_volatility'], groups, n_managers, 'mean'),
+        'avg_sharpe': _group_reduce(pair_metrics['sharpe_ratio'], groups, n_managers, 'mean'),
+        'avg_max_drawdown': _group_reduce(pair_metrics['max_drawdown'], groups, n_managers, 'mean'),
+        'worst_max_drawdown': _group_reduce(pair_metrics['max_drawdown'], groups, n_managers, 'max'),
+        'consistency_score': _group_reduce(pair_metrics['consistency_score'], groups, n_managers, 'mean'),
+    }
+    fund_count = np.bincount(groups, minlength=n_managers)
+    evaluated_count = np.bincount(groups[evaluated], minlength=n_managers)
+    positive = np.bincount(groups[evaluated & (pair_metrics['period_return'] > 0)], minlength=n_managers)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        positive_ratio = np.where(evaluated_count > 0, positive / evaluated_count * 100, np.nan)
+    career_years = _group_reduce(career_days, groups, n_managers, 'max') / 365.25
+
+    ranks = np.vstack([
+        _percentile_rank(agg['avg_annual_return']),
+        _percentile_rank(agg['avg_sharpe']),
+        _percentile_rank(agg['avg_max_drawdown'], higher_is_better=False),
+        _percentile_rank(agg['consistency_score']),
+    ])
+    rank_count = (~np.isnan(ranks)).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        composite = np.where(rank_count > 0, np.nansum(ranks, axis=0) / rank_count * 100, np.nan)
+    composite[evaluated_count == 0] = np.nan
+    order = np.argsort(np.where(np.isnan(composite), np.inf, -composite), kind='stable')
+    rank_overall = np.empty(n_managers, dtype=np.int64)
+    rank_overall[order] = np.arange(1, n_managers + 1)
+
+    manager_funds: Dict[int, List[str]] = {}
+    manager_scale: Dict[int, float] = {}
+    for g, p in zip(groups, pairs):
+        manager_funds.setdefault(int(g), []).append(p[2])
+        manager_scale[int(g)] = max(manager_scale.get(int(g), 0.0), float(p[4] or 0.0))
+
+    records = []
+    for i, (name, company) in enumerate(manager_keys):
+        has_rank = not np.isnan(composite[i])
+        records.append((
+            name, company, int(fund_count[i]), int(evaluated_count[i]), ','.join(manager_funds[i]),
+            _round(career_years[i], 2), window_start, end_date,
+            _round(agg['avg_period_return'][i]), _round(agg['best_period_return'][i]),
+            _round(agg['worst_period_return'][i]), _round(agg['avg_annual_return'][i]),
+            _round(agg['avg_volatility'][i]), _round(agg['avg_sharpe'][i]),
+            _round(agg['avg_max_drawdown'][i]), _round(agg['worst_max_drawdown'][i]),
+            _round(positive_ratio[i], 2), _round(agg['consistency_score'][i], 2),
+            consistency_grade(agg['consistency_score'][i]),
+            _round(composite[i], 2), int(rank_overall[i]) if has_rank else None,
+            manager_scale[i],
+        ))
+
+    if save:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM manager_metrics")
+            cursor.executemany(SAVE_MANAGER_METRICS_SQL, records)
+            conn.commit()
+
+    elapsed = time.time() - start_time
+    print(f"[ManagerMetrics] {n_managers}位基金经理, {len(fund_codes)}只基金, 耗时{elapsed:.2f}s")
+
+    return {
+        'success': True,
+        'manager_count': n_managers,
+        'fund_count': len(fund_codes),
+        'evaluated_manager_count': int((evaluated_count > 0).sum()),
+        'window_start': window_start,
+        'window_end': end_date,
+        'saved': save,
+        'elapsed_seconds': round(elapsed, 3),
+        'records': None if save else records
+    }
+
+
+def get_manager_ranking(sort_by: str = 'composite_score',
+                        ascending: bool = False,
+                        company: str = None,
+                        keyword: str = None,
+                        min_funds: int = 1,
+                        min_career_years: float = None,
+                        page: int = 1,
+                        page_size: int = 20) -> Dict[str, Any]:
+    """
+    基金经理排名（读取 manager_metrics，不做计算）
+
+    Args:
+        sort_by: 排序字段，见 RANKING_FIELDS
+        ascending: 是否升序（缺失值始终排在最后）
+        company: 基金公司（模糊匹配）
+        keyword: 经理姓名（模糊匹配）
+        min_funds: 最少有净值评估的现任基金数
+        min_career_years: 最短从业年限
+        page: 页码（从1开始）
+        page_size: 每页条数
+
+    Returns:
+        {'success': True, 'total', 'page', 'page_size', 'items': [...], 'window_start', 'window_end'}
+    """
+    if sort_by not in RANKING_FIELDS:
+        return {'success': False, 'error': f'不支持的排序字段: {sort_by}'}
+
+    conditions = ['evaluated_count >= ?']
+    params: List[Any] = [min_funds]
+    if company:
+        conditions.append('company_name LIKE ?')
+        params.append(f'%{company}%')
+    if keyword:
+        conditions.append('manager_name LIKE ?')
+        params.append(f'%{keyword}%')
+    if min_career_years is not None:
+        conditions.append('career_years >= ?')
+        params.append(min_career_years)
+    where = ' AND '.join(conditions)
+    direction = 'ASC' if ascending else 'DESC'
+    page = max(page, 1)
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM manager_metrics WHERE {where}", params)
+        total = cursor.fetchone()[0]
+        cursor.execute(f'''
+            SELECT * FROM manager_metrics WHERE {where}
+            ORDER BY ({sort_by} IS NULL), {sort_by} {direction}, manager_name
+            LIMIT ? OFFSET ?
+        ''', params + [page_size, (page - 1) * page_size])
+        items = []
+        for row in cursor.fetchall():
+            item = dict(row)
+            item['fund_codes'] = item['fund_codes'].split(',') if item['fund_codes'] else []
+            items.append(item)
+        cursor.execute("SELECT MIN(window_start), MAX(window_end), MAX(update_time) FROM manager_metrics")
+        window = cursor.fetchone()
+
+    return {
+        'success': True,
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'sort_by': sort_by,
+        'items': items,
+        'window_start': window[0],
+        'window_end': window[1],
+        'update_time': window[2]
+    }
@@ -0,0 +1,294 @@
+"""
+市场阶段识别模块
+根据本地 index_price 中的沪深300日线，用涨跌幅拐点规则划分牛市/熊市/震荡市，
+阶段日历写入 market_phase_record，并在内存中维护按开始日期排序的区间索引，供任意日期的阶段查询
+
+识别规则：
+    1. 拐点：自最近低点上涨达到 SWING_THRESHOLD（默认20%）确认低点，自最近高点回撤达到阈值确认高点，
+       高低点交替出现（单次遍历）
+    2. 低点 -> 高点 为牛市，高点 -> 低点 为熊市，阶段从拐点当日开始（confirmed_date 记录确认日）
+    3. 持续 MIN_SIDEWAYS_DAYS 天以上、年化涨跌幅绝对值低于 SIDEWAYS_ANNUAL_RETURN 的阶段改记为震荡市，
+       相邻同名阶段合并
+
+阶段日历为空（尚未同步指数行情）时，使用 DEFAULT_PHASE_RANGES 的人工划分
+"""
+import sys
+import os
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+
+
+# 识别阶段使用的指数（沪深300）
+PHASE_INDEX_CODE = '000300'
+
+BULL = '牛市'
+BEAR = '熊市'
+SIDEWAYS = '震荡市'
+
+# 确认拐点的涨跌幅
+SWING_THRESHOLD = 0.20
+
+# 震荡市：阶段年化涨跌幅绝对值上限及最短持续天数
+SIDEWAYS_ANNUAL_RETURN = 0.10
+MIN_SIDEWAYS_DAYS = 180
+
+# 识别至少需要的交易日数
+MIN_INDEX_DAYS = 250
+
+# 日历为空时的人工划分（月份闭区间）
+DEFAULT_PHASE_RANGES = {
+    "牛市尾声": ("2021-01", "2021-02"),
+    "熊市": ("2021-03", "2023-12"),
+    "牛市": ("2024-01", "2025-12")
+}
+
+DEFAULT_CURRENT_PHASE = "牛市"
+
+# 自动识别写入的记录来源前缀
+AUTO_SOURCE_PREFIX = 'auto:'
+
+
+@dataclass
+class PhaseCalendar:
+    starts: np.ndarray                    # 各阶段开始日期（datetime64[D]，升序）
+    ends: np.ndarray                      # 各阶段结束日期（NaT表示至今）
+    names: List[str]                      # 阶段名称
+    current: Optional[str] = None         # 当前阶段
+    updated_at: Optional[str] = None      # 日历写入时间（None表示人工默认划分）
+
+    @classmethod
+    def from_ranges(cls, ranges: Dict[str, tuple], current: str = None) -> 'PhaseCalendar':
+        """由 {阶段名: (开始月份, 结束月份)} 构造"""
+        items = sorted(ranges.items(), key=lambda item: item[1][0])
+        starts = np.array([start for _, (start, _) in items], dtype='datetime64[M]').astype('datetime64[D]')
+        ends = (np.array([end for _, (_, end) in items], dtype='datetime64[M]') + 1).astype('datetime64[D]') - 1
+        return cls(starts, ends, [name for name, _ in items], current)
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self.names) == 0
+
+    def phases_for(self, dates: Sequence[str]) -> np.ndarray:
+        """批量查询日期所处阶段，不在任何阶段内时为空串"""
+        days = np.array(dates, dtype='datetime64[D]')
+        result = np.full(days.size, '', dtype=object)
+        if self.is_empty or days.size == 0:
+            return result
+        idx = np.searchsorted(self.starts, days, side='right') - 1
+        inside = idx >= 0
+        safe = np.where(inside, idx, 0)
+        ends = self.ends[safe]
+        inside &= np.isnat(ends) | (days <= ends)
+        names = np.array(self.names, dtype=object)
+        result[inside] = names[safe[inside]]
+        return result
+
+    def phase_at(self, date: str) -> Optional[str]:
+        """查询单个日期所处阶段"""
+        return self.phases_for([date])[0] or None
+
+    def month_phases(self, months: Sequence[str]) -> np.ndarray:
+        """月份（'YYYY-MM'）按月中（15日）所处阶段归类"""
+        return self.phases_for([f"{str(m)[:7]}-15" for m in months])
+
+    def span(self, name: str) -> tuple:
+        """某阶段最近一段的 (开始日期, 结束日期)，结束日期为None表示至今"""
+        for i in range(len(self.names) - 1, -1, -1):
+            if self.names[i] == name:
+                end = None if np.isnat(self.ends[i]) else str(self.ends[i])
+                return str(self.starts[i]), end
+        return None, None
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                'phase_name': name,
+                'start_date': str(self.starts[i]),
+                'end_date': None if np.isnat(self.ends[i]) else str(self.ends[i]),
+            }
+            for i, name in enumerate(self.names)
+        ]
+
+
+def detect_turning_points(prices: np.ndarray, threshold: float = SWING_THRESHOLD) -> List[tuple]:
+    """
+    识别交替出现的高低点
+
+    Returns:
+        [(拐点下标, 'peak' / 'trough', 确认下标)]，按时间升序
+    """
+    points = []
+    n = prices.size
+    if n == 0:
+        return points
+    direction = 0          # 1: 上涨段（跟踪高点），-1: 下跌段（跟踪低点），0: 未定
+    high = low = 0
+    for i in range(1, n):
+        p = prices[i]
+        if direction >= 0:
+            if p > prices[high]:
+                high = i
+            if p <= prices[high] * (1 - threshold):
+                points.append((high, 'peak', i))
+                direction, low = -1, i
+                continue
+        if direction <= 0:
+            if p < prices[low]:
+                low = i
+            if p >= prices[low] * (1 + threshold):
+                points.append((low, 'trough', i))
+                direction, high = 1, i
+    return points
+
+
+def build_phase_segments(dates: List[str], prices: np.ndarray,
+                         threshold: float = SWING_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    由指数日线划分阶段
+
+    Returns:
+        [{'phase_name', 'start', 'end', 'confirmed'}]（下标），相邻同名阶段已合并
+    """
+    n = prices.size
+    points = detect_turning_points(prices, threshold)
+    days = np.array(dates, dtype='datetime64[D]')
+
+    bounds = [(0, None, 0)] + points
+    segments = []
+    for k, (start, kind, confirmed) in enumerate(bounds):
+        end = bounds[k + 1][0] - 1 if k + 1 < len(bounds) else n - 1
+        if end <= start:
+            continue
+        if kind is None:
+            # 首段方向由第一个拐点决定；没有拐点时按整体涨跌
+            rising = points[0][1] == 'peak' if points else prices[-1] >= prices[0]
+        else:
+            rising = kind == 'trough'
+        name = BULL if rising else BEAR
+
+        span_days = int((days[end] - days[start]).astype(np.int64))
+        if span_days >= MIN_SIDEWAYS_DAYS:
+            annual = (prices[end] / prices[start]) ** (365.0 / span_days) - 1
+            if abs(annual) < SIDEWAYS_ANNUAL_RETURN:
+                name = SIDEWAYS
+
+        if segments and segments[-1]['phase_name'] == name:
+            segments[-1]['end'] = end
+        else:
+            segments.append({'phase_name': name, 'start': start, 'end': end, 'confirmed': confirmed})
+    return segments
+
+
+def refresh_phase_calendar(index_code: str = PHASE_INDEX_CODE,
+                           threshold: float = SWING_THRESHOLD) -> Dict[str, Any]:
+    """
+    重新识别市场阶段并写入 market_phase_record
+
+    只覆盖自动识别的记录（data_source 以 AUTO_SOURCE_PREFIX 开头），人工录入的记录保留
+
+    Returns:
+        {'success': True, 'index_code', 'current_phase', 'phases': [...]}
+    """
+    from benchmark_regression import load_index_prices
+    from va_return_cache import invalidate_returns
+
+    with get_db_connection() as conn:
+        dates, prices = load_index_prices(index_code, conn=conn)
+        if dates.size < MIN_INDEX_DAYS:
+            return {'success': False, 'error': f'指数{index_code}本地行情不足{MIN_INDEX_DAYS}个交易日'}
+
+        dates = [str(d) for d in dates]
+        segments = build_phase_segments(dates, np.asarray(prices, dtype=np.float64), threshold)
+        source = f"{AUTO_SOURCE_PREFIX}{index_code}"
+        rows = []
+        for k, seg in enumerate(segments):
+            is_last = k == len(segments) - 1
+            rows.append((seg['phase_name'], dates[seg['start']],
+                         None if is_last else dates[seg['end']],
+                         1 if is_last else 0, dates[seg['confirmed']], source))
+
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM market_phase_record WHERE data_source LIKE ?', (AUTO_SOURCE_PREFIX + '%',))
+        # 与人工记录的阶段和开始日期相同时以自动识别结果为准
+        cursor.executemany('''
+            INSERT OR REPLACE INTO market_phase_record
+            (phase_name, start_date, end_date, is_current, confirmed_date, data_source, update_time)
+            VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+        ''', rows)
+        # 按旧阶段划分计算的平均月收益率全部失效
+        invalidate_returns(conn=conn)
+        conn.commit()
+
+    _calendar_cache.clear()
+    return {
+        'success': True,
+        'index_code': index_code,
+        'current_phase': rows[-1][0] if rows else None,
+        'phases': [
+            {'phase_name': r[0], 'start_date': r[1], 'end_date': r[2], 'confirmed_date': r[4]}
+            for r in rows
+        ]
+    }
+
+
+# 进程内阶段日历缓存：{'version': (记录数, 最大更新时间), 'calendar': PhaseCalendar}
+_calendar_cache = {}
+
+
+def get_phase_calendar(conn=None) -> PhaseCalendar:
+    """
+    获取阶段日历（按 market_phase_record 的记录数和更新时间判断是否需要重新加载）
+
+    自动识别的记录为空时返回 DEFAULT_PHASE_RANGES 构造的默认日历
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return get_phase_calendar(new_conn)
+
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COUNT(*) AS cnt, MAX(update_time) AS updated FROM market_phase_record
+        WHERE data_source LIKE ?
+    ''', (AUTO_SOURCE_PREFIX + '%',))
+    row = cursor.fetchone()
+    version = (row['cnt'], row['updated'])
+    if _calendar_cache.get('version') == version:
+        return _calendar_cache['calendar']
+
+    if not row['cnt']:
+        calendar = PhaseCalendar.from_ranges(DEFAULT_PHASE_RANGES, DEFAULT_CURRENT_PHASE)
+    else:
+        cursor.execute('''
+            SELECT phase_name, start_date, end_date, is_current FROM market_phase_record
+            WHERE data_source LIKE ?
+            ORDER BY start_date
+        ''', (AUTO_SOURCE_PREFIX + '%',))
+        records = cursor.fetchall()
+        current = next((r['phase_name'] for r in records if r['is_current']), records[-1]['phase_name'])
+        calendar = PhaseCalendar(
+            starts=np.array([r['start_date'] for r in records], dtype='datetime64[D]'),
+            ends=np.array([r['end_date'] or 'NaT' for r in records], dtype='datetime64[D]'),
+            names=[r['phase_name'] for r in records],
+            current=current,
+            updated_at=row['updated'],
+        )
+
+    _calendar_cache['version'] = version
+    _calendar_cache['calendar'] = calendar
+    return calendar
+
+
+def get_current_phase() -> str:
+    """当前市场阶段"""
+    return get_phase_calendar().current or DEFAULT_CURRENT_PHASE
+
+
+def get_phase_at(date: str) -> Optional[str]:
+    """指定日期所处的市场阶段"""
+    return get_phase_calendar().phase_at(date)
@@ -0,0 +1,196 @@
+"""
+基金月收益率模块
+由 fund_nav 按月汇总的月收益率（月末净值 / 月初净值 - 1，%）维护在 fund_monthly_return 表中，
+供市值定投按市场阶段统计平均月收益率，不再每次读取日净值重算
+
+增量维护：
+    每个月份记录该月净值的最大 update_time（nav_update_time）。更新时只找出
+    fund_nav 中 update_time 晚于该基金已处理最大 nav_update_time 的月份（新增净值、历史修订），
+    重新计算这些月份，其余月份不动。净值同步按 syncers.group_syncers.SAVE_FUND_NAV_SQL 写入，
+    数值未变的净值不改写 update_time，重复同步全量历史不会触发重算
+
+阶段统计：
+    月份按阶段日历（market_phase）的月中日期归类，平均值和标准差（样本标准差，与 pandas 一致）
+    用 NumPy 分组求和一次算出
+"""
+import sys
+import os
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import fetch_by_codes
+
+
+def _month_bounds(dates: List[str], navs: np.ndarray, update_times: List[str]) -> Dict[str, tuple]:
+    """按月汇总：{月份: (首日, 首日净值, 末日, 末日净值, 净值条数, 最大更新时间)}"""
+    months = np.array([d[:7] for d in dates], dtype=str)
+    labels, first, counts = np.unique(months, return_index=True, return_counts=True)
+    last = first + counts - 1
+    result = {}
+    for k, month in enumerate(labels):
+        lo, hi = first[k], last[k]
+        result[month] = (dates[lo], float(navs[lo]), dates[hi], float(navs[hi]), int(counts[k]),
+                         max((t for t in update_times[lo:hi + 1] if t), default=None))
+    return result
+
+
+def update_monthly_returns(fund_codes: List[str] = None, force: bool = False) -> Dict[str, Any]:
+    """
+    增量更新基金月收益率
+
+    Args:
+        fund_codes: 基金代码列表，None表示 fund_nav 中的全部基金
+        force: 是否全部重算
+
+    Returns:
+        {'success': True, 'fund_count': 有变化的基金数, 'month_count': 重算的月份数}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+
+        if force:
+            fetch_by_codes(cursor, "DELETE FROM fund_monthly_return WHERE {codes}", fund_codes)
+
+        # 有新增或修订净值的月份（已处理的最大 nav_update_time 之后写入的净值）
+        affected = {}
+        for code, month in fetch_by_codes(cursor, '''
+            SELECT DISTINCT n.fund_code, substr(n.nav_date, 1, 7)
+            FROM fund_nav n
+            LEFT JOIN (
+                SELECT fund_code, MAX(nav_update_time) AS watermark
+                FROM fund_monthly_return GROUP BY fund_code
+            ) s ON s.fund_code = n.fund_code
+            WHERE {codes} AND (s.watermark IS NULL OR n.update_time > s.watermark)
+        ''', fund_codes, 'n.fund_code'):
+            affected.setdefault(code, set()).add(month)
+
+        month_count = 0
+        for code, months in affected.items():
+            ordered = sorted(months)
+            cursor.execute('''
+                SELECT nav_date, unit_nav, update_time FROM fund_nav
+                WHERE fund_code = ? AND nav_date >= ? AND nav_date < ? AND unit_nav > 0
+                ORDER BY nav_date
+            ''', (code, ordered[0] + '-01', _next_month(ordered[-1]) + '-01'))
+            rows = cursor.fetchall()
+            bounds = _month_bounds([r[0] for r in rows], np.array([r[1] for r in rows], dtype=np.float64),
+                                   [r[2] for r in rows]) if rows else {}
+
+            records = []
+            for month in ordered:
+                if month not in bounds:
+                    continue
+                first_date, first_nav, last_date, last_nav, count, nav_time = bounds[month]
+                records.append((code, month, first_date, first_nav, last_date, last_nav, count,
+                                (last_nav / first_nav - 1) * 100, nav_time))
+            # 已无有效净值的月份（净值被改为空值）一并删除
+            stale = [(code, m) for m in ordered if m not in bounds]
+            if stale:
+                cursor.executemany("DELETE FROM fund_monthly_return WHERE fund_code = ? AND month = ?", stale)
+            cursor.executemany('''
+                INSERT OR REPLACE INTO fund_monthly_return
+                (fund_code, month, first_date, first_nav, last_date, last_nav, nav_count,
+                 monthly_return, nav_update_time, update_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+            ''', records)
+            month_count += len(records)
+
+        if affected:
+            from va_return_cache import invalidate_returns, SUBJECT_FUND
+            invalidate_returns(SUBJECT_FUND, list(affected), conn)
+        conn.commit()
+
+    return {'success': True, 'fund_count': len(affected), 'month_count': month_count}
+
+
+def _next_month(month: str) -> str:
+    return str(np.datetime64(month, 'M') + 1)
+
+
+def load_fund_monthly_returns(fund_codes: List[str], start_month: str = None, conn=None) -> Dict[str, tuple]:
+    """
+    批量读取月收益率
+
+    Returns:
+        {基金代码: (月份数组 'YYYY-MM', 月收益率数组 %)}，按月份升序
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return load_fund_monthly_returns(fund_codes, start_month, new_conn)
+
+    cursor = conn.cursor()
+    rows = fetch_by_codes(cursor, '''
+        SELECT fund_code, month, monthly_return FROM fund_monthly_return
+        WHERE month >= ? AND {codes}
+        ORDER BY fund_code, month
+    ''', list(fund_codes), params=(start_month or '',))
+    result = {}
+    if not rows:
+        return result
+    codes = np.array([r[0] for r in rows], dtype=object)
+    months = np.array([r[1] for r in rows], dtype=str)
+    returns = np.array([r[2] for r in rows], dtype=np.float64)
+    # 按基金切分（已按基金排序）
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], codes.size]
+    for lo, hi in zip(starts, ends):
+        result[codes[lo]] = (months[lo:hi], returns[lo:hi])
+    return result
+
+
+def phase_return_stats(months: np.ndarray, returns: np.ndarray, calendar) -> Dict[str, Dict[str, float]]:
+    """
+    按市场阶段统计月收益率
+
+    Args:
+        months / returns: 月份及月收益率（%）
+        calendar: market_phase.PhaseCalendar
+
+    Returns:
+        {阶段名: {'月数', '平均月收益率', '月收益率标准差'}}，不属于任何阶段的月份不计入；
+        只有1个月时标准差为NaN（与 pandas 一致）
+    """
+    if months.size == 0:
+        return {}
+    phases = calendar.month_phases(months)
+    names, groups = np.unique(phases.astype(str), return_inverse=True)
+    counts = np.bincount(groups, minlength=names.size)
+    sums = np.bincount(groups, weights=returns, minlength=names.size)
+    means = sums / counts
+    squares = np.bincount(groups, weights=(returns - means[groups]) ** 2, minlength=names.size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stds = np.sqrt(squares / (counts - 1))
+
+    return {
+        name: {'月数': int(counts[k]), '平均月收益率': float(means[k]), '月收益率标准差': float(stds[k])}
+        for k, name in enumerate(names) if name
+    }
+
+
+def get_fund_phase_stats(fund_code: str, calendar, years: int = 5) -> Optional[Dict[str, Any]]:
+    """
+    基金近N年按市场阶段的月收益率统计（只读 fund_monthly_return，表中无该基金时先增量生成）
+
+    Returns:
+        {'phases': {阶段名: 统计}, 'overall': 全部月份平均月收益率, 'months': 月数}，无数据时为None
+    """
+    start_month = (datetime.now() - timedelta(days=years * 365)).strftime('%Y-%m')
+    data = load_fund_monthly_returns([fund_code], start_month).get(fund_code)
+    if data is None:
+        update_monthly_returns([fund_code])
+        data = load_fund_monthly_returns([fund_code], start_month).get(fund_code)
+        if data is None:
+            return None
+
+    months, returns = data
+    return {
+        'phases': phase_return_stats(months, returns, calendar),
+        'overall': float(returns.mean()),
+        'months': int(months.size)
+    }
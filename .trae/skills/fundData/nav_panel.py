@@ -0,0 +1,210 @@
+"""
+净值面板模块
+将多只基金的净值加载为按交易日历对齐的二维数组（日期 × 基金），缺失值为NaN，
+供全市场风险指标、滚动指标、相关性等批量计算使用
+"""
+import sqlite3
+import numpy as np
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional
+
+from funddb import get_db_connection
+
+# SQLite单条语句参数个数上限较低，IN查询按批拆分
+SQL_IN_BATCH_SIZE = 500
+
+
+@dataclass
+class NavPanel:
+    dates: List[str]                      # 日期轴（升序）
+    fund_codes: List[str]                 # 基金轴
+    values: np.ndarray                    # 净值矩阵 shape=(len(dates), len(fund_codes))，缺失为NaN
+    code_index: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not self.code_index:
+            self.code_index = {code: i for i, code in enumerate(self.fund_codes)}
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def column(self, fund_code: str) -> np.ndarray:
+        """获取单只基金的净值列（含NaN）"""
+        return self.values[:, self.code_index[fund_code]]
+
+    def select(self, fund_codes: List[str]) -> 'NavPanel':
+        """按基金代码选取子面板（忽略面板中不存在的代码）"""
+        codes = [c for c in fund_codes if c in self.code_index]
+        cols = [self.code_index[c] for c in codes]
+        return NavPanel(self.dates, codes, self.values[:, cols])
+
+    def date_range(self, start_date: str = None, end_date: str = None) -> 'NavPanel':
+        """按日期区间截取子面板（闭区间）"""
+        lo = np.searchsorted(self.dates, start_date, side='left') if start_date else 0
+        hi = np.searchsorted(self.dates, end_date, side='right') if end_date else len(self.dates)
+        return NavPanel(self.dates[lo:hi], self.fund_codes, self.values[lo:hi], self.code_index)
+
+
+def ffill_panel(values: np.ndarray) -> np.ndarray:
+    """
+    沿日期轴向前填充NaN（向量化实现）
+
+    首个有效值之前的位置保持NaN
+    """
+    if values.size == 0:
+        return values.copy()
+
+    rows = np.arange(values.shape[0])[:, None]
+    idx = np.where(np.isnan(values), 0, rows)
+    idx = np.maximum.accumulate(idx, axis=0)
+    filled = values[idx, np.arange(values.shape[1])]
+
+    leading = np.cumsum(~np.isnan(values), axis=0) == 0
+    filled[leading] = np.nan
+    return filled
+
+
+def fetch_by_codes(cursor, sql: str, fund_codes: Optional[List[str]],
+                   column: str = 'fund_code', params: tuple = ()) -> List[tuple]:
+    """
+    执行带基金过滤条件的查询，sql中用 {codes} 标记过滤条件位置；
+    fund_codes为None时不过滤，否则按IN批次拆分
+    """
+    if fund_codes is None:
+        cursor.execute(sql.format(codes='1 = 1'), params)
+        return cursor.fetchall()
+    rows = []
+    for i in range(0, len(fund_codes), SQL_IN_BATCH_SIZE):
+        batch = fund_codes[i:i + SQL_IN_BATCH_SIZE]
+        placeholders = ','.join(['?' for _ in batch])
+        cursor.execute(sql.format(codes=f"{column} IN ({placeholders})"), params + tuple(batch))
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def load_nav_versions(fund_codes: List[str], conn: sqlite3.Connection = None) -> Dict[str, str]:
+    """
+    获取基金净值数据版本
+
+    版本由最新净值日期和净值条数组成，净值新增或补录历史都会改变版本，
+    用作净值派生结果（区间索引、滚动指标、相关矩阵等）的缓存键
+
+    Args:
+        fund_codes: 基金代码列表
+        conn: 复用已有连接，None则新建
+
+    Returns:
+        {基金代码: 版本字符串}，无净值的基金不在结果中
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return load_nav_versions(fund_codes, new_conn)
+
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    versions = {}
+    for i in range(0, len(fund_codes), SQL_IN_BATCH_SIZE):
+        batch = fund_codes[i:i + SQL_IN_BATCH_SIZE]
+        placeholders = ','.join(['?' for _ in batch])
+        cursor.execute(f'''
+            SELECT fund_code, MAX(nav_date), COUNT(*) FROM fund_nav
+            WHERE fund_code IN ({placeholders})
+            GROUP BY fund_code
+        ''', list(batch))
+        for code, latest, count in cursor.fetchall():
+            versions[code] = f"{latest}:{count}"
+    return versions
+
+
+def _load_date_axis(cursor, nav_dates: np.ndarray, start_date: str = None, end_date: str = None) -> np.ndarray:
+    """
+    构造日期轴：交易日历中覆盖净值区间的交易日，并补入日历外的净值日期
+    （如QDII基金在A股休市日公布的净值），保证每条净值都有对应位置
+    """
+    nav_dates = np.unique(nav_dates.astype(str))
+    lo = start_date or (str(nav_dates[0]) if nav_dates.size else None)
+    hi = end_date or (str(nav_dates[-1]) if nav_dates.size else None)
+
+    calendar = []
+    if lo and hi:
+        cursor.execute('''
+            SELECT trade_date FROM trade_calendar
+            WHERE is_trade_day = 1 AND trade_date >= ? AND trade_date <= ?
+        ''', (lo, hi))
+        calendar = [row[0] for row in cursor.fetchall()]
+
+    return np.union1d(np.array(calendar, dtype=str), nav_dates)
+
+
+def load_nav_panel(fund_codes: Optional[List[str]] = None,
+                   start_date: str = None,
+                   end_date: str = None,
+                   conn: sqlite3.Connection = None,
+                   adjusted: bool = False) -> NavPanel:
+    """
+    加载净值面板
+
+    Args:
+        fund_codes: 基金代码列表，None表示 fund_nav 中的全部基金
+        start_date: 开始日期（含）
+        end_date: 结束日期（含）
+        conn: 复用已有连接，None则新建
+        adjusted: 是否加载复权净值（fund_adjusted_nav，需先由 adjusted_nav.update_adjusted_nav 维护）
+
+    Returns:
+        NavPanel，列顺序与fund_codes一致（未提供时按代码排序）
+
+    实现：
+        一次（或按IN批次）读取 fund_code, nav_date, unit_nav 三列，
+        用 np.searchsorted / np.unique 把行映射到矩阵坐标后整体写入，
+        不逐行构造字典
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return load_nav_panel(fund_codes, start_date, end_date, new_conn, adjusted)
+
+    cursor = conn.cursor()
+    cursor.row_factory = None
+
+    table, column = ('fund_adjusted_nav', 'adjusted_nav') if adjusted else ('fund_nav', 'unit_nav')
+    conditions = [f'{column} IS NOT NULL', f'{column} > 0']
+    params = []
+    if start_date:
+        conditions.append('nav_date >= ?')
+        params.append(start_date)
+    if end_date:
+        conditions.append('nav_date <= ?')
+        params.append(end_date)
+    conditions.append('{codes}')
+    rows = fetch_by_codes(cursor, f"SELECT fund_code, nav_date, {column} FROM {table} WHERE {' AND '.join(conditions)}",
+                          fund_codes, params=tuple(params))
+
+    if rows:
+        row_codes, row_dates, row_navs = zip(*rows)
+        row_codes = np.array(row_codes, dtype=str)
+        row_dates = np.array(row_dates, dtype=str)
+        row_navs = np.array(row_navs, dtype=np.float64)
+    else:
+        row_codes = np.empty(0, dtype=str)
+        row_dates = np.empty(0, dtype=str)
+        row_navs = np.empty(0, dtype=np.float64)
+
+    if fund_codes is None:
+        codes = np.unique(row_codes)
+    else:
+        codes = np.array(list(dict.fromkeys(fund_codes)), dtype=str)
+
+    date_axis = _load_date_axis(cursor, row_dates, start_date, end_date)
+
+    values = np.full((len(date_axis), len(codes)), np.nan)
+    if row_navs.size and codes.size:
+        order = np.argsort(codes)
+        pos = np.searchsorted(codes, row_codes, sorter=order)
+        pos = np.clip(pos, 0, len(codes) - 1)
+        col_idx = order[pos]
+        known = codes[col_idx] == row_codes
+        row_idx = np.searchsorted(date_axis, row_dates)
+        values[row_idx[known], col_idx[known]] = row_navs[known]
+
+    return NavPanel(date_axis.tolist(), codes.tolist(), values)
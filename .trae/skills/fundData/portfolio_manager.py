@@ -7,6 +7,8 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from funddb import get_db_connection
+from ledger import invalidate_checkpoints
+from fund_cash import apply_fund_cash, get_fund_cash
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
@@ -780,7 +782,24 @@ class PortfolioManager:
             'fund_count': len(fund_values),
             'funds': fund_values
         }
-    
+
+    def get_portfolio_value_series(self, portfolio_id: int, start_date: str = None,
+                                   end_date: str = None, include_funds: bool = True) -> Dict[str, Any]:
+        """
+        获取组合逐日市值曲线（批量as-of对齐，见 portfolio_value 模块）
+
+        Args:
+            portfolio_id: 组合ID
+            start_date: 开始日期（可选，默认首次持仓日）
+            end_date: 结束日期（可选，默认最新净值日）
+            include_funds: 是否返回各基金市值序列
+
+        Returns:
+            逐日市值、收益指数及回撤/波动率
+        """
+        from portfolio_value import get_portfolio_value_series
+        return get_portfolio_value_series(portfolio_id, start_date, end_date, include_funds)
+
     def calculate_profit_loss(self, portfolio_id: int, fund_code: str,
                                from_date: str, to_date: str = None) -> Dict[str, Any]:
         """
@@ -1342,6 +1361,9 @@ def record_buy_transaction(portfolio_id: int, fund_code: str,
              shares, amount, nav, fee, notes)
             VALUES (?, ?, 'BUY', ?, ?, ?, ?, ?, ?)
         ''', (portfolio_id, fund_code, transaction_date, shares, amount, nav, fee, notes))
+        # 补录早于已有检查点的交易时，之后的回放检查点失效
+        invalidate_checkpoints(cursor, portfolio_id, fund_code, transaction_date)
+        apply_fund_cash(cursor, portfolio_id, fund_code, buy_amount=amount)
 
         # 更新或插入成分基金记录
         fund_name = PortfolioManager()._get_fund_name(fund_code)
@@ -1458,6 +1480,8 @@ def record_sell_transaction(portfolio_id: int, fund_code: str,
              shares, amount, nav, confirmed_nav, fee, notes)
             VALUES (?, ?, 'SELL', ?, ?, ?, ?, ?, ?, ?)
         ''', (portfolio_id, fund_code, transaction_date, shares, amount, nav, confirmed_nav, fee, notes))
+        invalidate_checkpoints(cursor, portfolio_id, fund_code, transaction_date)
+        apply_fund_cash(cursor, portfolio_id, fund_code, sell_amount=amount)
 
         # 更新成分基金记录
         if new_shares > 0:
@@ -1573,12 +1597,15 @@ def execute_buy_back_transaction(portfolio_id: int, fund_code: str,
         cursor.execute('''
             INSERT INTO portfolio_transaction
             (portfolio_id, fund_code, transaction_type, transaction_date,
-             shares, amount, nav, fee, notes)
-            VALUES (?, ?, 'BUY', ?, ?, ?, ?, ?, ?)
+             shares, amount, nav, fee, notes, buy_back_of)
+            VALUES (?, ?, 'BUY', ?, ?, ?, ?, ?, ?, ?)
         ''', (portfolio_id, fund_code, transaction_date, shares, amount, nav, fee,
-              notes or f'波段捡回 - 对应卖出记录#{target_sell_transaction_id}'))
+              notes or f'波段捡回 - 对应卖出记录#{target_sell_transaction_id}',
+              target_sell_transaction_id))
 
         buy_transaction_id = cursor.lastrowid
+        invalidate_checkpoints(cursor, portfolio_id, fund_code, transaction_date)
+        apply_fund_cash(cursor, portfolio_id, fund_code, buy_amount=amount)
 
         # 标记卖出记录为已回收
         cursor.execute('''
@@ -1762,6 +1789,7 @@ def calculate_fund_available_cash(portfolio_id: int, fund_code: str) -> Dict[str
     - 可用现金 = 所有卖出交易获得金额 - 所有买入交易投入金额
     - 如果结果为正，表示该基金有可用现金（净卖出）
     - 如果结果为负，表示该基金有投入成本（净买入）
+    - 金额读取 portfolio_fund_cash 余额表（随交易记录同步维护）
 
     Args:
         portfolio_id: 组合ID
@@ -1786,26 +1814,11 @@ def calculate_fund_available_cash(portfolio_id: int, fund_code: str) -> Dict[str
                 'error': '该基金不在组合中'
             }
 
-        # 计算所有买入交易的投入金额总和
-        cursor.execute('''
-            SELECT COALESCE(SUM(amount), 0) as total_buy_amount
-            FROM portfolio_transaction
-            WHERE portfolio_id = ? AND fund_code = ? AND transaction_type = 'BUY'
-        ''', (portfolio_id, fund_code))
-        buy_result = cursor.fetchone()
-        total_buy_amount = buy_result['total_buy_amount'] or 0
-
-        # 计算所有卖出交易的获得金额总和
-        cursor.execute('''
-            SELECT COALESCE(SUM(amount), 0) as total_sell_amount
-            FROM portfolio_transaction
-            WHERE portfolio_id = ? AND fund_code = ? AND transaction_type = 'SELL'
-        ''', (portfolio_id, fund_code))
-        sell_result = cursor.fetchone()
-        total_sell_amount = sell_result['total_sell_amount'] or 0
-
-        # 计算可用现金
-        available_cash = total_sell_amount - total_buy_amount
+        # 读取物化的可用现金余额
+        balance = get_fund_cash(portfolio_id, [fund_code], conn)[fund_code]
+        total_buy_amount = balance['total_buy_amount']
+        total_sell_amount = balance['total_sell_amount']
+        available_cash = balance['available_cash']
 
         return {
             'success': True,
@@ -1855,22 +1868,21 @@ def get_portfolio_funds_available_cash(portfolio_id: int) -> Dict[str, Any]:
                 'funds': []
             }
 
-        # 批量计算所有基金的可用现金
+        # 一次读取所有基金的可用现金余额
+        balances = get_fund_cash(portfolio_id, [fund['fund_code'] for fund in funds], conn)
         funds_cash = []
         total_available_cash = 0
 
         for fund in funds:
-            fund_code = fund['fund_code']
-            cash_info = calculate_fund_available_cash(portfolio_id, fund_code)
-            if cash_info['success']:
-                funds_cash.append({
-                    'fund_code': fund_code,
-                    'fund_name': cash_info['fund_name'],
-                    'available_cash': cash_info['available_cash'],
-                    'total_buy_amount': cash_info['total_buy_amount'],
-                    'total_sell_amount': cash_info['total_sell_amount']
-                })
-                total_available_cash += cash_info['available_cash']
+            balance = balances[fund['fund_code']]
+            funds_cash.append({
+                'fund_code': fund['fund_code'],
+                'fund_name': fund['fund_name'],
+                'available_cash': balance['available_cash'],
+                'total_buy_amount': balance['total_buy_amount'],
+                'total_sell_amount': balance['total_sell_amount']
+            })
+            total_available_cash += balance['available_cash']
 
         return {
             'success': True,
@@ -1884,7 +1896,7 @@ def get_portfolio_funds_available_cash(portfolio_id: int) -> Dict[str, Any]:
 
 def calculate_portfolio_available_cash_batch(portfolio_id: int) -> Dict[str, float]:
     """
-    批量计算组合内所有基金的可用现金（优化版，单次查询）
+    批量获取组合内所有基金的可用现金（读取 portfolio_fund_cash 余额表）
     
     用于止盈计算等需要快速获取所有基金可用现金的场景
     
@@ -1899,31 +1911,8 @@ def calculate_portfolio_available_cash_batch(portfolio_id: int) -> Dict[str, flo
             '161725': -2000.00
         }
     """
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # 一次性查询所有基金的买入和卖出金额
-        cursor.execute('''
-            SELECT 
-                fund_code,
-                SUM(CASE WHEN transaction_type = 'BUY' THEN amount ELSE 0 END) as total_buy,
-                SUM(CASE WHEN transaction_type = 'SELL' THEN amount ELSE 0 END) as total_sell
-            FROM portfolio_transaction
-            WHERE portfolio_id = ?
-            GROUP BY fund_code
-        ''', (portfolio_id,))
-        
-        rows = cursor.fetchall()
-        
-        # 构建可用现金映射
-        available_cash_map = {}
-        for row in rows:
-            fund_code = row['fund_code']
-            total_buy = row['total_buy'] or 0
-            total_sell = row['total_sell'] or 0
-            available_cash_map[fund_code] = total_sell - total_buy
-        
-        return available_cash_map
+    balances = get_fund_cash(portfolio_id)
+    return {code: balance['available_cash'] for code, balance in balances.items()}
 
 
 if __name__ == '__main__':
@@ -0,0 +1,255 @@
+"""
+组合收益率模块
+计算组合及其各基金的时间加权收益率（TWR）和资金加权收益率（XIRR）
+
+实现：
+    1. 每个组合用 portfolio_value.build_value_series 一次构建逐日份额/净值/市值矩阵
+    2. TWR：portfolio_value.holding_returns 的日收益率连乘（前日持仓按当日净值变动，不受申购赎回影响）
+    3. XIRR 现金流（投资者视角，投入为负、收回为正）：
+         - portfolio_transaction：BUY 为 -amount，SELL 为 +amount（按交易日期）
+         - 没有交易记录对应的份额变化（如导入的持仓快照）按 份额变化 × 当日净值 计入
+         - 期末持仓市值作为最后一笔正现金流
+       全部组合、全部基金的现金流排成一个矩阵，xirr.xirr_batch 一次求解
+    4. 结果按组合缓存（进程内 LRU），数据版本 = 交易记录、持仓快照的逐行签名 + 各基金净值版本，
+       任一变化即重算；多个组合同时请求时只重算失效的组合，仍在一个批次内求解
+"""
+import sys
+import os
+import hashlib
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import load_nav_versions
+from portfolio_value import build_value_series, holding_returns
+from xirr import xirr_batch, year_fractions
+
+
+# 进程内缓存上限（按 组合×截止日 计）
+RETURN_CACHE_SIZE = 128
+
+# 视为没有交易记录对应的份额变化的最小份额
+SHARE_TOLERANCE = 1e-4
+
+_return_cache: 'OrderedDict[tuple, tuple]' = OrderedDict()
+
+
+def _ledger_signatures(cursor, sql: str, portfolio_ids: List[int]) -> Dict[int, tuple]:
+    """
+    按组合计算记录签名：逐行（按ID）拼接参与计算的字段取MD5
+
+    Returns:
+        {组合ID: (签名, 涉及的基金代码集合)}，无记录的组合不在结果中
+    """
+    placeholders = ','.join(['?' for _ in portfolio_ids])
+    cursor.execute(sql.format(placeholders=placeholders), portfolio_ids)
+    digests, funds = {}, {}
+    for pid, *fields in cursor.fetchall():
+        digests.setdefault(pid, hashlib.md5()).update('|'.join(map(str, fields)).encode('utf-8') + b'\n')
+        funds.setdefault(pid, set()).add(fields[1])
+    return {pid: (digest.hexdigest(), funds[pid]) for pid, digest in digests.items()}
+
+
+def load_return_versions(portfolio_ids: List[int], conn) -> Dict[int, str]:
+    """
+    组合收益率的数据版本
+
+    Returns:
+        {组合ID: 版本字符串}，交易记录、持仓快照的任一行新增、删除或修改（日期、份额、金额、净值、手续费等），
+        或任一基金净值版本变化都会改变版本
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+
+    transactions = _ledger_signatures(cursor, '''
+        SELECT portfolio_id, id, fund_code, transaction_type, transaction_date, shares, amount, nav, fee
+        FROM portfolio_transaction WHERE portfolio_id IN ({placeholders}) ORDER BY portfolio_id, id
+    ''', portfolio_ids)
+    snapshots = _ledger_signatures(cursor, '''
+        SELECT portfolio_id, id, fund_code, record_date, shares, nav
+        FROM holding_history WHERE portfolio_id IN ({placeholders}) ORDER BY portfolio_id, id
+    ''', portfolio_ids)
+
+    funds = {pid: sorted(transactions.get(pid, (None, set()))[1] | snapshots.get(pid, (None, set()))[1])
+             for pid in portfolio_ids}
+    nav_versions = load_nav_versions(sorted({c for codes in funds.values() for c in codes}), conn)
+
+    return {
+        pid: f"{transactions.get(pid, (None,))[0]}|{snapshots.get(pid, (None,))[0]}|" +
+             ','.join(f"{c}:{nav_versions.get(c)}" for c in funds[pid])
+        for pid in portfolio_ids
+    }
+
+
+def _load_transactions(cursor, portfolio_id: int, end_date: str = None) -> List[tuple]:
+    sql = '''
+        SELECT fund_code, transaction_date, transaction_type, shares, amount FROM portfolio_transaction
+        WHERE portfolio_id = ?
+    '''
+    params = [portfolio_id]
+    if end_date:
+        sql += ' AND transaction_date <= ?'
+        params.append(end_date)
+    cursor.execute(sql + ' ORDER BY transaction_date, id', params)
+    return cursor.fetchall()
+
+
+def build_cash_flows(series: Dict[str, Any], transactions: List[tuple]) -> Dict[str, List[tuple]]:
+    """
+    由市值曲线和交易记录整理各基金的XIRR现金流
+
+    Returns:
+        {基金代码: [(日期, 金额)]}，投入为负、收回为正，最后一笔为期末市值
+    """
+    dates = series['dates']
+    codes = series['fund_codes']
+    column = {code: j for j, code in enumerate(codes)}
+    shares = series['shares']
+    navs = np.nan_to_num(series['navs'])
+
+    flows = {code: [] for code in codes}
+    recorded = np.zeros_like(shares)
+    for code, date, kind, trade_shares, amount in transactions:
+        if code not in column:
+            continue
+        sign = -1.0 if kind == 'SELL' else 1.0
+        flows[code].append((date, sign * -float(amount or 0)))
+        # 交易日不是净值日时，份额在下一个净值日体现
+        idx = int(np.searchsorted(dates, date, side='left'))
+        if idx < len(dates):
+            recorded[idx, column[code]] += sign * float(trade_shares or 0)
+
+    share_change = np.diff(np.vstack([np.zeros(len(codes)), shares]), axis=0)
+    untracked = share_change - recorded
+    rows, cols = np.nonzero(np.abs(untracked) > SHARE_TOLERANCE)
+    for i, j in zip(rows, cols):
+        flows[codes[j]].append((dates[i], float(-untracked[i, j] * navs[i, j])))
+
+    last_date = max([dates[-1]] + [t[1] for t in transactions])
+    for j, code in enumerate(codes):
+        flows[code].append((last_date, float(series['values'][-1, j])))
+    return flows
+
+
+def _solve_xirr(flow_lists: List[List[tuple]]) -> np.ndarray:
+    """多组现金流一次求解XIRR（小数）"""
+    if not flow_lists:
+        return np.empty(0)
+    width = max(len(f) for f in flow_lists)
+    amounts = np.zeros((len(flow_lists), width))
+    years = np.zeros((len(flow_lists), width))
+    for i, flows in enumerate(flow_lists):
+        amounts[i, :len(flows)] = [amount for _, amount in flows]
+        years[i, :len(flows)] = year_fractions([date for date, _ in flows])
+    return xirr_batch(amounts, years)
+
+
+def _percent(value: float) -> Optional[float]:
+    return None if value is None or not np.isfinite(value) else round(float(value) * 100, 4)
+
+
+def _compute(portfolio_ids: List[int], end_date: str, conn) -> Dict[int, Dict[str, Any]]:
+    """计算一组组合的收益率，所有XIRR在一个批次内求解"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+
+    results = {}
+    flow_lists = []
+    targets = []
+    for pid in portfolio_ids:
+        series = build_value_series(pid, end_date=end_date, conn=conn)
+        if not series['success']:
+            results[pid] = {'portfolio_id': pid, 'error': series['error']}
+            continue
+
+        cursor.execute("SELECT fund_code, fund_name FROM portfolio_fund WHERE portfolio_id = ?", (pid,))
+        names = dict(cursor.fetchall())
+        fund_flows = build_cash_flows(series, _load_transactions(cursor, pid, end_date))
+
+        shares, navs = series['shares'], series['navs']
+        funds = []
+        for j, code in enumerate(series['fund_codes']):
+            twr = np.prod(1 + holding_returns(shares[:, j:j + 1], navs[:, j:j + 1])) - 1
+            funds.append({
+                'fund_code': code,
+                'fund_name': names.get(code),
+                'market_value': round(float(series['values'][-1, j]), 2),
+                'net_invested': round(-sum(a for _, a in fund_flows[code][:-1]), 2),
+                'twr': _percent(twr),
+                'xirr': None,
+            })
+            flow_lists.append(fund_flows[code])
+            targets.append(funds[-1])
+
+        portfolio_flows = sorted(f for flows in fund_flows.values() for f in flows[:-1])
+        final_value = float(series['total'][-1])
+        last_date = max(flows[-1][0] for flows in fund_flows.values())
+        result = {
+            'portfolio_id': pid,
+            'start_date': series['dates'][0],
+            'end_date': series['dates'][-1],
+            'market_value': round(final_value, 2),
+            'net_invested': round(-sum(a for _, a in portfolio_flows), 2),
+            'twr': _percent(np.prod(1 + holding_returns(shares, navs)) - 1),
+            'xirr': None,
+            'funds': funds,
+        }
+        flow_lists.append(portfolio_flows + [(last_date, final_value)])
+        targets.append(result)
+        results[pid] = result
+
+    for target, rate in zip(targets, _solve_xirr(flow_lists)):
+        target['xirr'] = _percent(rate)
+    return results
+
+
+def get_portfolio_returns(portfolio_ids: List[int] = None, end_date: str = None) -> Dict[str, Any]:
+    """
+    获取组合及各基金的时间加权收益率（TWR）和资金加权收益率（XIRR）
+
+    Args:
+        portfolio_ids: 组合ID列表，None表示全部组合
+        end_date: 截止日期（可选，默认最新净值日）
+
+    Returns:
+        {'success': True, 'portfolios': [{'portfolio_id', 'start_date', 'end_date', 'market_value',
+         'net_invested', 'twr', 'xirr', 'funds': [{'fund_code', 'fund_name', 'market_value',
+         'net_invested', 'twr', 'xirr'}]}], 'from_cache': 命中缓存的组合数}
+        twr/xirr 为百分比（xirr 为年化），无法求解时为None；没有持仓记录的组合只有 'error'
+    """
+    with get_db_connection() as conn:
+        if portfolio_ids is None:
+            portfolio_ids = [row['id'] for row in conn.execute("SELECT id FROM portfolio ORDER BY id")]
+        portfolio_ids = [int(pid) for pid in portfolio_ids]
+        if not portfolio_ids:
+            return {'success': True, 'portfolios': [], 'from_cache': 0}
+
+        versions = load_return_versions(portfolio_ids, conn)
+        results = {}
+        stale = []
+        for pid in portfolio_ids:
+            cached = _return_cache.get((pid, end_date))
+            if cached is not None and cached[0] == versions[pid]:
+                _return_cache.move_to_end((pid, end_date))
+                results[pid] = cached[1]
+            else:
+                stale.append(pid)
+        from_cache = len(results)
+
+        if stale:
+            for pid, result in _compute(stale, end_date, conn).items():
+                results[pid] = result
+                _return_cache[(pid, end_date)] = (versions[pid], result)
+                _return_cache.move_to_end((pid, end_date))
+            while len(_return_cache) > RETURN_CACHE_SIZE:
+                _return_cache.popitem(last=False)
+
+    return {
+        'success': True,
+        'portfolios': [results[pid] for pid in portfolio_ids],
+        'from_cache': from_cache,
+    }
@@ -0,0 +1,276 @@
+"""
+组合市值时间序列模块
+一次构建组合在任意区间内的逐日市值曲线（各基金市值及合计），并由曲线计算组合回撤和波动率
+
+实现：
+    1. 份额为阶梯函数：holding_history 快照给出当日持仓总份额；
+       快照未覆盖的交易日的 portfolio_transaction（如波段捡回）按增减份额叠加到此前持仓上
+    2. 净值面板（nav_panel）从各基金区间开始前最后一个净值日加载，向前填充后截取区间，
+       即每个日期取不晚于该日的最新净值
+    3. 份额与净值都用 np.searchsorted 按日期做 as-of 对齐，得到 日期×基金 的份额矩阵和净值矩阵，
+       市值 = 份额 × 净值，全程无逐日查询
+
+组合收益指数（剔除申购/赎回的影响）：
+    日收益率 = Σ 前日份额 × 当日净值 / Σ 前日份额 × 前日净值 - 1
+    当日资金流 = Σ (当日份额 - 前日份额) × 当日净值（单独返回）
+    最大回撤、年化波动率按收益指数计算，避免加仓/减仓被误当作涨跌
+"""
+import sys
+import os
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import load_nav_panel, ffill_panel, SQL_IN_BATCH_SIZE
+from risk_metrics_calculator import calc_max_drawdown, calc_annual_volatility
+
+
+def load_share_steps(cursor, portfolio_id: int, fund_codes: List[str] = None,
+                     end_date: str = None) -> Dict[str, tuple]:
+    """
+    读取各基金份额阶梯
+
+    Returns:
+        {基金代码: (变动日期数组, 变动后份额数组)}，日期升序
+    """
+    params = [portfolio_id]
+    date_filter = ''
+    if end_date:
+        date_filter = ' AND {column} <= ?'
+        params.append(end_date)
+
+    cursor.execute(f'''
+        SELECT fund_code, record_date, shares FROM holding_history
+        WHERE portfolio_id = ?{date_filter.format(column='record_date')}
+        ORDER BY fund_code, record_date
+    ''', params)
+    snapshots = {}
+    for code, date, shares in cursor.fetchall():
+        snapshots.setdefault(code, {})[date] = float(shares or 0)
+
+    cursor.execute(f'''
+        SELECT fund_code, transaction_date, transaction_type, shares FROM portfolio_transaction
+        WHERE portfolio_id = ?{date_filter.format(column='transaction_date')}
+        ORDER BY fund_code, transaction_date, id
+    ''', params)
+    deltas = {}
+    for code, date, kind, shares in cursor.fetchall():
+        sign = -1.0 if kind == 'SELL' else 1.0
+        deltas.setdefault(code, []).append((date, sign * float(shares or 0)))
+
+    steps = {}
+    codes = fund_codes if fund_codes is not None else sorted(set(snapshots) | set(deltas))
+    for code in codes:
+        fund_snapshots = snapshots.get(code, {})
+        # 快照当日的交易已包含在快照份额中
+        fund_deltas = [(d, s) for d, s in deltas.get(code, []) if d not in fund_snapshots]
+        events = sorted([(d, 0, s) for d, s in fund_snapshots.items()] +
+                        [(d, 1, s) for d, s in fund_deltas])
+        if not events:
+            continue
+        dates, shares = [], []
+        current = 0.0
+        for date, is_delta, value in events:
+            current = current + value if is_delta else value
+            if dates and dates[-1] == date:
+                shares[-1] = current
+            else:
+                dates.append(date)
+                shares.append(current)
+        steps[code] = (np.array(dates, dtype=str), np.array(shares, dtype=np.float64))
+    return steps
+
+
+def asof_shares(steps: Dict[str, tuple], fund_codes: List[str], dates: List[str]) -> np.ndarray:
+    """份额矩阵 shape=(日期, 基金)：每个日期取不晚于该日的最新份额，首次变动前为0"""
+    axis = np.asarray(dates, dtype=str)
+    shares = np.zeros((axis.size, len(fund_codes)))
+    for j, code in enumerate(fund_codes):
+        if code not in steps:
+            continue
+        step_dates, step_shares = steps[code]
+        idx = np.searchsorted(step_dates, axis, side='right') - 1
+        shares[:, j] = np.where(idx >= 0, step_shares[np.maximum(idx, 0)], 0.0)
+    return shares
+
+
+def _nav_start_dates(cursor, fund_codes: List[str], start_date: str) -> Optional[str]:
+    """各基金不晚于start_date的最后净值日中最早的一个（净值面板从这里开始加载才能向前填充）"""
+    earliest = None
+    for i in range(0, len(fund_codes), SQL_IN_BATCH_SIZE):
+        batch = fund_codes[i:i + SQL_IN_BATCH_SIZE]
+        placeholders = ','.join(['?' for _ in batch])
+        cursor.execute(f'''
+            SELECT MIN(last_date) FROM (
+                SELECT MAX(nav_date) AS last_date FROM fund_nav
+                WHERE fund_code IN ({placeholders}) AND nav_date <= ? AND unit_nav > 0
+                GROUP BY fund_code
+            )
+        ''', list(batch) + [start_date])
+        value = cursor.fetchone()[0]
+        if value and (earliest is None or value < earliest):
+            earliest = value
+    return earliest
+
+
+def holding_returns(shares: np.ndarray, navs: np.ndarray) -> np.ndarray:
+    """
+    组合日收益率：前日持仓按当日净值与前日净值之比计算（只计两日净值都有效的基金），
+    当日的份额变动不影响当日收益率
+    """
+    n = shares.shape[0]
+    returns = np.zeros(n)
+    if n < 2:
+        return returns
+    held = shares[:-1]
+    valid = ~np.isnan(navs[1:]) & ~np.isnan(navs[:-1])
+    before = np.where(valid, held * np.nan_to_num(navs[:-1]), 0.0).sum(axis=1)
+    after = np.where(valid, held * np.nan_to_num(navs[1:]), 0.0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = np.where(before > 0, after / before - 1, 0.0)
+    return returns
+
+
+def curve_metrics(returns: np.ndarray, values: np.ndarray) -> Dict[str, Any]:
+    """
+    由组合日收益率计算收益指数、最大回撤和年化波动率
+
+    Returns:
+        {'index': 收益指数（首日为1）, 'max_drawdown', 'max_drawdown_start', 'max_drawdown_end',
+         'annual_volatility', 'total_return'}（百分比，回撤起止为下标）
+    """
+    index = np.cumprod(1 + returns)
+    max_drawdown, peak, trough = calc_max_drawdown(index)
+    # 首次持仓之前的日期不计入波动率
+    active = np.flatnonzero(values > 0)
+    window = returns[active[0] + 1:] if active.size else np.empty(0)
+    return {
+        'index': index,
+        'max_drawdown': max_drawdown,
+        'max_drawdown_start': peak,
+        'max_drawdown_end': trough,
+        'annual_volatility': calc_annual_volatility(window),
+        'total_return': float((index[-1] - 1) * 100) if index.size else 0.0,
+    }
+
+
+def build_value_series(portfolio_id: int, start_date: str = None, end_date: str = None,
+                       fund_codes: List[str] = None, conn=None) -> Dict[str, Any]:
+    """
+    构建组合逐日市值曲线（内部结构，数组形式）
+
+    Returns:
+        {'success': True, 'dates', 'fund_codes', 'shares', 'navs', 'values', 'total', 'flows'}，
+        shares/navs/values 为 日期×基金 矩阵
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return build_value_series(portfolio_id, start_date, end_date, fund_codes, new_conn)
+
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    steps = load_share_steps(cursor, portfolio_id, fund_codes, end_date)
+    codes = [c for c in (fund_codes if fund_codes is not None else sorted(steps)) if c in steps]
+    if not codes:
+        return {'success': False, 'error': '组合没有持仓记录'}
+
+    first_event = min(str(steps[c][0][0]) for c in codes)
+    start = max(start_date, first_event) if start_date else first_event
+    nav_start = _nav_start_dates(cursor, codes, start) or start
+
+    panel = load_nav_panel(codes, min(nav_start, start), end_date, conn)
+    navs = ffill_panel(panel.values)
+    lo = int(np.searchsorted(panel.dates, start, side='left'))
+    dates = panel.dates[lo:]
+    if not dates:
+        return {'success': False, 'error': '区间内没有净值数据'}
+    navs = navs[lo:]
+
+    shares = asof_shares(steps, codes, dates)
+    # 区间开始前最后一个份额状态，用于计算首日资金流
+    prior = asof_shares(steps, codes, [str(np.datetime64(dates[0], 'D') - 1)])[0]
+    priced = np.nan_to_num(navs)
+    values = shares * priced
+    share_change = np.diff(np.vstack([prior, shares]), axis=0)
+    flows = (share_change * priced).sum(axis=1)
+
+    return {
+        'success': True,
+        'dates': dates,
+        'fund_codes': codes,
+        'shares': shares,
+        'navs': navs,
+        'values': values,
+        'total': values.sum(axis=1),
+        'flows': flows,
+    }
+
+
+def _round_list(values: np.ndarray, digits: int = 2) -> List[Optional[float]]:
+    return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+
+def get_portfolio_value_series(portfolio_id: int, start_date: str = None, end_date: str = None,
+                               include_funds: bool = True) -> Dict[str, Any]:
+    """
+    获取组合逐日市值曲线及回撤、波动率
+
+    Args:
+        portfolio_id: 组合ID
+        start_date / end_date: 区间（默认从首次持仓到最新净值日）
+        include_funds: 是否返回各基金市值序列
+
+    Returns:
+        {'success': True, 'portfolio_id', 'start_date', 'end_date', 'dates', 'total_value', 'net_flow',
+         'return_index', 'funds': [{'fund_code', 'fund_name', 'shares', 'nav', 'market_value'}],
+         'metrics': {'final_value', 'total_return', 'max_drawdown', 'max_drawdown_start',
+                     'max_drawdown_end', 'annual_volatility'}}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM portfolio WHERE id = ?", (portfolio_id,))
+        if not cursor.fetchone():
+            return {'success': False, 'error': f'组合 {portfolio_id} 不存在'}
+
+        series = build_value_series(portfolio_id, start_date, end_date, conn=conn)
+        if not series['success']:
+            return series
+
+        cursor.execute("SELECT fund_code, fund_name FROM portfolio_fund WHERE portfolio_id = ?", (portfolio_id,))
+        names = {row['fund_code']: row['fund_name'] for row in cursor.fetchall()}
+
+    dates = series['dates']
+    metrics = curve_metrics(holding_returns(series['shares'], series['navs']), series['total'])
+    result = {
+        'success': True,
+        'portfolio_id': portfolio_id,
+        'start_date': dates[0],
+        'end_date': dates[-1],
+        'dates': dates,
+        'total_value': _round_list(series['total']),
+        'net_flow': _round_list(series['flows']),
+        'return_index': _round_list(metrics['index'], 6),
+        'metrics': {
+            'final_value': round(float(series['total'][-1]), 2),
+            'total_return': round(metrics['total_return'], 4),
+            'max_drawdown': round(metrics['max_drawdown'], 4),
+            'max_drawdown_start': dates[metrics['max_drawdown_start']] if metrics['max_drawdown'] > 0 else None,
+            'max_drawdown_end': dates[metrics['max_drawdown_end']] if metrics['max_drawdown'] > 0 else None,
+            'annual_volatility': round(metrics['annual_volatility'], 4),
+        }
+    }
+    if include_funds:
+        result['funds'] = [
+            {
+                'fund_code': code,
+                'fund_name': names.get(code),
+                'shares': _round_list(series['shares'][:, j], 4),
+                'nav': _round_list(series['navs'][:, j], 4),
+                'market_value': _round_list(series['values'][:, j]),
+            }
+            for j, code in enumerate(series['fund_codes'])
+        ]
+    return result
@@ -0,0 +1,271 @@
+"""
+区间指标索引模块
+为单只基金预计算区间查询索引，任意 [开始日期, 结束日期] 的区间收益、
+年化波动率和最大回撤无需取数循环：
+
+- 区间收益率：期末/期初净值，O(1)
+- 年化波动率：日收益率（减去全历史均值后）的前缀和与平方前缀和，O(1)
+- 最大回撤：线段树，每个节点保存 (区间最大净值, 区间最小净值, 区间内最大回撤)，
+  合并规则 dd(L∪R) = max(dd_L, dd_R, 1 - min_R / max_L)，O(log n)
+
+索引按净值数据版本缓存在进程内，净值更新后首次查询时重建；
+批量查询在NumPy数组上同步推进，同一基金的多个区间一次完成
+"""
+import sys
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import load_nav_versions
+from risk_metrics_calculator import load_nav_arrays
+
+
+# 与风险指标计算口径一致的最少数据要求
+MIN_RETURNS_FOR_VOLATILITY = 20
+MIN_DAYS_FOR_ANNUAL_RETURN = 126
+
+# 进程内索引缓存上限（按基金计，超出时淘汰最久未使用的）
+RANGE_INDEX_CACHE_SIZE = 512
+
+# 进程内索引缓存：{基金代码: FundRangeIndex}
+_range_index_cache: 'OrderedDict[str, FundRangeIndex]' = OrderedDict()
+
+
+def _combine(a_max, a_min, a_dd, b_max, b_min, b_dd):
+    """合并相邻区间（a在前，b在后）的回撤摘要"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cross = np.where(a_max > 0, 1 - b_min / a_max, 0.0)
+    return np.maximum(a_max, b_max), np.minimum(a_min, b_min), np.maximum(np.maximum(a_dd, b_dd), cross)
+
+
+@dataclass
+class FundRangeIndex:
+    fund_code: str
+    version: str
+    dates: np.ndarray             # 有效净值日期（升序）
+    navs: np.ndarray              # 有效净值
+    cum_ret: np.ndarray           # 去均值日收益率前缀和，cum_ret[k] = Σ_{t<=k} (r_t - μ)，cum_ret[0] = 0
+    cum_ret_sq: np.ndarray        # 去均值日收益率平方前缀和
+    tree_max: np.ndarray          # 线段树：区间最大净值
+    tree_min: np.ndarray          # 线段树：区间最小净值
+    tree_dd: np.ndarray           # 线段树：区间最大回撤（小数）
+    size: int                     # 线段树叶子数（2的幂）
+
+    @classmethod
+    def build(cls, fund_code: str, dates: List[str], navs: np.ndarray, version: str = '') -> 'FundRangeIndex':
+        """
+        构建索引
+
+        Args:
+            fund_code: 基金代码
+            dates: 日期列表（升序）
+            navs: 净值数组（空值为NaN，空值和非正值会被剔除）
+            version: 数据版本
+        """
+        keep = ~np.isnan(navs) & (navs > 0)
+        dates = np.asarray(dates, dtype=str)[keep]
+        navs = np.asarray(navs, dtype=np.float64)[keep]
+        n = navs.size
+
+        returns = (navs[1:] - navs[:-1]) / navs[:-1] if n > 1 else np.empty(0)
+        centered = returns - (returns.mean() if returns.size else 0.0)
+        cum_ret = np.concatenate(([0.0], np.cumsum(centered)))
+        cum_ret_sq = np.concatenate(([0.0], np.cumsum(centered * centered)))
+
+        size = 1
+        while size < max(n, 1):
+            size *= 2
+        tree_max = np.zeros(2 * size)
+        tree_min = np.full(2 * size, np.inf)
+        tree_dd = np.zeros(2 * size)
+        tree_max[size:size + n] = navs
+        tree_min[size:size + n] = navs
+
+        # 自底向上逐层合并（每层一次向量化运算）
+        lo = size // 2
+        while lo >= 1:
+            parents = np.arange(lo, 2 * lo)
+            left, right = 2 * parents, 2 * parents + 1
+            tree_max[parents], tree_min[parents], tree_dd[parents] = _combine(
+                tree_max[left], tree_min[left], tree_dd[left],
+                tree_max[right], tree_min[right], tree_dd[right])
+            lo //= 2
+
+        return cls(fund_code, version, dates, navs, cum_ret, cum_ret_sq,
+                   tree_max, tree_min, tree_dd, size)
+
+    def __len__(self):
+        return int(self.navs.size)
+
+    def locate(self, start_dates: List[Optional[str]], end_dates: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        日期映射为净值下标：开始取不早于start_date的首个净值，结束取不晚于end_date的最后一个净值
+        """
+        # 缺省开始日期用空串（早于任何日期），缺省结束日期用'~'（晚于任何日期）
+        starts = np.searchsorted(self.dates, np.array([d or '' for d in start_dates], dtype=str), side='left')
+        ends = np.searchsorted(self.dates, np.array([d or '~' for d in end_dates], dtype=str), side='right') - 1
+        return starts.astype(np.int64), ends.astype(np.int64)
+
+    def range_max_drawdown(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """
+        批量区间最大回撤（闭区间下标，小数），所有查询在线段树上同步推进
+        """
+        q = starts.size
+        l = starts + self.size
+        r = ends + 1 + self.size
+        l_max, l_min, l_dd = np.zeros(q), np.full(q, np.inf), np.zeros(q)
+        r_max, r_min, r_dd = np.zeros(q), np.full(q, np.inf), np.zeros(q)
+
+        while np.any(l < r):
+            active = l < r
+
+            m = active & (l & 1 == 1)
+            node = l[m]
+            l_max[m], l_min[m], l_dd[m] = _combine(l_max[m], l_min[m], l_dd[m],
+                                                  self.tree_max[node], self.tree_min[node], self.tree_dd[node])
+            l[m] += 1
+
+            m = active & (r & 1 == 1)
+            r[m] -= 1
+            node = r[m]
+            r_max[m], r_min[m], r_dd[m] = _combine(self.tree_max[node], self.tree_min[node], self.tree_dd[node],
+                                                  r_max[m], r_min[m], r_dd[m])
+            l >>= 1
+            r >>= 1
+
+        return _combine(l_max, l_min, l_dd, r_max, r_min, r_dd)[2]
+
+    def query(self, starts: np.ndarray, ends: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        批量区间指标（闭区间下标），无法计算处为NaN
+
+        Returns:
+            trading_days, period_return, annual_return, annual_volatility, max_drawdown（百分比）
+        """
+        valid = (ends - starts >= 1) & (starts >= 0) & (ends < len(self))
+        s = np.where(valid, starts, 0)
+        e = np.where(valid, ends, 0)
+        trading_days = np.where(valid, e - s + 1, 0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = self.navs[e] / self.navs[s] if len(self) else np.full(s.size, np.nan)
+            period_return = (ratio - 1) * 100
+            annual_return = (ratio ** (252 / trading_days) - 1) * 100
+
+            m = (e - s).astype(np.float64)
+            s1 = self.cum_ret[e] - self.cum_ret[s]
+            s2 = self.cum_ret_sq[e] - self.cum_ret_sq[s]
+            variance = np.maximum((s2 - s1 * s1 / m) / (m - 1), 0.0)
+            annual_volatility = np.sqrt(variance) * np.sqrt(252) * 100
+
+        max_drawdown = np.full(s.size, np.nan)
+        if valid.any():
+            max_drawdown[valid] = self.range_max_drawdown(s[valid], e[valid]) * 100
+
+        period_return[~valid] = np.nan
+        annual_return[~valid | (trading_days < MIN_DAYS_FOR_ANNUAL_RETURN)] = np.nan
+        annual_volatility[~valid | (trading_days - 1 < MIN_RETURNS_FOR_VOLATILITY)] = np.nan
+
+        return {
+            'valid': valid,
+            'trading_days': trading_days,
+            'period_return': period_return,
+            'annual_return': annual_return,
+            'annual_volatility': annual_volatility,
+            'max_drawdown': max_drawdown,
+        }
+
+
+def get_range_index(fund_code: str, version: str = None, conn=None) -> Optional[FundRangeIndex]:
+    """
+    获取基金区间索引（按数据版本缓存，版本变化时重建）
+
+    Args:
+        fund_code: 基金代码
+        version: 已知的数据版本，None则查询
+        conn: 复用已有连接
+
+    Returns:
+        FundRangeIndex，无净值数据时返回None
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return get_range_index(fund_code, version, new_conn)
+
+    if version is None:
+        version = load_nav_versions([fund_code], conn).get(fund_code)
+    if version is None:
+        return None
+
+    cached = _range_index_cache.get(fund_code)
+    if cached is not None and cached.version == version:
+        _range_index_cache.move_to_end(fund_code)
+        return cached
+
+    dates, navs = load_nav_arrays(conn.cursor(), fund_code)
+    index = FundRangeIndex.build(fund_code, dates, navs, version)
+    _range_index_cache[fund_code] = index
+    _range_index_cache.move_to_end(fund_code)
+    while len(_range_index_cache) > RANGE_INDEX_CACHE_SIZE:
+        _range_index_cache.popitem(last=False)
+    return index
+
+
+def _metric_value(value) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def query_range_metrics(queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    批量查询任意日期区间的收益、波动率和最大回撤
+
+    Args:
+        queries: 查询列表，每项包含 fund_code，可选 start_date / end_date（缺省为净值首尾）
+
+    Returns:
+        与queries等长的结果列表，每项包含实际起止日期、交易日数和各项指标（百分比）；
+        数据不足时 success=False 并给出 error
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+
+    by_fund: Dict[str, List[int]] = {}
+    for k, q in enumerate(queries):
+        by_fund.setdefault(q['fund_code'], []).append(k)
+
+    with get_db_connection() as conn:
+        versions = load_nav_versions(list(by_fund.keys()), conn)
+
+        for fund_code, positions in by_fund.items():
+            index = get_range_index(fund_code, versions.get(fund_code), conn) if fund_code in versions else None
+            if index is None:
+                for k in positions:
+                    results[k] = {**queries[k], 'success': False, 'error': '无净值数据'}
+                continue
+
+            starts, ends = index.locate([queries[k].get('start_date') for k in positions],
+                                        [queries[k].get('end_date') for k in positions])
+            metrics = index.query(starts, ends)
+
+            for j, k in enumerate(positions):
+                if not metrics['valid'][j]:
+                    results[k] = {**queries[k], 'success': False, 'error': '区间内净值数据不足'}
+                    continue
+                results[k] = {
+                    **queries[k],
+                    'success': True,
+                    'actual_start_date': str(index.dates[starts[j]]),
+                    'actual_end_date': str(index.dates[ends[j]]),
+                    'trading_days': int(metrics['trading_days'][j]),
+                    'period_return': _metric_value(metrics['period_return'][j]),
+                    'annual_return': _metric_value(metrics['annual_return'][j]),
+                    'annual_volatility': _metric_value(metrics['annual_volatility'][j]),
+                    'max_drawdown': _metric_value(metrics['max_drawdown'][j]),
+                }
+
+    return results
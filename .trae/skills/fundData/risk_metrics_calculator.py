@@ -2,13 +2,76 @@
 风险指标计算模块
 基于净值数据计算最大回撤、年化波动率、夏普比率等风险指标
 """
+import sqlite3
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime, timedelta
 from funddb import get_db_connection
+from nav_panel import load_nav_panel, ffill_panel
 
 
-def calc_max_drawdown(nav_series: List[float]) -> Tuple[float, int, int]:
+# 各周期对应的交易日数（None表示成立以来）
+PERIOD_DAYS = {
+    '近1月': 21,
+    '近6月': 126,
+    '近1年': 252,
+    '近3年': 756,
+    '近5年': 1260,
+    '成立以来': None
+}
+
+
+def load_nav_arrays(cursor, fund_code: str, limit: int = None,
+                    adjusted: bool = False) -> Tuple[List[str], np.ndarray]:
+    """
+    按列读取基金净值，直接返回float64数组
+    
+    Args:
+        cursor: 数据库游标
+        fund_code: 基金代码
+        limit: 只取最近N条，None表示全部
+        adjusted: 是否读取复权净值（fund_adjusted_nav）
+    
+    Returns:
+        (日期列表, 净值数组)，均按时间升序，空净值为NaN
+    
+    说明：
+        临时关闭游标的row_factory，以元组形式读取后一次性构造数组，
+        避免逐行构造sqlite3.Row和Python float
+    """
+    if adjusted:
+        from adjusted_nav import load_adjusted_nav_arrays
+        return load_adjusted_nav_arrays(cursor, fund_code, limit)
+    
+    cursor.row_factory = None
+    try:
+        if limit:
+            cursor.execute('''
+                SELECT nav_date, unit_nav FROM (
+                    SELECT nav_date, unit_nav FROM fund_nav
+                    WHERE fund_code = ?
+                    ORDER BY nav_date DESC
+                    LIMIT ?
+                ) ORDER BY nav_date ASC
+            ''', (fund_code, limit))
+        else:
+            cursor.execute('''
+                SELECT nav_date, unit_nav FROM fund_nav
+                WHERE fund_code = ?
+                ORDER BY nav_date ASC
+            ''', (fund_code,))
+        rows = cursor.fetchall()
+    finally:
+        cursor.row_factory = sqlite3.Row
+    
+    if not rows:
+        return [], np.empty(0, dtype=np.float64)
+    
+    dates, navs = zip(*rows)
+    return list(dates), np.array(navs, dtype=np.float64)
+
+
+def calc_max_drawdown(nav_series: Union[List[float], np.ndarray]) -> Tuple[float, int, int]:
     """
     计算最大回撤
     
@@ -19,34 +82,27 @@ def calc_max_drawdown(nav_series: List[float]) -> Tuple[float, int, int]:
         (最大回撤百分比, 最高点位置, 最低点位置)
     
     算法：
-        遍历净值序列，记录历史最高点
-        计算每个时点相对于历史最高点的回撤
-        取最大值
+        np.maximum.accumulate 得到历史最高点序列
+        计算每个时点相对于历史最高点的回撤，取最大值
+        最高点取最低点之前首次达到该历史最高值的位置
     """
-    if not nav_series or len(nav_series) < 2:
+    navs = np.asarray(nav_series, dtype=np.float64)
+    if navs.size < 2:
         return 0.0, 0, 0
     
-    max_nav = nav_series[0]
-    max_drawdown = 0.0
-    peak_idx = 0
-    trough_idx = 0
-    current_peak_idx = 0
+    running_max = np.maximum.accumulate(navs)
+    drawdowns = (running_max - navs) / running_max
+    trough_idx = int(np.argmax(drawdowns))
+    max_drawdown = float(drawdowns[trough_idx])
+    if max_drawdown <= 0:
+        return 0.0, 0, 0
     
-    for i, nav in enumerate(nav_series):
-        if nav > max_nav:
-            max_nav = nav
-            current_peak_idx = i
-        
-        drawdown = (max_nav - nav) / max_nav
-        if drawdown > max_drawdown:
-            max_drawdown = drawdown
-            peak_idx = current_peak_idx
-            trough_idx = i
+    peak_idx = int(np.argmax(navs[:trough_idx + 1]))
     
     return max_drawdown * 100, peak_idx, trough_idx
 
 
-def calc_annual_volatility(daily_returns: List[float], trading_days: int = 252) -> float:
+def calc_annual_volatility(daily_returns: Union[List[float], np.ndarray], trading_days: int = 252) -> float:
     """
     计算年化波动率
     
@@ -60,13 +116,14 @@ def calc_annual_volatility(daily_returns: List[float], trading_days: int = 252)
     算法：
         年化波动率 = 日收益率标准差 × sqrt(252)
     """
-    if not daily_returns or len(daily_returns) < 2:
+    returns = np.asarray(daily_returns, dtype=np.float64)
+    if returns.size < 2:
         return 0.0
     
-    std = np.std(daily_returns, ddof=1)
+    std = np.std(returns, ddof=1)
     annual_vol = std * np.sqrt(trading_days)
     
-    return annual_vol * 100
+    return float(annual_vol * 100)
 
 
 def calc_sharpe_ratio(annual_return: float, annual_volatility: float, risk_free_rate: float = 0.025) -> float:
@@ -90,7 +147,7 @@ def calc_sharpe_ratio(annual_return: float, annual_volatility: float, risk_free_
     return (annual_return / 100 - risk_free_rate) / (annual_volatility / 100)
 
 
-def calc_period_return(nav_series: List[float]) -> float:
+def calc_period_return(nav_series: Union[List[float], np.ndarray]) -> float:
     """
     计算区间收益率
     
@@ -103,13 +160,13 @@ def calc_period_return(nav_series: List[float]) -> float:
     算法：
         区间收益率 = (期末净值 / 期初净值) - 1
     """
-    if not nav_series or len(nav_series) < 2:
+    if nav_series is None or len(nav_series) < 2:
         return 0.0
     
-    return (nav_series[-1] / nav_series[0] - 1) * 100
+    return float((nav_series[-1] / nav_series[0] - 1) * 100)
 
 
-def calc_annual_return(nav_series: List[float], trading_days: int) -> float:
+def calc_annual_return(nav_series: Union[List[float], np.ndarray], trading_days: int) -> float:
     """
     计算年化收益率
     
@@ -123,16 +180,16 @@ def calc_annual_return(nav_series: List[float], trading_days: int) -> float:
     算法：
         年化收益率 = (期末净值 / 期初净值)^(252/天数) - 1
     """
-    if not nav_series or len(nav_series) < 2 or trading_days <= 0:
+    if nav_series is None or len(nav_series) < 2 or trading_days <= 0:
         return 0.0
     
-    total_return = nav_series[-1] / nav_series[0]
+    total_return = float(nav_series[-1] / nav_series[0])
     annual_return = (total_return ** (252 / trading_days)) - 1
     
     return annual_return * 100
 
 
-def calc_daily_returns(nav_series: List[float]) -> List[float]:
+def calc_daily_returns(nav_series: Union[List[float], np.ndarray]) -> np.ndarray:
     """
     计算日收益率序列
     
@@ -140,43 +197,42 @@ def calc_daily_returns(nav_series: List[float]) -> List[float]:
         nav_series: 净值序列（按时间升序）
     
     Returns:
-        日收益率序列
+        日收益率数组（前一日净值非正的点被剔除）
     """
-    if not nav_series or len(nav_series) < 2:
-        return []
-    
-    returns = []
-    for i in range(1, len(nav_series)):
-        if nav_series[i-1] > 0:
-            ret = (nav_series[i] - nav_series[i-1]) / nav_series[i-1]
-            returns.append(ret)
+    navs = np.asarray(nav_series, dtype=np.float64)
+    if navs.size < 2:
+        return np.empty(0, dtype=np.float64)
     
-    return returns
+    prev = navs[:-1]
+    valid = prev > 0
+    return (navs[1:][valid] - prev[valid]) / prev[valid]
 
 
-def calculate_risk_metrics_from_nav(nav_data: List[Dict[str, Any]], 
-                                     period: str = '近1年',
-                                     risk_free_rate: float = 0.025) -> Dict[str, Any]:
+def calculate_risk_metrics_from_array(dates: List[str],
+                                      navs: np.ndarray,
+                                      period: str = '近1年',
+                                      risk_free_rate: float = 0.025) -> Dict[str, Any]:
     """
-    从净值数据计算风险指标
+    从净值数组计算风险指标
     
     Args:
-        nav_data: 净值数据列表，每项包含 nav_date, unit_nav
+        dates: 日期列表（与navs等长，按时间升序，首尾作为计算区间）
+        navs: 净值数组（float64，空值为NaN，空值和0会被剔除）
         period: 周期名称
         risk_free_rate: 无风险利率
     
     Returns:
         风险指标字典
     """
-    if not nav_data or len(nav_data) < 2:
+    if len(dates) < 2:
         return {
             'success': False,
             'error': '净值数据不足',
             'period': period
         }
     
-    nav_series = [float(d['unit_nav']) for d in nav_data if d['unit_nav']]
-    trading_days = len(nav_series)
+    navs = navs[~np.isnan(navs) & (navs != 0)]
+    trading_days = int(navs.size)
     
     if trading_days < 2:
         return {
@@ -185,21 +241,18 @@ def calculate_risk_metrics_from_nav(nav_data: List[Dict[str, Any]],
             'period': period
         }
     
-    start_date = nav_data[0]['nav_date']
-    end_date = nav_data[-1]['nav_date']
-    
-    max_drawdown, _, _ = calc_max_drawdown(nav_series)
-    daily_returns = calc_daily_returns(nav_series)
-    annual_volatility = calc_annual_volatility(daily_returns) if len(daily_returns) >= 20 else None
-    period_return = calc_period_return(nav_series)
-    annual_return = calc_annual_return(nav_series, trading_days) if trading_days >= 126 else None
+    max_drawdown, _, _ = calc_max_drawdown(navs)
+    daily_returns = calc_daily_returns(navs)
+    annual_volatility = calc_annual_volatility(daily_returns) if daily_returns.size >= 20 else None
+    period_return = calc_period_return(navs)
+    annual_return = calc_annual_return(navs, trading_days) if trading_days >= 126 else None
     sharpe_ratio = calc_sharpe_ratio(annual_return, annual_volatility, risk_free_rate) if annual_volatility and annual_return else None
     
     return {
         'success': True,
         'period': period,
-        'start_date': start_date,
-        'end_date': end_date,
+        'start_date': dates[0],
+        'end_date': dates[-1],
         'trading_days': trading_days,
         'period_return': round(period_return, 4) if period_return else None,
         'annual_return': round(annual_return, 4) if annual_return else None,
@@ -211,6 +264,77 @@ def calculate_risk_metrics_from_nav(nav_data: List[Dict[str, Any]],
     }
 
 
+def period_window(dates: List[str], navs: np.ndarray, days: Optional[int]) -> Tuple[List[str], np.ndarray]:
+    """
+    截取周期窗口：最近 days 个有效净值点（非空且大于0）所在区间，days为None时取全部有效区间
+
+    窗口按有效净值点计数而不是按行计数，首尾对齐到有效净值日，
+    与面板计算（calculate_panel_risk_metrics）的窗口口径一致
+    """
+    valid_idx = np.flatnonzero(~np.isnan(navs) & (navs > 0))
+    if valid_idx.size == 0:
+        return [], navs[:0]
+    lo = valid_idx[-days] if days and valid_idx.size > days else valid_idx[0]
+    hi = valid_idx[-1] + 1
+    return dates[lo:hi], navs[lo:hi]
+
+
+def calculate_risk_metrics_batch(dates: List[str],
+                                 navs: np.ndarray,
+                                 periods: List[str] = None,
+                                 risk_free_rate: float = 0.025) -> Dict[str, Dict[str, Any]]:
+    """
+    基于同一份净值数组一次计算多个周期的风险指标
+    
+    各周期按 period_window 取最近N个有效净值点的切片（视图，不复制），
+    只需读取一次数据库
+    
+    Args:
+        dates: 日期列表（按时间升序，完整历史）
+        navs: 净值数组（float64，完整历史）
+        periods: 周期列表，默认 PERIOD_DAYS 中的全部周期
+        risk_free_rate: 无风险利率
+    
+    Returns:
+        {周期: 风险指标字典}
+    """
+    periods = periods or list(PERIOD_DAYS.keys())
+    results = {}
+    
+    for period in periods:
+        window_dates, window_navs = period_window(dates, navs, PERIOD_DAYS.get(period))
+        results[period] = calculate_risk_metrics_from_array(window_dates, window_navs, period, risk_free_rate)
+    
+    return results
+
+
+def calculate_risk_metrics_from_nav(nav_data: List[Dict[str, Any]], 
+                                     period: str = '近1年',
+                                     risk_free_rate: float = 0.025) -> Dict[str, Any]:
+    """
+    从净值数据计算风险指标
+    
+    Args:
+        nav_data: 净值数据列表，每项包含 nav_date, unit_nav
+        period: 周期名称
+        risk_free_rate: 无风险利率
+    
+    Returns:
+        风险指标字典
+    """
+    if not nav_data or len(nav_data) < 2:
+        return {
+            'success': False,
+            'error': '净值数据不足',
+            'period': period
+        }
+    
+    dates = [d['nav_date'] for d in nav_data]
+    navs = np.array([d['unit_nav'] for d in nav_data], dtype=np.float64)
+    
+    return calculate_risk_metrics_from_array(dates, navs, period, risk_free_rate)
+
+
 def compare_with_xueqiu(calc_result: Dict[str, Any], xueqiu_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     对比自计算与雪球的风险指标
@@ -261,6 +385,71 @@ def compare_with_xueqiu(calc_result: Dict[str, Any], xueqiu_data: Dict[str, Any]
     return comparison
 
 
+def _cached_risk_result(fund_code: str, row) -> Dict[str, Any]:
+    """将 fund_risk_metrics 缓存行转换为计算结果格式"""
+    return {
+        'success': True,
+        'fund_code': fund_code,
+        'period': row['period'],
+        'start_date': row['calc_start_date'],
+        'end_date': row['calc_end_date'],
+        'trading_days': row['trading_days'],
+        'period_return': row['period_return'],
+        'max_drawdown': row['max_drawdown'],
+        'annual_volatility': row['annual_volatility'],
+        'sharpe_ratio': row['sharpe_ratio'],
+        'from_cache': True,
+        'message': '使用缓存数据'
+    }
+
+
+def _ensure_nav_count(cursor, fund_code: str) -> int:
+    """检查净值条数，不足20条时尝试同步，返回最终条数"""
+    from syncers import sync_group_nav
+    
+    cursor.execute('SELECT COUNT(*) as cnt FROM fund_nav WHERE fund_code = ?', (fund_code,))
+    nav_count = cursor.fetchone()['cnt']
+    
+    if nav_count < 20:
+        print(f"[RiskCalc] {fund_code} 净值数据不足({nav_count}条)，尝试获取...")
+        sync_group_nav([fund_code])
+        
+        cursor.execute('SELECT COUNT(*) as cnt FROM fund_nav WHERE fund_code = ?', (fund_code,))
+        nav_count = cursor.fetchone()['cnt']
+    
+    return nav_count
+
+
+def _risk_metrics_row(fund_code: str, result: Dict[str, Any]) -> tuple:
+    """构造 fund_risk_metrics 写入参数"""
+    return (
+        fund_code, result['period'],
+        result.get('max_drawdown'),
+        result.get('annual_volatility'),
+        result.get('sharpe_ratio'),
+        'calculated',
+        result.get('start_date'),
+        result.get('end_date'),
+        result.get('trading_days'),
+        result.get('period_return')
+    )
+
+
+SAVE_RISK_METRICS_SQL = '''
+    INSERT OR REPLACE INTO fund_risk_metrics
+    (fund_code, period, max_drawdown, annual_volatility, sharpe_ratio,
+     data_source, calc_start_date, calc_end_date, trading_days, period_return, update_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+'''
+
+SAVE_ADJ_RISK_METRICS_SQL = '''
+    INSERT OR REPLACE INTO fund_risk_metrics_adj
+    (fund_code, period, max_drawdown, annual_volatility, sharpe_ratio,
+     data_source, calc_start_date, calc_end_date, trading_days, period_return, update_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+'''
+
+
 def calculate_fund_risk_metrics(fund_code: str, 
                                  period: str = '近1年',
                                  force_update: bool = False) -> Dict[str, Any]:
@@ -277,18 +466,6 @@ def calculate_fund_risk_metrics(fund_code: str,
     Returns:
         计算结果
     """
-    from funddb import get_db_connection
-    from syncers import sync_group_nav
-    
-    period_days = {
-        '近1月': 21,
-        '近6月': 126,
-        '近1年': 252,
-        '近3年': 756,
-        '近5年': 1260,
-        '成立以来': None
-    }
-    
     with get_db_connection() as conn:
         cursor = conn.cursor()
         
@@ -306,58 +483,21 @@ def calculate_fund_risk_metrics(fund_code: str,
                 if latest_nav and latest_nav['latest']:
                     calc_end = row['calc_end_date']
                     if calc_end and calc_end >= latest_nav['latest']:
-                        return {
-                            'success': True,
-                            'fund_code': fund_code,
-                            'period': period,
-                            'start_date': row['calc_start_date'],
-                            'end_date': row['calc_end_date'],
-                            'trading_days': row['trading_days'],
-                            'period_return': row['period_return'],
-                            'max_drawdown': row['max_drawdown'],
-                            'annual_volatility': row['annual_volatility'],
-                            'sharpe_ratio': row['sharpe_ratio'],
-                            'from_cache': True,
-                            'message': '使用缓存数据'
-                        }
-        
-        cursor.execute('SELECT COUNT(*) as cnt FROM fund_nav WHERE fund_code = ?', (fund_code,))
-        nav_count = cursor.fetchone()['cnt']
+                        return _cached_risk_result(fund_code, row)
         
+        nav_count = _ensure_nav_count(cursor, fund_code)
         if nav_count < 20:
-            print(f"[RiskCalc] {fund_code} 净值数据不足({nav_count}条)，尝试获取...")
-            sync_group_nav([fund_code])
-            
-            cursor.execute('SELECT COUNT(*) as cnt FROM fund_nav WHERE fund_code = ?', (fund_code,))
-            nav_count = cursor.fetchone()['cnt']
-            
-            if nav_count < 20:
-                return {
-                    'success': False,
-                    'fund_code': fund_code,
-                    'period': period,
-                    'error': f'净值数据不足({nav_count}条)'
-                }
+            return {
+                'success': False,
+                'fund_code': fund_code,
+                'period': period,
+                'error': f'净值数据不足({nav_count}条)'
+            }
         
-        days = period_days.get(period)
-        if days:
-            cursor.execute('''
-                SELECT nav_date, unit_nav FROM fund_nav
-                WHERE fund_code = ?
-                ORDER BY nav_date DESC
-                LIMIT ?
-            ''', (fund_code, days))
-            nav_data = cursor.fetchall()
-            nav_data = list(reversed(nav_data))
-        else:
-            cursor.execute('''
-                SELECT nav_date, unit_nav FROM fund_nav
-                WHERE fund_code = ?
-                ORDER BY nav_date ASC
-            ''', (fund_code,))
-            nav_data = cursor.fetchall()
+        # 按有效净值点取窗口（含空净值的行不计入周期天数），与批量和面板计算一致
+        dates, navs = period_window(*load_nav_arrays(cursor, fund_code), PERIOD_DAYS.get(period))
         
-        if not nav_data:
+        if not dates:
             return {
                 'success': False,
                 'fund_code': fund_code,
@@ -365,34 +505,257 @@ def calculate_fund_risk_metrics(fund_code: str,
                 'error': '无净值数据'
             }
         
-        result = calculate_risk_metrics_from_nav(nav_data, period)
+        result = calculate_risk_metrics_from_array(dates, navs, period)
         result['fund_code'] = fund_code
         
         if not result.get('success'):
             return result
         
-        cursor.execute('''
-            INSERT OR REPLACE INTO fund_risk_metrics
-            (fund_code, period, max_drawdown, annual_volatility, sharpe_ratio,
-             data_source, calc_start_date, calc_end_date, trading_days, period_return, update_time)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-        ''', (
-            fund_code, period,
-            result.get('max_drawdown'),
-            result.get('annual_volatility'),
-            result.get('sharpe_ratio'),
-            'calculated',
-            result.get('start_date'),
-            result.get('end_date'),
-            result.get('trading_days'),
-            result.get('period_return')
-        ))
-        
+        cursor.execute(SAVE_RISK_METRICS_SQL, _risk_metrics_row(fund_code, result))
         conn.commit()
         
         return result
 
 
+def calculate_fund_risk_metrics_batch(fund_code: str,
+                                      periods: List[str] = None,
+                                      force_update: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    一次计算单只基金多个周期的风险指标
+    
+    只读取一次完整净值历史，各周期在同一数组上切片计算，
+    结果在同一事务中批量写入数据库
+    
+    Args:
+        fund_code: 基金代码
+        periods: 周期列表，默认 PERIOD_DAYS 中的全部周期
+        force_update: 是否强制更新
+    
+    Returns:
+        {周期: 计算结果}
+    """
+    periods = periods or list(PERIOD_DAYS.keys())
+    results = {}
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        if not force_update:
+            cursor.execute('SELECT MAX(nav_date) as latest FROM fund_nav WHERE fund_code = ?', (fund_code,))
+            latest = cursor.fetchone()['latest']
+            
+            if latest:
+                placeholders = ','.join(['?' for _ in periods])
+                cursor.execute(f'''
+                    SELECT * FROM fund_risk_metrics
+                    WHERE fund_code = ? AND data_source = 'calculated' AND period IN ({placeholders})
+                ''', [fund_code] + periods)
+                for row in cursor.fetchall():
+                    if row['update_time'] and row['calc_end_date'] and row['calc_end_date'] >= latest:
+                        results[row['period']] = _cached_risk_result(fund_code, row)
+        
+        pending = [p for p in periods if p not in results]
+        if not pending:
+            return results
+        
+        nav_count = _ensure_nav_count(cursor, fund_code)
+        if nav_count < 20:
+            for period in pending:
+                results[period] = {
+                    'success': False,
+                    'fund_code': fund_code,
+                    'period': period,
+                    'error': f'净值数据不足({nav_count}条)'
+                }
+            return results
+        
+        dates, navs = load_nav_arrays(cursor, fund_code)
+        
+        rows = []
+        for period, result in calculate_risk_metrics_batch(dates, navs, pending).items():
+            result['fund_code'] = fund_code
+            results[period] = result
+            if result.get('success'):
+                rows.append(_risk_metrics_row(fund_code, result))
+        
+        if rows:
+            cursor.executemany(SAVE_RISK_METRICS_SQL, rows)
+            conn.commit()
+    
+    return results
+
+
+def calculate_panel_risk_metrics(dates: List[str],
+                                 values: np.ndarray,
+                                 period: str = '近1年',
+                                 risk_free_rate: float = 0.025) -> Dict[str, np.ndarray]:
+    """
+    在净值面板上对所有基金同时计算单个周期的风险指标
+    
+    与逐只基金的计算口径一致：每只基金取最近N个有效净值点，
+    日收益率按相邻有效净值点计算（跳过缺失日），不做插值
+    
+    Args:
+        dates: 日期轴（升序）
+        values: 净值矩阵 (日期 × 基金)，缺失为NaN
+        period: 周期名称
+        risk_free_rate: 无风险利率
+    
+    Returns:
+        各指标数组（长度为基金数，无法计算处为NaN）及起止日期索引
+    """
+    days = PERIOD_DAYS.get(period)
+    n_dates, n_funds = values.shape
+    cols = np.arange(n_funds)
+    
+    valid = ~np.isnan(values)
+    if days:
+        rank_from_end = np.cumsum(valid[::-1], axis=0)[::-1]
+        window = valid & (rank_from_end <= days)
+    else:
+        window = valid
+    
+    trading_days = window.sum(axis=0)
+    x = np.where(window, values, np.nan)
+    
+    first_idx = np.argmax(window, axis=0)
+    last_idx = n_dates - 1 - np.argmax(window[::-1], axis=0)
+    first_nav = x[first_idx, cols]
+    last_nav = x[last_idx, cols]
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        period_return = (last_nav / first_nav - 1) * 100
+        
+        running_max = np.fmax.accumulate(x, axis=0)
+        drawdowns = np.where(window, (running_max - x) / running_max, -np.inf)
+        max_drawdown = drawdowns.max(axis=0) * 100
+        
+        prev = ffill_panel(x)[:-1]
+        returns = (x[1:] - prev) / prev
+        ret_valid = ~np.isnan(returns)
+        n_returns = ret_valid.sum(axis=0)
+        ret_mean = np.where(ret_valid, returns, 0).sum(axis=0) / n_returns
+        ret_var = np.where(ret_valid, (returns - ret_mean) ** 2, 0).sum(axis=0) / (n_returns - 1)
+        annual_volatility = np.sqrt(ret_var) * np.sqrt(252) * 100
+        
+        annual_return = ((last_nav / first_nav) ** (252 / trading_days) - 1) * 100
+        sharpe_ratio = (annual_return / 100 - risk_free_rate) / (annual_volatility / 100)
+    
+    ok = trading_days >= 2
+    annual_volatility[~ok | (n_returns < 20)] = np.nan
+    annual_return[~ok | (trading_days < 126)] = np.nan
+    sharpe_ratio[np.isnan(annual_volatility) | np.isnan(annual_return)
+                 | (annual_volatility == 0) | (annual_return == 0)] = np.nan
+    period_return[~ok] = np.nan
+    max_drawdown[~ok] = np.nan
+    
+    return {
+        'success': ok,
+        'trading_days': trading_days,
+        'start_idx': first_idx,
+        'end_idx': last_idx,
+        'period_return': period_return,
+        'annual_return': annual_return,
+        'max_drawdown': max_drawdown,
+        'annual_volatility': annual_volatility,
+        'sharpe_ratio': sharpe_ratio,
+    }
+
+
+def _round_metric(value: float) -> Optional[float]:
+    """与逐只计算一致：NaN和0记为None，其余保留4位小数"""
+    if np.isnan(value) or value == 0:
+        return None
+    return round(float(value), 4)
+
+
+def calculate_universe_risk_metrics(fund_codes: List[str] = None,
+                                    periods: List[str] = None,
+                                    risk_free_rate: float = 0.025,
+                                    chunk_size: int = 500,
+                                    save: bool = True,
+                                    adjusted: bool = False) -> Dict[str, Any]:
+    """
+    全市场横截面风险指标计算
+    
+    将全部（或指定）基金净值加载为交易日历对齐的面板，
+    按基金分块对所有周期做向量化计算，结果在单个事务内批量写入 fund_risk_metrics
+    （复权口径写入 fund_risk_metrics_adj）
+    
+    Args:
+        fund_codes: 基金代码列表，None表示 fund_nav 中的全部基金
+        periods: 周期列表，默认 PERIOD_DAYS 中的全部周期
+        risk_free_rate: 无风险利率
+        chunk_size: 每块基金数，控制峰值内存
+        save: 是否写入数据库
+        adjusted: 是否使用复权净值（全收益口径，先增量更新复权净值；
+                  写入 fund_risk_metrics_adj，data_source 为 'calculated_adj'）
+    
+    Returns:
+        计算汇总（基金数、写入条数、跳过数、耗时）
+    """
+    import time
+    
+    start_time = time.time()
+    periods = periods or list(PERIOD_DAYS.keys())
+    
+    if adjusted:
+        from adjusted_nav import update_adjusted_nav
+        update_adjusted_nav(fund_codes)
+    data_source = 'calculated_adj' if adjusted else 'calculated'
+    
+    with get_db_connection() as conn:
+        panel = load_nav_panel(fund_codes, conn=conn, adjusted=adjusted)
+        load_seconds = time.time() - start_time
+        
+        rows = []
+        skipped = 0
+        n_funds = len(panel.fund_codes)
+        
+        for lo in range(0, n_funds, chunk_size):
+            block = panel.values[:, lo:lo + chunk_size]
+            block_codes = panel.fund_codes[lo:lo + chunk_size]
+            # 与逐只计算一致：有效净值不足20条的基金不计算
+            enough = (~np.isnan(block)).sum(axis=0) >= 20
+            skipped += int((~enough).sum())
+            
+            for period in periods:
+                metrics = calculate_panel_risk_metrics(panel.dates, block, period, risk_free_rate)
+                for j in np.nonzero(enough & metrics['success'])[0]:
+                    rows.append((
+                        block_codes[j], period,
+                        _round_metric(metrics['max_drawdown'][j]),
+                        _round_metric(metrics['annual_volatility'][j]),
+                        _round_metric(metrics['sharpe_ratio'][j]),
+                        data_source,
+                        panel.dates[metrics['start_idx'][j]],
+                        panel.dates[metrics['end_idx'][j]],
+                        int(metrics['trading_days'][j]),
+                        _round_metric(metrics['period_return'][j])
+                    ))
+        
+        if save and rows:
+            cursor = conn.cursor()
+            cursor.executemany(SAVE_ADJ_RISK_METRICS_SQL if adjusted else SAVE_RISK_METRICS_SQL, rows)
+            conn.commit()
+    
+    elapsed = time.time() - start_time
+    print(f"[RiskCalc] 全市场风险指标: {n_funds}只基金, {len(rows)}条结果, "
+          f"加载{load_seconds:.2f}s, 总耗时{elapsed:.2f}s")
+    
+    return {
+        'success': True,
+        'fund_count': n_funds,
+        'skip_count': skipped,
+        'record_count': len(rows),
+        'periods': periods,
+        'saved': save,
+        'load_seconds': round(load_seconds, 3),
+        'elapsed_seconds': round(elapsed, 3),
+        'records': None if save else rows
+    }
+
+
 def calculate_portfolio_risk_metrics(portfolio_id: int = None,
                                       portfolio_name: str = None,
                                       force_update: bool = False) -> Dict[str, Any]:
@@ -450,8 +813,10 @@ def calculate_portfolio_risk_metrics(portfolio_id: int = None,
             'periods': []
         }
         
+        fund_calc = calculate_fund_risk_metrics_batch(fund_code, periods, force_update)
+        
         for period in periods:
-            calc_result = calculate_fund_risk_metrics(fund_code, period, force_update)
+            calc_result = fund_calc[period]
             
             if calc_result.get('success'):
                 success_count += 1
@@ -0,0 +1,463 @@
+"""
+风险指标增量更新模块
+
+为每只基金的每个滑动窗口（近1月/近6月/近1年）维护累加器状态：
+- 环形缓冲区：窗口内的净值和日期，用于窗口过期
+- 收益率累加和：sum(r)、sum(r²)，用于O(1)计算均值和方差
+- 运行峰值和最大回撤：新净值到达时O(1)更新
+
+新增一个交易日净值时只需更新状态，无需重新读取和计算整个窗口。
+状态持久化在 fund_risk_stream_state 表中，并提供全量重算的一致性校验。
+
+口径说明：
+    窗口取最近N个有效净值点（空值和非正值不进入窗口），
+    与 calculate_risk_metrics_from_array 对有效净值尾部切片的计算结果一致
+"""
+import sys
+import os
+import math
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from risk_metrics_calculator import (
+    PERIOD_DAYS,
+    load_nav_arrays,
+    calc_period_return,
+    calc_annual_return,
+    calc_sharpe_ratio,
+    calculate_risk_metrics_from_array,
+    _risk_metrics_row,
+    SAVE_RISK_METRICS_SQL,
+)
+
+
+# 支持增量更新的周期（固定长度滑动窗口）
+STREAM_PERIODS = ['近1月', '近6月', '近1年']
+
+# 一致性校验中各指标允许的差异（均为保留4位小数后的值）
+CONSISTENCY_FIELDS = ['period_return', 'annual_return', 'max_drawdown', 'annual_volatility', 'sharpe_ratio']
+
+
+@dataclass
+class RollingRiskState:
+    """
+    单只基金单个窗口的累加器状态
+
+    序号seq为已追加的有效净值个数，第k个净值存放在缓冲区 k % window_size 位置，
+    窗口内为序号 [seq - nav_count, seq) 的净值
+    """
+    fund_code: str
+    period: str
+    window_size: int
+    navs: np.ndarray = None               # 环形缓冲区：净值
+    dates: List[str] = None               # 环形缓冲区：日期
+    seq: int = 0
+    nav_count: int = 0
+    sum_ret: float = 0.0                  # 窗口内日收益率之和
+    sum_ret_sq: float = 0.0               # 窗口内日收益率平方和
+    peak_nav: float = 0.0                 # 窗口内运行峰值
+    peak_seq: int = -1
+    max_dd: float = 0.0                   # 窗口内最大回撤（小数）
+    dd_peak_seq: int = -1                 # 最大回撤的峰值序号
+    dd_trough_seq: int = -1               # 最大回撤的谷值序号
+    last_date: Optional[str] = None
+
+    def __post_init__(self):
+        if self.navs is None:
+            self.navs = np.zeros(self.window_size, dtype=np.float64)
+        if self.dates is None:
+            self.dates = [''] * self.window_size
+
+    def _nav_at(self, seq: int) -> float:
+        return float(self.navs[seq % self.window_size])
+
+    def window_navs(self) -> np.ndarray:
+        """按时间顺序返回窗口内净值"""
+        idx = np.arange(self.seq - self.nav_count, self.seq) % self.window_size
+        return self.navs[idx]
+
+    def window_dates(self) -> List[str]:
+        """按时间顺序返回窗口内日期"""
+        return [self.dates[k % self.window_size] for k in range(self.seq - self.nav_count, self.seq)]
+
+    def append(self, nav_date: str, unit_nav: float) -> bool:
+        """
+        追加一个净值点，O(1)更新状态
+
+        仅当过期点恰好是运行峰值或最大回撤的峰值时，需要在窗口内重扫回撤（O(N)），
+        其余情况均为常数时间
+
+        Returns:
+            是否追加（空值、非正值被忽略）
+        """
+        if unit_nav is None or math.isnan(unit_nav) or unit_nav <= 0:
+            return False
+
+        s = self.seq
+        rescan = False
+
+        if self.nav_count == self.window_size:
+            old_seq = s - self.window_size
+            old_nav = self._nav_at(old_seq)
+            next_nav = self._nav_at(old_seq + 1)
+            r = (next_nav - old_nav) / old_nav
+            self.sum_ret -= r
+            self.sum_ret_sq -= r * r
+            self.nav_count -= 1
+            rescan = old_seq in (self.peak_seq, self.dd_peak_seq)
+
+        if self.nav_count > 0:
+            prev_nav = self._nav_at(s - 1)
+            r = (unit_nav - prev_nav) / prev_nav
+            self.sum_ret += r
+            self.sum_ret_sq += r * r
+
+        self.navs[s % self.window_size] = unit_nav
+        self.dates[s % self.window_size] = nav_date
+        self.nav_count += 1
+        self.seq += 1
+        self.last_date = nav_date
+
+        if rescan:
+            self._rescan_drawdown()
+        else:
+            if unit_nav >= self.peak_nav:
+                self.peak_nav = unit_nav
+                self.peak_seq = s
+            dd = (self.peak_nav - unit_nav) / self.peak_nav
+            if dd > self.max_dd:
+                self.max_dd = dd
+                self.dd_peak_seq = self.peak_seq
+                self.dd_trough_seq = s
+
+        # 每滚动一整个窗口用缓冲区重算一次累加和，消除加减抵消带来的浮点漂移（均摊O(1)）
+        if self.seq % self.window_size == 0:
+            self._refresh_sums()
+
+        return True
+
+    def _rescan_drawdown(self):
+        """在当前窗口内重新计算运行峰值和最大回撤"""
+        navs = self.window_navs()
+        base = self.seq - self.nav_count
+
+        # 峰值取最后一次出现的位置，尽量推迟其过期
+        peak_i = len(navs) - 1 - int(np.argmax(navs[::-1]))
+        self.peak_nav = float(navs[peak_i])
+        self.peak_seq = base + peak_i
+
+        running_max = np.maximum.accumulate(navs)
+        drawdowns = (running_max - navs) / running_max
+        trough_i = int(np.argmax(drawdowns))
+        if drawdowns[trough_i] <= 0:
+            self.max_dd, self.dd_peak_seq, self.dd_trough_seq = 0.0, -1, -1
+            return
+
+        head = navs[:trough_i + 1]
+        self.max_dd = float(drawdowns[trough_i])
+        self.dd_peak_seq = base + len(head) - 1 - int(np.argmax(head[::-1]))
+        self.dd_trough_seq = base + trough_i
+
+    def _refresh_sums(self):
+        """用缓冲区重算收益率累加和"""
+        navs = self.window_navs()
+        returns = (navs[1:] - navs[:-1]) / navs[:-1]
+        self.sum_ret = float(returns.sum())
+        self.sum_ret_sq = float((returns * returns).sum())
+
+    def metrics(self, risk_free_rate: float = 0.025) -> Dict[str, Any]:
+        """
+        由累加器状态计算风险指标，返回格式与 calculate_risk_metrics_from_array 相同
+
+        算法：
+            方差 = (Σr² - (Σr)²/n) / (n-1)
+        """
+        if self.nav_count < 2:
+            return {
+                'success': False,
+                'error': '有效净值数据不足',
+                'period': self.period
+            }
+
+        trading_days = self.nav_count
+        ends = [self._nav_at(self.seq - trading_days), self._nav_at(self.seq - 1)]
+
+        n_returns = trading_days - 1
+        annual_volatility = None
+        if n_returns >= 20:
+            variance = (self.sum_ret_sq - self.sum_ret * self.sum_ret / n_returns) / (n_returns - 1)
+            annual_volatility = math.sqrt(max(variance, 0.0)) * math.sqrt(252) * 100
+
+        max_drawdown = self.max_dd * 100
+        period_return = calc_period_return(ends)
+        annual_return = calc_annual_return(ends, trading_days) if trading_days >= 126 else None
+        sharpe_ratio = calc_sharpe_ratio(annual_return, annual_volatility, risk_free_rate) if annual_volatility and annual_return else None
+
+        return {
+            'success': True,
+            'period': self.period,
+            'start_date': self.dates[(self.seq - trading_days) % self.window_size],
+            'end_date': self.last_date,
+            'trading_days': trading_days,
+            'period_return': round(period_return, 4) if period_return else None,
+            'annual_return': round(annual_return, 4) if annual_return else None,
+            'max_drawdown': round(max_drawdown, 4) if max_drawdown else None,
+            'annual_volatility': round(annual_volatility, 4) if annual_volatility else None,
+            'sharpe_ratio': round(sharpe_ratio, 4) if sharpe_ratio else None,
+            'risk_free_rate': risk_free_rate,
+            'data_source': 'calculated'
+        }
+
+    def to_row(self) -> tuple:
+        """构造 fund_risk_stream_state 写入参数"""
+        return (
+            self.fund_code, self.period, self.window_size, self.seq, self.nav_count,
+            self.sum_ret, self.sum_ret_sq, self.peak_nav, self.peak_seq,
+            self.max_dd, self.dd_peak_seq, self.dd_trough_seq, self.last_date,
+            self.navs.astype('<f8').tobytes(), ','.join(self.dates)
+        )
+
+    @classmethod
+    def from_row(cls, row) -> 'RollingRiskState':
+        """从 fund_risk_stream_state 行恢复状态"""
+        window_size = row['window_size']
+        return cls(
+            fund_code=row['fund_code'],
+            period=row['period'],
+            window_size=window_size,
+            navs=np.frombuffer(row['nav_buffer'], dtype='<f8').copy(),
+            dates=row['date_buffer'].split(',') if row['date_buffer'] else [''] * window_size,
+            seq=row['seq'],
+            nav_count=row['nav_count'],
+            sum_ret=row['sum_ret'],
+            sum_ret_sq=row['sum_ret_sq'],
+            peak_nav=row['peak_nav'],
+            peak_seq=row['peak_seq'],
+            max_dd=row['max_dd'],
+            dd_peak_seq=row['dd_peak_seq'],
+            dd_trough_seq=row['dd_trough_seq'],
+            last_date=row['last_date']
+        )
+
+
+SAVE_STREAM_STATE_SQL = '''
+    INSERT OR REPLACE INTO fund_risk_stream_state
+    (fund_code, period, window_size, seq, nav_count, sum_ret, sum_ret_sq,
+     peak_nav, peak_seq, max_dd, dd_peak_seq, dd_trough_seq, last_date,
+     nav_buffer, date_buffer, update_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+'''
+
+
+def _valid_nav_arrays(cursor, fund_code: str, limit: int = None):
+    """读取净值并剔除空值和非正值"""
+    dates, navs = load_nav_arrays(cursor, fund_code, limit)
+    keep = ~np.isnan(navs) & (navs > 0)
+    return [d for d, k in zip(dates, keep) if k], navs[keep]
+
+
+def build_risk_stream_state(fund_code: str,
+                            period: str,
+                            dates: List[str],
+                            navs: np.ndarray) -> RollingRiskState:
+    """
+    由有效净值历史构建累加器状态（全量初始化）
+
+    Args:
+        fund_code: 基金代码
+        period: 周期名称，须在 STREAM_PERIODS 中
+        dates: 日期列表（按时间升序，仅含有效净值）
+        navs: 有效净值数组
+
+    Returns:
+        RollingRiskState
+    """
+    window_size = PERIOD_DAYS[period]
+    state = RollingRiskState(fund_code, period, window_size)
+    for nav_date, unit_nav in zip(dates[-window_size:], navs[-window_size:]):
+        state.append(nav_date, float(unit_nav))
+    return state
+
+
+def load_risk_stream_states(cursor, fund_code: str) -> Dict[str, RollingRiskState]:
+    """读取基金的全部累加器状态"""
+    cursor.execute('SELECT * FROM fund_risk_stream_state WHERE fund_code = ?', (fund_code,))
+    return {row['period']: RollingRiskState.from_row(row) for row in cursor.fetchall()}
+
+
+def init_risk_stream(fund_code: str, periods: List[str] = None) -> Dict[str, Any]:
+    """
+    全量初始化（或重建）基金的累加器状态，并写入对应周期的风险指标
+
+    Args:
+        fund_code: 基金代码
+        periods: 周期列表，默认 STREAM_PERIODS
+
+    Returns:
+        {'success': True, 'fund_code': ..., 'results': {周期: 风险指标}}
+    """
+    periods = periods or STREAM_PERIODS
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        dates, navs = _valid_nav_arrays(cursor, fund_code, max(PERIOD_DAYS[p] for p in periods))
+        if len(dates) < 2:
+            return {
+                'success': False,
+                'fund_code': fund_code,
+                'error': f'有效净值数据不足({len(dates)}条)'
+            }
+
+        states = {p: build_risk_stream_state(fund_code, p, dates, navs) for p in periods}
+        results = _save_states(cursor, fund_code, states)
+        conn.commit()
+
+    return {'success': True, 'fund_code': fund_code, 'results': results}
+
+
+def _save_states(cursor, fund_code: str, states: Dict[str, RollingRiskState],
+                 risk_free_rate: float = 0.025) -> Dict[str, Dict[str, Any]]:
+    """写入累加器状态及由其导出的风险指标，返回各周期指标"""
+    results = {}
+    metric_rows = []
+    for period, state in states.items():
+        result = state.metrics(risk_free_rate)
+        result['fund_code'] = fund_code
+        results[period] = result
+        if result.get('success'):
+            metric_rows.append(_risk_metrics_row(fund_code, result))
+
+    cursor.executemany(SAVE_STREAM_STATE_SQL, [s.to_row() for s in states.values()])
+    if metric_rows:
+        cursor.executemany(SAVE_RISK_METRICS_SQL, metric_rows)
+    return results
+
+
+def update_risk_metrics_incremental(fund_code: str,
+                                    risk_free_rate: float = 0.025) -> Dict[str, Any]:
+    """
+    增量更新基金的近1月/近6月/近1年风险指标
+
+    只读取各窗口 last_date 之后新增的净值，逐点O(1)追加到累加器状态，
+    然后写回状态和 fund_risk_metrics。尚无状态的周期自动全量初始化。
+
+    说明：
+        历史净值被修订（已追加日期的净值发生变化）无法被增量检测，
+        可通过 check_risk_stream_consistency(fund_code, repair=True) 校验并重建
+
+    Args:
+        fund_code: 基金代码
+        risk_free_rate: 无风险利率
+
+    Returns:
+        {'success': True, 'fund_code': ..., 'appended': 实际追加的净值数, 'results': {周期: 风险指标}}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        states = load_risk_stream_states(cursor, fund_code)
+
+        missing = [p for p in STREAM_PERIODS if p not in states]
+        if missing:
+            dates, navs = _valid_nav_arrays(cursor, fund_code, max(PERIOD_DAYS[p] for p in missing))
+            for period in missing:
+                states[period] = build_risk_stream_state(fund_code, period, dates, navs)
+
+        since = min((s.last_date or '') for s in states.values())
+        cursor.execute('''
+            SELECT nav_date, unit_nav FROM fund_nav
+            WHERE fund_code = ? AND nav_date > ?
+            ORDER BY nav_date ASC
+        ''', (fund_code, since))
+        new_rows = cursor.fetchall()
+
+        appended = 0
+        for row in new_rows:
+            unit_nav = row['unit_nav']
+            if unit_nav is None:
+                continue
+            applied = False
+            for state in states.values():
+                if state.last_date is None or row['nav_date'] > state.last_date:
+                    applied = state.append(row['nav_date'], float(unit_nav)) or applied
+            # 只统计实际追加到累加器的净值（非正值被 append 忽略）
+            if applied:
+                appended += 1
+
+        results = _save_states(cursor, fund_code, states, risk_free_rate)
+        conn.commit()
+
+    return {
+        'success': True,
+        'fund_code': fund_code,
+        'appended': appended,
+        'results': results
+    }
+
+
+def check_risk_stream_consistency(fund_code: str,
+                                  tolerance: float = 1e-4,
+                                  repair: bool = False) -> Dict[str, Any]:
+    """
+    一致性校验：用完整净值窗口全量重算，与累加器状态导出的指标逐项比对
+
+    Args:
+        fund_code: 基金代码
+        tolerance: 允许差异（指标均保留4位小数，默认允许末位舍入差异）
+        repair: 不一致时是否用全量结果重建状态
+
+    Returns:
+        {'success': True, 'consistent': bool, 'mismatches': [...], 'repaired': bool}
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        states = load_risk_stream_states(cursor, fund_code)
+        if not states:
+            return {
+                'success': False,
+                'fund_code': fund_code,
+                'error': '尚未初始化累加器状态'
+            }
+
+        dates, navs = _valid_nav_arrays(cursor, fund_code)
+
+        mismatches = []
+        for period, state in states.items():
+            days = state.window_size
+            expected = calculate_risk_metrics_from_array(dates[-days:], navs[-days:], period)
+            actual = state.metrics(expected.get('risk_free_rate', 0.025))
+
+            if expected.get('success') != actual.get('success'):
+                mismatches.append({'period': period, 'field': 'success',
+                                   'stream': actual.get('success'), 'full': expected.get('success')})
+                continue
+            if not expected.get('success'):
+                continue
+
+            for key in ('start_date', 'end_date', 'trading_days'):
+                if expected[key] != actual[key]:
+                    mismatches.append({'period': period, 'field': key,
+                                       'stream': actual[key], 'full': expected[key]})
+            for key in CONSISTENCY_FIELDS:
+                a, e = actual[key], expected[key]
+                if (a is None) != (e is None) or (a is not None and abs(a - e) > tolerance):
+                    mismatches.append({'period': period, 'field': key, 'stream': a, 'full': e})
+
+        repaired = False
+        if mismatches and repair:
+            rebuilt = {p: build_risk_stream_state(fund_code, p, dates, navs) for p in states}
+            _save_states(cursor, fund_code, rebuilt)
+            conn.commit()
+            repaired = True
+
+    return {
+        'success': True,
+        'fund_code': fund_code,
+        'consistent': not mismatches,
+        'mismatches': mismatches,
+        'repaired': repaired
+    }
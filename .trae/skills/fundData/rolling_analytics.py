@@ -0,0 +1,233 @@
+"""
+滚动指标分析服务
+对多只基金同时计算滚动收益率、滚动波动率、滚动夏普比率和滚动回撤，
+指标口径与 fund_analyzer.FundAnalyzer 的 calculate_rolling_volatility /
+calculate_rolling_sharpe 一致（按基金自身净值序列滚动，日收益率为相邻净值的pct_change）
+
+实现：
+    1. 从净值面板取出各基金的有效净值，按列压缩为左对齐矩阵（各列独立的序列）
+    2. 滚动均值/标准差用前缀和相减，滚动最大值用分块前后缀最大值（van Herk算法），
+       均为O(n)向量化，与窗口长度无关
+    3. 结果按 (基金, 窗口, 无风险利率, 数据版本) 缓存在进程内，净值更新后自动失效
+"""
+import sys
+import os
+from collections import OrderedDict
+from typing import List, Dict, Any
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import load_nav_panel, load_nav_versions
+
+
+ROLLING_METRICS = ['return', 'volatility', 'sharpe', 'drawdown']
+
+# 进程内结果缓存上限（按基金×窗口计）
+ROLLING_CACHE_SIZE = 512
+
+_rolling_cache: 'OrderedDict[tuple, Dict[str, Any]]' = OrderedDict()
+
+
+def rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    沿第0轴的滚动最大值（van Herk / Gil-Werman 算法）
+
+    out[t] = max(values[t-window+1 .. t])，t < window-1 时取已有部分；NaN被忽略，窗口内全为NaN时为NaN
+    """
+    n = values.shape[0]
+    if n == 0:
+        return values.copy()
+
+    x = np.where(np.isnan(values), -np.inf, values)
+    n_blocks = -(-n // window)
+    pad = n_blocks * window - n
+    padded = np.concatenate([x, np.full((pad,) + x.shape[1:], -np.inf)]) if pad else x
+    blocks = padded.reshape((n_blocks, window) + x.shape[1:])
+
+    prefix = np.maximum.accumulate(blocks, axis=1).reshape(padded.shape)
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+
+    out = prefix[:n].copy()
+    t = np.arange(window - 1, n)
+    out[t] = np.maximum(suffix[t - window + 1], prefix[t])
+    out[np.isneginf(out)] = np.nan
+    return out
+
+
+def pack_columns(values: np.ndarray):
+    """
+    将各列的有效值（非NaN）按原顺序移到列首
+
+    Returns:
+        (packed, order, counts)：packed[k, j] 为第j列第k个有效值，
+        order[k, j] 为其在原矩阵中的行号，counts[j] 为第j列有效值个数
+    """
+    valid = ~np.isnan(values)
+    order = np.argsort(~valid, axis=0, kind='stable')
+    packed = np.take_along_axis(values, order, axis=0)
+    return packed, order, valid.sum(axis=0)
+
+
+def compute_rolling_metrics(navs: np.ndarray,
+                            window: int = 60,
+                            risk_free_rate: float = 0.025,
+                            periods_per_year: int = 252) -> Dict[str, np.ndarray]:
+    """
+    对左对齐的净值矩阵计算滚动指标
+
+    Args:
+        navs: 净值矩阵 (观测 × 基金)，各列从首行开始连续有效，尾部为NaN
+        window: 滚动窗口（日收益率个数）
+        risk_free_rate: 无风险利率（年化）
+        periods_per_year: 每年交易日数
+
+    Returns:
+        与navs同形的矩阵（百分比，夏普比率为比值），窗口不足处为NaN：
+        return   - 窗口区间收益率 nav[t] / nav[t-window] - 1
+        volatility - 窗口内日收益率标准差 × sqrt(252)
+        sharpe   - (日收益率均值 - 日无风险利率) / 标准差 × sqrt(252)
+        drawdown - 当前净值相对窗口内最高净值的回撤（≤0）
+    """
+    n, f = navs.shape
+    out = {name: np.full((n, f), np.nan) for name in ROLLING_METRICS}
+    if n <= window or window < 2:
+        return out
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = navs[1:] / navs[:-1] - 1
+        ret_valid = ~np.isnan(returns)
+        col_mean = np.where(ret_valid, returns, 0).sum(axis=0) / np.maximum(ret_valid.sum(axis=0), 1)
+        centered = np.where(ret_valid, returns - col_mean, 0)
+
+        c1 = np.concatenate([np.zeros((1, f)), np.cumsum(centered, axis=0)])
+        c2 = np.concatenate([np.zeros((1, f)), np.cumsum(centered * centered, axis=0)])
+
+        # t为净值下标，窗口为 returns[t-window .. t-1]，即净值 t-window .. t
+        s1 = c1[window:] - c1[:-window]
+        s2 = c2[window:] - c2[:-window]
+        mean = s1 / window + col_mean
+        std = np.sqrt(np.maximum((s2 - s1 * s1 / window) / (window - 1), 0.0))
+
+        ok = ~np.isnan(navs[window:]) & ~np.isnan(navs[:-window])
+
+        annual = np.sqrt(periods_per_year)
+        vol = std * annual
+        sharpe = (mean - risk_free_rate / periods_per_year) / std * annual
+        sharpe[std == 0] = np.nan
+
+        out['return'][window:] = np.where(ok, (navs[window:] / navs[:-window] - 1) * 100, np.nan)
+        out['volatility'][window:] = np.where(ok, vol * 100, np.nan)
+        out['sharpe'][window:] = np.where(ok, sharpe, np.nan)
+
+        peak = rolling_max(navs, window + 1)
+        out['drawdown'][window:] = np.where(ok, (navs[window:] / peak[window:] - 1) * 100, np.nan)
+
+    return out
+
+
+def downsample_indices(n: int, max_points: int = None) -> np.ndarray:
+    """等间隔抽样下标（保留首尾点），用于图表展示"""
+    if not max_points or n <= max_points:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, max_points).round().astype(np.int64))
+
+
+def _compute_funds(fund_codes: List[str], window: int, risk_free_rate: float, conn) -> Dict[str, Dict[str, Any]]:
+    """加载面板并计算各基金的完整滚动序列"""
+    panel = load_nav_panel(fund_codes, conn=conn)
+    packed, order, counts = pack_columns(panel.values)
+    metrics = compute_rolling_metrics(packed, window, risk_free_rate)
+
+    dates = np.asarray(panel.dates, dtype=str)
+    series = {}
+    for j, code in enumerate(panel.fund_codes):
+        count = int(counts[j])
+        series[code] = {
+            'dates': dates[order[:count, j]],
+            **{name: metrics[name][:count, j] for name in ROLLING_METRICS}
+        }
+    return series
+
+
+def _format_series(series: Dict[str, Any],
+                   start_date: str = None,
+                   end_date: str = None,
+                   max_points: int = None) -> Dict[str, Any]:
+    """按日期截取、去掉窗口不足的前段并抽样，转换为可序列化列表"""
+    dates = series['dates']
+    lo = np.searchsorted(dates, start_date, side='left') if start_date else 0
+    hi = np.searchsorted(dates, end_date, side='right') if end_date else len(dates)
+    first_valid = np.argmax(~np.isnan(series['volatility'])) if (~np.isnan(series['volatility'])).any() else len(dates)
+    lo = max(lo, first_valid)
+
+    idx = lo + downsample_indices(max(hi - lo, 0), max_points)
+
+    def to_list(arr):
+        return [None if np.isnan(v) else round(float(v), 4) for v in arr[idx]]
+
+    return {
+        'dates': dates[idx].tolist(),
+        **{name: to_list(series[name]) for name in ROLLING_METRICS},
+        'point_count': int(idx.size),
+        'total_points': int(max(hi - lo, 0))
+    }
+
+
+def get_rolling_analytics(fund_codes: List[str],
+                          window: int = 60,
+                          start_date: str = None,
+                          end_date: str = None,
+                          max_points: int = None,
+                          risk_free_rate: float = 0.025) -> Dict[str, Any]:
+    """
+    获取多只基金的滚动指标序列
+
+    Args:
+        fund_codes: 基金代码列表
+        window: 滚动窗口（交易日）
+        start_date: 开始日期（含），None表示全部
+        end_date: 结束日期（含）
+        max_points: 每只基金最多返回的点数（等间隔抽样），None表示不抽样
+        risk_free_rate: 无风险利率
+
+    Returns:
+        {'success': True, 'window': window, 'funds': {基金代码: {dates, return, volatility, sharpe, drawdown}},
+         'missing': [无净值数据的基金], 'cache_hits': 命中缓存的基金数}
+    """
+    if window < 2:
+        return {'success': False, 'error': '滚动窗口至少为2个交易日'}
+
+    fund_codes = list(dict.fromkeys(fund_codes))
+    funds = {}
+
+    with get_db_connection() as conn:
+        versions = load_nav_versions(fund_codes, conn)
+
+        pending = []
+        for code in fund_codes:
+            key = (code, window, risk_free_rate, versions.get(code))
+            if versions.get(code) and key in _rolling_cache:
+                _rolling_cache.move_to_end(key)
+                funds[code] = _rolling_cache[key]
+            elif versions.get(code):
+                pending.append(code)
+
+        cache_hits = len(funds)
+        if pending:
+            for code, series in _compute_funds(pending, window, risk_free_rate, conn).items():
+                _rolling_cache[(code, window, risk_free_rate, versions[code])] = series
+                funds[code] = series
+            while len(_rolling_cache) > ROLLING_CACHE_SIZE:
+                _rolling_cache.popitem(last=False)
+
+    return {
+        'success': True,
+        'window': window,
+        'funds': {code: _format_series(funds[code], start_date, end_date, max_points)
+                  for code in fund_codes if code in funds},
+        'missing': [code for code in fund_codes if code not in funds],
+        'cache_hits': cache_hits
+    }
@@ -705,8 +705,42 @@ class SmartFundData:
             
             row = cursor.fetchone()
             return row['max_drawdown'] if row else None
-    
-    def get_funds_risk_and_return(self, 
+
+    def get_range_metrics(self,
+                          fund_code: str,
+                          start_date: str = None,
+                          end_date: str = None) -> Dict[str, Any]:
+        """
+        获取任意日期区间的收益率、年化波动率和最大回撤（基于本地净值计算）
+
+        适用于"自买入日以来"、"两笔交易之间"等非标准周期
+
+        Args:
+            fund_code: 基金代码
+            start_date: 开始日期（含），None表示最早净值
+            end_date: 结束日期（含），None表示最新净值
+
+        Returns:
+            区间指标（百分比），含实际起止日期和交易日数
+        """
+        return self.get_range_metrics_batch([
+            {'fund_code': fund_code, 'start_date': start_date, 'end_date': end_date}
+        ])[0]
+
+    def get_range_metrics_batch(self, queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量获取区间指标
+
+        Args:
+            queries: 查询列表，每项包含 fund_code，可选 start_date / end_date
+
+        Returns:
+            与queries等长的结果列表
+        """
+        from range_index import query_range_metrics
+        return query_range_metrics(queries)
+
+    def get_funds_risk_and_return(self,
                                    fund_codes: List[str] = None,
                                    keyword: str = None,
                                    period: str = '近1年') -> List[Dict[str, Any]]:
@@ -1226,7 +1260,7 @@ def get_portfolio_funds_full(portfolio_id: int = None,
     - 风险收益指标：自动检查并刷新（12小时有效期，基于metrics_update_time）
 
     实时计算指标（不存储在数据库）：
-    - 可用现金：根据交易记录实时计算（卖出所得 - 买入投入）
+    - 可用现金：读取随交易记录维护的余额（卖出所得 - 买入投入）
     - 市值：shares × unit_nav
     - 成本：shares × buy_nav
     - 盈亏：(unit_nav - buy_nav) × shares
@@ -1249,7 +1283,8 @@ def get_portfolio_funds_full(portfolio_id: int = None,
         # 强制刷新
         result = get_portfolio_funds_full(portfolio_id=2, force_update=True)
     """
-    from portfolio_manager import list_portfolios, list_portfolio_funds, PortfolioManager, calculate_fund_available_cash
+    from portfolio_manager import list_portfolios, list_portfolio_funds, PortfolioManager
+    from fund_cash import get_fund_cash
 
     if not portfolio_id and not portfolio_name:
         portfolios = list_portfolios()
@@ -1280,6 +1315,8 @@ def get_portfolio_funds_full(portfolio_id: int = None,
     smart = SmartFundData()
     pm = PortfolioManager()
     result_funds = []
+    # 可用现金余额一次读取
+    cash_balances = get_fund_cash(portfolio_id, [fund['fund_code'] for fund in funds])
 
     # 统计信息
     freshness_summary = {
@@ -1359,12 +1396,8 @@ def get_portfolio_funds_full(portfolio_id: int = None,
             fund_info['top_holdings'] = holdings.get('holdings', [])
             fund_info['holdings_quarter'] = holdings.get('quarter')
 
-        # 计算可用现金（实时计算，不存储在数据库）
-        cash_info = calculate_fund_available_cash(portfolio_id, fund_code)
-        if cash_info['success']:
-            fund_info['available_cash'] = cash_info['available_cash']
-            fund_info['total_buy_amount'] = cash_info['total_buy_amount']
-            fund_info['total_sell_amount'] = cash_info['total_sell_amount']
+        # 可用现金（portfolio_fund_cash 余额表，随交易记录同步维护）
+        fund_info.update(cash_balances[fund_code])
 
         result_funds.append(fund_info)
 
@@ -1479,7 +1512,7 @@ def format_portfolio_report(portfolio_data: Dict[str, Any]) -> str:
 
 # ==================== 止盈相关便捷函数 ====================
 
-def get_take_profit_advice(portfolio_id: int) -> Dict[str, Any]:
+def get_take_profit_advice(portfolio_id: int, refresh_nav: bool = True) -> Dict[str, Any]:
     """
     便捷函数：获取组合止盈建议
     
@@ -1487,6 +1520,7 @@ def get_take_profit_advice(portfolio_id: int) -> Dict[str, Any]:
     
     Args:
         portfolio_id: 组合ID
+        refresh_nav: 是否先批量同步过期净值（默认同步；传 False 只使用本地净值）
     
     Returns:
         止盈建议数据
@@ -1495,7 +1529,7 @@ def get_take_profit_advice(portfolio_id: int) -> Dict[str, Any]:
         result = get_take_profit_advice(portfolio_id=1)
     """
     from take_profit import calculate_portfolio_take_profit
-    return calculate_portfolio_take_profit(portfolio_id)
+    return calculate_portfolio_take_profit(portfolio_id, refresh_nav=refresh_nav)
 
 
 def get_take_profit_report(portfolio_id: int) -> str:
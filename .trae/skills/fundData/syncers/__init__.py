@@ -8,6 +8,7 @@ from .global_syncers import (
     sync_fund_company,
     sync_fund_dividend,
     sync_fund_split,
+    sync_index_price,
     sync_all_global_data
 )
 
@@ -27,6 +28,7 @@ __all__ = [
     'sync_fund_company',
     'sync_fund_dividend',
     'sync_fund_split',
+    'sync_index_price',
     'sync_all_global_data',
     # 分组数据同步器
     'sync_group_nav',
@@ -8,6 +8,7 @@ from typing import List, Dict, Any, Optional
 from datetime import datetime
 import time
 from funddb import get_db_connection, update_sync_meta
+from market_phase import PHASE_INDEX_CODE
 
 
 class SyncResult:
@@ -369,6 +370,21 @@ def _sync_fund_company_from_manager() -> SyncResult:
         return SyncResult(False, error_msg, errors=[str(e)])
 
 
+def _refresh_adjusted_nav(fund_codes: List[str]):
+    """分红/拆分数据更新后，增量维护已有复权净值的基金"""
+    try:
+        from adjusted_nav import update_adjusted_nav
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT fund_code FROM fund_adjusted_nav_state")
+            maintained = {row[0] for row in cursor.fetchall()}
+        affected = [code for code in fund_codes if code in maintained]
+        if affected:
+            update_adjusted_nav(affected)
+    except Exception as e:
+        print(f"[FundData] 更新复权净值失败: {e}")
+
+
 def sync_fund_dividend(year: str = None) -> SyncResult:
     """
     同步基金分红数据（批量）
@@ -427,6 +443,7 @@ def sync_fund_dividend(year: str = None) -> SyncResult:
             conn.commit()
         
         update_sync_meta('fund_dividend', 'success')
+        _refresh_adjusted_nav(list({item['fund_code'] for item in data}))
         print(f"[FundData] 基金分红数据同步完成: {len(data)} 条记录")
         
         return SyncResult(True, f"成功同步 {len(data)} 条 {year} 年基金分红数据", len(data))
@@ -494,6 +511,7 @@ def sync_fund_split(year: str = None) -> SyncResult:
             conn.commit()
         
         update_sync_meta('fund_split', 'success')
+        _refresh_adjusted_nav(list({item['fund_code'] for item in data}))
         print(f"[FundData] 基金拆分数据同步完成: {len(data)} 条记录")
         
         return SyncResult(True, f"成功同步 {len(data)} 条 {year} 年基金拆分数据", len(data))
@@ -505,6 +523,116 @@ def sync_fund_split(year: str = None) -> SyncResult:
         return SyncResult(False, error_msg, errors=[str(e)])
 
 
+# 指数/ETF行情同步范围：{代码: (名称, 类型)}，ETF使用后复权价格
+INDEX_PRICE_SOURCES = {
+    '000300': ('沪深300', 'index'),
+    '000905': ('中证500', 'index'),
+    '000852': ('中证1000', 'index'),
+    '000001': ('上证指数', 'index'),
+    '399006': ('创业板指', 'index'),
+    '510300': ('沪深300ETF', 'etf'),
+    '510500': ('中证500ETF', 'etf'),
+}
+
+
+def _fetch_index_price(index_code: str, source_type: str, start_date: str, end_date: str) -> pd.DataFrame:
+    """从AKShare获取指数或ETF日行情（日期格式YYYYMMDD）"""
+    if source_type == 'etf':
+        return ak.fund_etf_hist_em(symbol=index_code, period="daily",
+                                   start_date=start_date, end_date=end_date, adjust="hfq")
+    return ak.index_zh_a_hist(symbol=index_code, period="daily",
+                              start_date=start_date, end_date=end_date)
+
+
+def _refresh_market_phase():
+    """阶段识别所用指数有新行情时，重新识别市场阶段日历"""
+    try:
+        from market_phase import refresh_phase_calendar
+        result = refresh_phase_calendar(PHASE_INDEX_CODE)
+        if result['success']:
+            print(f"[FundData] ✓ 市场阶段已更新，当前阶段: {result['current_phase']}")
+    except Exception as e:
+        print(f"[FundData] 更新市场阶段失败: {e}")
+
+
+def sync_index_price(index_codes: List[str] = None, years: int = 10) -> SyncResult:
+    """
+    增量同步指数/ETF日行情到index_price表
+    
+    每个代码只拉取库中最新日期之后的数据；库中没有数据时拉取最近years年
+    
+    Args:
+        index_codes: 指数/ETF代码列表，不传则同步INDEX_PRICE_SOURCES中的全部代码
+        years: 首次同步的历史年数
+    """
+    index_codes = index_codes or list(INDEX_PRICE_SOURCES.keys())
+    print(f"[FundData] 开始增量同步 {len(index_codes)} 个指数/ETF行情...")
+    
+    end_date = datetime.now().strftime("%Y%m%d")
+    total_count = 0
+    errors = []
+    phase_index_updated = False
+    
+    for index_code in index_codes:
+        default_type = 'etf' if index_code.startswith(('51', '15')) else 'index'
+        source_type = INDEX_PRICE_SOURCES.get(index_code, ('', default_type))[1]
+        try:
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT MAX(trade_date) FROM index_price WHERE index_code = ?", (index_code,))
+                latest = cursor.fetchone()[0]
+            
+            if latest:
+                start_date = (pd.Timestamp(latest) + pd.Timedelta(days=1)).strftime("%Y%m%d")
+            else:
+                start_date = (pd.Timestamp.now() - pd.DateOffset(years=years)).strftime("%Y%m%d")
+            if start_date > end_date:
+                print(f"[FundData] - {index_code}: 已是最新")
+                continue
+            
+            df = _fetch_index_price(index_code, source_type, start_date, end_date)
+            if df is None or len(df) == 0:
+                print(f"[FundData] - {index_code}: 无新数据")
+                continue
+            
+            def value(row, column):
+                v = row.get(column)
+                return float(v) if pd.notna(v) else None
+            
+            insert_values = [
+                (index_code, pd.Timestamp(row['日期']).strftime('%Y-%m-%d'),
+                 value(row, '开盘'), value(row, '收盘'), value(row, '最高'), value(row, '最低'),
+                 value(row, '成交量'), source_type)
+                for _, row in df.iterrows() if pd.notna(row.get('收盘'))
+            ]
+            
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO index_price
+                    (index_code, trade_date, open_price, close_price, high_price, low_price, volume, data_source, update_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                ''', insert_values)
+                conn.commit()
+            
+            total_count += len(insert_values)
+            if index_code == PHASE_INDEX_CODE:
+                phase_index_updated = True
+            print(f"[FundData] ✓ {index_code}: 新增 {len(insert_values)} 条行情")
+            time.sleep(0.5)
+            
+        except Exception as e:
+            errors.append(f"{index_code}: {e}")
+            print(f"[FundData] ✗ {index_code}: {e}")
+    
+    if phase_index_updated:
+        _refresh_market_phase()
+    
+    update_sync_meta('index_price', 'success' if not errors else 'partial', '; '.join(errors) or None)
+    return SyncResult(not errors or total_count > 0,
+                      f"成功同步 {total_count} 条指数/ETF行情", total_count, errors)
+
+
 def sync_all_global_data() -> Dict[str, SyncResult]:
     """
     同步所有全局数据
@@ -537,6 +665,10 @@ def sync_all_global_data() -> Dict[str, SyncResult]:
     
     # 6. 基金拆分（当年）
     results['fund_split'] = sync_fund_split()
+    time.sleep(1)
+    
+    # 7. 指数/ETF行情（增量）
+    results['index_price'] = sync_index_price()
     
     print("=" * 60)
     print("[FundData] 全局数据同步完成")
@@ -11,6 +11,21 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from funddb import get_db_connection, update_sync_meta
 
 
+# 写入净值：已存在且数值未变的净值不改写，update_time 只在新增或修订时更新，
+# 净值派生数据（如 fund_monthly_return）据此增量维护
+SAVE_FUND_NAV_SQL = '''
+    INSERT INTO fund_nav (fund_code, nav_date, unit_nav, accum_nav, daily_return, update_time)
+    VALUES (?, ?, ?, ?, ?, datetime('now'))
+    ON CONFLICT(fund_code, nav_date) DO UPDATE SET
+        unit_nav = excluded.unit_nav,
+        accum_nav = excluded.accum_nav,
+        daily_return = excluded.daily_return,
+        update_time = excluded.update_time
+    WHERE fund_nav.unit_nav IS NOT excluded.unit_nav
+       OR fund_nav.accum_nav IS NOT excluded.accum_nav
+       OR fund_nav.daily_return IS NOT excluded.daily_return
+'''
+
 # 跳过行业配置查询的基金类型（这些基金没有股票行业配置）
 SKIP_INDUSTRY_ALLOCATION_TYPES = [
     '债券型-混合一级',
@@ -79,11 +94,7 @@ def sync_single_fund_nav(fund_code: str) -> Dict[str, Any]:
                     item['accum_nav'], item['daily_return']
                 ))
             
-            cursor.executemany('''
-                INSERT OR REPLACE INTO fund_nav
-                (fund_code, nav_date, unit_nav, accum_nav, daily_return, update_time)
-                VALUES (?, ?, ?, ?, ?, datetime('now'))
-            ''', insert_values)
+            cursor.executemany(SAVE_FUND_NAV_SQL, insert_values)
             
             conn.commit()
         
@@ -135,6 +146,26 @@ def sync_group_nav(fund_codes: List[str], max_workers: int = 3) -> SyncResult:
     # 更新元数据
     update_sync_meta('fund_nav', 'success' if success_count > 0 else 'partial')
     
+    # 增量维护复权净值、月收益率和滚动风险指标
+    synced_codes = [r['code'] for r in results if r['success']]
+    if synced_codes:
+        try:
+            from adjusted_nav import update_adjusted_nav
+            update_adjusted_nav(synced_codes)
+        except Exception as e:
+            print(f"[FundData] 更新复权净值失败: {e}")
+        try:
+            from monthly_return import update_monthly_returns
+            update_monthly_returns(synced_codes)
+        except Exception as e:
+            print(f"[FundData] 更新月收益率失败: {e}")
+        for code in synced_codes:
+            try:
+                from risk_stream import update_risk_metrics_incremental
+                update_risk_metrics_incremental(code)
+            except Exception as e:
+                print(f"[FundData] 增量更新 {code} 风险指标失败: {e}")
+    
     message = f"成功同步 {success_count}/{len(valid_codes)} 只基金净值数据，共 {total_count} 条记录"
     print(f"[FundData] {message}")
     
@@ -384,6 +415,15 @@ def sync_group_holdings(fund_codes: List[str], years: List[str] = None, max_work
     
     update_sync_meta('fund_stock_holding', 'success' if success_count > 0 else 'partial')
     
+    # 重算持仓季度变动和换手率（部分失败的基金也可能已写入股票持仓）
+    synced_codes = [r['code'] for r in results if r['stock_count']]
+    if synced_codes:
+        try:
+            from holding_changes import update_holding_changes
+            update_holding_changes(synced_codes)
+        except Exception as e:
+            print(f"[FundData] 更新持仓变动失败: {e}")
+    
     message = f"成功同步 {success_count}/{len(valid_codes)} 只基金持仓数据（股票{total_stock} 债券{total_bond} 行业{total_industry}）"
     print(f"[FundData] {message}")
     
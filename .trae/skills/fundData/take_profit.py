@@ -8,10 +8,12 @@
 4. 可用现金限制：实际卖出金额不能超过可用现金
 
 数据获取：
-- 当前净值：get_fund_nav(fund_code) - 自动检查新鲜度
-- 持仓信息：list_portfolio_funds(portfolio_id)
-- 卖出记录：get_portfolio_transactions(portfolio_id, fund_code, transaction_type='SELL')
-- 可用现金：calculate_portfolio_available_cash_batch(portfolio_id) - 批量预计算
+- 单只基金（calculate）：
+  - 当前净值：get_fund_nav(fund_code) - 自动检查新鲜度
+  - 持仓信息：list_portfolio_funds(portfolio_id)
+  - 卖出记录：get_portfolio_transactions(portfolio_id, fund_code, transaction_type='SELL')
+- 整个组合（calculate_portfolio）：load_take_profit_inputs 先批量同步过期净值（smart_batch_update_nav），
+  再批量加载最新净值、持仓、卖出记录、可用现金和止盈配置，逐只基金的判断在内存中完成
 """
 
 import sys
@@ -36,6 +38,20 @@ class TakeProfitParams:
     buy_back_threshold: float = 0.20    # 捡回阈值（如0.20表示下跌20%触发）
 
 
+def params_from_config(config: Dict[str, Any]) -> TakeProfitParams:
+    """由模板行或基金止盈配置（get_fund_config）构造止盈参数"""
+    return TakeProfitParams(
+        first_threshold=config['first_threshold'],
+        first_sell_ratio=config['first_sell_ratio'],
+        step_size=config['step_size'],
+        follow_up_sell_ratio=config['follow_up_sell_ratio'],
+        enable_cost_control=bool(config['enable_cost_control']),
+        target_diluted_cost=config['target_diluted_cost'],
+        enable_buy_back=bool(config.get('enable_buy_back', False)),
+        buy_back_threshold=config.get('buy_back_threshold', 0.20)
+    )
+
+
 @dataclass
 class TakeProfitFundResult:
     fund_code: str
@@ -69,8 +85,10 @@ class TakeProfitFundResult:
 
 class TakeProfitCalculator:
     
-    def __init__(self, params: TakeProfitParams = None):
+    def __init__(self, params: TakeProfitParams = None, use_adjusted_nav: bool = False):
         self.params = params or TakeProfitParams()
+        # 收益率是否计入买入后的分红再投资和拆分折算（复权口径）
+        self.use_adjusted_nav = use_adjusted_nav
     
     def calculate(self, fund_code: str, portfolio_id: int, 
                   available_cash: float = 0,                     # 预计算的可用现金
@@ -81,6 +99,27 @@ class TakeProfitCalculator:
         from portfolio_manager import list_portfolio_funds, get_portfolio_transactions
         
         use_params = params or self.params
+        details = self._input_details(fund_code, portfolio_id, available_cash, use_params,
+                                      param_source, template_name)
+        details.append(f"【数据获取】")
+        
+        nav_data = get_fund_nav(fund_code, force_update=False)
+        funds = list_portfolio_funds(portfolio_id) if nav_data else []
+        fund_holding = next((f for f in funds if f['fund_code'] == fund_code), None)
+        sell_transactions = get_portfolio_transactions(
+            portfolio_id,
+            fund_code=fund_code,
+            transaction_type='SELL'
+        ) if fund_holding else []
+        
+        return self._evaluate(fund_code, available_cash, use_params, param_source, template_name,
+                              details, nav_data, fund_holding, sell_transactions,
+                              self._adjustment_ratio(fund_holding))
+    
+    def _input_details(self, fund_code: str, portfolio_id: int, available_cash: float,
+                       use_params: TakeProfitParams, param_source: str,
+                       template_name: Optional[str]) -> List[str]:
+        """算法明细的入参部分"""
         details = []
         
         details.append(f"【算法入参】")
@@ -99,10 +138,30 @@ class TakeProfitCalculator:
         if template_name:
             details.append(f"使用模板: {template_name}")
         details.append("")
+        return details
+    
+    def _adjustment_ratio(self, fund_holding: Optional[Dict[str, Any]], conn=None) -> float:
+        """复权口径下买入后的分红/拆分份额倍数，不使用复权口径时为1"""
+        if not (self.use_adjusted_nav and fund_holding and (fund_holding.get('buy_nav') or 0) > 0
+                and fund_holding.get('buy_date')):
+            return 1.0
+        from adjusted_nav import get_adjustment_ratio
+        return get_adjustment_ratio(fund_holding['fund_code'], fund_holding['buy_date'], conn)
+    
+    def _evaluate(self, fund_code: str, available_cash: float, use_params: TakeProfitParams,
+                  param_source: str, template_name: Optional[str], details: List[str],
+                  nav_data: Optional[Dict[str, Any]], fund_holding: Optional[Dict[str, Any]],
+                  sell_transactions: List[Dict[str, Any]],
+                  adjustment_ratio: float = 1.0) -> TakeProfitFundResult:
+        """
+        由已获取的数据计算单只基金的止盈建议（不访问数据库）
         
-        details.append(f"【数据获取】")
-        
-        nav_data = get_fund_nav(fund_code, force_update=False)
+        Args:
+            nav_data: 最新净值（含 unit_nav、nav_date），None表示无净值
+            fund_holding: 持仓行，None表示不在组合中
+            sell_transactions: 该基金卖出记录，按交易日期倒序
+            adjustment_ratio: 复权倍数（见 _adjustment_ratio）
+        """
         if not nav_data:
             return self._error_result(fund_code, available_cash, "无法获取净值数据", details)
         
@@ -110,13 +169,6 @@ class TakeProfitCalculator:
         nav_date = nav_data.get('nav_date', '')
         details.append(f"当前净值: {current_nav} ({nav_date})")
         
-        funds = list_portfolio_funds(portfolio_id)
-        fund_holding = None
-        for f in funds:
-            if f['fund_code'] == fund_code:
-                fund_holding = f
-                break
-        
         if not fund_holding:
             return self._error_result(fund_code, available_cash, "该基金不在组合中", details)
         
@@ -132,16 +184,13 @@ class TakeProfitCalculator:
         
         current_value = current_shares * current_nav
         current_profit_rate = (current_nav - buy_nav) / buy_nav if buy_nav > 0 else 0
+        if adjustment_ratio != 1.0 and buy_nav > 0:
+            current_profit_rate = (current_nav * adjustment_ratio - buy_nav) / buy_nav
+            details.append(f"复权倍数(买入后分红/拆分): {adjustment_ratio:.6f}")
         
         details.append(f"当前市值: {current_value:.2f}")
         details.append(f"当前收益率: {current_profit_rate * 100:.2f}%")
         details.append("")
-        
-        sell_transactions = get_portfolio_transactions(
-            portfolio_id,
-            fund_code=fund_code,
-            transaction_type='SELL'
-        )
 
         # 筛选未回收的卖出记录（用于波段捡回）
         unrecovered_sells = [t for t in sell_transactions if t.get('is_recovered', 0) == 0]
@@ -332,41 +381,39 @@ class TakeProfitCalculator:
             decline_rate=None
         )
     
-    def calculate_portfolio(self, portfolio_id: int) -> Dict[str, Any]:
-        from portfolio_manager import list_portfolio_funds, calculate_portfolio_available_cash_batch
-        from take_profit_manager import TakeProfitTemplateManager
+    def calculate_portfolio(self, portfolio_id: int, refresh_nav: bool = True) -> Dict[str, Any]:
+        """
+        计算组合内所有基金的止盈建议
+
+        数据由 load_take_profit_inputs 一次性批量加载，逐只基金的判断在内存中完成
 
-        template_manager = TakeProfitTemplateManager()
-        funds = list_portfolio_funds(portfolio_id)
+        Args:
+            portfolio_id: 组合ID
+            refresh_nav: 是否先批量同步过期净值（默认同步；对延迟敏感的调用方可传 False 只用本地净值）
+        """
+        inputs = load_take_profit_inputs(portfolio_id, refresh_nav)
 
-        # 【批量预计算】一次性计算所有基金的可用现金
-        available_cash_map = calculate_portfolio_available_cash_batch(portfolio_id)
+        adjustment_ratios = {}
+        if self.use_adjusted_nav:
+            with get_db_connection() as conn:
+                adjustment_ratios = {f['fund_code']: self._adjustment_ratio(f, conn) for f in inputs['holdings']}
 
         results = []
-        for fund in funds:
+        for fund in inputs['holdings']:
             fund_code = fund['fund_code']
-
-            # 获取预计算的可用现金
-            available_cash = available_cash_map.get(fund_code, 0)
-
-            config = template_manager.get_fund_config(portfolio_id, fund_code)
-            params = TakeProfitParams(
-                first_threshold=config['first_threshold'],
-                first_sell_ratio=config['first_sell_ratio'],
-                step_size=config['step_size'],
-                follow_up_sell_ratio=config['follow_up_sell_ratio'],
-                enable_cost_control=config['enable_cost_control'],
-                target_diluted_cost=config['target_diluted_cost'],
-                enable_buy_back=config.get('enable_buy_back', False),
-                buy_back_threshold=config.get('buy_back_threshold', 0.20)
-            )
-
-            result = self.calculate(
-                fund_code, portfolio_id,
-                available_cash=available_cash,  # 传入预计算的可用现金
-                params=params,
-                param_source=config.get('param_source', 'default'),
-                template_name=config.get('template_name')
+            available_cash = inputs['cash'].get(fund_code, 0)
+            config = inputs['configs'][fund_code]
+            params = params_from_config(config)
+            param_source = config.get('param_source', 'default')
+            template_name = config.get('template_name')
+
+            details = self._input_details(fund_code, portfolio_id, available_cash, params,
+                                          param_source, template_name)
+            details.append(f"【数据获取】")
+            result = self._evaluate(
+                fund_code, available_cash, params, param_source, template_name, details,
+                inputs['navs'].get(fund_code), fund, inputs['sells'].get(fund_code, []),
+                adjustment_ratios.get(fund_code, 1.0)
             )
             results.append(result)
 
@@ -398,16 +445,90 @@ class TakeProfitCalculator:
         }
 
 
+def load_take_profit_inputs(portfolio_id: int, refresh_nav: bool = True) -> Dict[str, Any]:
+    """
+    批量加载组合止盈计算所需的数据，查询次数与基金数量无关
+
+    Args:
+        portfolio_id: 组合ID
+        refresh_nav: 是否先同步过期净值（smart_batch_update_nav，一次判断所有基金的新鲜度，需要联网）
+
+    Returns:
+        {
+            'holdings': 持仓行列表（按基金代码排序）,
+            'navs': {基金代码: 最新净值 {'nav_date', 'unit_nav', 'accum_nav', 'daily_return'}},
+            'sells': {基金代码: 卖出记录列表（按交易日期倒序）},
+            'cash': {基金代码: 可用现金},
+            'configs': {基金代码: 解析后的止盈配置}
+        }
+    """
+    from fund_cash import get_fund_cash
+    from nav_panel import SQL_IN_BATCH_SIZE
+    from take_profit_manager import TakeProfitTemplateManager
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM portfolio_fund
+            WHERE portfolio_id = ?
+            ORDER BY fund_code
+        ''', (portfolio_id,))
+        holdings = [dict(row) for row in cursor.fetchall()]
+    fund_codes = [f['fund_code'] for f in holdings]
+
+    if refresh_nav and fund_codes:
+        from smart_fund_data import SmartFundData
+        SmartFundData().smart_batch_update_nav(fund_codes)
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+
+        # 每只基金最新一条净值（MAX 聚合时其余列取自 nav_date 最大的那一行）
+        navs = {}
+        for i in range(0, len(fund_codes), SQL_IN_BATCH_SIZE):
+            batch = fund_codes[i:i + SQL_IN_BATCH_SIZE]
+            placeholders = ','.join(['?' for _ in batch])
+            cursor.execute(f'''
+                SELECT fund_code, MAX(nav_date) AS nav_date, unit_nav, accum_nav, daily_return
+                FROM fund_nav
+                WHERE fund_code IN ({placeholders})
+                GROUP BY fund_code
+            ''', batch)
+            for row in cursor.fetchall():
+                navs[row['fund_code']] = dict(row)
+
+        cursor.execute('''
+            SELECT * FROM portfolio_transaction
+            WHERE portfolio_id = ? AND transaction_type = 'SELL'
+            ORDER BY fund_code, transaction_date DESC, create_time DESC
+        ''', (portfolio_id,))
+        sells = {}
+        for row in cursor.fetchall():
+            sells.setdefault(row['fund_code'], []).append(dict(row))
+
+        balances = get_fund_cash(portfolio_id, fund_codes, conn)
+
+    return {
+        'holdings': holdings,
+        'navs': navs,
+        'sells': sells,
+        'cash': {code: balance['available_cash'] for code, balance in balances.items()},
+        'configs': TakeProfitTemplateManager().get_fund_configs(portfolio_id, fund_codes)
+    }
+
+
 def calculate_take_profit(fund_code: str, portfolio_id: int, 
                           available_cash: float = 0,
-                          params: TakeProfitParams = None) -> TakeProfitFundResult:
-    calc = TakeProfitCalculator(params)
+                          params: TakeProfitParams = None,
+                          use_adjusted_nav: bool = False) -> TakeProfitFundResult:
+    calc = TakeProfitCalculator(params, use_adjusted_nav)
     return calc.calculate(fund_code, portfolio_id, available_cash, params)
 
 
-def calculate_portfolio_take_profit(portfolio_id: int) -> Dict[str, Any]:
-    calc = TakeProfitCalculator()
-    return calc.calculate_portfolio(portfolio_id)
+def calculate_portfolio_take_profit(portfolio_id: int, use_adjusted_nav: bool = False,
+                                    refresh_nav: bool = True) -> Dict[str, Any]:
+    calc = TakeProfitCalculator(use_adjusted_nav=use_adjusted_nav)
+    return calc.calculate_portfolio(portfolio_id, refresh_nav)
 
 
 def get_take_profit_report_text(portfolio_id: int) -> str:
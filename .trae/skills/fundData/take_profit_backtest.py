@@ -0,0 +1,366 @@
+"""
+阶梯止盈策略历史回测模块
+在基金完整日净值历史上逐日重放 TakeProfitCalculator._execute_logic 的判断规则，
+统计收益率、最大回撤和交易次数，用于比较 标准型/激进型 等模板的历史表现
+
+回测状态（与组合账本一致）：
+    持仓份额、摊薄成本（卖出/捡回时按 record_sell_transaction / execute_buy_back_transaction 的公式更新）、
+    现金、最近一次卖出净值、未回收卖出记录栈（波段捡回按LIFO取最近一笔）
+
+每日判断顺序与 _execute_logic 相同：
+    1. 成本控制：摊薄成本 <= 目标摊薄成本 -> STOP（之后不再有交易，状态冻结）
+    2. 波段捡回：跌幅达到捡回阈值时，现金充足则买回，否则当日HOLD（不再判断止盈）
+    3. 初次止盈：收益率 >= 首次止盈阈值 -> 卖出首次止盈比例
+    4. 后续止盈：较上次卖出净值涨幅 >= 阶梯步长 -> 卖出后续止盈比例
+
+实现：
+    两次交易之间状态不变，各条件只依赖当日净值，因此不逐日循环，
+    而是对剩余净值数组整段求布尔触发掩码，直接跳到下一个触发日；
+    搜索窗口逐次翻倍，总开销约为 O(交易日数 + 交易次数 × log)
+"""
+import sys
+import os
+import time
+from datetime import datetime
+from dataclasses import asdict
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from risk_metrics_calculator import load_nav_arrays
+from take_profit import TakeProfitParams, params_from_config
+
+
+# 默认初始买入金额
+DEFAULT_INITIAL_AMOUNT = 10000.0
+
+# 触发搜索的初始窗口（交易日）
+SEARCH_WINDOW = 64
+
+# 交易类型
+TRADE_FIRST_SELL = 'first_sell'
+TRADE_FOLLOW_UP_SELL = 'follow_up_sell'
+TRADE_BUY_BACK = 'buy_back'
+
+
+def _trigger_mask(seg: np.ndarray, params: TakeProfitParams, cost: float,
+                  last_sell_nav: Optional[float], cash: float,
+                  target: Optional[tuple]) -> tuple:
+    """
+    计算一段净值上的触发掩码
+
+    Returns:
+        (触发掩码, 捡回掩码)，捡回掩码为None表示本段不可能捡回
+    """
+    buy = None
+    blocked = None
+    if target is not None:
+        target_nav, target_shares = target
+        # 跌幅达标即拦截止盈判断；现金不足时当日HOLD
+        blocked = (target_nav - seg) / target_nav >= params.buy_back_threshold
+        buy = blocked & (cash >= target_shares * seg)
+
+    if last_sell_nav is None:
+        sell = (seg - cost) / cost >= params.first_threshold
+    elif last_sell_nav > 0:
+        sell = (seg - last_sell_nav) / last_sell_nav >= params.step_size
+    else:
+        sell = np.zeros(seg.size, dtype=bool)
+
+    if blocked is not None:
+        return (sell & ~blocked) | buy, buy
+    return sell, None
+
+
+def run_backtest(navs: np.ndarray,
+                 params: TakeProfitParams,
+                 initial_amount: float = DEFAULT_INITIAL_AMOUNT,
+                 initial_cash: float = 0.0,
+                 record_equity: bool = True) -> Dict[str, Any]:
+    """
+    在净值数组上回测阶梯止盈策略（首日按当日净值全额买入）
+
+    Args:
+        navs: 按时间升序的净值数组（不含空值，均大于0）
+        params: 止盈参数
+        initial_amount: 初始买入金额
+        initial_cash: 初始现金（可用于波段捡回）
+        record_equity: 是否返回逐日权益曲线
+
+    Returns:
+        {'trades': [(日序号, 类型, 净值, 份额, 金额, 交易后份额, 交易后现金, 交易后摊薄成本)],
+         'shares', 'cash', 'diluted_cost', 'unrecovered_sells', 'stop_index',
+         'final_value', 'total_return', 'max_drawdown', 'max_drawdown_index'(峰值, 谷值), 'equity'}
+
+    说明：
+        交易按触发日净值成交，不计手续费；卖出份额为当时持仓 × 卖出比例，
+        捡回份额与对应卖出份额一致（同 execute_buy_back_transaction 的校验）
+    """
+    n = navs.size
+    shares = initial_amount / navs[0]
+    cost = float(navs[0])
+    cash = float(initial_cash)
+    last_sell_nav = None
+    unrecovered = []
+    trades = []
+    stop_index = None
+
+    i = 1
+    while i < n:
+        if params.enable_cost_control and cost <= params.target_diluted_cost:
+            stop_index = i
+            break
+
+        target = None
+        if params.enable_buy_back and unrecovered and unrecovered[-1][0] > 0:
+            target = unrecovered[-1]
+
+        # 窗口翻倍查找下一个触发日
+        window = SEARCH_WINDOW
+        hit = -1
+        buy_mask = None
+        while i < n:
+            end = min(i + window, n)
+            mask, buy_mask = _trigger_mask(navs[i:end], params, cost, last_sell_nav, cash, target)
+            k = int(np.argmax(mask))
+            if mask[k]:
+                hit = i + k
+                break
+            i = end
+            window *= 2
+        if hit < 0:
+            break
+
+        nav = float(navs[hit])
+        if buy_mask is not None and buy_mask[hit - i]:
+            target_nav, target_shares = unrecovered.pop()
+            amount = target_shares * nav
+            cost = (shares * cost + amount) / (shares + target_shares)
+            shares += target_shares
+            cash -= amount
+            trades.append((hit, TRADE_BUY_BACK, nav, target_shares, amount, shares, cash, cost))
+        else:
+            first = last_sell_nav is None
+            ratio = params.first_sell_ratio if first else params.follow_up_sell_ratio
+            sell_shares = shares * ratio
+            amount = sell_shares * nav
+            new_shares = shares - sell_shares
+            cost = max((shares * cost - amount) / new_shares, 0.0) if new_shares > 0 else 0.0
+            shares = new_shares
+            cash += amount
+            last_sell_nav = nav
+            unrecovered.append((nav, sell_shares))
+            trades.append((hit, TRADE_FIRST_SELL if first else TRADE_FOLLOW_UP_SELL,
+                           nav, sell_shares, amount, shares, cash, cost))
+            if shares <= 0:
+                break
+        i = hit + 1
+
+    # 交易日收盘成交，权益当日不变；之后按区间内不变的份额和现金展开
+    change_at = np.array([0] + [t[0] + 1 for t in trades], dtype=np.int64)
+    share_steps = np.array([initial_amount / navs[0]] + [t[5] for t in trades])
+    cash_steps = np.array([float(initial_cash)] + [t[6] for t in trades])
+    pos = np.searchsorted(change_at, np.arange(n), side='right') - 1
+    equity = share_steps[pos] * navs + cash_steps[pos]
+
+    peak = np.maximum.accumulate(equity)
+    drawdown = equity / peak - 1
+    trough = int(np.argmin(drawdown))
+    peak_index = int(np.argmax(equity[:trough + 1]))
+    capital = initial_amount + initial_cash
+
+    return {
+        'trades': trades,
+        'shares': shares,
+        'cash': cash,
+        'diluted_cost': cost,
+        'unrecovered_sells': len(unrecovered),
+        'stop_index': stop_index,
+        'final_value': float(equity[-1]),
+        'total_return': float(equity[-1] / capital - 1),
+        'max_drawdown': float(-drawdown[trough]),
+        'max_drawdown_index': (peak_index, trough),
+        'equity': equity if record_equity else None,
+    }
+
+
+def _annualize(total_return: float, days: int) -> Optional[float]:
+    if days <= 0 or total_return <= -1:
+        return None
+    return (1 + total_return) ** (365.0 / days) - 1
+
+
+def _max_drawdown(values: np.ndarray) -> float:
+    return float(-np.min(values / np.maximum.accumulate(values) - 1))
+
+
+def summarize_backtest(dates: List[str], navs: np.ndarray, result: Dict[str, Any],
+                       initial_amount: float, initial_cash: float) -> Dict[str, Any]:
+    """将 run_backtest 的结果整理为带日期的统计、交易明细和买入持有对比"""
+    days = (datetime.strptime(dates[-1], '%Y-%m-%d') - datetime.strptime(dates[0], '%Y-%m-%d')).days
+    trades = result['trades']
+    counts = {kind: sum(1 for t in trades if t[1] == kind)
+              for kind in (TRADE_FIRST_SELL, TRADE_FOLLOW_UP_SELL, TRADE_BUY_BACK)}
+
+    annual = _annualize(result['total_return'], days)
+    max_dd = result['max_drawdown']
+    hold_equity = initial_amount / navs[0] * navs + initial_cash
+    hold_return = float(hold_equity[-1] / (initial_amount + initial_cash) - 1)
+    hold_annual = _annualize(hold_return, days)
+    peak, trough = result['max_drawdown_index']
+
+    return {
+        'start_date': dates[0],
+        'end_date': dates[-1],
+        'trading_days': len(dates),
+        'strategy': {
+            'total_return': round(result['total_return'] * 100, 2),
+            'annualized_return': round(annual * 100, 2) if annual is not None else None,
+            'max_drawdown': round(max_dd * 100, 2),
+            'max_drawdown_start': dates[peak],
+            'max_drawdown_end': dates[trough],
+            'calmar_ratio': round(annual / max_dd, 4) if annual is not None and max_dd > 0 else None,
+            'final_value': round(result['final_value'], 2),
+            'final_shares': round(result['shares'], 2),
+            'final_cash': round(result['cash'], 2),
+            'diluted_cost': round(result['diluted_cost'], 4),
+            'unrecovered_sells': result['unrecovered_sells'],
+            'stopped': result['stop_index'] is not None,
+            'stop_date': dates[result['stop_index']] if result['stop_index'] is not None else None,
+        },
+        'buy_and_hold': {
+            'total_return': round(hold_return * 100, 2),
+            'annualized_return': round(hold_annual * 100, 2) if hold_annual is not None else None,
+            'max_drawdown': round(_max_drawdown(hold_equity) * 100, 2),
+            'final_value': round(float(hold_equity[-1]), 2),
+        },
+        'trade_count': {
+            'total': len(trades),
+            'sell': counts[TRADE_FIRST_SELL] + counts[TRADE_FOLLOW_UP_SELL],
+            'first_sell': counts[TRADE_FIRST_SELL],
+            'follow_up_sell': counts[TRADE_FOLLOW_UP_SELL],
+            'buy_back': counts[TRADE_BUY_BACK],
+            'total_sell_amount': round(sum(t[4] for t in trades if t[1] != TRADE_BUY_BACK), 2),
+            'total_buy_back_amount': round(sum(t[4] for t in trades if t[1] == TRADE_BUY_BACK), 2),
+        },
+        'trades': [
+            {
+                'date': dates[t[0]],
+                'action': 'BUY' if t[1] == TRADE_BUY_BACK else 'SELL',
+                'type': t[1],
+                'nav': round(t[2], 4),
+                'shares': round(t[3], 2),
+                'amount': round(t[4], 2),
+                'shares_after': round(t[5], 2),
+                'cash_after': round(t[6], 2),
+                'diluted_cost': round(t[7], 4),
+            }
+            for t in trades
+        ],
+    }
+
+
+def load_backtest_navs(fund_code: str, start_date: str = None, end_date: str = None,
+                       use_adjusted_nav: bool = False, conn=None) -> tuple:
+    """
+    读取回测区间内的有效净值
+
+    Returns:
+        (日期列表, 净值数组)，已剔除空值和非正净值
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return load_backtest_navs(fund_code, start_date, end_date, use_adjusted_nav, new_conn)
+
+    dates, navs = load_nav_arrays(conn.cursor(), fund_code, adjusted=use_adjusted_nav)
+    if not dates:
+        return [], navs
+    date_arr = np.array(dates, dtype=str)
+    keep = ~np.isnan(navs) & (navs > 0)
+    if start_date:
+        keep &= date_arr >= start_date
+    if end_date:
+        keep &= date_arr <= end_date
+    return date_arr[keep].tolist(), navs[keep]
+
+
+def resolve_params(params: TakeProfitParams = None, template_id: int = None,
+                   template_name: str = None) -> tuple:
+    """
+    确定回测参数：显式参数 > 指定模板（ID或名称） > 默认模板
+
+    Returns:
+        (TakeProfitParams, 模板名称)，指定的模板不存在时为 (None, None)
+    """
+    if params is not None:
+        return params, None
+
+    from take_profit_manager import TakeProfitTemplateManager
+    manager = TakeProfitTemplateManager()
+    if template_id is not None:
+        template = manager.get_template(template_id)
+    elif template_name:
+        template = manager.get_template_by_name(template_name)
+    else:
+        template = manager.get_default_template()
+    if not template:
+        return None, None
+    return params_from_config(template), template.get('name')
+
+
+def backtest_take_profit(fund_code: str,
+                         params: TakeProfitParams = None,
+                         template_id: int = None,
+                         template_name: str = None,
+                         start_date: str = None,
+                         end_date: str = None,
+                         initial_amount: float = DEFAULT_INITIAL_AMOUNT,
+                         initial_cash: float = 0.0,
+                         use_adjusted_nav: bool = False,
+                         include_equity: bool = False) -> Dict[str, Any]:
+    """
+    回测单只基金的阶梯止盈策略
+
+    Args:
+        fund_code: 基金代码
+        params: 止盈参数，None时按 template_id / template_name / 默认模板
+        start_date / end_date: 回测区间（YYYY-MM-DD），默认全部本地净值
+        initial_amount: 首日买入金额
+        initial_cash: 初始现金（波段捡回可用）
+        use_adjusted_nav: 是否使用复权净值（分红再投资口径）
+        include_equity: 是否返回逐日权益曲线
+
+    Returns:
+        {'success': True, 'fund_code', 'template_name', 'params', 'strategy', 'buy_and_hold',
+         'trade_count', 'trades', 'elapsed_ms', ...}
+    """
+    start = time.perf_counter()
+    use_params, name = resolve_params(params, template_id, template_name)
+    if use_params is None:
+        return {'success': False, 'error': '止盈模板不存在'}
+    if initial_amount <= 0:
+        return {'success': False, 'error': '初始买入金额必须大于0'}
+
+    dates, navs = load_backtest_navs(fund_code, start_date, end_date, use_adjusted_nav)
+    if len(dates) < 2:
+        return {'success': False, 'error': f'基金 {fund_code} 回测区间内净值数据不足'}
+
+    result = run_backtest(navs, use_params, initial_amount, initial_cash, record_equity=include_equity)
+    summary = summarize_backtest(dates, navs, result, initial_amount, initial_cash)
+    if include_equity:
+        summary['equity'] = {'dates': dates, 'values': np.round(result['equity'], 2).tolist()}
+
+    return {
+        'success': True,
+        'fund_code': fund_code,
+        'template_name': name,
+        'params': asdict(use_params),
+        'use_adjusted_nav': use_adjusted_nav,
+        'initial_amount': initial_amount,
+        'initial_cash': initial_cash,
+        **summary,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
@@ -17,6 +17,65 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from funddb import get_db_connection
 
 
+def _resolve_fund_config(portfolio_id: int, fund_code: str,
+                         config: Optional[Dict[str, Any]],
+                         template: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    按优先级解析基金止盈参数：自定义参数 > 指定模板 > 默认模板
+
+    Args:
+        config: fund_take_profit_config 行（无配置为None）
+        template: 配置指定的模板行；未指定模板时为默认模板行（有自定义参数时不使用）
+    """
+    result = {
+        'portfolio_id': portfolio_id,
+        'fund_code': fund_code,
+        'param_source': 'default',
+        'template_id': None,
+        'template_name': None,
+        'first_threshold': 0.20,
+        'first_sell_ratio': 0.30,
+        'step_size': 0.05,
+        'follow_up_sell_ratio': 0.20,
+        'enable_cost_control': True,
+        'target_diluted_cost': 0.0,
+        'enable_buy_back': False,
+        'buy_back_threshold': 0.20
+    }
+    
+    if config:
+        result['template_id'] = config.get('template_id')
+        result['enabled'] = config.get('enabled', 1)
+        
+        if config.get('custom_first_threshold') is not None:
+            result['first_threshold'] = config['custom_first_threshold']
+            result['first_sell_ratio'] = config['custom_first_sell_ratio']
+            result['step_size'] = config['custom_step_size']
+            result['follow_up_sell_ratio'] = config['custom_follow_up_sell_ratio']
+            result['enable_cost_control'] = bool(config['custom_enable_cost_control'])
+            result['target_diluted_cost'] = config['custom_target_diluted_cost']
+            result['enable_buy_back'] = bool(config.get('custom_enable_buy_back', 0))
+            result['buy_back_threshold'] = config.get('custom_buy_back_threshold', 0.20)
+            result['param_source'] = 'custom'
+            return result
+    
+    result['param_source'] = 'template' if config and config.get('template_id') else 'default'
+    
+    if template:
+        result['template_id'] = template['id']
+        result['template_name'] = template['name']
+        result['first_threshold'] = template['first_threshold']
+        result['first_sell_ratio'] = template['first_sell_ratio']
+        result['step_size'] = template['step_size']
+        result['follow_up_sell_ratio'] = template['follow_up_sell_ratio']
+        result['enable_cost_control'] = bool(template['enable_cost_control'])
+        result['target_diluted_cost'] = template['target_diluted_cost']
+        result['enable_buy_back'] = bool(template.get('enable_buy_back', 0))
+        result['buy_back_threshold'] = template.get('buy_back_threshold', 0.20)
+    
+    return result
+
+
 class TakeProfitTemplateManager:
     
     def list_templates(self) -> List[Dict[str, Any]]:
@@ -170,66 +229,51 @@ class TakeProfitTemplateManager:
                 WHERE portfolio_id = ? AND fund_code = ?
             ''', (portfolio_id, fund_code))
             config = cursor.fetchone()
+            config = dict(config) if config else None
             
-            result = {
-                'portfolio_id': portfolio_id,
-                'fund_code': fund_code,
-                'param_source': 'default',
-                'template_id': None,
-                'template_name': None,
-                'first_threshold': 0.20,
-                'first_sell_ratio': 0.30,
-                'step_size': 0.05,
-                'follow_up_sell_ratio': 0.20,
-                'enable_cost_control': True,
-                'target_diluted_cost': 0.0,
-                'enable_buy_back': False,
-                'buy_back_threshold': 0.20
-            }
-            
-            has_custom_params = False
-            if config:
-                config = dict(config)
-                result['template_id'] = config.get('template_id')
-                result['enabled'] = config.get('enabled', 1)
-                
-                if config.get('custom_first_threshold') is not None:
-                    has_custom_params = True
-                    result['first_threshold'] = config['custom_first_threshold']
-                    result['first_sell_ratio'] = config['custom_first_sell_ratio']
-                    result['step_size'] = config['custom_step_size']
-                    result['follow_up_sell_ratio'] = config['custom_follow_up_sell_ratio']
-                    result['enable_cost_control'] = bool(config['custom_enable_cost_control'])
-                    result['target_diluted_cost'] = config['custom_target_diluted_cost']
-                    result['enable_buy_back'] = bool(config.get('custom_enable_buy_back', 0))
-                    result['buy_back_threshold'] = config.get('custom_buy_back_threshold', 0.20)
-                    result['param_source'] = 'custom'
-            
-            if not has_custom_params:
-                template = None
-                if config and config.get('template_id'):
-                    cursor.execute('SELECT * FROM take_profit_template WHERE id = ?', (config['template_id'],))
-                    template = cursor.fetchone()
-                    result['param_source'] = 'template'
-                else:
-                    cursor.execute('SELECT * FROM take_profit_template WHERE is_default = 1')
-                    template = cursor.fetchone()
-                    result['param_source'] = 'default'
-                
-                if template:
-                    template = dict(template)
-                    result['template_id'] = template['id']
-                    result['template_name'] = template['name']
-                    result['first_threshold'] = template['first_threshold']
-                    result['first_sell_ratio'] = template['first_sell_ratio']
-                    result['step_size'] = template['step_size']
-                    result['follow_up_sell_ratio'] = template['follow_up_sell_ratio']
-                    result['enable_cost_control'] = bool(template['enable_cost_control'])
-                    result['target_diluted_cost'] = template['target_diluted_cost']
-                    result['enable_buy_back'] = bool(template.get('enable_buy_back', 0))
-                    result['buy_back_threshold'] = template.get('buy_back_threshold', 0.20)
+            if config and config.get('custom_first_threshold') is None and config.get('template_id'):
+                cursor.execute('SELECT * FROM take_profit_template WHERE id = ?', (config['template_id'],))
+            else:
+                cursor.execute('SELECT * FROM take_profit_template WHERE is_default = 1')
+            template = cursor.fetchone()
             
-            return result
+            return _resolve_fund_config(portfolio_id, fund_code, config, dict(template) if template else None)
+    
+    def get_fund_configs(self, portfolio_id: int, fund_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量解析基金止盈配置（与 get_fund_config 结果一致）
+        
+        基金配置、引用的模板和默认模板各一次查询，不随基金数量增加查询次数
+        
+        Returns:
+            {基金代码: 配置}
+        """
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM fund_take_profit_config WHERE portfolio_id = ?', (portfolio_id,))
+            configs = {row['fund_code']: dict(row) for row in cursor.fetchall()}
+            
+            template_ids = sorted({c['template_id'] for c in configs.values() if c.get('template_id')})
+            templates = {}
+            if template_ids:
+                placeholders = ','.join(['?' for _ in template_ids])
+                cursor.execute(f'SELECT * FROM take_profit_template WHERE id IN ({placeholders})', template_ids)
+                templates = {row['id']: dict(row) for row in cursor.fetchall()}
+            
+            cursor.execute('SELECT * FROM take_profit_template WHERE is_default = 1')
+            default_template = cursor.fetchone()
+            default_template = dict(default_template) if default_template else None
+        
+        result = {}
+        for fund_code in fund_codes:
+            config = configs.get(fund_code)
+            if config and config.get('template_id'):
+                template = templates.get(config['template_id'])
+            else:
+                template = default_template
+            result[fund_code] = _resolve_fund_config(portfolio_id, fund_code, config, template)
+        return result
     
     def set_fund_template(self, portfolio_id: int, fund_code: str, 
                           template_id: int = None) -> Dict[str, Any]:
@@ -359,10 +403,11 @@ class TakeProfitTemplateManager:
         from portfolio_manager import list_portfolio_funds
         
         funds = list_portfolio_funds(portfolio_id)
+        fund_configs = self.get_fund_configs(portfolio_id, [f['fund_code'] for f in funds])
         configs = []
         
         for fund in funds:
-            config = self.get_fund_config(portfolio_id, fund['fund_code'])
+            config = fund_configs[fund['fund_code']]
             config['fund_name'] = fund.get('fund_name', '')
             configs.append(config)
         
@@ -0,0 +1,337 @@
+"""
+止盈模板参数寻优模块
+在基金历史净值上对阶梯止盈参数（首次止盈阈值/比例、阶梯步长、后续止盈比例、捡回阈值）做网格或随机搜索，
+按风险调整后收益排名，最优参数可保存为新的止盈模板
+
+实现：
+    1. 用 load_nav_panel 一次读取全部基金净值，各基金去掉空值后首尾相接成一条float64数组（附偏移量）
+    2. 数组放入 multiprocessing.shared_memory，进程池各worker按名称映射同一块内存，不逐任务序列化净值
+    3. 参数组合分块派发给worker，每块对全部基金运行 take_profit_backtest.run_backtest，
+       只回传 (参数 × 基金 × 指标) 的小数组
+    4. 任务量较小或 workers=1 时直接在当前进程计算，避免进程启动开销
+
+评分：
+    score = 各基金平均年化收益 / 各基金平均最大回撤（收益回撤比），
+    同时给出买入持有的同口径基准，便于判断止盈是否改善了风险调整后收益
+"""
+import sys
+import os
+import time
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, replace
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import load_nav_panel
+from take_profit import TakeProfitParams
+from take_profit_backtest import run_backtest, DEFAULT_INITIAL_AMOUNT
+
+
+# 默认搜索网格；buy_back_threshold 为0表示不启用波段捡回
+DEFAULT_GRID = {
+    'first_threshold': [0.10, 0.15, 0.20, 0.25, 0.30],
+    'first_sell_ratio': [0.20, 0.30, 0.50],
+    'step_size': [0.03, 0.05, 0.08, 0.10],
+    'follow_up_sell_ratio': [0.10, 0.15, 0.20, 0.30],
+    'buy_back_threshold': [0.0, 0.10, 0.20],
+}
+
+SEARCH_METHODS = ['grid', 'random']
+
+SORT_FIELDS = ['score', 'annualized_return', 'max_drawdown', 'total_return']
+
+# 参与寻优的基金至少需要的净值天数（约1年）
+MIN_NAV_DAYS = 250
+
+# 按基金类型寻优时最多取的基金数
+MAX_FUNDS_PER_TYPE = 50
+
+# 回测次数（参数组合 × 基金）低于该值时不启用进程池
+PARALLEL_MIN_TASKS = 2000
+
+# 每个worker分到的参数块数
+CHUNKS_PER_WORKER = 4
+
+# 后端接口单次请求最多使用的进程数（不按CPU核数，避免一个请求占满所有核）
+API_MAX_WORKERS = 2
+
+# 单次回测回传的指标列：累计收益、最大回撤、交易次数
+_METRICS = 3
+
+# worker进程内的共享净值（由 _init_worker 设置）
+_worker_state = {}
+
+
+def build_param_sets(grid: Dict[str, List[float]] = None,
+                     method: str = 'grid',
+                     n_samples: int = 200,
+                     base: TakeProfitParams = None,
+                     seed: Optional[int] = 42) -> List[TakeProfitParams]:
+    """
+    生成待评估的参数组合
+
+    Args:
+        grid: 各参数的候选值，缺省的参数沿用 base；None表示 DEFAULT_GRID
+        method: 'grid' 全部组合，'random' 从全部组合中无放回随机抽取 n_samples 个
+        base: 不参与搜索的参数（成本控制、目标摊薄成本等）
+        seed: 随机种子
+
+    Returns:
+        TakeProfitParams 列表
+    """
+    grid = grid or DEFAULT_GRID
+    base = base or TakeProfitParams()
+    names = list(grid.keys())
+    combos = list(itertools.product(*(grid[name] for name in names)))
+    if method == 'random' and n_samples < len(combos):
+        rng = np.random.default_rng(seed)
+        combos = [combos[i] for i in sorted(rng.choice(len(combos), n_samples, replace=False))]
+
+    param_sets = []
+    for combo in combos:
+        values = dict(zip(names, combo))
+        if 'buy_back_threshold' in values:
+            values['enable_buy_back'] = values['buy_back_threshold'] > 0
+            if not values['enable_buy_back']:
+                values['buy_back_threshold'] = base.buy_back_threshold
+        param_sets.append(replace(base, **values))
+    return param_sets
+
+
+def load_optimization_navs(fund_codes: List[str],
+                           start_date: str = None,
+                           end_date: str = None,
+                           use_adjusted_nav: bool = False,
+                           min_days: int = MIN_NAV_DAYS) -> Dict[str, Any]:
+    """
+    读取基金净值并拼接为一条连续数组
+
+    Returns:
+        {'fund_codes': 有效基金, 'navs': 拼接后的净值, 'offsets': 各基金起止偏移(len+1),
+         'years': 各基金回测年数}
+    """
+    panel = load_nav_panel(fund_codes, start_date, end_date, adjusted=use_adjusted_nav)
+    dates = np.array(panel.dates, dtype='datetime64[D]') if panel.dates else np.empty(0, dtype='datetime64[D]')
+
+    codes, series, years = [], [], []
+    for j, code in enumerate(panel.fund_codes):
+        column = panel.values[:, j]
+        valid = ~np.isnan(column) & (column > 0)
+        if valid.sum() < min_days:
+            continue
+        used = dates[valid]
+        codes.append(code)
+        series.append(column[valid])
+        years.append((used[-1] - used[0]).astype(np.int64) / 365.0)
+
+    offsets = np.zeros(len(series) + 1, dtype=np.int64)
+    if series:
+        offsets[1:] = np.cumsum([s.size for s in series])
+    return {
+        'fund_codes': codes,
+        'navs': np.concatenate(series) if series else np.empty(0, dtype=np.float64),
+        'offsets': offsets,
+        'years': np.array(years, dtype=np.float64),
+    }
+
+
+def _evaluate(navs: np.ndarray, offsets: np.ndarray, param_sets: List[TakeProfitParams]) -> np.ndarray:
+    """对每组参数回测全部基金，返回 shape=(参数数, 基金数, 3) 的 [累计收益, 最大回撤, 交易次数]"""
+    n_funds = offsets.size - 1
+    out = np.zeros((len(param_sets), n_funds, _METRICS))
+    for p, params in enumerate(param_sets):
+        for f in range(n_funds):
+            result = run_backtest(navs[offsets[f]:offsets[f + 1]], params, DEFAULT_INITIAL_AMOUNT,
+                                  record_equity=False)
+            out[p, f, 0] = result['total_return']
+            out[p, f, 1] = result['max_drawdown']
+            out[p, f, 2] = len(result['trades'])
+    return out
+
+
+def _init_worker(shm_name: str, size: int, offsets: np.ndarray):
+    """worker初始化：按名称映射共享净值数组"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_state['shm'] = shm
+    _worker_state['navs'] = np.ndarray((size,), dtype=np.float64, buffer=shm.buf)
+    _worker_state['offsets'] = offsets
+
+
+def _worker_evaluate(param_sets: List[TakeProfitParams]) -> np.ndarray:
+    return _evaluate(_worker_state['navs'], _worker_state['offsets'], param_sets)
+
+
+def _run_parallel(navs: np.ndarray, offsets: np.ndarray, param_sets: List[TakeProfitParams],
+                  workers: int) -> np.ndarray:
+    shm = shared_memory.SharedMemory(create=True, size=max(navs.nbytes, 1))
+    try:
+        np.ndarray(navs.shape, dtype=np.float64, buffer=shm.buf)[:] = navs
+        chunk = max(1, -(-len(param_sets) // (workers * CHUNKS_PER_WORKER)))
+        chunks = [param_sets[i:i + chunk] for i in range(0, len(param_sets), chunk)]
+        # 调用方可能是多线程进程（如后端在线程池中调用），fork 可能死锁，使用 spawn 启动worker
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker,
+                                 initargs=(shm.name, navs.size, offsets)) as executor:
+            return np.concatenate(list(executor.map(_worker_evaluate, chunks)))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _annualize(total_return: np.ndarray, years: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where((years > 0) & (total_return > -1),
+                        np.power(1 + total_return, 1 / np.where(years > 0, years, 1)) - 1, np.nan)
+
+
+def _summary(annual: np.ndarray, drawdown: np.ndarray, total: np.ndarray) -> Dict[str, Any]:
+    mean_annual = float(np.nanmean(annual))
+    mean_drawdown = float(np.mean(drawdown))
+    return {
+        'annualized_return': round(mean_annual * 100, 2),
+        'max_drawdown': round(mean_drawdown * 100, 2),
+        'total_return': round(float(np.mean(total)) * 100, 2),
+        'score': round(mean_annual / mean_drawdown, 4) if mean_drawdown > 0 else None,
+    }
+
+
+def select_funds(fund_codes: List[str] = None, fund_type: str = None,
+                 max_funds: int = MAX_FUNDS_PER_TYPE) -> List[str]:
+    """确定寻优基金：显式代码列表，或 fund_info 中类型包含 fund_type 的基金（按代码取前 max_funds 只有净值的基金）"""
+    if fund_codes:
+        return list(dict.fromkeys(fund_codes))
+    if not fund_type:
+        return []
+    with get_db_connection() as conn:
+        rows = conn.execute('''
+            SELECT i.fund_code FROM fund_info i
+            WHERE i.fund_type LIKE ?
+              AND EXISTS (SELECT 1 FROM fund_nav n WHERE n.fund_code = i.fund_code)
+            ORDER BY i.fund_code
+            LIMIT ?
+        ''', (f'%{fund_type}%', max_funds)).fetchall()
+    return [row['fund_code'] for row in rows]
+
+
+def optimize_take_profit(fund_codes: List[str] = None,
+                         fund_type: str = None,
+                         grid: Dict[str, List[float]] = None,
+                         method: str = 'grid',
+                         n_samples: int = 200,
+                         base: TakeProfitParams = None,
+                         start_date: str = None,
+                         end_date: str = None,
+                         use_adjusted_nav: bool = False,
+                         sort_by: str = 'score',
+                         top_n: int = 20,
+                         workers: int = None,
+                         max_funds: int = MAX_FUNDS_PER_TYPE,
+                         seed: Optional[int] = 42) -> Dict[str, Any]:
+    """
+    止盈参数寻优
+
+    Args:
+        fund_codes: 基金代码列表（按基金寻优）
+        fund_type: 基金类型（按类型寻优，fund_codes为空时使用）
+        grid / method / n_samples / base / seed: 见 build_param_sets
+        start_date / end_date: 回测区间
+        use_adjusted_nav: 是否使用复权净值
+        sort_by: 排名字段，score / annualized_return / total_return 降序，max_drawdown 升序
+        top_n: 返回前N组参数
+        workers: 进程数，None表示CPU核数，1表示不使用进程池
+        max_funds: 按类型寻优时的基金数上限
+
+    Returns:
+        {'success': True, 'fund_codes', 'param_count', 'backtest_count', 'workers',
+         'baseline': 买入持有基准, 'ranking': [{'rank', 'params', 指标...}], 'elapsed_ms'}
+    """
+    if method not in SEARCH_METHODS:
+        return {'success': False, 'error': f'不支持的搜索方式: {method}'}
+    if sort_by not in SORT_FIELDS:
+        return {'success': False, 'error': f'不支持的排序字段: {sort_by}'}
+
+    start = time.perf_counter()
+    codes = select_funds(fund_codes, fund_type, max_funds)
+    if not codes:
+        return {'success': False, 'error': '未指定基金或该类型下没有基金'}
+
+    data = load_optimization_navs(codes, start_date, end_date, use_adjusted_nav)
+    if not data['fund_codes']:
+        return {'success': False, 'error': f'没有净值数据满足{MIN_NAV_DAYS}个交易日的基金'}
+
+    param_sets = build_param_sets(grid, method, n_samples, base, seed)
+    if not param_sets:
+        return {'success': False, 'error': '参数组合为空'}
+
+    navs, offsets, years = data['navs'], data['offsets'], data['years']
+    backtest_count = len(param_sets) * len(data['fund_codes'])
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and backtest_count >= PARALLEL_MIN_TASKS:
+        metrics = _run_parallel(navs, offsets, param_sets, workers)
+    else:
+        workers = 1
+        metrics = _evaluate(navs, offsets, param_sets)
+
+    total = metrics[:, :, 0]
+    drawdown = metrics[:, :, 1]
+    annual = _annualize(total, years[None, :])
+
+    rows = []
+    for p, params in enumerate(param_sets):
+        row = {'params': asdict(params), **_summary(annual[p], drawdown[p], total[p])}
+        row['avg_trades'] = round(float(metrics[p, :, 2].mean()), 2)
+        rows.append(row)
+
+    descending = sort_by != 'max_drawdown'
+    rows.sort(key=lambda r: (r[sort_by] is None,
+                             -(r[sort_by] or 0) if descending else (r[sort_by] or 0)))
+    for i, row in enumerate(rows, 1):
+        row['rank'] = i
+
+    # 买入持有基准（同一批基金、同一区间）
+    hold_total = np.array([navs[offsets[f + 1] - 1] / navs[offsets[f]] - 1 for f in range(years.size)])
+    hold_drawdown = np.array([
+        float(-np.min(s / np.maximum.accumulate(s) - 1))
+        for s in (navs[offsets[f]:offsets[f + 1]] for f in range(years.size))
+    ])
+
+    return {
+        'success': True,
+        'fund_codes': data['fund_codes'],
+        'fund_type': fund_type,
+        'method': method,
+        'sort_by': sort_by,
+        'param_count': len(param_sets),
+        'backtest_count': backtest_count,
+        'workers': workers,
+        'baseline': _summary(_annualize(hold_total, years), hold_drawdown, hold_total),
+        'ranking': rows[:top_n],
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+def save_as_template(entry: Dict[str, Any], name: str, description: str = None) -> Dict[str, Any]:
+    """
+    将寻优结果中的一组参数保存为止盈模板
+
+    Args:
+        entry: optimize_take_profit 返回的 ranking 元素（或含 'params' 的字典）
+        name: 模板名称
+        description: 模板描述，None时自动生成
+    """
+    from take_profit_manager import TakeProfitTemplateManager
+
+    params = entry['params']
+    if description is None:
+        description = (f"参数寻优({datetime.now().strftime('%Y-%m-%d')})：首次盈利{params['first_threshold']:.0%}"
+                       f"卖出{params['first_sell_ratio']:.0%}，后续每涨{params['step_size']:.0%}"
+                       f"卖出{params['follow_up_sell_ratio']:.0%}")
+    return TakeProfitTemplateManager().create_template(name, description, **params)
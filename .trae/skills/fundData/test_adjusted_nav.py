@@ -0,0 +1,88 @@
+"""
+测试复权净值
+验证分红再投资/拆分折算的复权口径、增量更新与整只重建结果一致，以及复权面板和止盈复权倍数
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+
+import funddb
+from adjusted_nav import compute_adjustment_factors, update_adjusted_nav, get_adjustment_ratio
+from nav_panel import load_nav_panel
+from risk_metrics_calculator import load_nav_arrays
+
+
+def test_adjustment_factors():
+    """分红日复权收益 = (nav_t + d) / nav_{t-1}，拆分日复权净值连续"""
+    dates = ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05']
+    navs = np.array([1.20, 1.22, 1.02, 1.03, 0.515])
+    factors = compute_adjustment_factors(dates, navs,
+                                         dividends=[('2024-01-03', 0.2), ('2023-12-01', 0.1)],
+                                         splits=[('2024-01-05', 2.0)])
+    adjusted = navs * factors
+    assert np.isclose(adjusted[2] / adjusted[1], (1.02 + 0.2) / 1.22)
+    assert np.isclose(adjusted[4], adjusted[3] * 0.515 * 2 / 1.03)
+    assert factors[0] == 1.0 and factors[1] == 1.0
+
+    # 事件落在非净值日：在其后首个净值日生效
+    shifted = compute_adjustment_factors(dates, navs, dividends=[('2024-01-02 12:00', 0.2)])
+    assert shifted[1] == 1.0 and shifted[2] > 1.0
+    print("复权因子: 通过")
+
+
+def test_incremental_update(temp_db):
+    rng = np.random.default_rng(0)
+    dates = [f"2024-{i // 28 + 1:02d}-{i % 28 + 1:02d}" for i in range(300)]
+    navs = np.round(np.cumprod(1 + rng.normal(0.0003, 0.01, 300)), 4)
+
+    def insert_navs(lo, hi):
+        with funddb.get_db_connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO fund_nav (fund_code, nav_date, unit_nav) VALUES ('000001', ?, ?)",
+                             [(d, float(v)) for d, v in zip(dates[lo:hi], navs[lo:hi])])
+            conn.commit()
+
+    insert_navs(0, 200)
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO fund_dividend (fund_code, ex_dividend_date, dividend_per_share) VALUES ('000001', ?, 0.05)",
+                     (dates[50],))
+        conn.commit()
+    first = update_adjusted_nav(['000001'])
+    assert first['rebuilt'] == ['000001']
+    assert update_adjusted_nav(['000001'])['unchanged'] == 1
+
+    # 新增净值和晚于已处理日期的分红：增量追加
+    insert_navs(200, 300)
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO fund_dividend (fund_code, ex_dividend_date, dividend_per_share) VALUES ('000001', ?, 0.03)",
+                     (dates[250],))
+        conn.commit()
+    second = update_adjusted_nav(['000001'])
+    assert second['appended'] == 100 and second['rebuilt'] == []
+
+    with funddb.get_db_connection() as conn:
+        incremental = load_nav_arrays(conn.cursor(), '000001', adjusted=True)[1]
+    expected = navs * compute_adjustment_factors(dates, navs, [(dates[50], 0.05), (dates[250], 0.03)])
+    assert np.allclose(incremental, expected)
+
+    # 补录历史拆分：整只重建
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO fund_split (fund_code, split_date, split_ratio) VALUES ('000001', ?, 1.5)", (dates[100],))
+        conn.commit()
+    assert update_adjusted_nav(['000001'])['rebuilt'] == ['000001']
+
+    panel = load_nav_panel(['000001'], adjusted=True)
+    expected = navs * compute_adjustment_factors(dates, navs, [(dates[50], 0.05), (dates[250], 0.03)],
+                                                 [(dates[100], 1.5)])
+    assert np.allclose(panel.column('000001'), expected)
+
+    ratio = get_adjustment_ratio('000001', dates[60])
+    assert np.isclose(ratio, expected[-1] / navs[-1] / (expected[60] / navs[60]))
+    assert get_adjustment_ratio('999999', dates[60]) == 1.0
+    print("增量更新与重建: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,111 @@
+"""
+测试基准回归指标
+与numpy最小二乘及 FundAnalyzer 的 beta / 跟踪误差比对，并验证基准识别和结果保存
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+import numpy as np
+import pandas as pd
+
+import funddb
+from benchmark_regression import (
+    resolve_benchmark_index, regress_on_benchmark, compute_benchmark_regression, get_benchmark_regression
+)
+
+
+def test_resolve_benchmark_index():
+    assert resolve_benchmark_index("沪深300指数收益率×80%+中债综合指数收益率×20%") == '000300'
+    assert resolve_benchmark_index("中证500指数收益率×60%+沪深300指数收益率×20%") == '000905'
+    assert resolve_benchmark_index("中债总财富指数") == '000300'
+    assert resolve_benchmark_index(None) == '000300'
+    print("基准识别: 通过")
+
+
+def test_regression_matches_lstsq():
+    """beta/alpha与最小二乘一致，跟踪误差与FundAnalyzer一致"""
+    from fund_analyzer import FundAnalyzer
+
+    rng = np.random.default_rng(0)
+    bench = rng.normal(0.0003, 0.01, 300)
+    funds = 0.0001 + bench[:, None] * np.array([0.8, 1.2, 0.3]) + rng.normal(0, 0.005, (300, 3))
+    funds[:50, 2] = np.nan
+    bench[10] = np.nan
+
+    metrics = regress_on_benchmark(funds, bench, risk_free_rate=0.02)
+    analyzer = FundAnalyzer(risk_free_rate=0.02)
+    for j in range(3):
+        ok = ~np.isnan(funds[:, j]) & ~np.isnan(bench)
+        f, b = funds[ok, j], bench[ok]
+        rf = 0.02 / 252
+        slope, intercept = np.polyfit(b - rf, f - rf, 1)
+        assert np.isclose(metrics['beta'][j], slope)
+        assert np.isclose(metrics['alpha'][j], intercept * 252)
+        assert np.isclose(metrics['r_squared'][j], np.corrcoef(f, b)[0, 1] ** 2)
+        assert metrics['observations'][j] == ok.sum()
+
+        fs, bs = pd.Series(f), pd.Series(b)
+        assert np.isclose(metrics['beta'][j], analyzer.calculate_beta(fs, bs))
+        assert np.isclose(metrics['tracking_error'][j], analyzer.calculate_tracking_error(fs, bs))
+
+    short = regress_on_benchmark(funds[:10], bench[:10])
+    assert np.isnan(short['beta']).all()
+    print("与最小二乘/FundAnalyzer一致: 通过")
+
+
+def test_compute_and_store(temp_db):
+    rng = np.random.default_rng(1)
+    dates = [f"2023-{i // 200 + 1:02d}-{i % 200:03d}" for i in range(400)]
+    index_close = {
+        '000300': np.cumprod(1 + rng.normal(0.0002, 0.01, 400)),
+        '000905': np.cumprod(1 + rng.normal(0.0002, 0.012, 400)),
+    }
+    with funddb.get_db_connection() as conn:
+        for code, closes in index_close.items():
+            conn.executemany("INSERT INTO index_price (index_code, trade_date, close_price) VALUES (?, ?, ?)",
+                             [(code, d, float(c)) for d, c in zip(dates, closes)])
+        for code, bench_text, beta in (('000001', '沪深300指数收益率×90%', 0.9),
+                                       ('000002', '中证500指数收益率×80%+中债指数×20%', 1.1)):
+            idx = '000300' if '沪深300' in bench_text else '000905'
+            b = index_close[idx][1:] / index_close[idx][:-1] - 1
+            navs = np.concatenate(([1.0], np.cumprod(1 + beta * b + rng.normal(0, 0.002, 399))))
+            conn.execute("INSERT INTO fund_info (fund_code, fund_name, benchmark) VALUES (?, ?, ?)",
+                         (code, f"基金{code}", bench_text))
+            conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                             [(code, d, float(v)) for d, v in zip(dates, navs) if d != dates[100]])
+        conn.commit()
+
+    result = compute_benchmark_regression(window=252)
+    assert result['success'] and result['saved'] == 2
+    by_code = {r['fund_code']: r for r in result['results']}
+    assert by_code['000001']['index_code'] == '000300' and abs(by_code['000001']['beta'] - 0.9) < 0.05
+    assert by_code['000002']['index_code'] == '000905' and abs(by_code['000002']['beta'] - 1.1) < 0.05
+    assert by_code['000001']['observations'] == 252 and by_code['000001']['end_date'] == dates[-1]
+
+    stored = get_benchmark_regression(['000001', '000002'])
+    assert stored['computed'] == []
+    assert stored['results']['000002']['beta'] == by_code['000002']['beta']
+
+    assert compute_benchmark_regression(['000001'], index_code='399006')['missing_index'] == ['399006']
+
+    # 基准行情或基金净值更新后，保存的结果过期并重算
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO index_price (index_code, trade_date, close_price) VALUES ('000905', '2099-01-01', ?)",
+                     (float(index_close['000905'][-1]) * 1.01,))
+        conn.commit()
+    stored = get_benchmark_regression(['000001', '000002'])
+    assert stored['computed'] == ['000002']
+    assert stored['results']['000002']['end_date'] == '2099-01-01'
+    assert get_benchmark_regression(['000001', '000002'])['computed'] == []
+
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES ('000001', ?, 1.0)", (dates[100],))
+        conn.commit()
+    assert get_benchmark_regression(['000001', '000002'])['computed'] == ['000001']
+    print("批量计算与保存: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,81 @@
+"""
+测试相关性/协方差矩阵服务
+与pandas成对缺失的 corr/cov 比对，并验证缓存和新增基金的增量计算
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import funddb
+from correlation_service import get_correlation_matrix, get_portfolio_correlation
+
+
+def _insert_navs(rng, codes, dates):
+    """写入带缺失日的相关净值序列，返回 dates × codes 的DataFrame"""
+    common = rng.normal(0, 0.01, len(dates))
+    frame = {}
+    rows = []
+    for k, code in enumerate(codes):
+        daily = 0.6 * common + rng.normal(0.0003, 0.008, len(dates))
+        navs = np.round(np.cumprod(1 + daily), 4)
+        keep = rng.random(len(dates)) > 0.1
+        keep[:k * 40] = False
+        frame[code] = pd.Series(np.where(keep, navs, np.nan), index=dates)
+        rows += [(code, d, float(v)) for d, v, kept in zip(dates, navs, keep) if kept]
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)", rows)
+        conn.executemany("INSERT INTO trade_calendar (trade_date, is_trade_day) VALUES (?, 1)", [(d,) for d in dates])
+        conn.commit()
+    return pd.DataFrame(frame)
+
+
+def _expected(frame, codes, window):
+    returns = (frame[codes] / frame[codes].shift(1) - 1).iloc[-window:]
+    return returns.corr(min_periods=20).to_numpy(), returns.cov(min_periods=20).to_numpy()
+
+
+def _as_array(matrix):
+    return np.array([[np.nan if v is None else v for v in row] for row in matrix])
+
+
+def test_correlation_service(temp_db):
+    rng = np.random.default_rng(3)
+    dates = [f"2022-{i // 300 + 1:02d}-{i % 300:03d}" for i in range(600)]
+    codes = [f"00000{k}" for k in range(1, 7)]
+    frame = _insert_navs(rng, codes, dates)
+
+    base = codes[:5]
+    result = get_correlation_matrix(base, window=250)
+    assert result['success'] and not result['from_cache']
+    corr, cov = _expected(frame, base, 250)
+    assert np.allclose(_as_array(result['correlation']), corr, atol=1e-4, equal_nan=True)
+    assert np.allclose(_as_array(result['covariance']), cov, atol=1e-8, equal_nan=True)
+
+    assert get_correlation_matrix(list(reversed(base)), window=250)['from_cache']
+
+    # 新增一只基金：增量计算，结果与全量一致
+    extended = get_correlation_matrix(base + [codes[5]], window=250)
+    assert extended['incremental']
+    corr, cov = _expected(frame, base + [codes[5]], 250)
+    assert np.allclose(_as_array(extended['correlation']), corr, atol=1e-4, equal_nan=True)
+    assert np.allclose(_as_array(extended['covariance']), cov, atol=1e-8, equal_nan=True)
+
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO portfolio (id, name) VALUES (1, '测试组合')")
+        conn.executemany("INSERT INTO portfolio_fund (portfolio_id, fund_code, fund_name) VALUES (1, ?, ?)",
+                         [(c, f"基金{c}") for c in codes[:3]])
+        conn.commit()
+    portfolio = get_portfolio_correlation(1, window=250)
+    assert portfolio['success'] and len(portfolio['fund_names']) == 3
+    assert portfolio['avg_correlation'] is not None
+
+    assert not get_correlation_matrix(['000001', '999999'])['success']
+    print("相关性矩阵服务: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,76 @@
+"""
+测试 FundAnalyzer 单次遍历指标内核
+与逐方法计算（calculate_all_metrics_by_method）逐项比对，含净值缺失日
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+
+def _series(seed, n, gaps=()):
+    rng = np.random.default_rng(seed)
+    navs = np.round(np.cumprod(1 + rng.normal(0.0004, 0.013, n)), 4)
+    series = pd.Series(navs, index=pd.bdate_range('2021-01-04', periods=n))
+    series.iloc[list(gaps)] = np.nan
+    return series
+
+
+def _assert_same(kernel, by_method, tag):
+    expected = by_method.to_dict()
+    for key, value in kernel.to_dict().items():
+        other = expected[key]
+        if key == 'analysis_date':
+            continue
+        if isinstance(value, float) and isinstance(other, float):
+            if np.isnan(value) or np.isnan(other):
+                assert np.isnan(value) and np.isnan(other), (tag, key, value, other)
+            else:
+                assert value == pytest.approx(other, rel=1e-9, abs=1e-12), (tag, key, value, other)
+        else:
+            assert value == other, (tag, key, value, other)
+
+
+def test_kernel_matches_by_method_with_gaps():
+    """含缺失净值（单日、连续多日、首尾）时内核与逐方法计算一致"""
+    from fund_analyzer import FundAnalyzer, benchmark_all_metrics
+
+    analyzer = FundAnalyzer(risk_free_rate=0.025)
+    benchmark = _series(99, 300, gaps=(40, 41))
+    cases = {
+        'no_gap': (),
+        'single_gap': (50,),
+        'run_gap': (100, 101, 102, 150),
+        'edge_gap': (0, 299),
+    }
+    for seed, (tag, gaps) in enumerate(cases.items()):
+        nav = _series(seed, 300, gaps)
+        for bench in (None, benchmark):
+            kernel = analyzer.calculate_all_metrics(nav, bench, '000001')
+            by_method = analyzer.calculate_all_metrics_by_method(nav, bench, '000001')
+            _assert_same(kernel, by_method, (tag, bench is not None))
+
+        result = benchmark_all_metrics(nav, benchmark, repeat=1, analyzer=analyzer)
+        assert result['max_abs_diff'] < 1e-9, (tag, result['max_abs_diff'])
+    print("内核与逐方法计算一致（含缺失净值）: 通过")
+
+
+def test_batch_matches_single():
+    """批量计算与逐只计算一致"""
+    from fund_analyzer import FundAnalyzer
+
+    analyzer = FundAnalyzer()
+    frame = pd.DataFrame({'000001': _series(1, 200), '000002': _series(2, 200, gaps=(20, 21))})
+    frame.iloc[:50, 1] = np.nan
+    batch = analyzer.calculate_all_metrics_batch(frame)
+    for code in frame.columns:
+        _assert_same(batch[code], analyzer.calculate_all_metrics(frame[code].dropna(), None, code), code)
+    print("批量计算: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,107 @@
+"""
+测试成分基金可用现金余额
+验证买入/卖出/捡回及修改历史交易时余额同步、旧库补齐，以及对账发现并修正不一致
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+
+import funddb
+from fund_cash import get_fund_cash, reconcile_fund_cash
+from ledger import update_transaction, delete_transaction
+from portfolio_manager import (record_buy_transaction, record_sell_transaction, execute_buy_back_transaction,
+                               calculate_fund_available_cash, get_portfolio_funds_available_cash,
+                               calculate_portfolio_available_cash_batch)
+
+
+def _setup_db():
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO portfolio (id, name, cash) VALUES (1, '测试组合', 10000)")
+        conn.commit()
+
+
+def _ledger_cash(portfolio_id: int):
+    with funddb.get_db_connection() as conn:
+        rows = conn.execute('''
+            SELECT fund_code, SUM(CASE WHEN transaction_type = 'SELL' THEN amount ELSE -amount END)
+            FROM portfolio_transaction WHERE portfolio_id = ? GROUP BY fund_code
+        ''', (portfolio_id,)).fetchall()
+    return {code: cash for code, cash in rows}
+
+
+def _last_id():
+    with funddb.get_db_connection() as conn:
+        return conn.execute("SELECT MAX(id) FROM portfolio_transaction").fetchone()[0]
+
+
+def test_maintained_on_transactions(temp_db):
+    _setup_db()
+    record_buy_transaction(1, '000001', 1000, 1000, '2024-01-02')
+    record_buy_transaction(1, '000001', 500, 600, '2024-02-01')
+    record_buy_transaction(1, '000002', 300, 900, '2024-02-01')
+    record_sell_transaction(1, '000001', 400, 560, '2024-03-01')
+    record_sell_transaction(1, '000001', 200, 300, '2024-04-01')
+    sell_id = _last_id()
+    execute_buy_back_transaction(1, '000001', sell_id, 200, 250, '2024-05-06')
+
+    # 校验失败的交易不影响余额
+    assert not record_sell_transaction(1, '000002', 9999, 1, '2024-05-07')['success']
+
+    balances = get_fund_cash(1)
+    assert balances['000001'] == {'total_buy_amount': 1850, 'total_sell_amount': 860, 'available_cash': -990}
+    assert {code: b['available_cash'] for code, b in balances.items()} == _ledger_cash(1)
+    assert calculate_portfolio_available_cash_batch(1) == _ledger_cash(1)
+    info = calculate_fund_available_cash(1, '000002')
+    assert info['available_cash'] == -900 and info['total_buy_amount'] == 900
+    summary = get_portfolio_funds_available_cash(1)
+    assert summary['total_available_cash'] == -1890 and summary['fund_count'] == 2
+
+    # 修改、删除历史交易后余额按交易记录重算
+    with funddb.get_db_connection() as conn:
+        first_sell = conn.execute("SELECT id FROM portfolio_transaction WHERE transaction_date = '2024-03-01'").fetchone()[0]
+    update_transaction(first_sell, amount=600)
+    delete_transaction(_last_id())
+    assert get_fund_cash(1)['000001']['available_cash'] == -990 + 40 + 250
+    assert reconcile_fund_cash(1, fix=False)['mismatches'] == []
+    print("随交易维护余额: 通过")
+
+
+def test_backfill_and_reconcile(temp_db):
+    _setup_db()
+    # 旧库：交易记录已存在但没有余额，初始化时补齐
+    with funddb.get_db_connection() as conn:
+        conn.executemany('''INSERT INTO portfolio_transaction (portfolio_id, fund_code, transaction_type, transaction_date, shares, amount)
+                            VALUES (1, ?, ?, '2024-01-02', 100, ?)''',
+                         [('000001', 'BUY', 100.0), ('000001', 'SELL', 130.0), ('000003', 'BUY', 50.0)])
+        conn.commit()
+    funddb.init_database()
+    assert get_fund_cash(1, ['000001', '000003', '000009']) == {
+        '000001': {'total_buy_amount': 100, 'total_sell_amount': 130, 'available_cash': 30},
+        '000003': {'total_buy_amount': 50, 'total_sell_amount': 0, 'available_cash': -50},
+        '000009': {'total_buy_amount': 0, 'total_sell_amount': 0, 'available_cash': 0},
+    }
+
+    # 绕过交易接口直接改表：对账发现并修正
+    with funddb.get_db_connection() as conn:
+        conn.execute("UPDATE portfolio_transaction SET amount = 150 WHERE transaction_type = 'SELL'")
+        conn.execute("DELETE FROM portfolio_transaction WHERE fund_code = '000003'")
+        conn.execute("INSERT INTO portfolio_transaction (portfolio_id, fund_code, transaction_type, transaction_date, shares, amount) "
+                     "VALUES (1, '000004', 'BUY', '2024-01-03', 10, 20)")
+        conn.commit()
+    report = reconcile_fund_cash(fix=False)
+    assert [m['fund_code'] for m in report['mismatches']] == ['000001', '000003', '000004']
+    assert report['fixed'] == 0 and report['mismatches'][2]['actual_available_cash'] is None
+
+    report = reconcile_fund_cash()
+    assert report['fixed'] == 3 and report['checked'] == 3
+    assert {code: b['available_cash'] for code, b in get_fund_cash(1).items()} == _ledger_cash(1)
+    assert reconcile_fund_cash()['mismatches'] == []
+    assert np.isclose(get_fund_cash(1)['000001']['available_cash'], 50)
+    print("旧库补齐与对账: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,104 @@
+"""
+测试基金筛选引擎
+与逐行Python筛选结果比对，并验证分位条件、排序和数据变化后的快照刷新
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+
+import funddb
+import fund_screener
+from fund_screener import screen_funds, get_screen_fields
+
+
+def _insert_universe(rng, n):
+    types = ['股票型', '混合型-偏股', '债券型-长债', '指数型-股票']
+    funds = []
+    with funddb.get_db_connection() as conn:
+        for i in range(n):
+            code = f"{i:06d}"
+            fund = {
+                'fund_code': code,
+                'fund_type': types[i % len(types)],
+                'return_1y': float(rng.normal(5, 15)),
+                'max_drawdown_1y': float(abs(rng.normal(15, 8))),
+                'sharpe_1y': float(rng.normal(0.5, 0.8)) if i % 17 else None,
+                'rating_max': float(rng.integers(1, 6)),
+                'tenure_days': int(rng.integers(100, 4000)),
+            }
+            funds.append(fund)
+            conn.execute("INSERT INTO fund_info (fund_code, fund_name, fund_type) VALUES (?, ?, ?)",
+                         (code, f"基金{code}", fund['fund_type']))
+            conn.execute('''INSERT INTO fund_risk_metrics (fund_code, period, period_return, max_drawdown, sharpe_ratio)
+                            VALUES (?, '近1年', ?, ?, ?)''',
+                         (code, fund['return_1y'], fund['max_drawdown_1y'], fund['sharpe_1y']))
+            conn.execute("INSERT INTO fund_rating (fund_code, rating_sh, rating_zs) VALUES (?, ?, ?)",
+                         (code, fund['rating_max'], fund['rating_max'] - 1))
+            conn.execute("INSERT INTO fund_manager (manager_name, fund_code, tenure_days) VALUES (?, ?, ?)",
+                         (f"经理{i}", code, fund['tenure_days']))
+            conn.execute("INSERT INTO fund_manager (manager_name, fund_code, tenure_days) VALUES (?, ?, 10)",
+                         (f"助理{i}", code))
+        conn.commit()
+    return funds
+
+
+def test_fund_screener(temp_db):
+    fund_screener._snapshot = None
+
+    rng = np.random.default_rng(0)
+    funds = _insert_universe(rng, 2000)
+
+    filters = [
+        {'field': 'fund_type', 'op': 'in', 'value': ['股票型', '混合型-偏股']},
+        {'field': 'return_1y', 'op': '>', 'value': 0},
+        {'field': 'max_drawdown_1y', 'op': '<', 'value': 20},
+        {'field': 'rating_max', 'op': '>=', 'value': 4},
+        {'field': 'manager_tenure_years', 'op': '>', 'value': 3},
+    ]
+    result = screen_funds(filters, sort_by='return_1y', page_size=10000)
+    expected = [f for f in funds if f['fund_type'] in ('股票型', '混合型-偏股') and f['return_1y'] > 0
+                and f['max_drawdown_1y'] < 20 and f['rating_max'] >= 4 and f['tenure_days'] / 365.25 > 3]
+    expected.sort(key=lambda f: -f['return_1y'])
+    assert result['total'] == len(expected) > 0
+    assert [r['fund_code'] for r in result['items']] == [f['fund_code'] for f in expected]
+    assert result['items'][0]['manager_name'].startswith('经理')
+
+    # 夏普前10%：在满足其余条件且夏普有值的基金中排名
+    top = screen_funds(filters[:1] + [{'field': 'sharpe_1y', 'op': 'top_pct', 'value': 10}],
+                       sort_by='sharpe_1y', page_size=10000)
+    pool = sorted([f['sharpe_1y'] for f in funds
+                   if f['fund_type'] in ('股票型', '混合型-偏股') and f['sharpe_1y'] is not None], reverse=True)
+    keep = int(np.ceil(len(pool) * 0.1))
+    assert top['total'] == keep
+    assert np.isclose(top['items'][-1]['sharpe_1y'], round(pool[keep - 1], 4))
+
+    # 缺失值排在最后
+    by_sharpe = screen_funds(sort_by='sharpe_1y', sort_dir='asc', page=1, page_size=10000)
+    assert by_sharpe['items'][-1]['sharpe_1y'] is None and by_sharpe['items'][0]['sharpe_1y'] is not None
+
+    start = time.perf_counter()
+    for _ in range(20):
+        screen_funds(filters, sort_by='sharpe_1y', page_size=20)
+    print(f"  筛选耗时: {(time.perf_counter() - start) / 20 * 1000:.2f}ms/次（{len(funds)}只基金）")
+
+    assert not screen_funds([{'field': 'unknown', 'op': '>', 'value': 1}])['success']
+    assert not screen_funds([{'field': 'return_1y', 'op': '~', 'value': 1}])['success']
+
+    # 数据变化后快照刷新
+    with funddb.get_db_connection() as conn:
+        conn.execute("UPDATE fund_risk_metrics SET period_return = 999, update_time = datetime('now', '+1 minute') "
+                     "WHERE fund_code = '000003'")
+        conn.commit()
+    fund_screener._snapshot.checked_at = 0
+    best = screen_funds(sort_by='return_1y', page_size=1)
+    assert best['items'][0]['fund_code'] == '000003'
+    assert 'return_1y' in get_screen_fields()['numeric_fields']
+    print("基金筛选引擎: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
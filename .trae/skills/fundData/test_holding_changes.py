@@ -0,0 +1,104 @@
+"""
+测试持仓变动与换手率
+与 fund_analyzer.PortfolioAnalyzer.detect_position_changes 逐基金比对，并验证入库和查询
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+import numpy as np
+import pandas as pd
+
+import funddb
+from holding_changes import compute_holding_changes, update_holding_changes, get_stock_buyers, get_top_turnover_funds
+
+
+QUARTERS = ['2024年1季度股票投资明细', '2024年2季度股票投资明细', '2024年3季度股票投资明细']
+
+
+def _random_holdings(rng, n_funds):
+    rows = []
+    stocks = [f"{600000 + i}" for i in range(60)]
+    for f in range(n_funds):
+        # 部分基金缺一期：上期为更早的一期
+        quarters = QUARTERS if f % 5 else QUARTERS[::2]
+        for q in quarters:
+            for stock in rng.choice(stocks, 10, replace=False):
+                rows.append((f"{f:06d}", q, stock, f"股票{stock}", round(float(rng.uniform(0.5, 9)), 2), 1000.0))
+    return pd.DataFrame(rows, columns=['fund_code', 'report_date', 'stock_code', 'stock_name', 'hold_ratio', 'hold_shares'])
+
+
+def test_matches_portfolio_analyzer():
+    from fund_analyzer import PortfolioAnalyzer
+
+    holdings = _random_holdings(np.random.default_rng(0), 40)
+    changes, turnover = compute_holding_changes(holdings)
+
+    for (code, quarter), period in changes.groupby(['fund_code', 'quarter']):
+        prev_quarter = period['prev_quarter'].iloc[0]
+        fund = holdings[holdings['fund_code'] == code]
+        report = {q[:4] + 'Q' + q[5]: q for q in QUARTERS}
+
+        def frame(q):
+            part = fund[fund['report_date'] == report[q]]
+            return pd.DataFrame({'stock_code': part['stock_code'], 'weight': part['hold_ratio'] / 100})
+
+        expected = PortfolioAnalyzer.detect_position_changes(frame(quarter), frame(prev_quarter))
+        row = turnover[(turnover['fund_code'] == code) & (turnover['quarter'] == quarter)].iloc[0]
+        assert np.isclose(row['turnover'], expected['turnover_ratio_pct'])
+        for t in ['added', 'removed', 'increased', 'decreased']:
+            assert row[f'num_{t}'] == expected[f'num_{t}']
+            assert set(period.loc[period['change_type'] == t, 'stock_code']) == \
+                {s['stock_code'] for s in expected[f'{t}_stocks']}
+
+    skipped = turnover[turnover['fund_code'] == '000000']
+    assert list(skipped['prev_quarter']) == ['2024Q1']
+    print("持仓变动与逐基金计算一致: 通过")
+
+
+def test_holding_change_queries(temp_db):
+    holdings = _random_holdings(np.random.default_rng(1), 500)
+    with funddb.get_db_connection() as conn:
+        conn.executemany('''INSERT INTO fund_stock_holding (fund_code, report_date, stock_code, stock_name, hold_ratio, hold_shares)
+                            VALUES (?, ?, ?, ?, ?, ?)''', holdings.itertuples(index=False, name=None))
+        conn.execute("INSERT INTO fund_info (fund_code, fund_name, fund_type) VALUES ('000001', '测试基金', '股票型')")
+        conn.commit()
+
+    start = time.perf_counter()
+    result = update_holding_changes()
+    print(f"  全量计算耗时: {time.perf_counter() - start:.2f}s（{result['fund_count']}只基金）")
+    assert result['success'] and result['fund_count'] == 500
+
+    changes, turnover = compute_holding_changes(holdings)
+    latest = changes[(changes['quarter'] == '2024Q3') & changes['change_type'].isin(['added', 'increased'])]
+    stock = latest['stock_code'].value_counts().index[0]
+
+    buyers = get_stock_buyers(stock)
+    assert buyers['quarter'] == '2024Q3'
+    assert buyers['total'] == (latest['stock_code'] == stock).sum()
+    weights = [item['weight_change'] for item in buyers['items']]
+    assert weights == sorted(weights, reverse=True)
+    added_only = get_stock_buyers(stock, quarter='2024年3季度', include_increased=False)
+    assert all(item['change_type'] == 'added' for item in added_only['items'])
+
+    top = get_top_turnover_funds(limit=5)
+    expected = turnover[turnover['quarter'] == '2024Q3'].sort_values(['turnover', 'fund_code'], ascending=[False, True])
+    assert [item['fund_code'] for item in top['items']] == list(expected['fund_code'][:5])
+    assert get_top_turnover_funds(fund_type='股票')['items'][0]['fund_code'] == '000001'
+
+    # 单只基金重算只替换该基金的结果
+    with funddb.get_db_connection() as conn:
+        conn.execute("DELETE FROM fund_stock_holding WHERE fund_code = '000001' AND report_date = ?", (QUARTERS[2],))
+        conn.commit()
+    update_holding_changes(['000001'])
+    with funddb.get_db_connection() as conn:
+        quarters = [r[0] for r in conn.execute("SELECT quarter FROM holding_turnover WHERE fund_code = '000001'")]
+        total = conn.execute("SELECT COUNT(*) FROM holding_turnover").fetchone()[0]
+    assert quarters == ['2024Q2'] and total == len(turnover) - 1
+    print("持仓变动入库与查询: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,104 @@
+"""
+测试组合穿透持仓
+与逐只基金累加的结果比对，并验证季度选择、重叠度和缓存失效
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+
+import funddb
+import holdings_lookthrough
+from holdings_lookthrough import get_portfolio_lookthrough, normalize_quarter, compute_overlap
+
+
+HOLDINGS = {
+    '000001': [('600519', '贵州茅台', 8.0), ('000858', '五粮液', 6.0), ('300750', '宁德时代', 4.0)],
+    '000002': [('600519', '贵州茅台', 5.0), ('300750', '宁德时代', 9.0)],
+    '000003': [('601318', '中国平安', 7.0)],
+}
+
+
+def test_normalize_quarter():
+    assert normalize_quarter('2024年3季度股票投资明细') == '2024Q3'
+    assert normalize_quarter('2024-06-30') == '2024Q2'
+    assert normalize_quarter('2023Q4') == '2023Q4'
+    assert normalize_quarter('未知') is None
+    overlap, common = compute_overlap(np.array([[0.1, 0.2, 0.0], [0.05, 0.3, 0.1]]))
+    assert np.isclose(overlap[0, 1], 0.25) and np.isclose(overlap[0, 0], 0.3)
+    assert common[0, 1] == 2 and common[1, 1] == 3
+    print("季度解析与重叠度: 通过")
+
+
+def test_portfolio_lookthrough(temp_db):
+    holdings_lookthrough._lookthrough_cache.clear()
+
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO portfolio (id, name) VALUES (1, '测试组合')")
+        conn.execute("INSERT INTO portfolio_fund (portfolio_id, fund_code, current_value) VALUES (1, '000001', 5000)")
+        conn.execute("INSERT INTO portfolio_fund (portfolio_id, fund_code, current_value) VALUES (1, '000002', 3000)")
+        # 无市值：按 份额×最新净值 = 1000 × 2.0
+        conn.execute("INSERT INTO portfolio_fund (portfolio_id, fund_code, shares) VALUES (1, '000003', 1000)")
+        conn.execute("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES ('000003', '2024-09-30', 2.0)")
+        for code, rows in HOLDINGS.items():
+            for stock_code, name, ratio in rows:
+                conn.execute('''INSERT INTO fund_stock_holding (fund_code, report_date, stock_code, stock_name, hold_ratio)
+                                VALUES (?, '2024年3季度股票投资明细', ?, ?, ?)''', (code, stock_code, name, ratio))
+        # 旧一期持仓：默认不应被使用
+        conn.execute('''INSERT INTO fund_stock_holding (fund_code, report_date, stock_code, stock_name, hold_ratio)
+                        VALUES ('000001', '2024年2季度股票投资明细', '000001', '平安银行', 9.0)''')
+        conn.execute('''INSERT INTO fund_industry_allocation (fund_code, report_date, industry_name, allocation_ratio)
+                        VALUES ('000001', '2024-09-30', '制造业', 60.0)''')
+        conn.execute('''INSERT INTO fund_industry_allocation (fund_code, report_date, industry_name, allocation_ratio)
+                        VALUES ('000003', '2024-09-30', '金融业', 80.0)''')
+        conn.commit()
+
+    result = get_portfolio_lookthrough(1)
+    assert result['success'] and not result['from_cache']
+    assert result['quarter'] == '2024Q3'
+
+    weights = {'000001': 0.5, '000002': 0.3, '000003': 0.2}
+    expected = {}
+    for code, rows in HOLDINGS.items():
+        for stock_code, _, ratio in rows:
+            expected[stock_code] = expected.get(stock_code, 0) + weights[code] * ratio
+    exposure = {s['stock_code']: s['exposure'] for s in result['stock_exposure']}
+    assert exposure.keys() == expected.keys()
+    for stock_code, value in expected.items():
+        assert np.isclose(exposure[stock_code], value)
+    assert result['stock_exposure'][0]['stock_code'] == '600519'
+    assert result['stock_exposure'][0]['fund_count'] == 2
+
+    industries = {i['industry_name']: i['exposure'] for i in result['industry_exposure']}
+    assert np.isclose(industries['制造业'], 30.0) and np.isclose(industries['金融业'], 16.0)
+
+    overlap = result['overlap']
+    i, j = overlap['fund_codes'].index('000001'), overlap['fund_codes'].index('000002')
+    assert np.isclose(overlap['matrix'][i][j], 5.0 + 4.0)
+    assert overlap['common_stocks'][i][j] == 2
+    assert overlap['matrix'][i][overlap['fund_codes'].index('000003')] == 0
+
+    assert get_portfolio_lookthrough(1)['from_cache']
+
+    # 指定季度：000001使用2季度持仓，其余基金没有不晚于该季度的持仓
+    earlier = get_portfolio_lookthrough(1, quarter='2024Q2')
+    assert [s['stock_code'] for s in earlier['stock_exposure']] == ['000001']
+    assert np.isclose(earlier['stock_exposure'][0]['exposure'], 4.5)
+
+    # 市值变化后缓存失效
+    with funddb.get_db_connection() as conn:
+        conn.execute("UPDATE portfolio_fund SET current_value = 0, shares = 0 WHERE fund_code = '000002'")
+        conn.commit()
+    refreshed = get_portfolio_lookthrough(1)
+    assert not refreshed['from_cache']
+    assert '000858' in {s['stock_code'] for s in refreshed['stock_exposure']}
+    assert np.isclose({s['stock_code']: s['exposure'] for s in refreshed['stock_exposure']}['600519'], 8.0 * 5 / 7)
+
+    assert not get_portfolio_lookthrough(99)['success']
+    print("组合穿透持仓: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,250 @@
+"""
+测试交易流水回放
+修改/删除历史交易后的回放结果，与按修正后的交易重新逐笔记账（record_buy/sell_transaction）的结果比对，
+并验证只从最近检查点回放、组合现金和持仓快照同步调整
+"""
+import sys
+import os
+from datetime import date, timedelta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+
+import funddb
+import ledger
+from ledger import update_transaction, delete_transaction, get_ledger_state, rebuild_portfolio_ledger
+from portfolio_manager import (record_buy_transaction, record_sell_transaction, execute_buy_back_transaction,
+                               calculate_fund_available_cash)
+
+FUND = '000001'
+
+
+def _make_ops(count: int = 120):
+    """生成交易序列：[(类型, 日期, 份额, 金额)]，第40笔后对第30笔卖出做一次捡回"""
+    rng = np.random.default_rng(11)
+    ops = []
+    shares = 500.0
+    for i in range(count):
+        day = (date(2023, 1, 2) + timedelta(days=i)).isoformat()
+        nav = 1 + 0.3 * np.sin(i / 15)
+        if i % 3 == 2 and shares > 400:
+            sell = round(shares * 0.2, 2)
+            ops.append(('SELL', day, sell, round(sell * nav, 2)))
+            shares -= sell
+        else:
+            buy = float(rng.integers(100, 300))
+            ops.append(('BUY', day, buy, round(buy * nav, 2)))
+            shares += buy
+    return ops
+
+
+def _book(new_db, ops):
+    """新建数据库（new_db 为 temp_db_factory），导入期初持仓后按顺序逐笔记账，返回 {序号: 交易ID}"""
+    path = new_db()
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO portfolio (id, name, cash) VALUES (1, '测试组合', 100000)")
+        # 交易记录之外的期初持仓（导入）
+        conn.execute("INSERT INTO portfolio_fund (portfolio_id, fund_code, shares, buy_nav) VALUES (1, ?, 500, 1.2)", (FUND,))
+        conn.commit()
+
+    ids = {}
+    for k, (kind, day, shares, amount, *target) in enumerate(ops):
+        if target:
+            result = execute_buy_back_transaction(1, FUND, ids[target[0]], shares, amount, day)
+            ids[k] = result['buy_transaction_id']
+            continue
+        if kind == 'BUY':
+            result = record_buy_transaction(1, FUND, shares, amount, day)
+        else:
+            result = record_sell_transaction(1, FUND, shares, amount, day)
+        assert result['success'], result
+        with funddb.get_db_connection() as conn:
+            ids[k] = conn.execute("SELECT MAX(id) FROM portfolio_transaction").fetchone()[0]
+    return path, ids
+
+
+def _snapshot():
+    with funddb.get_db_connection() as conn:
+        fund = conn.execute("SELECT shares, buy_nav FROM portfolio_fund WHERE portfolio_id = 1 AND fund_code = ?",
+                            (FUND,)).fetchone()
+        cash = conn.execute("SELECT cash FROM portfolio WHERE id = 1").fetchone()[0]
+        history = conn.execute("SELECT record_date, shares FROM holding_history ORDER BY record_date").fetchall()
+    return (fund['shares'], fund['buy_nav']) if fund else None, cash, [tuple(r) for r in history]
+
+
+def _assert_same(actual, expected):
+    (a_fund, a_cash, a_history), (e_fund, e_cash, e_history) = actual, expected
+    assert np.allclose(a_fund, e_fund), (a_fund, e_fund)
+    assert np.isclose(a_cash, e_cash), (a_cash, e_cash)
+    # 快照日期可能多出交易移走后的原日期，按 as-of 份额比对
+    e_dates = np.array([d for d, _ in e_history])
+    e_shares = np.r_[500.0, [s for _, s in e_history]]
+    assert set(e_dates) <= {d for d, _ in a_history}
+    for record_date, shares in a_history:
+        assert np.isclose(shares, e_shares[np.searchsorted(e_dates, record_date, side='right')]), record_date
+
+
+def _with_buy_back(ops):
+    ops = list(ops)
+    sell = next(k for k in range(30, len(ops)) if ops[k][0] == 'SELL')
+    ops.insert(40, ('BUY', ops[40][1], ops[sell][2], round(ops[sell][3] * 0.9, 2), sell))
+    return ops
+
+
+def test_replay_matches_booking(temp_db_factory, monkeypatch):
+    monkeypatch.setattr(ledger, 'LEDGER_CHECKPOINT_INTERVAL', 10)
+    ops = _with_buy_back(_make_ops())
+    first, ids = _book(temp_db_factory, ops)
+
+    # 回放结果与逐笔记账一致
+    state = get_ledger_state(1)['funds'][0]
+    fund, cash, _ = _snapshot()
+    assert state['transaction_count'] == len(ops)
+    assert np.isclose(state['shares'], fund[0], atol=1e-4) and np.isclose(state['buy_nav'], fund[1], atol=1e-4)
+    assert np.isclose(state['available_cash'], calculate_fund_available_cash(1, FUND)['available_cash'], atol=0.01)
+
+    # 修改第100笔卖出的金额：只从其之前最近的检查点回放
+    k = next(i for i in range(100, len(ops)) if ops[i][0] == 'SELL')
+    result = update_transaction(ids[k], amount=ops[k][3] + 100)
+    assert result['success'] and result['cash_change'] == 100
+    assert result['from_checkpoint'] == 10 * (k // 10) and result['replayed'] == len(ops) - result['from_checkpoint']
+    edited = _snapshot()
+
+    corrected = list(ops)
+    corrected[k] = (ops[k][0], ops[k][1], ops[k][2], ops[k][3] + 100)
+    _book(temp_db_factory, corrected)
+    expected = _snapshot()
+
+    monkeypatch.setattr(funddb, 'DB_PATH', first)
+    _assert_same(edited, expected)
+    print("修改历史交易后回放: 通过")
+
+    # 把第5笔买入挪到更晚的日期：从较早的日期开始回放
+    day = ops[60][1]
+    result = update_transaction(ids[5], transaction_date=day)
+    assert result['from_checkpoint'] == 0
+    moved = _snapshot()
+    reordered = corrected[:5] + corrected[6:61] + [(corrected[5][0], day) + corrected[5][2:]] + corrected[61:]
+    # 捡回记录引用的卖出序号随之前移
+    reordered = [op[:4] + (op[4] - 1,) if len(op) > 4 else op for op in reordered]
+    _book(temp_db_factory, reordered)
+    expected = _snapshot()
+    monkeypatch.setattr(funddb, 'DB_PATH', first)
+    _assert_same(moved, expected)
+    print("修改交易日期后回放: 通过")
+
+
+def test_delete_and_rebuild(temp_db_factory, monkeypatch):
+    ops = _with_buy_back(_make_ops(60))
+    first, ids = _book(temp_db_factory, ops)
+    with funddb.get_db_connection() as conn:
+        target = conn.execute("SELECT buy_back_of FROM portfolio_transaction WHERE id = ?", (ids[40],)).fetchone()[0]
+    assert target == ids[ops[40][4]]
+
+    # 删除捡回买入：卖出记录恢复未回收，扣除的现金退回
+    _, cash_before, _ = _snapshot()
+    result = delete_transaction(ids[40])
+    assert result['success'] and np.isclose(result['cash_change'], ops[40][3])
+    deleted = _snapshot()
+    assert np.isclose(deleted[1], cash_before + ops[40][3])
+    with funddb.get_db_connection() as conn:
+        assert conn.execute("SELECT is_recovered FROM portfolio_transaction WHERE id = ?", (target,)).fetchone()[0] == 0
+
+    _book(temp_db_factory, ops[:40] + ops[41:])
+    expected = _snapshot()
+    monkeypatch.setattr(funddb, 'DB_PATH', first)
+    fund, cash, history = deleted
+    assert np.allclose(fund, expected[0]) and np.isclose(cash, expected[1])
+    # 捡回不写持仓快照，其余快照按回放结果校正
+    assert np.allclose([s for _, s in history], [s for _, s in expected[2]])
+
+    # 持仓被改乱后全量重建
+    with funddb.get_db_connection() as conn:
+        conn.execute("UPDATE portfolio_fund SET shares = 1, buy_nav = 9 WHERE fund_code = ?", (FUND,))
+        conn.commit()
+    assert rebuild_portfolio_ledger(1)['success']
+    assert np.allclose(_snapshot()[0], expected[0])
+
+    assert not update_transaction(999999, amount=1)['success']
+    assert not update_transaction(ids[1], fund_code='000002')['success']
+    assert not get_ledger_state(99)['success']
+    print("删除交易与全量重建: 通过")
+
+
+def test_full_sell_then_rebuy(temp_db_factory, monkeypatch):
+    """期初持仓清仓后再买入：基线取自导入快照，修改清仓卖出后与重新记账一致"""
+    ops = [('SELL', '2023-02-01', 500, 650), ('BUY', '2023-02-10', 300, 330),
+           ('BUY', '2023-03-01', 100, 125), ('SELL', '2023-03-15', 50, 70)]
+
+    def book(ops):
+        path, ids = _book(temp_db_factory, ops)
+        with funddb.get_db_connection() as conn:
+            conn.execute("INSERT INTO holding_history (portfolio_id, fund_code, record_date, shares, nav) "
+                         "VALUES (1, ?, '2023-01-01', 500, 1.2)", (FUND,))
+            conn.commit()
+        return path, ids
+
+    first, ids = book(ops)
+    with funddb.get_db_connection() as conn:
+        booked = conn.execute("SELECT shares, buy_nav FROM portfolio_fund WHERE fund_code = ?", (FUND,)).fetchone()
+    state = get_ledger_state(1)['funds'][0]
+    assert np.isclose(state['shares'], booked['shares']) and np.isclose(state['buy_nav'], booked['buy_nav'], atol=1e-4)
+    with funddb.get_db_connection() as conn:
+        baseline = conn.execute("SELECT shares, buy_nav FROM ledger_checkpoint WHERE seq = 0").fetchone()
+    assert tuple(baseline) == (500, 1.2)
+
+    # 清仓卖出改为部分卖出：剩余份额的成本按期初成本计算
+    result = update_transaction(ids[0], shares=400, amount=520)
+    assert result['success']
+    edited = _snapshot()
+
+    corrected = [('SELL', '2023-02-01', 400, 520)] + ops[1:]
+    book(corrected)
+    expected = _snapshot()
+    monkeypatch.setattr(funddb, 'DB_PATH', first)
+    assert np.allclose(edited[0], expected[0]) and np.isclose(edited[1], expected[1])
+    print("清仓后再买入的期初基线: 通过")
+
+
+def test_buy_back_ignores_notes(temp_db_factory, monkeypatch):
+    """是否为捡回只看 buy_back_of，修改备注不影响组合现金"""
+    ops = _with_buy_back(_make_ops(60))
+    _book(temp_db_factory, ops)
+    _, cash_before, _ = _snapshot()
+    with funddb.get_db_connection() as conn:
+        plain = conn.execute("SELECT MIN(id) FROM portfolio_transaction WHERE transaction_type = 'BUY'").fetchone()[0]
+        buy_back = conn.execute("SELECT id FROM portfolio_transaction WHERE buy_back_of IS NOT NULL").fetchone()[0]
+    assert update_transaction(plain, notes='波段捡回 - 手工备注')['cash_change'] == 0
+    assert update_transaction(buy_back, notes='普通买入')['cash_change'] == 0
+    assert np.isclose(_snapshot()[1], cash_before)
+    print("捡回识别不依赖备注: 通过")
+
+
+def test_backfill_buy_back_of(temp_db, monkeypatch):
+    """旧库新增 buy_back_of 字段时按备注一次性回填"""
+    import sqlite3
+    old_db = temp_db + '.old'
+    conn = sqlite3.connect(old_db)
+    conn.execute('''CREATE TABLE portfolio_transaction (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, portfolio_id INTEGER NOT NULL, fund_code VARCHAR(10) NOT NULL,
+        transaction_type VARCHAR(10) NOT NULL, transaction_date DATE NOT NULL, shares DECIMAL(15,4) NOT NULL,
+        amount DECIMAL(15,2) NOT NULL, nav DECIMAL(10,4), fee DECIMAL(10,2) DEFAULT 0, notes TEXT)''')
+    conn.executemany("INSERT INTO portfolio_transaction (portfolio_id, fund_code, transaction_type, transaction_date, "
+                     "shares, amount, notes) VALUES (1, '000001', ?, '2024-01-02', 100, 100, ?)",
+                     [('SELL', None), ('BUY', '波段捡回 - 对应卖出记录#1'), ('BUY', '波段捡回'), ('BUY', '定投')])
+    conn.commit()
+    conn.close()
+    try:
+        monkeypatch.setattr(funddb, 'DB_PATH', old_db)
+        funddb.init_database()
+        with funddb.get_db_connection() as conn:
+            values = [r[0] for r in conn.execute("SELECT buy_back_of FROM portfolio_transaction ORDER BY id")]
+        assert values == [None, 1, 0, None]
+    finally:
+        os.remove(old_db)
+    print("buy_back_of 回填: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
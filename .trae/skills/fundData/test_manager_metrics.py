@@ -0,0 +1,102 @@
+"""
+测试基金经理批量评估
+稳定性评分与 fund_analyzer.ManagerEvaluator 逐只计算比对，并验证经理汇总、排名和评估区间
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+import numpy as np
+import pandas as pd
+
+import funddb
+from manager_metrics import calculate_panel_consistency, calculate_manager_metrics, get_manager_ranking
+from risk_metrics_calculator import calculate_risk_metrics_from_array
+
+
+def test_consistency_matches_evaluator():
+    from fund_analyzer import ManagerEvaluator
+
+    rng = np.random.default_rng(1)
+    values = np.cumprod(1 + rng.normal(0.0004, 0.012, (400, 5)), axis=0)
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[:150, 3] = np.nan
+    values[:330, 4] = np.nan
+
+    batch = calculate_panel_consistency(values)
+    evaluator = ManagerEvaluator()
+    for j in range(values.shape[1]):
+        series = pd.Series(values[:, j]).dropna()
+        expected = evaluator.calculate_consistency_score(series)
+        assert np.isclose(batch['consistency_score'][j], expected['consistency_score']), j
+        assert np.isclose(batch['positive_ratio'][j], expected['positive_ratio'])
+        assert np.isclose(batch['win_stability'][j], expected['win_stability'])
+        assert np.isclose(batch['vol_stability'][j], expected['vol_stability'], rtol=1e-6)
+    print("稳定性评分与逐只计算一致: 通过")
+
+
+def test_manager_metrics_batch(temp_db):
+    rng = np.random.default_rng(2)
+    dates = pd.bdate_range('2021-01-04', periods=1000).strftime('%Y-%m-%d').tolist()
+    n_funds, n_managers = 300, 120
+    navs = np.round(np.cumprod(1 + rng.normal(0.0003, 0.012, (1000, n_funds)), axis=0), 4)
+
+    with funddb.get_db_connection() as conn:
+        for j in range(n_funds):
+            conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                             [(f"{j:06d}", d, float(v)) for d, v in zip(dates, navs[:, j])])
+        for m in range(n_managers):
+            codes = {f"{(m * 7 + k * 13) % n_funds:06d}" for k in range(1 + m % 4)}
+            for code in codes:
+                conn.execute('''INSERT INTO fund_manager (manager_name, company_name, fund_code, tenure_days, total_scale, update_time)
+                                VALUES (?, ?, ?, ?, ?, ?)''',
+                             (f"经理{m}", f"公司{m % 5}", code, 5000 if m else 200, 10.0 + m, dates[-1]))
+        # 没有净值的基金不参与评估
+        conn.execute("INSERT INTO fund_manager (manager_name, company_name, fund_code, tenure_days) VALUES ('新经理', '公司0', '999999', 30)")
+        conn.commit()
+
+    start = time.perf_counter()
+    result = calculate_manager_metrics(years=2)
+    print(f"  批量评估耗时: {time.perf_counter() - start:.2f}s（{n_managers + 1}位经理）")
+    assert result['success'] and result['manager_count'] == n_managers + 1
+    assert result['evaluated_manager_count'] == n_managers
+
+    # 逐只基金按同一区间计算后等权平均
+    with funddb.get_db_connection() as conn:
+        row = dict(conn.execute("SELECT * FROM manager_metrics WHERE manager_name = '经理5'").fetchone())
+        codes = [r[0] for r in conn.execute("SELECT fund_code FROM fund_manager WHERE manager_name = '经理5'")]
+    assert row['fund_count'] == len(codes) == row['evaluated_count']
+    lo = np.searchsorted(dates, row['window_start'])
+    singles = [calculate_risk_metrics_from_array(dates[lo:], navs[lo:, int(c)], '成立以来') for c in codes]
+    assert np.isclose(row['avg_period_return'], np.mean([s['period_return'] for s in singles]), atol=1e-3)
+    assert np.isclose(row['avg_max_drawdown'], np.mean([s['max_drawdown'] for s in singles]), atol=1e-3)
+    assert np.isclose(row['worst_max_drawdown'], max(s['max_drawdown'] for s in singles), atol=1e-3)
+    assert np.isclose(row['avg_sharpe'], np.mean([s['sharpe_ratio'] for s in singles]), atol=1e-3)
+
+    # 从业时间短于评估区间：从从业开始日期起算
+    with funddb.get_db_connection() as conn:
+        short = dict(conn.execute("SELECT * FROM manager_metrics WHERE manager_name = '经理0'").fetchone())
+        code = conn.execute("SELECT fund_code FROM fund_manager WHERE manager_name = '经理0'").fetchone()[0]
+    lo = np.searchsorted(dates, (pd.Timestamp(dates[-1]) - pd.Timedelta(days=200)).strftime('%Y-%m-%d'))
+    expected = (navs[-1, int(code)] / navs[lo, int(code)] - 1) * 100
+    assert np.isclose(short['avg_period_return'], expected, atol=1e-3)
+
+    ranking = get_manager_ranking(page_size=10)
+    assert ranking['success'] and ranking['total'] == n_managers
+    scores = [item['composite_score'] for item in ranking['items']]
+    assert scores == sorted(scores, reverse=True)
+    assert [item['rank_overall'] for item in ranking['items']] == list(range(1, 11))
+
+    by_drawdown = get_manager_ranking(sort_by='avg_max_drawdown', ascending=True, company='公司1', min_funds=2)
+    assert all(item['company_name'] == '公司1' and item['evaluated_count'] >= 2 for item in by_drawdown['items'])
+    drawdowns = [item['avg_max_drawdown'] for item in by_drawdown['items']]
+    assert drawdowns == sorted(drawdowns)
+    assert get_manager_ranking(keyword='新经理', min_funds=0)['items'][0]['rank_overall'] is None
+    assert not get_manager_ranking(sort_by='unknown')['success']
+    print("经理批量评估与排名: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
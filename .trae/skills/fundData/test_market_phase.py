@@ -0,0 +1,113 @@
+"""
+测试市场阶段识别与阶段日历
+用分段构造的指数行情验证拐点识别、震荡市判定、日历写入/缓存和区间查询
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import funddb
+import market_phase
+from market_phase import (PhaseCalendar, detect_turning_points, build_phase_segments,
+                          refresh_phase_calendar, get_phase_calendar, DEFAULT_PHASE_RANGES)
+
+
+def _index_series():
+    """上涨60% -> 下跌40% -> 三年缓涨25% -> 下跌25%"""
+    segments = [
+        np.linspace(1.0, 1.6, 300),
+        np.linspace(1.6, 0.96, 300)[1:],
+        np.linspace(0.96, 1.2, 780)[1:],
+        np.linspace(1.2, 0.9, 120)[1:],
+    ]
+    prices = np.concatenate(segments) * 3000
+    dates = pd.bdate_range('2019-01-02', periods=prices.size).strftime('%Y-%m-%d').tolist()
+    return dates, prices
+
+
+def test_detection():
+    prices = np.array([100, 110, 125, 118, 95, 99, 90, 100, 115, 112])
+    points = detect_turning_points(prices, 0.2)
+    assert points == [(0, 'trough', 2), (2, 'peak', 4), (6, 'trough', 8)]
+
+    dates, prices = _index_series()
+    segments = build_phase_segments(dates, prices)
+    names = [s['phase_name'] for s in segments]
+    assert names == ['牛市', '熊市', '震荡市', '熊市'], names
+    assert dates[segments[1]['start']] == dates[299]
+    # 相邻阶段首尾衔接
+    for prev, cur in zip(segments, segments[1:]):
+        assert cur['start'] == prev['end'] + 1
+    print("拐点识别与阶段划分: 通过")
+
+
+def test_calendar_lookup():
+    calendar = PhaseCalendar.from_ranges(DEFAULT_PHASE_RANGES, '牛市')
+    assert calendar.names == ['牛市尾声', '熊市', '牛市']
+    assert calendar.phase_at('2021-02-28') == '牛市尾声'
+    assert calendar.phase_at('2021-03-01') == '熊市'
+    assert calendar.phase_at('2020-12-31') is None and calendar.phase_at('2026-01-01') is None
+    assert list(calendar.month_phases(['2023-12', '2024-01'])) == ['熊市', '牛市']
+    assert calendar.span('熊市') == ('2021-03-01', '2023-12-31')
+
+    open_ended = PhaseCalendar(np.array(['2020-01-01', '2022-06-01'], dtype='datetime64[D]'),
+                               np.array(['2022-05-31', 'NaT'], dtype='datetime64[D]'),
+                               ['牛市', '熊市'], '熊市')
+    assert list(open_ended.phases_for(['2019-12-31', '2022-05-31', '2030-01-01'])) == ['', '牛市', '熊市']
+    assert open_ended.span('熊市') == ('2022-06-01', None)
+    print("阶段日历区间查询: 通过")
+
+
+def test_refresh_from_db(temp_db):
+    market_phase._calendar_cache.clear()
+
+    try:
+        # 无识别记录时使用默认划分
+        calendar = get_phase_calendar()
+        assert calendar.updated_at is None and calendar.current == '牛市'
+        assert get_phase_calendar() is calendar
+
+        assert not refresh_phase_calendar()['success']
+
+        dates, prices = _index_series()
+        with funddb.get_db_connection() as conn:
+            conn.executemany("INSERT INTO index_price (index_code, trade_date, close_price) VALUES ('000300', ?, ?)",
+                             list(zip(dates, prices.tolist())))
+            conn.commit()
+
+        result = refresh_phase_calendar()
+        assert result['success'] and result['current_phase'] == '熊市'
+        assert [p['phase_name'] for p in result['phases']] == ['牛市', '熊市', '震荡市', '熊市']
+        assert result['phases'][-1]['end_date'] is None
+
+        calendar = get_phase_calendar()
+        assert calendar.updated_at is not None and calendar.current == '熊市'
+        assert get_phase_calendar() is calendar
+        assert calendar.phase_at(dates[400]) == '熊市' and calendar.phase_at(dates[1000]) == '震荡市'
+        assert calendar.phase_at('2018-12-31') is None
+
+        with funddb.get_db_connection() as conn:
+            rows = conn.execute("SELECT is_current, data_source FROM market_phase_record ORDER BY start_date").fetchall()
+        assert [r['is_current'] for r in rows] == [0, 0, 0, 1]
+        assert all(r['data_source'] == 'auto:000300' for r in rows)
+
+        # 重新识别后缓存失效，人工录入的记录保留
+        with funddb.get_db_connection() as conn:
+            conn.execute("INSERT INTO market_phase_record (phase_name, start_date, data_source) VALUES ('牛市', '2015-01-05', 'manual')")
+            conn.commit()
+        refresh_phase_calendar(threshold=0.5)
+        assert get_phase_calendar() is not calendar
+        with funddb.get_db_connection() as conn:
+            manual = conn.execute("SELECT COUNT(*) FROM market_phase_record WHERE data_source = 'manual'").fetchone()[0]
+        assert manual == 1
+        print("阶段日历写入与缓存: 通过")
+    finally:
+        market_phase._calendar_cache.clear()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
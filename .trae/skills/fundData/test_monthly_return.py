@@ -0,0 +1,125 @@
+"""
+测试基金月收益率增量汇总
+与 va_simulation.monthly_returns / pandas 分组结果比对，验证增量只重算受影响月份和按阶段统计
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import funddb
+from market_phase import PhaseCalendar
+from syncers.group_syncers import SAVE_FUND_NAV_SQL
+from va_simulation import monthly_returns
+from monthly_return import (update_monthly_returns, load_fund_monthly_returns,
+                            phase_return_stats, get_fund_phase_stats)
+
+PHASES = {"熊市": ("2021-03", "2023-12"), "牛市": ("2024-01", "2025-12")}
+
+
+def test_phase_stats():
+    calendar = PhaseCalendar.from_ranges(PHASES)
+    rng = np.random.default_rng(0)
+    months = pd.period_range('2020-01', '2025-06', freq='M').astype(str).to_numpy()
+    returns = rng.normal(1, 4, months.size)
+    stats = phase_return_stats(months, returns, calendar)
+
+    df = pd.DataFrame({'月份': months, '月收益率': returns})
+    for name, (start, end) in PHASES.items():
+        selected = df[(df['月份'] >= start) & (df['月份'] <= end)]['月收益率']
+        assert stats[name]['月数'] == len(selected)
+        assert np.isclose(stats[name]['平均月收益率'], selected.mean())
+        assert np.isclose(stats[name]['月收益率标准差'], selected.std())
+    assert set(stats) == set(PHASES)
+    assert np.isnan(phase_return_stats(np.array(['2024-01']), np.array([2.0]), calendar)['牛市']['月收益率标准差'])
+    print("按阶段统计: 通过")
+
+
+def test_incremental_update(temp_db):
+    rng = np.random.default_rng(3)
+    dates = pd.bdate_range('2020-01-02', '2025-06-30').strftime('%Y-%m-%d').tolist()
+    navs = {code: np.round(np.cumprod(1 + rng.normal(0.0004, 0.01, len(dates))), 4)
+            for code in ['000001', '000002']}
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav, update_time) VALUES (?, ?, ?, '2025-06-30 20:00:00')",
+                         [(code, d, float(v)) for code, values in navs.items() for d, v in zip(dates, values)])
+        conn.commit()
+
+    result = update_monthly_returns()
+    assert result['fund_count'] == 2 and result['month_count'] == 2 * 66
+    loaded = load_fund_monthly_returns(['000001', '000002', '000009'])
+    assert set(loaded) == {'000001', '000002'}
+    for code, values in navs.items():
+        labels, expected = monthly_returns(dates, values)
+        assert list(loaded[code][0]) == list(labels)
+        assert np.allclose(loaded[code][1], expected)
+
+    # 无新数据时不重算
+    assert update_monthly_returns() == {'success': True, 'fund_count': 0, 'month_count': 0}
+
+    # 同步重新写入全量历史：数值未变的净值不改写 update_time，不触发重算；修订的净值只重算所在月份
+    with funddb.get_db_connection() as conn:
+        conn.executemany(SAVE_FUND_NAV_SQL, [('000002', d, float(v), None, None) for d, v in zip(dates, navs['000002'])])
+        conn.commit()
+    assert update_monthly_returns() == {'success': True, 'fund_count': 0, 'month_count': 0}
+    with funddb.get_db_connection() as conn:
+        conn.executemany(SAVE_FUND_NAV_SQL, [('000002', d, float(v) + (0.01 if d == '2022-03-15' else 0), None, None)
+                                             for d, v in zip(dates, navs['000002'])])
+        conn.commit()
+    assert update_monthly_returns() == {'success': True, 'fund_count': 1, 'month_count': 1}
+    with funddb.get_db_connection() as conn:
+        conn.execute("UPDATE fund_nav SET unit_nav = unit_nav - 0.01 WHERE fund_code = '000002' AND nav_date = '2022-03-15'")
+        conn.commit()
+    update_monthly_returns(['000002'], force=True)
+
+    # 新增7月净值、修订2021-05的一条净值：只重算这两个月
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav, update_time) VALUES ('000001', ?, ?, '2025-07-02 20:00:00')",
+                         [('2025-07-01', 1.5), ('2025-07-02', 1.53)])
+        conn.execute("UPDATE fund_nav SET unit_nav = unit_nav * 1.1, update_time = '2025-07-02 20:00:00' "
+                     "WHERE fund_code = '000001' AND nav_date = '2021-05-31'")
+        before = {r['month']: r['update_time'] for r in conn.execute(
+            "SELECT month, update_time FROM fund_monthly_return WHERE fund_code = '000001'")}
+        conn.execute("UPDATE fund_monthly_return SET update_time = '2000-01-01 00:00:00'")
+        conn.commit()
+    result = update_monthly_returns(['000001'])
+    assert result == {'success': True, 'fund_count': 1, 'month_count': 2}
+    with funddb.get_db_connection() as conn:
+        changed = [r['month'] for r in conn.execute(
+            "SELECT month FROM fund_monthly_return WHERE update_time > '2000-01-01 00:00:00' ORDER BY month")]
+        july = conn.execute("SELECT monthly_return FROM fund_monthly_return "
+                            "WHERE fund_code = '000001' AND month = '2025-07'").fetchone()[0]
+    assert changed == ['2021-05', '2025-07'] and len(before) == 66
+    assert np.isclose(july, 2.0)
+    revised = navs['000001'].copy()
+    revised[dates.index('2021-05-31')] *= 1.1
+    labels, expected = monthly_returns(dates, revised)
+    months, values = load_fund_monthly_returns(['000001'])['000001']
+    assert np.allclose(values[:-1], expected)
+
+    force = update_monthly_returns(['000002'], force=True)
+    assert force['month_count'] == 66
+
+    # 阶段统计：表中没有的基金先生成
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES ('000003', ?, ?)",
+                         [(d, float(v)) for d, v in zip(dates, navs['000002'])])
+        conn.commit()
+    calendar = PhaseCalendar.from_ranges(PHASES)
+    stats = get_fund_phase_stats('000003', calendar, years=20)
+    assert stats['months'] == 66 and stats['phases']['熊市']['月数'] == 34
+    assert get_fund_phase_stats('000009', calendar) is None
+
+    start = time.perf_counter()
+    for _ in range(100):
+        get_fund_phase_stats('000001', calendar, years=20)
+    print(f"  阶段统计平均耗时: {(time.perf_counter() - start) * 10:.2f}ms")
+    print("月收益率增量汇总: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
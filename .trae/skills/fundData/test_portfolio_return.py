@@ -0,0 +1,127 @@
+"""
+测试组合时间加权收益率（TWR）和资金加权收益率（XIRR）
+验证交易现金流与导入快照的隐含现金流、与单组 xirr 的结果一致，以及按数据版本缓存
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import funddb
+import portfolio_return
+from portfolio_return import get_portfolio_returns
+from xirr import xirr
+
+
+def _setup_db():
+    portfolio_return._return_cache.clear()
+
+    dates = pd.bdate_range('2023-01-02', '2024-12-31').strftime('%Y-%m-%d').tolist()
+    # 000001 每日+0.05%，000002 先跌后涨
+    navs = {'000001': 1.0 * 1.0005 ** np.arange(len(dates)),
+            '000002': np.concatenate([np.linspace(2.0, 1.5, 250), np.linspace(1.5, 2.4, len(dates) - 250)])}
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                         [(code, d, float(v)) for code, values in navs.items() for d, v in zip(dates, values)])
+        conn.execute("INSERT INTO portfolio (id, name) VALUES (1, '组合一')")
+        conn.execute("INSERT INTO portfolio (id, name) VALUES (2, '组合二')")
+        conn.execute("INSERT INTO portfolio (id, name) VALUES (3, '空组合')")
+        conn.executemany("INSERT INTO portfolio_fund (portfolio_id, fund_code, fund_name) VALUES (?, ?, ?)",
+                         [(1, '000001', '基金一'), (1, '000002', '基金二'), (2, '000002', '基金二')])
+        # 组合1：000001 买入后持有；000002 导入快照（无交易记录）后再加仓
+        conn.executemany("INSERT INTO holding_history (portfolio_id, fund_code, record_date, shares) VALUES (?, ?, ?, ?)",
+                         [(1, '000001', '2023-01-02', 1000), (1, '000002', '2023-03-01', 500),
+                          (1, '000002', '2024-01-02', 1500), (2, '000002', '2023-01-02', 1000),
+                          (2, '000002', '2024-06-03', 400)])
+        conn.executemany('''INSERT INTO portfolio_transaction (portfolio_id, fund_code, transaction_type, transaction_date, shares, amount)
+                            VALUES (?, ?, ?, ?, ?, ?)''',
+                         [(1, '000001', 'BUY', '2023-01-02', 1000, 1000), (1, '000002', 'BUY', '2024-01-02', 1000, 1700),
+                          (2, '000002', 'BUY', '2023-01-02', 1000, 2000), (2, '000002', 'SELL', '2024-06-03', 600, 1300)])
+        conn.commit()
+    return dates, navs
+
+
+def test_twr_and_xirr(temp_db):
+    dates, navs = _setup_db()
+    result = get_portfolio_returns()
+    assert result['success'] and result['from_cache'] == 0
+    p1, p2, p3 = result['portfolios']
+    assert p3 == {'portfolio_id': 3, 'error': '组合没有持仓记录'}
+
+    # 单笔买入后持有：TWR = 净值涨幅，XIRR = 年化涨幅
+    f1 = p1['funds'][0]
+    growth = navs['000001'][-1] / navs['000001'][0]
+    years = (np.datetime64(dates[-1]) - np.datetime64(dates[0])).astype(int) / 365.0
+    assert np.isclose(f1['twr'], (growth - 1) * 100, atol=1e-3)
+    assert np.isclose(f1['xirr'], (growth ** (1 / years) - 1) * 100, atol=1e-3)
+    assert f1['net_invested'] == 1000
+
+    # 导入快照按当日市值计入投入
+    nav_0301 = navs['000002'][dates.index('2023-03-01')]
+    f2 = p1['funds'][1]
+    assert np.isclose(f2['net_invested'], 500 * nav_0301 + 1700, atol=0.01)
+    expected = xirr([-500 * nav_0301, -1700, 1500 * navs['000002'][-1]], ['2023-03-01', '2024-01-02', dates[-1]])
+    assert np.isclose(f2['xirr'], expected * 100, atol=1e-3)
+    # TWR 只看持有期净值变化
+    assert np.isclose(f2['twr'], (navs['000002'][-1] / nav_0301 - 1) * 100, atol=1e-3)
+
+    expected = xirr([-1000, -500 * nav_0301, -1700, 1000 * navs['000001'][-1] + 1500 * navs['000002'][-1]],
+                    ['2023-01-02', '2023-03-01', '2024-01-02', dates[-1]])
+    assert np.isclose(p1['xirr'], expected * 100, atol=1e-3)
+    assert np.isclose(p1['market_value'], 1000 * navs['000001'][-1] + 1500 * navs['000002'][-1], atol=0.01)
+
+    # 卖出：收回金额为正现金流
+    expected = xirr([-2000, 1300, 400 * navs['000002'][-1]], ['2023-01-02', '2024-06-03', dates[-1]])
+    assert np.isclose(p2['xirr'], expected * 100, atol=1e-3)
+    assert np.isclose(p2['twr'], (navs['000002'][-1] / navs['000002'][0] - 1) * 100, atol=1e-3)
+    print("TWR与XIRR: 通过")
+
+
+def test_cache(temp_db):
+    dates, navs = _setup_db()
+    first = get_portfolio_returns([1, 2])
+    assert get_portfolio_returns([1, 2]) == {**first, 'from_cache': 2}
+
+    # 组合2新增交易：只重算组合2
+    with funddb.get_db_connection() as conn:
+        conn.execute('''INSERT INTO portfolio_transaction (portfolio_id, fund_code, transaction_type, transaction_date, shares, amount)
+                        VALUES (2, '000002', 'SELL', '2024-12-02', 400, 900)''')
+        conn.commit()
+    second = get_portfolio_returns([1, 2])
+    assert second['from_cache'] == 1
+    assert second['portfolios'][0] == first['portfolios'][0]
+    assert second['portfolios'][1]['xirr'] != first['portfolios'][1]['xirr']
+
+    # 修改已有交易的日期或净值（条数、ID、份额、金额不变）：版本变化
+    with funddb.get_db_connection() as conn:
+        versions = portfolio_return.load_return_versions([1, 2], conn)
+        conn.execute("UPDATE portfolio_transaction SET transaction_date = '2024-12-03' "
+                     "WHERE portfolio_id = 2 AND transaction_date = '2024-12-02'")
+        conn.commit()
+        changed = portfolio_return.load_return_versions([1, 2], conn)
+        assert changed[1] == versions[1] and changed[2] != versions[2]
+        conn.execute("UPDATE portfolio_transaction SET nav = 2.25 WHERE portfolio_id = 2 AND transaction_date = '2024-12-03'")
+        conn.commit()
+        assert portfolio_return.load_return_versions([1, 2], conn)[2] != changed[2]
+    assert get_portfolio_returns([1, 2])['from_cache'] == 1
+
+    # 新净值：版本变化
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES ('000001', '2025-01-02', 2.0)")
+        conn.commit()
+    third = get_portfolio_returns([1, 2])
+    assert third['from_cache'] == 1 and third['portfolios'][0]['end_date'] == '2025-01-02'
+
+    portfolio_return._return_cache.clear()
+    start = time.perf_counter()
+    get_portfolio_returns([1, 2])
+    print(f"  两个组合全量计算耗时: {(time.perf_counter() - start) * 1000:.2f}ms")
+    print("按数据版本缓存: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
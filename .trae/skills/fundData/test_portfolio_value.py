@@ -0,0 +1,126 @@
+"""
+测试组合市值时间序列
+与逐日按 holding_history / fund_nav 取最近记录的原有算法比对，验证波段捡回交易份额叠加、
+资金流不影响收益指数，以及回撤、波动率
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import funddb
+from portfolio_value import (build_value_series, get_portfolio_value_series, holding_returns,
+                             curve_metrics, load_share_steps)
+
+
+def _asof(conn, sql, params):
+    row = conn.execute(sql, params).fetchone()
+    return row[0] if row else None
+
+
+def _setup_portfolio():
+    rng = np.random.default_rng(7)
+    dates = pd.bdate_range('2024-01-02', '2024-12-31').strftime('%Y-%m-%d').tolist()
+    navs = {'000001': np.round(np.cumprod(1 + rng.normal(0.0003, 0.01, len(dates))), 4),
+            '000002': np.round(np.cumprod(1 + rng.normal(0.0001, 0.015, len(dates))), 4)}
+    with funddb.get_db_connection() as conn:
+        # 000002 缺几天净值（向前填充）
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                         [(code, d, float(v)) for code, values in navs.items() for i, (d, v) in enumerate(zip(dates, values))
+                          if not (code == '000002' and i % 17 == 5)])
+        conn.execute("INSERT INTO portfolio (id, name) VALUES (1, '测试组合')")
+        conn.execute("INSERT INTO portfolio (id, name) VALUES (2, '空组合')")
+        conn.executemany("INSERT INTO portfolio_fund (portfolio_id, fund_code, fund_name) VALUES (1, ?, ?)",
+                         [('000001', '基金一'), ('000002', '基金二')])
+        conn.executemany("INSERT INTO holding_history (portfolio_id, fund_code, record_date, shares) VALUES (1, ?, ?, ?)",
+                         [('000001', '2024-01-10', 1000), ('000001', '2024-03-15', 1500), ('000001', '2024-08-01', 500),
+                          ('000002', '2024-02-01', 2000), ('000002', '2024-06-03', 0)])
+        conn.executemany('''INSERT INTO portfolio_transaction (portfolio_id, fund_code, transaction_type, transaction_date, shares, amount)
+                            VALUES (1, ?, ?, ?, ?, 0)''',
+                         [('000001', 'BUY', '2024-01-10', 1000), ('000001', 'BUY', '2024-03-15', 500),
+                          ('000001', 'SELL', '2024-08-01', 1000), ('000002', 'BUY', '2024-02-01', 2000),
+                          ('000002', 'SELL', '2024-06-03', 2000),
+                          # 波段捡回：只有交易记录，没有持仓快照
+                          ('000001', 'BUY', '2024-09-02', 300)])
+        conn.commit()
+    return dates
+
+
+def test_matches_asof_lookup(temp_db):
+    dates = _setup_portfolio()
+    with funddb.get_db_connection() as conn:
+        steps = load_share_steps(conn.cursor(), 1)
+        assert list(steps['000001'][1]) == [1000, 1500, 500, 800]
+
+        # 首次持仓之前的区间截掉
+        assert build_value_series(1, '2024-01-05', conn=conn)['dates'][0] == '2024-01-10'
+        series = build_value_series(1, '2024-02-05', '2024-11-29', conn=conn)
+        assert series['dates'][0] == '2024-02-05' and series['dates'][-1] == '2024-11-29'
+        for i in range(0, len(series['dates']), 7):
+            date = series['dates'][i]
+            expected_total = 0.0
+            for j, code in enumerate(series['fund_codes']):
+                shares = _asof(conn, "SELECT shares FROM holding_history WHERE portfolio_id = 1 AND fund_code = ? "
+                                     "AND record_date <= ? ORDER BY record_date DESC LIMIT 1", (code, date)) or 0
+                if code == '000001' and date >= '2024-09-02':
+                    shares += 300
+                nav = _asof(conn, "SELECT unit_nav FROM fund_nav WHERE fund_code = ? AND nav_date <= ? "
+                                  "ORDER BY nav_date DESC LIMIT 1", (code, date))
+                assert np.isclose(series['shares'][i, j], shares)
+                expected_total += shares * nav
+            assert np.isclose(series['total'][i], expected_total)
+
+        # 资金流：份额变化 × 当日净值
+        k = series['dates'].index('2024-09-02')
+        assert np.isclose(series['flows'][k], 300 * series['navs'][k, 0])
+        assert np.isclose(series['flows'][0], 0.0)
+    print("与逐日as-of查询一致: 通过")
+
+
+def test_curve_metrics(temp_db):
+    dates = _setup_portfolio()
+    result = get_portfolio_value_series(1)
+    assert result['success'] and result['start_date'] == '2024-01-10'
+    assert [f['fund_name'] for f in result['funds']] == ['基金一', '基金二']
+
+    # 收益指数只由净值涨跌决定：加仓、减仓、捡回当日不产生跳变
+    with funddb.get_db_connection() as conn:
+        series = build_value_series(1, conn=conn)
+    returns = holding_returns(series['shares'], series['navs'])
+    k = series['dates'].index('2024-03-15')
+    held = series['shares'][k - 1]
+    expected = (held * series['navs'][k]).sum() / (held * series['navs'][k - 1]).sum() - 1
+    assert np.isclose(returns[k], expected)
+    index = np.array(result['return_index'])
+    assert np.allclose(index, np.cumprod(1 + returns), atol=1e-6)
+
+    # 持有不变时指数等于市值比
+    values = np.array(result['total_value'])
+    lo, hi = series['dates'].index('2024-06-04'), series['dates'].index('2024-07-31')
+    assert np.isclose(index[hi] / index[lo], values[hi] / values[lo], rtol=1e-4)
+
+    peak = np.maximum.accumulate(index)
+    assert np.isclose(result['metrics']['max_drawdown'], ((peak - index) / peak).max() * 100, atol=1e-3)
+    assert np.isclose(result['metrics']['annual_volatility'], np.std(returns[1:], ddof=1) * np.sqrt(252) * 100,
+                      atol=1e-3)
+
+    metrics = curve_metrics(np.array([0.0, 0.0, 0.1, -0.5]), np.array([0.0, 100.0, 110.0, 55.0]))
+    assert np.isclose(metrics['max_drawdown'], 50.0) and metrics['max_drawdown_start'] == 2
+    assert np.isclose(metrics['total_return'], -45.0)
+
+    assert get_portfolio_value_series(2) == {'success': False, 'error': '组合没有持仓记录'}
+    assert not get_portfolio_value_series(99)['success']
+
+    start = time.perf_counter()
+    for _ in range(20):
+        get_portfolio_value_series(1)
+    print(f"  全年市值曲线平均耗时: {(time.perf_counter() - start) * 50:.2f}ms")
+    print("收益指数、回撤与波动率: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,96 @@
+"""
+测试区间指标索引
+随机区间与直接切片计算结果比对，并验证按数据版本重建索引
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+
+import funddb
+from risk_metrics_calculator import calc_max_drawdown, calc_daily_returns, calc_annual_volatility
+import range_index
+from range_index import FundRangeIndex, query_range_metrics, get_range_index
+
+
+def _random_series(seed, n):
+    rng = np.random.default_rng(seed)
+    navs = np.round(np.cumprod(1 + rng.normal(0.0003, 0.015, n)), 4)
+    dates = [f"2018-{i // 500 + 1:02d}-{i % 500:03d}" for i in range(n)]
+    return dates, navs
+
+
+def test_random_ranges_match_slices():
+    """随机区间：收益率、波动率、最大回撤与切片计算一致"""
+    dates, navs = _random_series(1, 3000)
+    index = FundRangeIndex.build('000001', dates, navs)
+
+    rng = np.random.default_rng(5)
+    starts = rng.integers(0, 2999, 2000)
+    ends = np.minimum(starts + rng.integers(1, 1500, 2000), 2999)
+    metrics = index.query(starts, ends)
+
+    for k in range(starts.size):
+        seg = navs[starts[k]:ends[k] + 1]
+        assert metrics['trading_days'][k] == seg.size
+        assert abs(metrics['period_return'][k] - (seg[-1] / seg[0] - 1) * 100) < 1e-9
+        assert abs(metrics['max_drawdown'][k] - calc_max_drawdown(seg)[0]) < 1e-9
+        returns = calc_daily_returns(seg)
+        if returns.size >= 20:
+            assert abs(metrics['annual_volatility'][k] - calc_annual_volatility(returns)) < 1e-8
+        else:
+            assert np.isnan(metrics['annual_volatility'][k])
+    print("随机区间: 通过")
+
+
+def test_query_by_date_and_version(temp_db, monkeypatch):
+    """按日期批量查询，净值更新后索引按版本重建，缓存按LRU淘汰"""
+    dates, navs = _random_series(2, 800)
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                         [('000001', d, float(v)) for d, v in zip(dates[:700], navs[:700])])
+        conn.commit()
+
+    queries = [{'fund_code': '000001', 'start_date': dates[100], 'end_date': dates[600]},
+               {'fund_code': '000001'},
+               {'fund_code': '000001', 'start_date': dates[699]},
+               {'fund_code': '999999'}]
+    results = query_range_metrics(queries)
+    assert results[0]['success'] and results[0]['trading_days'] == 501
+    assert results[0]['actual_start_date'] == dates[100]
+    assert results[1]['actual_end_date'] == dates[699]
+    assert not results[2]['success'] and not results[3]['success']
+
+    first = get_range_index('000001')
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                         [('000001', d, float(v)) for d, v in zip(dates[700:], navs[700:])])
+        conn.commit()
+    assert get_range_index('000001') is not first
+    assert query_range_metrics([{'fund_code': '000001'}])[0]['actual_end_date'] == dates[-1]
+
+    # LRU上限：超出时淘汰最久未使用的基金
+    monkeypatch.setattr(range_index, 'RANGE_INDEX_CACHE_SIZE', 2)
+    range_index._range_index_cache.clear()
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                         [(code, d, float(v)) for code in ('000002', '000003') for d, v in zip(dates, navs)])
+        conn.commit()
+    get_range_index('000001')
+    get_range_index('000002')
+    get_range_index('000001')
+    get_range_index('000003')
+    assert list(range_index._range_index_cache) == ['000001', '000003']
+
+    batch = [{'fund_code': '000001', 'start_date': dates[i], 'end_date': dates[i + 200]} for i in range(0, 500)] * 10
+    t0 = time.time()
+    query_range_metrics(batch)
+    elapsed = time.time() - t0
+    print(f"按日期批量查询: 通过 ({len(batch)}个区间, {elapsed * 1000:.1f}ms)")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,156 @@
+"""
+测试风险指标NumPy向量化内核
+与原逐点循环实现逐位比对，确保数值结果完全一致
+"""
+import sys
+import os
+import sqlite3
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from risk_metrics_calculator import (
+    calc_max_drawdown,
+    calc_daily_returns,
+    calc_annual_volatility,
+    load_nav_arrays,
+    calc_period_return,
+    calc_annual_return,
+    calc_sharpe_ratio,
+    calculate_risk_metrics_from_nav,
+    calculate_risk_metrics_batch,
+    PERIOD_DAYS,
+)
+
+
+def _loop_max_drawdown(nav_series):
+    """原逐点循环实现（参照）"""
+    if not nav_series or len(nav_series) < 2:
+        return 0.0, 0, 0
+
+    max_nav = nav_series[0]
+    max_drawdown = 0.0
+    peak_idx = 0
+    trough_idx = 0
+    current_peak_idx = 0
+
+    for i, nav in enumerate(nav_series):
+        if nav > max_nav:
+            max_nav = nav
+            current_peak_idx = i
+
+        drawdown = (max_nav - nav) / max_nav
+        if drawdown > max_drawdown:
+            max_drawdown = drawdown
+            peak_idx = current_peak_idx
+            trough_idx = i
+
+    return max_drawdown * 100, peak_idx, trough_idx
+
+
+def _loop_daily_returns(nav_series):
+    """原逐点循环实现（参照）"""
+    returns = []
+    for i in range(1, len(nav_series)):
+        if nav_series[i-1] > 0:
+            returns.append((nav_series[i] - nav_series[i-1]) / nav_series[i-1])
+    return returns
+
+
+def _loop_risk_metrics(nav_data, period, risk_free_rate=0.025):
+    """原基于sqlite3.Row列表的计算流程（参照）"""
+    nav_series = [float(d['unit_nav']) for d in nav_data if d['unit_nav']]
+    trading_days = len(nav_series)
+    if trading_days < 2:
+        return {'success': False, 'error': '有效净值数据不足', 'period': period}
+
+    max_drawdown, _, _ = _loop_max_drawdown(nav_series)
+    daily_returns = _loop_daily_returns(nav_series)
+    annual_volatility = calc_annual_volatility(daily_returns) if len(daily_returns) >= 20 else None
+    period_return = calc_period_return(nav_series)
+    annual_return = calc_annual_return(nav_series, trading_days) if trading_days >= 126 else None
+    sharpe_ratio = calc_sharpe_ratio(annual_return, annual_volatility, risk_free_rate) if annual_volatility and annual_return else None
+
+    return {
+        'success': True,
+        'period': period,
+        'start_date': nav_data[0]['nav_date'],
+        'end_date': nav_data[-1]['nav_date'],
+        'trading_days': trading_days,
+        'period_return': round(period_return, 4) if period_return else None,
+        'annual_return': round(annual_return, 4) if annual_return else None,
+        'max_drawdown': round(max_drawdown, 4) if max_drawdown else None,
+        'annual_volatility': round(annual_volatility, 4) if annual_volatility else None,
+        'sharpe_ratio': round(sharpe_ratio, 4) if sharpe_ratio else None,
+        'risk_free_rate': risk_free_rate,
+        'data_source': 'calculated'
+    }
+
+
+def _random_navs(seed, n=800):
+    rng = np.random.default_rng(seed)
+    navs = np.round(np.cumprod(1 + rng.normal(0.0003, 0.015, n)), 4)
+    return navs.tolist()
+
+
+def test_max_drawdown_matches_loop():
+    """最大回撤与循环实现完全一致（含峰谷位置）"""
+    for seed in range(20):
+        navs = _random_navs(seed)
+        assert calc_max_drawdown(navs) == _loop_max_drawdown(navs)
+
+    # 单调上涨、持平、重复高点等边界情况
+    for navs in ([1.0, 1.1, 1.2], [1.0, 1.0, 1.0], [1.2, 1.0, 1.2, 0.9, 1.2, 0.9], [1.0]):
+        assert calc_max_drawdown(navs) == _loop_max_drawdown(navs)
+    print("最大回撤: 通过")
+
+
+def test_daily_returns_and_volatility_match_loop():
+    """日收益率和年化波动率与循环实现完全一致"""
+    for seed in range(20):
+        navs = _random_navs(seed)
+        vec = calc_daily_returns(navs)
+        ref = _loop_daily_returns(navs)
+        assert vec.tolist() == ref
+        assert calc_annual_volatility(vec) == calc_annual_volatility(ref)
+    print("日收益率/波动率: 通过")
+
+
+def test_load_nav_arrays_and_batch():
+    """按列读取净值，批量多周期结果与逐周期计算一致"""
+    navs = _random_navs(7, n=1500)
+    dates = [f"2019-01-01+{i:04d}" for i in range(len(navs))]
+    navs[100] = None
+
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('CREATE TABLE fund_nav (fund_code TEXT, nav_date TEXT, unit_nav REAL)')
+    cursor.executemany('INSERT INTO fund_nav VALUES (?, ?, ?)',
+                       [('000001', d, v) for d, v in zip(dates, navs)])
+
+    all_dates, all_navs = load_nav_arrays(cursor, '000001')
+    assert all_dates == dates
+    assert np.isnan(all_navs[100])
+    assert isinstance(cursor.execute('SELECT 1 AS x').fetchone(), sqlite3.Row)
+
+    batch = calculate_risk_metrics_batch(all_dates, all_navs)
+    for period, days in PERIOD_DAYS.items():
+        rows = [{'nav_date': d, 'unit_nav': v} for d, v in zip(dates, navs)]
+        if days:
+            rows = rows[-days:]
+            tail_dates, tail_navs = load_nav_arrays(cursor, '000001', days)
+            assert tail_dates == dates[-days:]
+        expected = _loop_risk_metrics(rows, period)
+        assert batch[period] == expected, period
+        assert calculate_risk_metrics_from_nav(rows, period) == expected, period
+
+    conn.close()
+    print("批量多周期: 通过")
+
+
+if __name__ == "__main__":
+    test_max_drawdown_matches_loop()
+    test_daily_returns_and_volatility_match_loop()
+    test_load_nav_arrays_and_batch()
+    print("\n=== 测试完成 ===")
@@ -0,0 +1,126 @@
+"""
+测试风险指标增量更新
+逐日追加净值，每一步与全量重算结果比对；并验证状态持久化和一致性校验
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+
+import funddb
+from risk_metrics_calculator import calculate_risk_metrics_from_array, PERIOD_DAYS
+from risk_stream import (
+    STREAM_PERIODS,
+    CONSISTENCY_FIELDS,
+    RollingRiskState,
+    build_risk_stream_state,
+    init_risk_stream,
+    update_risk_metrics_incremental,
+    check_risk_stream_consistency,
+)
+
+
+def _random_series(seed, n):
+    rng = np.random.default_rng(seed)
+    navs = np.round(np.cumprod(1 + rng.normal(0.0003, 0.015, n)), 4)
+    dates = [f"2020-{i // 300 + 1:02d}-{i % 300:03d}" for i in range(n)]
+    return dates, navs
+
+
+def _assert_same(actual, expected, tag):
+    assert actual['success'] == expected['success'], tag
+    for key in ('start_date', 'end_date', 'trading_days'):
+        assert actual[key] == expected[key], (tag, key)
+    for key in CONSISTENCY_FIELDS:
+        a, e = actual[key], expected[key]
+        assert (a is None) == (e is None), (tag, key, a, e)
+        if a is not None:
+            assert abs(a - e) <= 1e-4, (tag, key, a, e)
+
+
+def test_append_matches_full_recompute():
+    """逐点追加与每步全量重算一致（含窗口过期、峰值过期重扫）"""
+    for seed in range(5):
+        dates, navs = _random_series(seed, 900)
+        for period in STREAM_PERIODS:
+            days = PERIOD_DAYS[period]
+            state = build_risk_stream_state('000001', period, dates[:30], navs[:30])
+            for i in range(30, len(navs)):
+                state.append(dates[i], float(navs[i]))
+                lo = max(0, i + 1 - days)
+                expected = calculate_risk_metrics_from_array(dates[lo:i + 1], navs[lo:i + 1], period)
+                _assert_same(state.metrics(), expected, (seed, period, i))
+    print("逐点追加: 通过")
+
+
+def test_state_round_trip():
+    """状态序列化后恢复，继续追加结果不变"""
+    dates, navs = _random_series(11, 400)
+    state = build_risk_stream_state('000001', '近6月', dates[:300], navs[:300])
+
+    names = ['fund_code', 'period', 'window_size', 'seq', 'nav_count', 'sum_ret', 'sum_ret_sq',
+             'peak_nav', 'peak_seq', 'max_dd', 'dd_peak_seq', 'dd_trough_seq', 'last_date',
+             'nav_buffer', 'date_buffer']
+    restored = RollingRiskState.from_row(dict(zip(names, state.to_row())))
+
+    for i in range(300, 400):
+        state.append(dates[i], float(navs[i]))
+        restored.append(dates[i], float(navs[i]))
+    assert restored.metrics() == state.metrics()
+    print("状态序列化: 通过")
+
+
+def test_incremental_update_in_db(temp_db):
+    """数据库中增量更新、一致性校验和修复"""
+    dates, navs = _random_series(3, 500)
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                         [('000001', d, float(v)) for d, v in zip(dates[:450], navs[:450])])
+        conn.commit()
+
+    assert init_risk_stream('000001')['success']
+
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                         [('000001', d, float(v)) for d, v in zip(dates[450:], navs[450:])])
+        conn.commit()
+
+    result = update_risk_metrics_incremental('000001')
+    assert result['appended'] == 50
+    for period in STREAM_PERIODS:
+        days = PERIOD_DAYS[period]
+        expected = calculate_risk_metrics_from_array(dates[-days:], navs[-days:], period)
+        _assert_same(result['results'][period], expected, period)
+
+    with funddb.get_db_connection() as conn:
+        row = conn.execute("SELECT * FROM fund_risk_metrics WHERE fund_code = '000001' AND period = '近1年'").fetchone()
+    assert row['calc_end_date'] == dates[-1]
+
+    assert update_risk_metrics_incremental('000001')['appended'] == 0
+
+    # 非正值净值不计入追加数
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES ('000001', ?, ?)",
+                         [('2099-01-01', 0.0), ('2099-01-02', -1.0)])
+        conn.commit()
+    assert update_risk_metrics_incremental('000001')['appended'] == 0
+    with funddb.get_db_connection() as conn:
+        conn.execute("DELETE FROM fund_nav WHERE nav_date >= '2099-01-01'")
+        conn.commit()
+    assert check_risk_stream_consistency('000001')['consistent']
+
+    # 修订历史净值后增量无法感知，一致性校验应发现并修复
+    with funddb.get_db_connection() as conn:
+        conn.execute("UPDATE fund_nav SET unit_nav = unit_nav * 0.5 WHERE fund_code = '000001' AND nav_date = ?",
+                     (dates[-10],))
+        conn.commit()
+    check = check_risk_stream_consistency('000001', repair=True)
+    assert not check['consistent'] and check['repaired']
+    assert check_risk_stream_consistency('000001')['consistent']
+    print("数据库增量更新: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
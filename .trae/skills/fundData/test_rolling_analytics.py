@@ -0,0 +1,91 @@
+"""
+测试滚动指标分析服务
+与 FundAnalyzer.calculate_rolling_volatility / calculate_rolling_sharpe 及pandas滚动计算比对
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+import numpy as np
+import pandas as pd
+
+import funddb
+from rolling_analytics import rolling_max, compute_rolling_metrics, get_rolling_analytics
+
+
+def test_rolling_max():
+    """滚动最大值与逐窗口计算一致"""
+    rng = np.random.default_rng(0)
+    values = rng.random((103, 4))
+    values[5, 1] = np.nan
+    for window in (1, 7, 20, 103, 150):
+        expected = np.array([[np.max(np.nan_to_num(values[max(0, t - window + 1):t + 1, j], nan=-np.inf)) for j in range(4)]
+                             for t in range(103)])
+        expected[np.isneginf(expected)] = np.nan
+        assert np.allclose(rolling_max(values, window), expected, equal_nan=True)
+    print("滚动最大值: 通过")
+
+
+def test_matches_fund_analyzer():
+    """滚动波动率/夏普与FundAnalyzer一致，滚动收益/回撤与pandas一致"""
+    from fund_analyzer import FundAnalyzer
+
+    analyzer = FundAnalyzer(risk_free_rate=0.025)
+    rng = np.random.default_rng(1)
+    navs = np.round(np.cumprod(1 + rng.normal(0.0004, 0.012, (600, 3)), axis=0), 4)
+    navs[500:, 2] = np.nan
+
+    window = 60
+    metrics = compute_rolling_metrics(navs, window, 0.025)
+    for j in range(3):
+        series = pd.Series(navs[:, j]).dropna()
+        returns = series.pct_change().dropna()
+        vol = analyzer.calculate_rolling_volatility(returns, window).to_numpy() * 100
+        sharpe = analyzer.calculate_rolling_sharpe(series, window).to_numpy()
+        ret = (series / series.shift(window) - 1).to_numpy() * 100
+        dd = (series / series.rolling(window + 1).max() - 1).to_numpy() * 100
+
+        n = len(series)
+        assert np.allclose(metrics['volatility'][1:n, j], vol, equal_nan=True)
+        assert np.allclose(metrics['sharpe'][1:n, j], sharpe, equal_nan=True)
+        assert np.allclose(metrics['return'][:n, j], ret, equal_nan=True)
+        assert np.allclose(metrics['drawdown'][:n, j], dd, equal_nan=True)
+        assert np.isnan(metrics['volatility'][n:, j]).all()
+    print("与FundAnalyzer一致: 通过")
+
+
+def test_service_cache_and_downsample(temp_db):
+    """服务接口：缓存按数据版本失效，抽样点数受限"""
+
+    rng = np.random.default_rng(2)
+    dates = [f"2021-{i // 300 + 1:02d}-{i % 300:03d}" for i in range(900)]
+    rows = []
+    for code, start in (('000001', 0), ('000002', 400)):
+        navs = np.round(np.cumprod(1 + rng.normal(0.0003, 0.01, 900 - start)), 4)
+        rows += [(code, d, float(v)) for d, v in zip(dates[start:850], navs)]
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)", rows)
+        conn.commit()
+
+    result = get_rolling_analytics(['000001', '000002', '999999'], window=60, max_points=100)
+    assert result['missing'] == ['999999'] and result['cache_hits'] == 0
+    fund = result['funds']['000001']
+    assert fund['point_count'] == 100 and fund['total_points'] == 850 - 60
+    assert fund['dates'][0] == dates[60] and fund['dates'][-1] == dates[849]
+    assert result['funds']['000002']['dates'][0] == dates[460]
+
+    assert get_rolling_analytics(['000001', '000002'], window=60)['cache_hits'] == 2
+
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES ('000001', ?, 1.5)", (dates[850],))
+        conn.commit()
+    again = get_rolling_analytics(['000001', '000002'], window=60, start_date=dates[800])
+    assert again['cache_hits'] == 1
+    assert again['funds']['000001']['dates'][-1] == dates[850]
+    assert again['funds']['000001']['dates'][0] == dates[800]
+    print("服务缓存与抽样: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
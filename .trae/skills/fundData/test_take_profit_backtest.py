@@ -0,0 +1,135 @@
+"""
+测试阶梯止盈回测
+与逐日调用 TakeProfitCalculator._execute_logic 并按账本公式更新持仓的循环逐笔比对，
+并验证模板解析、区间过滤和耗时
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import funddb
+from take_profit import TakeProfitCalculator, TakeProfitParams
+from take_profit_backtest import run_backtest, backtest_take_profit, TRADE_BUY_BACK
+
+
+def _loop_backtest(navs, params, initial_amount=10000.0, initial_cash=0.0):
+    """逐日调用 _execute_logic，卖出/捡回按 record_sell_transaction / execute_buy_back_transaction 更新"""
+    calc = TakeProfitCalculator(params)
+    shares = initial_amount / navs[0]
+    cost = float(navs[0])
+    cash = initial_cash
+    sells = []
+    trades = []
+    for i in range(1, len(navs)):
+        nav = float(navs[i])
+        unrecovered = [s for s in reversed(sells) if not s['is_recovered']]
+        action, ratio, _, info = calc._execute_logic(
+            params, bool(sells), (nav - cost) / cost if cost > 0 else 0, nav,
+            sells[-1]['nav'] if sells else None, cost, cash, unrecovered)
+        if action == 'STOP':
+            break
+        if action == 'SELL':
+            sell_shares = shares * ratio
+            amount = sell_shares * nav
+            new_shares = shares - sell_shares
+            cost = max((shares * cost - amount) / new_shares, 0)
+            shares = new_shares
+            cash += amount
+            sells.append({'id': len(sells), 'nav': nav, 'shares': sell_shares, 'is_recovered': 0})
+            trades.append((i, 'SELL', shares, cash))
+        elif action == 'BUY':
+            sells[info['target_transaction_id']]['is_recovered'] = 1
+            cost = (shares * cost + info['amount']) / (shares + info['shares'])
+            shares += info['shares']
+            cash -= info['amount']
+            trades.append((i, 'BUY', shares, cash))
+    return trades, shares, cash
+
+
+def _random_navs(seed, n=2500):
+    rng = np.random.default_rng(seed)
+    return np.round(np.cumprod(1 + rng.normal(0.0004, 0.015, n)), 4)
+
+
+def test_matches_execute_logic():
+    param_sets = [
+        TakeProfitParams(),
+        TakeProfitParams(0.30, 0.20, 0.08, 0.15, enable_cost_control=False),
+        TakeProfitParams(0.10, 0.30, 0.03, 0.20, enable_cost_control=False,
+                         enable_buy_back=True, buy_back_threshold=0.08),
+        TakeProfitParams(0.05, 0.50, 0.02, 0.50, enable_cost_control=True,
+                         enable_buy_back=True, buy_back_threshold=0.05),
+    ]
+    total_trades = 0
+    for seed in range(5):
+        navs = _random_navs(seed)
+        for params in param_sets:
+            result = run_backtest(navs, params)
+            expected, shares, cash = _loop_backtest(navs, params)
+            got = [(t[0], 'BUY' if t[1] == TRADE_BUY_BACK else 'SELL', t[5], t[6]) for t in result['trades']]
+            assert [g[:2] for g in got] == [e[:2] for e in expected], (seed, params)
+            assert np.allclose([g[2:] for g in got], [e[2:] for e in expected]) if got else True
+            assert np.isclose(result['shares'], shares) and np.isclose(result['cash'], cash)
+            # 权益曲线与份额、现金一致
+            assert np.isclose(result['final_value'], shares * navs[-1] + cash)
+            total_trades += len(got)
+    assert total_trades > 50
+    print("逐笔交易与 _execute_logic 逐日重放一致: 通过")
+
+
+def test_statistics():
+    navs = np.array([1.0, 1.1, 1.25, 1.2, 1.4, 1.0, 0.9, 1.3])
+    result = run_backtest(navs, TakeProfitParams(enable_cost_control=False))
+    kinds = [t[1] for t in result['trades']]
+    assert kinds == ['first_sell', 'follow_up_sell']
+    equity = result['equity']
+    assert np.isclose(equity[-1], 10000 * 0.7 * 0.8 * 1.3 + 10000 * 0.3 * 1.25 + 10000 * 0.7 * 0.2 * 1.4)
+    # 峰值在第二次卖出当日(1.4)，谷值在0.9
+    assert result['max_drawdown_index'] == (4, 6)
+    assert np.isclose(result['max_drawdown'], 1 - equity[6] / equity[4])
+
+    # 成本收回即停止（目标摊薄成本0）
+    navs = np.linspace(1.0, 5.0, 400)
+    result = run_backtest(navs, TakeProfitParams(first_sell_ratio=0.5, follow_up_sell_ratio=0.5))
+    assert result['stop_index'] is not None and result['diluted_cost'] == 0
+    assert result['trades'][-1][0] < result['stop_index']
+    print("收益回撤与停止止盈统计: 通过")
+
+
+def test_backtest_from_db(temp_db):
+    navs = _random_navs(7)
+    dates = pd.bdate_range('2015-01-05', periods=navs.size).strftime('%Y-%m-%d')
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES ('000001', ?, ?)",
+                         [(d, float(v)) for d, v in zip(dates, navs)])
+        conn.commit()
+
+    result = backtest_take_profit('000001', template_name='激进型')
+    assert result['success'] and result['template_name'] == '激进型'
+    assert result['params']['first_threshold'] == 0.30
+    assert result['trading_days'] == navs.size
+    counts = result['trade_count']
+    assert counts['total'] == len(result['trades']) == counts['sell'] + counts['buy_back']
+
+    ranged = backtest_take_profit('000001', start_date=dates[500], end_date=dates[1500],
+                                  include_equity=True)
+    assert ranged['start_date'] == dates[500] and ranged['trading_days'] == 1001
+    assert ranged['template_name'] == '标准型'
+    assert len(ranged['equity']['values']) == 1001
+
+    assert not backtest_take_profit('000001', template_id=9999)['success']
+    assert not backtest_take_profit('999999')['success']
+
+    start = time.perf_counter()
+    backtest_take_profit('000001', params=TakeProfitParams(enable_buy_back=True, buy_back_threshold=0.1))
+    print(f"  10年日净值回测耗时: {(time.perf_counter() - start) * 1000:.1f}ms")
+    print("本地净值回测: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
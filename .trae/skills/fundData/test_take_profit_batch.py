@@ -0,0 +1,159 @@
+"""
+测试组合止盈批量计算
+calculate_portfolio 批量加载数据后的结果，与逐只基金按原查询（list_portfolio_funds、
+get_portfolio_transactions、get_fund_config）取数再判断的结果逐项比对，并验证耗时
+"""
+import sys
+import os
+import time
+from dataclasses import asdict
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import funddb
+from take_profit import TakeProfitCalculator, params_from_config, load_take_profit_inputs
+from take_profit_manager import TakeProfitTemplateManager
+from portfolio_manager import (record_buy_transaction, record_sell_transaction, execute_buy_back_transaction,
+                               list_portfolio_funds, get_portfolio_transactions,
+                               calculate_portfolio_available_cash_batch)
+
+
+def _setup_db():
+    with funddb.get_db_connection() as conn:
+        conn.execute("INSERT INTO portfolio (id, name, cash) VALUES (1, '测试组合', 100000)")
+        conn.commit()
+
+
+def _add_navs(fund_code: str, navs):
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                         [(fund_code, f'2024-06-{day:02d}', nav) for day, nav in enumerate(navs, start=1)])
+        conn.commit()
+
+
+def _build_portfolio():
+    """覆盖初次止盈、持有、后续止盈、波段捡回、现金不足、成本控制、无净值及三种参数来源"""
+    manager = TakeProfitTemplateManager()
+    aggressive = manager.get_template_by_name('激进型')['id']
+
+    # 初次止盈（默认模板）
+    record_buy_transaction(1, '000001', 1000, 1000, '2024-01-02')
+    _add_navs('000001', [1.1, 1.25])
+    # 收益不足，继续持有（指定模板）
+    record_buy_transaction(1, '000002', 1000, 1000, '2024-01-02')
+    _add_navs('000002', [1.2, 1.1])
+    manager.set_fund_template(1, '000002', aggressive)
+    # 两笔卖出后再上涨：后续止盈以最近一笔卖出净值为准
+    record_buy_transaction(1, '000003', 1000, 1000, '2024-01-02')
+    record_sell_transaction(1, '000003', 100, 120, '2024-03-01', nav=1.2)
+    record_sell_transaction(1, '000003', 100, 130, '2024-04-01', nav=1.3)
+    _add_navs('000003', [1.3, 1.38])
+    # 波段捡回（自定义参数）：最近一笔卖出已捡回，按更早一笔未回收卖出判断，卖出所得现金足够
+    record_buy_transaction(1, '000004', 1000, 100, '2024-01-02', nav=0.1)
+    record_sell_transaction(1, '000004', 300, 450, '2024-03-01', nav=1.5)
+    record_sell_transaction(1, '000004', 100, 140, '2024-04-01', nav=1.4)
+    with funddb.get_db_connection() as conn:
+        last_sell = conn.execute("SELECT MAX(id) FROM portfolio_transaction").fetchone()[0]
+    execute_buy_back_transaction(1, '000004', last_sell, 100, 110, '2024-05-06')
+    _add_navs('000004', [1.2, 1.1])
+    manager.set_fund_custom_params(1, '000004', first_threshold=0.2, first_sell_ratio=0.3, step_size=0.05,
+                                   follow_up_sell_ratio=0.2, enable_cost_control=False, target_diluted_cost=0,
+                                   enable_buy_back=True, buy_back_threshold=0.2)
+    # 跌幅达标但现金不足
+    record_buy_transaction(1, '000005', 1000, 1000, '2024-01-02')
+    record_sell_transaction(1, '000005', 100, 150, '2024-03-01', nav=1.5)
+    record_buy_transaction(1, '000005', 500, 600, '2024-04-01')
+    _add_navs('000005', [1.1])
+    manager.set_fund_custom_params(1, '000005', first_threshold=0.2, first_sell_ratio=0.3, step_size=0.05,
+                                   follow_up_sell_ratio=0.2, enable_cost_control=False, target_diluted_cost=0,
+                                   enable_buy_back=True, buy_back_threshold=0.2)
+    # 本金已收回（摊薄成本为0，默认模板启用成本控制）
+    record_buy_transaction(1, '000006', 1000, 1000, '2024-01-02')
+    _add_navs('000006', [1.5])
+    # 本地没有净值
+    record_buy_transaction(1, '000007', 1000, 1000, '2024-01-02')
+
+    with funddb.get_db_connection() as conn:
+        conn.execute("UPDATE portfolio_fund SET cost_nav = buy_nav WHERE fund_code != '000006'")
+        conn.commit()
+
+
+def _expected(calc: TakeProfitCalculator, portfolio_id: int):
+    """逐只基金按原来的查询取数，再用同一判断逻辑计算"""
+    manager = TakeProfitTemplateManager()
+    cash_map = calculate_portfolio_available_cash_batch(portfolio_id)
+    results = []
+    for fund in list_portfolio_funds(portfolio_id):
+        fund_code = fund['fund_code']
+        config = manager.get_fund_config(portfolio_id, fund_code)
+        params = params_from_config(config)
+        with funddb.get_db_connection() as conn:
+            nav = conn.execute("SELECT * FROM fund_nav WHERE fund_code = ? ORDER BY nav_date DESC LIMIT 1",
+                               (fund_code,)).fetchone()
+        holding = next(f for f in list_portfolio_funds(portfolio_id) if f['fund_code'] == fund_code)
+        sells = get_portfolio_transactions(portfolio_id, fund_code=fund_code, transaction_type='SELL')
+        available_cash = cash_map.get(fund_code, 0)
+        details = calc._input_details(fund_code, portfolio_id, available_cash, params,
+                                      config['param_source'], config.get('template_name'))
+        details.append(f"【数据获取】")
+        results.append(calc._evaluate(fund_code, available_cash, params, config['param_source'],
+                                      config.get('template_name'), details,
+                                      dict(nav) if nav else None, holding, sells))
+    return [asdict(r) for r in results]
+
+
+def test_batch_matches_per_fund(temp_db):
+    _setup_db()
+    _build_portfolio()
+    calc = TakeProfitCalculator()
+    result = calc.calculate_portfolio(1, refresh_nav=False)
+    expected = _expected(calc, 1)
+
+    assert result['funds'] == expected
+    actions = {f['fund_code']: f['action'] for f in result['funds']}
+    assert actions == {'000001': 'SELL', '000002': 'HOLD', '000003': 'SELL', '000004': 'BUY',
+                       '000005': 'HOLD', '000006': 'STOP', '000007': 'ERROR'}
+    funds = {f['fund_code']: f for f in result['funds']}
+    assert funds['000003']['last_sell_nav'] == 1.3
+    assert funds['000004']['target_sell_nav'] == 1.5 and funds['000004']['param_source'] == 'custom'
+    assert funds['000002']['template_name'] == '激进型'
+    assert result['summary']['buy_back_count'] == 1 and result['summary']['error_count'] == 1
+
+    # 批量解析的配置与逐只解析一致
+    manager = TakeProfitTemplateManager()
+    configs = manager.get_fund_configs(1, [f'00000{i}' for i in range(1, 9)])
+    for code, config in configs.items():
+        assert config == manager.get_fund_config(1, code), code
+    print("批量计算与逐只计算一致: 通过")
+
+
+def test_batch_timing(temp_db):
+    _setup_db()
+    fund_count = 100
+    with funddb.get_db_connection() as conn:
+        for i in range(fund_count):
+            code = f'{i:06d}'
+            conn.execute("INSERT INTO portfolio_fund (portfolio_id, fund_code, shares, buy_nav, cost_nav) VALUES (1, ?, 1000, 1.0, 1.0)",
+                         (code,))
+            conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                             [(code, f'2024-{m:02d}-{d:02d}', 1 + 0.002 * (m * 28 + d) + 0.001 * i)
+                              for m in range(1, 13) for d in range(1, 29)])
+            conn.execute("INSERT INTO portfolio_transaction (portfolio_id, fund_code, transaction_type, transaction_date, shares, amount, nav) "
+                         "VALUES (1, ?, 'SELL', '2024-06-03', 100, 120, 1.2)", (code,))
+        conn.commit()
+    funddb.init_database()
+
+    inputs = load_take_profit_inputs(1, refresh_nav=False)
+    assert len(inputs['holdings']) == fund_count and inputs['navs']['000000']['nav_date'] == '2024-12-28'
+    assert all(len(inputs['sells'][f['fund_code']]) == 1 for f in inputs['holdings'])
+
+    start = time.perf_counter()
+    result = TakeProfitCalculator().calculate_portfolio(1, refresh_nav=False)
+    elapsed = time.perf_counter() - start
+    assert result['summary']['total_funds'] == fund_count and result['summary']['error_count'] == 0
+    assert elapsed < 1.0, elapsed
+    print(f"{fund_count}只基金批量计算耗时: {elapsed * 1000:.1f}ms: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
@@ -0,0 +1,98 @@
+"""
+测试止盈参数寻优
+验证参数组合生成、进程池（共享内存）与单进程结果一致、排名与逐只回测一致，以及保存为模板
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import funddb
+import take_profit_optimizer
+from take_profit import TakeProfitParams
+from take_profit_backtest import backtest_take_profit
+from take_profit_optimizer import build_param_sets, optimize_take_profit, save_as_template, DEFAULT_GRID
+
+SMALL_GRID = {
+    'first_threshold': [0.10, 0.20],
+    'step_size': [0.05, 0.10],
+    'buy_back_threshold': [0.0, 0.10],
+}
+
+
+def test_build_param_sets():
+    full = build_param_sets()
+    assert len(full) == np.prod([len(v) for v in DEFAULT_GRID.values()])
+    assert sum(p.enable_buy_back for p in full) == len(full) * 2 // 3
+
+    sampled = build_param_sets(method='random', n_samples=30, seed=1)
+    assert len(sampled) == 30 and len({tuple(vars(p).values()) for p in sampled}) == 30
+    assert sampled == build_param_sets(method='random', n_samples=30, seed=1)
+
+    base = TakeProfitParams(enable_cost_control=False, target_diluted_cost=0.5)
+    small = build_param_sets(SMALL_GRID, base=base)
+    assert len(small) == 8 and all(not p.enable_cost_control and p.first_sell_ratio == 0.30 for p in small)
+    print("参数组合生成: 通过")
+
+
+def test_optimize(temp_db):
+    try:
+        rng = np.random.default_rng(11)
+        dates = pd.bdate_range('2018-01-01', periods=1200).strftime('%Y-%m-%d')
+        rows, info = [], []
+        for k in range(4):
+            code = f'00000{k}'
+            navs = np.round(np.cumprod(1 + rng.normal(0.0004, 0.015, len(dates))), 4)
+            # 第4只基金净值不足一年，不参与寻优
+            used = dates if k < 3 else dates[:100]
+            rows += [(code, d, float(v)) for d, v in zip(used, navs)]
+            # 类型按包含匹配（fund_info 中的类型常带细分，如"指数型-股票型"）
+            info.append((code, f'基金{k}', '指数型-股票型' if k == 2 else '股票型'))
+        with funddb.get_db_connection() as conn:
+            conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)", rows)
+            conn.executemany("INSERT INTO fund_info (fund_code, fund_name, fund_type) VALUES (?, ?, ?)", info)
+            conn.commit()
+
+        serial = optimize_take_profit(fund_type='股票型', grid=SMALL_GRID, workers=1, top_n=100)
+        assert serial['success'] and serial['workers'] == 1
+        assert serial['fund_codes'] == ['000000', '000001', '000002']
+        assert serial['param_count'] == 8 and serial['backtest_count'] == 24
+        scores = [r['score'] for r in serial['ranking']]
+        assert scores == sorted(scores, reverse=True)
+
+        # 排名第一的参数与逐只回测的平均结果一致
+        best = serial['ranking'][0]
+        params = TakeProfitParams(**best['params'])
+        totals = [backtest_take_profit(c, params=params)['strategy']['total_return'] for c in serial['fund_codes']]
+        assert abs(np.mean(totals) - best['total_return']) < 0.01
+
+        # 进程池 + 共享内存与单进程结果相同
+        take_profit_optimizer.PARALLEL_MIN_TASKS = 0
+        parallel = optimize_take_profit(fund_codes=serial['fund_codes'], grid=SMALL_GRID, workers=2, top_n=100)
+        assert parallel['workers'] == 2
+        assert [r['params'] for r in parallel['ranking']] == [r['params'] for r in serial['ranking']]
+        assert [r['score'] for r in parallel['ranking']] == scores
+
+        by_drawdown = optimize_take_profit(fund_type='股票型', grid=SMALL_GRID, sort_by='max_drawdown', workers=1)
+        drawdowns = [r['max_drawdown'] for r in by_drawdown['ranking']]
+        assert drawdowns == sorted(drawdowns)
+        assert not optimize_take_profit(fund_type='债券型')['success']
+        assert not optimize_take_profit(fund_codes=['000003'])['success']
+        assert not optimize_take_profit(fund_codes=['000000'], method='anneal')['success']
+
+        saved = save_as_template(best, '优化型')
+        assert saved['success']
+        from take_profit_manager import TakeProfitTemplateManager
+        template = TakeProfitTemplateManager().get_template(saved['template_id'])
+        assert template['name'] == '优化型' and template['first_threshold'] == best['params']['first_threshold']
+        assert bool(template['enable_buy_back']) == best['params']['enable_buy_back']
+        print("参数寻优与模板保存: 通过")
+    finally:
+        take_profit_optimizer.PARALLEL_MIN_TASKS = 2000
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
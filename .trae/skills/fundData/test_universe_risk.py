@@ -0,0 +1,138 @@
+"""
+测试净值面板与全市场风险指标引擎
+在临时数据库上构造多只基金（含缺失日、不同成立日），
+与逐只基金的数组计算结果比对
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+
+import funddb
+from nav_panel import load_nav_panel, ffill_panel
+from risk_metrics_calculator import (
+    load_nav_arrays,
+    calculate_risk_metrics_batch,
+    calculate_universe_risk_metrics,
+    PERIOD_DAYS,
+)
+
+
+def _insert_navs(n_funds=12, n_days=1400):
+    """在临时数据库中写入模拟净值"""
+    rng = np.random.default_rng(2024)
+    all_days = [f"2019-{i // 400 + 1:02d}-{i % 400:03d}" for i in range(n_days)]
+    nav_rows = {}
+
+    with funddb.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO trade_calendar (trade_date, is_trade_day) VALUES (?, 1)",
+                           [(d,) for d in all_days])
+        for k in range(n_funds):
+            code = f"{k:06d}"
+            start = int(rng.integers(0, n_days - 30))
+            navs = np.round(np.cumprod(1 + rng.normal(0.0004, 0.012, n_days - start)), 4)
+            keep = rng.random(n_days - start) > 0.05
+            days = [d for d, kept in zip(all_days[start:], keep) if kept]
+            values = navs[keep].tolist()
+            nav_rows[code] = (days, values)
+            cursor.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)",
+                               [(code, d, v) for d, v in zip(days, values)])
+        conn.commit()
+
+    return nav_rows
+
+
+def test_ffill_panel():
+    """向前填充：保留首个有效值之前的NaN"""
+    values = np.array([[np.nan, 1.0], [2.0, np.nan], [np.nan, np.nan], [3.0, 4.0]])
+    filled = ffill_panel(values)
+    expected = np.array([[np.nan, 1.0], [2.0, 1.0], [2.0, 1.0], [3.0, 4.0]])
+    assert np.array_equal(filled, expected, equal_nan=True)
+    print("向前填充: 通过")
+
+
+def test_universe_matches_per_fund(temp_db):
+    """面板引擎与逐只计算结果一致"""
+    nav_rows = _insert_navs()
+    panel = load_nav_panel()
+    assert panel.fund_codes == sorted(nav_rows)
+    for code, (days, values) in nav_rows.items():
+        col = panel.column(code)
+        assert np.count_nonzero(~np.isnan(col)) == len(values)
+
+    summary = calculate_universe_risk_metrics(save=False)
+    records = {(r[0], r[1]): r for r in summary['records']}
+
+    for code, (days, values) in nav_rows.items():
+        expected = calculate_risk_metrics_batch(days, np.array(values))
+        for period in PERIOD_DAYS:
+            exp = expected[period]
+            if len(values) < 20 or not exp['success']:
+                assert (code, period) not in records
+                continue
+            rec = records[(code, period)]
+            assert rec[6] == exp['start_date'] and rec[7] == exp['end_date']
+            assert rec[8] == exp['trading_days']
+            for got, key in ((rec[2], 'max_drawdown'), (rec[3], 'annual_volatility'),
+                             (rec[4], 'sharpe_ratio'), (rec[9], 'period_return')):
+                want = exp[key]
+                assert (got is None) == (want is None), (code, period, key)
+                if want is not None:
+                    assert abs(got - want) <= 1e-4, (code, period, key, got, want)
+
+    saved = calculate_universe_risk_metrics()
+    with funddb.get_db_connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM fund_risk_metrics").fetchone()[0]
+    assert count == saved['record_count']
+
+    # 复权口径写入独立表，不覆盖未复权结果
+    adjusted = calculate_universe_risk_metrics(adjusted=True)
+    with funddb.get_db_connection() as conn:
+        sources = dict(conn.execute("SELECT data_source, COUNT(*) FROM fund_risk_metrics GROUP BY data_source").fetchall())
+        adj_count = conn.execute("SELECT COUNT(*) FROM fund_risk_metrics_adj WHERE data_source = 'calculated_adj'").fetchone()[0]
+    assert sources == {'calculated': saved['record_count']}
+    assert adj_count == adjusted['record_count'] > 0
+    print(f"全市场引擎: 通过 ({saved['fund_count']}只基金, {saved['record_count']}条)")
+
+
+def test_null_nav_rows_same_window(temp_db):
+    """含空净值行时，逐只计算与面板引擎按相同的有效净值点取窗口"""
+    rng = np.random.default_rng(7)
+    days = [f"2020-{i // 400 + 1:02d}-{i % 400:03d}" for i in range(400)]
+    navs = np.round(np.cumprod(1 + rng.normal(0.0004, 0.012, len(days))), 4).tolist()
+    # 近1年窗口内、窗口起点前后和最新一天为空净值
+    for i in (160, 300, 301, 350, 399):
+        navs[i] = None
+
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO trade_calendar (trade_date, is_trade_day) VALUES (?, 1)", [(d,) for d in days])
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES ('000001', ?, ?)",
+                         list(zip(days, navs)))
+        conn.commit()
+        dates, values = load_nav_arrays(conn.cursor(), '000001')
+
+    expected = calculate_risk_metrics_batch(dates, values)
+    valid_days = [d for d, v in zip(days, navs) if v is not None]
+    assert expected['近1年']['trading_days'] == 252
+    assert expected['近1年']['start_date'] == valid_days[-252] and expected['近1年']['end_date'] == valid_days[-1]
+    assert expected['成立以来']['trading_days'] == len(valid_days)
+
+    records = {r[1]: r for r in calculate_universe_risk_metrics(save=False)['records']}
+    for period in PERIOD_DAYS:
+        exp = expected[period]
+        rec = records[period]
+        assert (rec[6], rec[7], rec[8]) == (exp['start_date'], exp['end_date'], exp['trading_days']), period
+        for got, key in ((rec[2], 'max_drawdown'), (rec[3], 'annual_volatility'),
+                         (rec[4], 'sharpe_ratio'), (rec[9], 'period_return')):
+            want = exp[key]
+            assert (got is None) == (want is None), (period, key)
+            if want is not None:
+                assert abs(got - want) <= 1e-4, (period, key, got, want)
+    print("空净值行窗口口径一致: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
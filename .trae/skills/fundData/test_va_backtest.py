@@ -0,0 +1,115 @@
+"""
+测试市值定投历史回测与批量XIRR
+与逐期按 v2 公式计算的循环比对，验证阶段收益率、再平衡日、对比基准和组合批量回测
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import funddb
+from xirr import xirr, xirr_batch, year_fractions
+from va_backtest import (rebalance_points, phase_rates, run_va_backtest,
+                         backtest_value_averaging, backtest_portfolio_value_averaging)
+
+PHASES = {"熊市": ("2021-03", "2023-12"), "牛市": ("2024-01", "2025-12")}
+
+
+def test_xirr():
+    assert abs(xirr([-1000, 1100], ['2021-01-01', '2022-01-01']) - 0.10) < 1e-9
+    assert np.isnan(xirr([1000, 500], ['2021-01-01', '2022-01-01']))
+
+    rng = np.random.default_rng(0)
+    amounts = np.column_stack([-rng.uniform(100, 1000, (200, 6)), rng.uniform(0, 3000, 200)])
+    years = np.sort(rng.uniform(0, 5, (200, 7)), axis=1)
+    years[:, 0] = 0
+    rates = xirr_batch(amounts, years)
+    ok = np.isfinite(rates)
+    assert ok.sum() > 190
+    # 收益率接近-100%时各项贴现值很大，按相对误差检查
+    terms = amounts[ok] * (1 + rates[ok, None]) ** -years[ok]
+    assert np.all(np.abs(terms.sum(axis=1)) <= 1e-8 * np.abs(terms).sum(axis=1))
+    print("批量XIRR: 通过")
+
+
+def test_rules():
+    dates = pd.bdate_range('2023-11-01', '2024-03-31').strftime('%Y-%m-%d').tolist()
+    points = rebalance_points(dates)
+    assert [dates[i] for i in points] == ['2023-11-01', '2023-12-01', '2024-01-01', '2024-02-01', '2024-03-01']
+    assert all(pd.Timestamp(dates[i]).weekday() == 0 for i in rebalance_points(dates, 'week')[1:])
+    assert list(rebalance_points(dates, 20)[:3]) == [0, 20, 40]
+
+    labels = np.array(['2023-11', '2023-12', '2024-01', '2024-02', '2020-05'])
+    returns = np.array([1.0, 3.0, 2.0, 4.0, 10.0])
+    rates = phase_rates(['2023-12-15', '2024-02-01', '2020-01-02'], labels, returns, PHASES)
+    assert np.allclose(rates, [2.0, 3.0, 4.0])
+
+    # 与逐期按 calculate_value_averaging_v2 公式的循环比对
+    rng = np.random.default_rng(1)
+    navs = np.cumprod(1 + rng.normal(0.01, 0.05, 25))
+    days = np.cumsum(np.r_[0, rng.integers(28, 32, 24)])
+    rates = rng.normal(1.0, 0.5, 24)
+    for kwargs in ({}, {'allow_sell': False}, {'max_trade': 300.0}):
+        sim = run_va_backtest(navs, days, rates, 10000, **kwargs)
+        shares = 10000 / navs[0]
+        target = 10000.0
+        for k in range(1, 25):
+            target += 10000 * rates[k - 1] / 100 * (days[k] - days[k - 1]) / 30
+            trade = target - shares * navs[k]
+            if kwargs.get('allow_sell') is False:
+                trade = max(trade, 0)
+            if 'max_trade' in kwargs:
+                trade = min(max(trade, -300), 300)
+            shares += trade / navs[k]
+            assert np.isclose(sim['trades'][k], trade) and np.isclose(sim['shares'][k], shares)
+        assert np.isclose(sim['targets'][-1], target)
+    print("再平衡日、阶段收益率与定投规则: 通过")
+
+
+def test_backtest_from_db(temp_db):
+    rng = np.random.default_rng(5)
+    dates = pd.bdate_range('2019-01-02', '2025-06-30').strftime('%Y-%m-%d')
+    rows = []
+    for code in ['000001', '000002']:
+        navs = np.round(np.cumprod(1 + rng.normal(0.0003, 0.012, len(dates))), 4)
+        rows += [(code, d, float(v)) for d, v in zip(dates, navs)]
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES (?, ?, ?)", rows)
+        conn.execute("INSERT INTO portfolio (id, name) VALUES (1, '测试组合')")
+        conn.executemany("INSERT INTO portfolio_fund (portfolio_id, fund_code, fund_name, shares) VALUES (1, ?, ?, 100)",
+                         [('000001', '基金一'), ('000002', '基金二'), ('000009', '无净值')])
+        conn.commit()
+
+    result = backtest_portfolio_value_averaging(1, phases=PHASES)
+    assert result['success'] and [f['fund_code'] for f in result['funds']] == ['000001', '000002']
+    assert result['skipped'] == [{'fund_code': '000009', 'reason': '无净值数据'}]
+    fund = result['funds'][0]
+    assert fund['fund_name'] == '基金一' and fund['end_date'] == '2025-06-30'
+    assert fund['start_date'] >= '2022-06-30' and fund['summary']['periods'] == len(fund['records']) - 1
+
+    summary = fund['summary']
+    amounts = np.array([r['amount'] for r in fund['records']])
+    assert abs(summary['max_capital_deployed'] - np.cumsum(amounts).max()) < 0.1
+    assert fund['lump_sum']['capital'] == fund['dca']['capital'] == summary['max_capital_deployed']
+    for section in (summary, fund['lump_sum'], fund['dca']):
+        assert section['irr'] is not None
+
+    # 单只XIRR与批量结果一致
+    flows = list(-amounts) + [summary['final_value']]
+    flow_dates = [r['date'] for r in fund['records']] + [fund['end_date']]
+    assert abs(xirr(flows, flow_dates) * 100 - summary['irr']) < 0.05
+
+    fixed = backtest_value_averaging(['000001'], start_date='2024-01-01', interval='week',
+                                     avg_monthly_return=1.0, allow_sell=False, include_records=False)
+    assert fixed['funds'][0]['summary']['sell_count'] == 0 and 'records' not in fixed['funds'][0]
+    assert not backtest_value_averaging(['000001'], interval='year')['success']
+    assert not backtest_portfolio_value_averaging(99)['success']
+    print(f"  组合回测耗时: {result['elapsed_ms']}ms")
+    print("本地净值回测与对比基准: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
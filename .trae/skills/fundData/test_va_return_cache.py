@@ -0,0 +1,111 @@
+"""
+测试市值定投平均月收益率缓存
+验证持久化读写、版本/TTL失效、LRU上限，以及月收益率重算、阶段日历重新识别时的主动失效
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import funddb
+import market_phase
+import va_return_cache
+from market_phase import PhaseCalendar, refresh_phase_calendar
+from monthly_return import update_monthly_returns
+from va_return_cache import (get_cached_return, save_cached_return, invalidate_returns,
+                             fund_data_version, index_data_version, SUBJECT_FUND, SUBJECT_INDEX)
+
+
+def _clear_caches():
+    va_return_cache._return_cache.clear()
+    market_phase._calendar_cache.clear()
+
+
+def test_cache_validity(temp_db):
+    _clear_caches()
+    save_cached_return(SUBJECT_INDEX, '510300', '牛市', 'v1', 1.5, 4.2, 24, '2024-01-01', None, '沪深300ETF')
+    cached = get_cached_return(SUBJECT_INDEX, '510300', '牛市', 'v1')
+    assert cached['avg_monthly_return'] == 1.5 and cached['sample_months'] == 24
+    assert get_cached_return(SUBJECT_INDEX, '510300', '牛市', 'v2') is None
+    assert get_cached_return(SUBJECT_FUND, '510300', '牛市', 'v1') is None
+
+    # 进程内缓存清空后（相当于新进程）从表中读取
+    va_return_cache._return_cache.clear()
+    assert get_cached_return(SUBJECT_INDEX, '510300', '牛市', 'v1')['monthly_return_std'] == 4.2
+    assert len(va_return_cache._return_cache) == 1
+
+    # 超过TTL、计算口径版本变化均失效
+    save_cached_return(SUBJECT_FUND, '000001', '熊市', 'v1', -0.5)
+    with funddb.get_db_connection() as conn:
+        conn.execute("UPDATE va_return_cache SET update_time = '2000-01-01 00:00:00' WHERE subject_code = '000001'")
+        conn.execute("UPDATE va_return_cache SET cache_version = 0 WHERE subject_code = '510300'")
+        conn.commit()
+    va_return_cache._return_cache.clear()
+    assert get_cached_return(SUBJECT_FUND, '000001', '熊市', 'v1') is None
+    assert get_cached_return(SUBJECT_INDEX, '510300', '牛市', 'v1') is None
+
+    # LRU上限
+    original = va_return_cache.RETURN_CACHE_SIZE
+    va_return_cache.RETURN_CACHE_SIZE = 3
+    try:
+        for i in range(5):
+            save_cached_return(SUBJECT_FUND, f"00010{i}", '牛市', 'v1', float(i))
+        assert [key[1] for key in va_return_cache._return_cache] == ['000102', '000103', '000104']
+        assert get_cached_return(SUBJECT_FUND, '000100', '牛市', 'v1')['avg_monthly_return'] == 0.0
+    finally:
+        va_return_cache.RETURN_CACHE_SIZE = original
+
+    invalidate_returns(SUBJECT_FUND, ['000100', '000101'])
+    assert get_cached_return(SUBJECT_FUND, '000100', '牛市', 'v1') is None
+    assert get_cached_return(SUBJECT_FUND, '000102', '牛市', 'v1') is not None
+    print("缓存版本、TTL与LRU: 通过")
+
+
+def test_invalidation(temp_db):
+    _clear_caches()
+    try:
+        dates = pd.bdate_range('2022-01-03', '2025-06-30').strftime('%Y-%m-%d').tolist()
+        navs = np.cumprod(np.full(len(dates), 1.0005))
+        with funddb.get_db_connection() as conn:
+            conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav, update_time) VALUES ('000001', ?, ?, '2025-06-30 20:00:00')",
+                             [(d, float(v)) for d, v in zip(dates, navs)])
+            conn.commit()
+        update_monthly_returns()
+
+        calendar = PhaseCalendar.from_ranges({"牛市": ("2024-01", "2025-12")}, '牛市')
+        version = fund_data_version('000001', calendar)
+        assert version == 'None|2025-06-30 20:00:00' and index_data_version(calendar) == 'None'
+        save_cached_return(SUBJECT_FUND, '000001', '牛市', version, 1.1)
+        save_cached_return(SUBJECT_INDEX, '510300', '牛市', index_data_version(calendar), 1.3)
+
+        # 新净值写入后月收益率重算：基金缓存删除，数据版本同时变化
+        with funddb.get_db_connection() as conn:
+            conn.execute("INSERT INTO fund_nav (fund_code, nav_date, unit_nav, update_time) "
+                         "VALUES ('000001', '2025-07-01', 1.9, '2025-07-01 20:00:00')")
+            conn.commit()
+        update_monthly_returns(['000001'])
+        assert fund_data_version('000001', calendar) != version
+        assert get_cached_return(SUBJECT_FUND, '000001', '牛市', version) is None
+        assert get_cached_return(SUBJECT_INDEX, '510300', '牛市', 'None') is not None
+
+        # 阶段日历重新识别：全部失效
+        closes = np.concatenate([np.linspace(3000, 4500, 200), np.linspace(4500, 3200, 200)])
+        index_dates = pd.bdate_range('2023-01-02', periods=closes.size).strftime('%Y-%m-%d')
+        with funddb.get_db_connection() as conn:
+            conn.executemany("INSERT INTO index_price (index_code, trade_date, close_price) VALUES ('000300', ?, ?)",
+                             list(zip(index_dates, closes.tolist())))
+            conn.commit()
+        assert refresh_phase_calendar()['success']
+        assert get_cached_return(SUBJECT_INDEX, '510300', '牛市', 'None') is None
+        with funddb.get_db_connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM va_return_cache").fetchone()[0] == 0
+        print("月收益率与阶段日历变化时失效: 通过")
+    finally:
+        market_phase._calendar_cache.clear()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
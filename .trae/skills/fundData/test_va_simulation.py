@@ -0,0 +1,108 @@
+"""
+测试市值定投蒙特卡洛模拟
+与 simulate_period 的逐月循环逐条路径比对，并验证约束、bootstrap抽样、历史月收益率和耗时
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import funddb
+from va_simulation import (simulate_paths, draw_monthly_returns, run_monte_carlo,
+                           load_monthly_returns, profit_rates, simulate_fund_value_averaging)
+
+
+def _loop_path(current_holding, target_growth, returns, max_trade=None, allow_sell=True):
+    """simulate_period 的逐月规则（加上可选约束）"""
+    target_value = current_value = current_holding
+    total_invested = total_sold = 0
+    for r in returns:
+        target_value += target_growth
+        before = current_value * (1 + r / 100)
+        invest = target_value - before
+        if not allow_sell:
+            invest = max(invest, 0)
+        if max_trade is not None:
+            invest = min(max(invest, -max_trade), max_trade)
+        current_value = before + invest
+        if invest > 0:
+            total_invested += invest
+        else:
+            total_sold += -invest
+    return current_value, total_invested, total_sold
+
+
+def test_matches_loop():
+    returns = draw_monthly_returns(24, 50, 'normal', mean=1.0, std=6.0, seed=0)
+    for kwargs in ({}, {'allow_sell': False}, {'max_trade': 800.0}):
+        sim = simulate_paths(100000, 1000, returns, **kwargs)
+        for j in range(returns.shape[1]):
+            value, invested, sold = _loop_path(100000, 1000, returns[:, j], **kwargs)
+            assert np.isclose(sim['values'][-1, j], value)
+            assert np.isclose(sim['invested'][-1, j], invested)
+            assert np.isclose(sim['sold'][-1, j], sold)
+
+    # 无约束时每期都回到目标市值
+    sim = simulate_paths(100000, 1000, returns)
+    assert np.allclose(sim['values'], sim['targets'][:, None])
+    rate = profit_rates(100000, np.array([110000.0]), np.array([5000.0]))
+    assert np.isclose(rate[0], 5000 / 105000 * 100)
+    print("逐路径结果与逐月循环一致: 通过")
+
+
+def test_monte_carlo_summary():
+    history = np.array([3.0, -2.0, 5.0, 1.0, -4.0, 2.5, 0.5, -1.0, 6.0, -3.5, 1.5, 2.0])
+    boot = draw_monthly_returns(12, 1000, 'bootstrap', history=history, seed=1)
+    assert set(np.unique(boot)) <= set(history)
+
+    result = run_monte_carlo(100000, 1.0, months=12, n_paths=5000, model='bootstrap',
+                             history=history, allow_sell=False)
+    assert result['success'] and result['model'] == 'bootstrap'
+    final = result['final']
+    for name in ['total_invested', 'final_value', 'profit_rate']:
+        bands = [final[name][f'p{p}'] for p in (5, 25, 50, 75, 95)]
+        assert bands == sorted(bands)
+    assert len(result['bands']['value']['p50']) == 12
+    assert final['total_sold']['p95'] == 0
+
+    # 历史不足时退回正态模型；相同种子结果可复现
+    short = run_monte_carlo(100000, 1.0, history=history[:5], model='bootstrap')
+    assert short['model'] == 'normal'
+    assert short == {**run_monte_carlo(100000, 1.0, history=history[:5], model='bootstrap'),
+                     'elapsed_ms': short['elapsed_ms']}
+    assert not run_monte_carlo(100000, 1.0, model='garch')['success']
+
+    start = time.perf_counter()
+    run_monte_carlo(100000, 1.0, months=36, n_paths=10000, history=history)
+    print(f"  10000条路径×36个月耗时: {(time.perf_counter() - start) * 1000:.1f}ms")
+    print("蒙特卡洛分位数结果: 通过")
+
+
+def test_load_monthly_returns(temp_db):
+    rng = np.random.default_rng(3)
+    dates = pd.bdate_range('2023-01-02', periods=300)
+    navs = np.round(np.cumprod(1 + rng.normal(0.0005, 0.01, 300)), 4)
+    with funddb.get_db_connection() as conn:
+        conn.executemany("INSERT INTO fund_nav (fund_code, nav_date, unit_nav) VALUES ('000001', ?, ?)",
+                         [(d.strftime('%Y-%m-%d'), float(v)) for d, v in zip(dates, navs)])
+        conn.commit()
+
+    monthly = load_monthly_returns('000001')
+    df = pd.DataFrame({'净值日期': dates, '单位净值': navs})
+    df['月份'] = df['净值日期'].dt.to_period('M')
+    expected = df.groupby('月份')['单位净值'].agg(['first', 'last'])
+    assert np.allclose(monthly, (expected['last'] / expected['first'] - 1) * 100)
+    assert load_monthly_returns('999999').size == 0
+
+    # 指定的目标增长额透传给模拟
+    sim = simulate_fund_value_averaging('000001', 10000, 1.0, months=6, n_paths=200, target_growth=250)
+    assert sim['success'] and sim['target_growth'] == 250 and sim['final_target'] == 10000 + 6 * 250
+    print("历史月收益率: 通过")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
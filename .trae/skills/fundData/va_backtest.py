@@ -0,0 +1,320 @@
+"""
+市值定投历史回测模块
+在基金真实日净值上按月（或按周、每N个交易日）执行 calculate_value_averaging_v2 的目标市值规则，
+记录每一笔买入/卖出，并与同等资金的一次性买入、定额定投对比
+
+目标市值（v2口径的分段形式）：
+    目标市值_k = 初始市值 + Σ 初始市值 × 平均月收益率_j × (第j期天数 / 30)
+    平均月收益率_j 取第j期开始日所处市场阶段下该基金的历史平均月收益率（阶段无数据时取全部月份平均），
+    或由调用方统一指定
+    投入金额_k = 目标市值_k - 份额 × 当日净值（正为买入，负为卖出）
+
+说明：
+    阶段平均收益率与 calculate_value_averaging_v2 一样使用全部历史月份计算，回测结果含前视偏差，
+    适合比较规则本身的资金使用效率，而非预测收益
+
+对比基准（资金预算相同 = 市值定投的最大资金占用）：
+    一次性买入：期初投入全部预算
+    定额定投：期初投入初始金额，其余预算按期均分投入
+收益率以XIRR计，组合内全部基金、三种策略的现金流一次批量求解
+"""
+import sys
+import os
+import time
+from typing import List, Dict, Any, Optional, Union
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from market_phase import PhaseCalendar, get_phase_calendar
+from nav_panel import load_nav_panel
+from va_simulation import monthly_returns
+from xirr import xirr_batch, year_fractions
+
+
+# 默认回测年数（未指定开始日期时）
+DEFAULT_YEARS = 3
+
+# 默认初始投入金额
+DEFAULT_INITIAL_AMOUNT = 10000.0
+
+# 再平衡频率
+INTERVALS = ['month', 'week']
+
+
+def rebalance_points(dates: List[str], interval: Union[str, int] = 'month') -> np.ndarray:
+    """
+    确定再平衡交易日的下标（首个交易日为建仓日，必含）
+
+    Args:
+        dates: 按时间升序的交易日
+        interval: 'month' 每月首个交易日，'week' 每周首个交易日，整数N 每N个交易日
+    """
+    if isinstance(interval, (int, np.integer)):
+        return np.arange(0, len(dates), max(int(interval), 1))
+    days = np.array(dates, dtype='datetime64[D]')
+    if interval == 'week':
+        # 1970-01-01 为周四，偏移3天使周期从周一开始
+        keys = (days.astype(np.int64) + 3) // 7
+    else:
+        keys = days.astype('datetime64[M]').astype(np.int64)
+    return np.unique(keys, return_index=True)[1]
+
+
+def phase_rates(period_dates: List[str], month_labels: np.ndarray, month_returns: np.ndarray,
+                phases: Union[PhaseCalendar, Dict[str, tuple]]) -> np.ndarray:
+    """
+    各期适用的平均月收益率（%）
+
+    Args:
+        period_dates: 各期开始日期
+        month_labels / month_returns: 基金历史月份及月收益率（va_simulation.monthly_returns）
+        phases: 市场阶段日历，或 {阶段名: (开始月份, 结束月份)}
+    """
+    if not isinstance(phases, PhaseCalendar):
+        phases = PhaseCalendar.from_ranges(phases)
+    overall = float(np.mean(month_returns)) if month_returns.size else 0.0
+    history_phase = phases.month_phases(month_labels)
+    averages = {}
+    for name in set(phases.names):
+        selected = month_returns[history_phase == name]
+        averages[name] = float(selected.mean()) if selected.size else overall
+
+    period_phase = phases.phases_for(period_dates)
+    return np.array([averages.get(p, overall) for p in period_phase], dtype=np.float64)
+
+
+def run_va_backtest(navs: np.ndarray, days: np.ndarray, rates: np.ndarray,
+                    initial_amount: float = DEFAULT_INITIAL_AMOUNT,
+                    allow_sell: bool = True, max_trade: float = None) -> Dict[str, np.ndarray]:
+    """
+    在再平衡日序列上执行市值定投
+
+    Args:
+        navs: 各再平衡日净值，navs[0] 为建仓日
+        days: 各再平衡日距建仓日的天数
+        rates: 各期平均月收益率（%），len(navs) - 1 个
+        initial_amount: 建仓金额（即初始市值）
+        allow_sell: 是否允许卖出
+        max_trade: 单期买入/卖出金额上限
+
+    Returns:
+        {'targets', 'trades', 'shares', 'values'}，均为 len(navs) 的数组（第0期为建仓）
+    """
+    growth = initial_amount * rates / 100 * np.diff(days) / 30.0
+    targets = initial_amount + np.concatenate([[0.0], np.cumsum(growth)])
+
+    if allow_sell and max_trade is None:
+        # 无约束时每期都回到目标市值，可直接整体计算
+        shares = targets / navs
+        trades = np.empty_like(targets)
+        trades[0] = initial_amount
+        trades[1:] = targets[1:] - shares[:-1] * navs[1:]
+    else:
+        shares = np.empty_like(targets)
+        trades = np.empty_like(targets)
+        shares[0] = initial_amount / navs[0]
+        trades[0] = initial_amount
+        for k in range(1, navs.size):
+            trade = targets[k] - shares[k - 1] * navs[k]
+            if not allow_sell:
+                trade = max(trade, 0.0)
+            if max_trade is not None:
+                trade = min(max(trade, -max_trade), max_trade)
+            trades[k] = trade
+            shares[k] = shares[k - 1] + trade / navs[k]
+
+    return {'targets': targets, 'trades': trades, 'shares': shares, 'values': shares * navs}
+
+
+def _backtest_fund(dates: List[str], navs: np.ndarray, points: np.ndarray, rates: np.ndarray,
+                   initial_amount: float, allow_sell: bool, max_trade: Optional[float]) -> Dict[str, Any]:
+    """单只基金回测，返回明细和三种策略的现金流（供批量XIRR）"""
+    point_navs = navs[points]
+    point_dates = [dates[i] for i in points]
+    days = year_fractions(point_dates) * 365
+    sim = run_va_backtest(point_navs, days, rates, initial_amount, allow_sell, max_trade)
+
+    trades = sim['trades']
+    net_invested = np.cumsum(trades)
+    max_capital = float(net_invested.max())
+    final_nav = navs[-1]
+    final_value = float(sim['shares'][-1] * final_nav)
+    periods = points.size - 1
+
+    # 定额定投：其余预算按期均分
+    dca_amount = (max_capital - initial_amount) / periods if periods > 0 else 0.0
+    dca_trades = np.full(points.size, dca_amount)
+    dca_trades[0] = initial_amount
+    dca_value = float(np.sum(dca_trades / point_navs) * final_nav)
+    lump_value = max_capital / point_navs[0] * final_nav
+
+    flow_dates = point_dates + [dates[-1]]
+    return {
+        'records': [
+            {
+                'date': point_dates[k],
+                'nav': round(float(point_navs[k]), 4),
+                'target_value': round(float(sim['targets'][k]), 2),
+                'amount': round(float(trades[k]), 2),
+                'action': '建仓' if k == 0 else ('买入' if trades[k] > 0 else ('卖出' if trades[k] < 0 else '不操作')),
+                'shares': round(float(sim['shares'][k]), 2),
+                'rate': round(float(rates[k - 1]), 4) if k > 0 else None,
+            }
+            for k in range(points.size)
+        ],
+        'summary': {
+            'periods': periods,
+            'buy_count': int(np.sum(trades[1:] > 0)),
+            'sell_count': int(np.sum(trades[1:] < 0)),
+            'total_bought': round(float(trades[trades > 0].sum()), 2),
+            'total_sold': round(float(-trades[trades < 0].sum()), 2),
+            'net_invested': round(float(net_invested[-1]), 2),
+            'max_capital_deployed': round(max_capital, 2),
+            'final_value': round(final_value, 2),
+            'profit': round(final_value - float(net_invested[-1]), 2),
+        },
+        'lump_sum': {'capital': round(max_capital, 2), 'final_value': round(lump_value, 2),
+                     'profit': round(lump_value - max_capital, 2)},
+        'dca': {'capital': round(max_capital, 2), 'period_amount': round(dca_amount, 2),
+                'final_value': round(dca_value, 2), 'profit': round(dca_value - max_capital, 2)},
+        'flows': {
+            'va': (np.append(-trades, final_value), flow_dates),
+            'lump_sum': (np.array([-max_capital, lump_value]), [point_dates[0], dates[-1]]),
+            'dca': (np.append(-dca_trades, dca_value), flow_dates),
+        },
+    }
+
+
+def _attach_irr(results: List[Dict[str, Any]]):
+    """全部基金 × 三种策略的现金流补齐为矩阵后一次求XIRR"""
+    keys = [(r, name) for r in results for name in ('va', 'lump_sum', 'dca')]
+    if not keys:
+        return
+    width = max(r['flows'][name][0].size for r, name in keys)
+    amounts = np.zeros((len(keys), width))
+    years = np.zeros((len(keys), width))
+    for row, (r, name) in enumerate(keys):
+        flow, flow_dates = r['flows'][name]
+        amounts[row, :flow.size] = flow
+        years[row, :flow.size] = year_fractions(flow_dates)
+    irr = xirr_batch(amounts, years)
+    for row, (r, name) in enumerate(keys):
+        target = r['summary'] if name == 'va' else r[name]
+        target['irr'] = round(float(irr[row]) * 100, 2) if np.isfinite(irr[row]) else None
+    for r in results:
+        del r['flows']
+
+
+def backtest_value_averaging(fund_codes: List[str],
+                             start_date: str = None,
+                             end_date: str = None,
+                             interval: Union[str, int] = 'month',
+                             initial_amount: float = DEFAULT_INITIAL_AMOUNT,
+                             avg_monthly_return: float = None,
+                             phases: Union[PhaseCalendar, Dict[str, tuple]] = None,
+                             allow_sell: bool = True,
+                             max_trade: float = None,
+                             include_records: bool = True) -> Dict[str, Any]:
+    """
+    批量回测市值定投
+
+    Args:
+        fund_codes: 基金代码列表
+        start_date / end_date: 回测区间，未指定开始日期时取结束日前 DEFAULT_YEARS 年
+        interval: 再平衡频率，见 rebalance_points
+        initial_amount: 每只基金的建仓金额
+        avg_monthly_return: 统一的平均月收益率（%），None时按市场阶段取各基金历史平均
+        phases: 市场阶段日历或阶段划分，None时使用 market_phase.get_phase_calendar()
+        allow_sell / max_trade: 交易约束
+        include_records: 是否返回逐期明细
+
+    Returns:
+        {'success': True, 'funds': [{'fund_code', 'start_date', 'end_date', 'summary', 'lump_sum', 'dca',
+         'records'}], 'skipped': [...], 'elapsed_ms'}
+    """
+    if not isinstance(interval, (int, np.integer)) and interval not in INTERVALS:
+        return {'success': False, 'error': f'不支持的再平衡频率: {interval}'}
+    if initial_amount <= 0:
+        return {'success': False, 'error': '建仓金额必须大于0'}
+    if not fund_codes:
+        return {'success': False, 'error': '基金列表为空'}
+
+    start = time.perf_counter()
+    if avg_monthly_return is None and phases is None:
+        phases = get_phase_calendar()
+    elif phases is not None and not isinstance(phases, PhaseCalendar):
+        phases = PhaseCalendar.from_ranges(phases)
+
+    # 阶段平均收益率需要全部历史，一次读取全部净值后再按区间截取
+    panel = load_nav_panel(fund_codes, end_date=end_date)
+    results, skipped = [], []
+    for code in fund_codes:
+        column = panel.column(code) if code in panel.code_index else np.empty(0)
+        valid = ~np.isnan(column) & (column > 0)
+        if not valid.any():
+            skipped.append({'fund_code': code, 'reason': '无净值数据'})
+            continue
+        all_dates = [d for d, ok in zip(panel.dates, valid) if ok]
+        all_navs = column[valid]
+
+        window_start = start_date
+        if not window_start:
+            last = np.datetime64(all_dates[-1], 'D')
+            window_start = str(last - np.timedelta64(DEFAULT_YEARS * 365, 'D'))
+        lo = int(np.searchsorted(all_dates, window_start, side='left')) if window_start else 0
+        dates, navs = all_dates[lo:], all_navs[lo:]
+
+        points = rebalance_points(dates, interval)
+        if points.size < 2:
+            skipped.append({'fund_code': code, 'reason': '回测区间内净值不足两期'})
+            continue
+
+        period_starts = [dates[i] for i in points[:-1]]
+        if avg_monthly_return is not None:
+            rates = np.full(points.size - 1, float(avg_monthly_return))
+        else:
+            labels, returns = monthly_returns(all_dates, all_navs)
+            rates = phase_rates(period_starts, labels, returns, phases)
+
+        fund = _backtest_fund(dates, navs, points, rates, initial_amount, allow_sell, max_trade)
+        fund.update({'fund_code': code, 'start_date': dates[0], 'end_date': dates[-1]})
+        if not include_records:
+            del fund['records']
+        results.append(fund)
+
+    _attach_irr(results)
+    return {
+        'success': True,
+        'interval': interval,
+        'initial_amount': initial_amount,
+        'allow_sell': allow_sell,
+        'max_trade': max_trade,
+        'funds': results,
+        'skipped': skipped,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+def backtest_portfolio_value_averaging(portfolio_id: int, **kwargs) -> Dict[str, Any]:
+    """
+    回测组合内全部基金的市值定投（参数见 backtest_value_averaging）
+    """
+    with get_db_connection() as conn:
+        rows = conn.execute('''
+            SELECT fund_code, fund_name FROM portfolio_fund
+            WHERE portfolio_id = ?
+            ORDER BY fund_code
+        ''', (portfolio_id,)).fetchall()
+    if not rows:
+        return {'success': False, 'error': '组合不存在或没有成分基金'}
+
+    result = backtest_value_averaging([row['fund_code'] for row in rows], **kwargs)
+    if result.get('success'):
+        names = {row['fund_code']: row['fund_name'] for row in rows}
+        for fund in result['funds']:
+            fund['fund_name'] = names.get(fund['fund_code'])
+        result['portfolio_id'] = portfolio_id
+    return result
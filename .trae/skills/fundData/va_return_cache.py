@@ -0,0 +1,181 @@
+"""
+市值定投平均月收益率缓存模块
+按 (对象类型, 代码, 市场阶段) 缓存基金自身和沪深300/中证500参考基准的阶段平均月收益率，
+持久化在 va_return_cache 表中（进程重启、多个 uvicorn worker 之间共享），
+前面再加一层有上限的进程内 LRU
+
+有效性：
+    - TTL：基金 FUND_TTL_DAYS 天，指数基准 INDEX_TTL_DAYS 天
+    - 版本：CACHE_VERSION（计算口径变化时递增）+ 数据版本（阶段日历写入时间，
+      基金另加其月收益率最新的 nav_update_time），不一致即视为失效
+    - 阶段日历重新识别、基金月收益率重算时还会主动删除对应缓存
+"""
+import sys
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from nav_panel import SQL_IN_BATCH_SIZE
+
+
+# 计算口径版本，修改平均月收益率算法时递增使旧缓存失效
+CACHE_VERSION = 1
+
+SUBJECT_FUND = 'fund'
+SUBJECT_INDEX = 'index'
+
+FUND_TTL_DAYS = 30
+INDEX_TTL_DAYS = 365
+
+# 进程内缓存上限（按 对象×阶段 计）
+RETURN_CACHE_SIZE = 1024
+
+_TTL_DAYS = {SUBJECT_FUND: FUND_TTL_DAYS, SUBJECT_INDEX: INDEX_TTL_DAYS}
+
+_return_cache: 'OrderedDict[tuple, Dict[str, Any]]' = OrderedDict()
+
+
+def fund_data_version(fund_code: str, calendar, conn=None) -> str:
+    """基金缓存的数据版本：阶段日历写入时间 + 月收益率最新 nav_update_time"""
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return fund_data_version(fund_code, calendar, new_conn)
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(nav_update_time) FROM fund_monthly_return WHERE fund_code = ?", (fund_code,))
+    return f"{calendar.updated_at}|{cursor.fetchone()[0]}"
+
+
+def index_data_version(calendar) -> str:
+    """指数基准缓存的数据版本：阶段日历写入时间"""
+    return f"{calendar.updated_at}"
+
+
+def _is_valid(entry: Dict[str, Any], version: str) -> bool:
+    return (entry['cache_version'] == CACHE_VERSION
+            and entry['source_version'] == version
+            and entry['expires_at'] > datetime.now(timezone.utc))
+
+
+def get_cached_return(subject_type: str, code: str, market_phase: str, version: str) -> Optional[Dict[str, Any]]:
+    """
+    读取缓存的阶段平均月收益率
+
+    Returns:
+        {'avg_monthly_return', 'monthly_return_std', 'sample_months', 'data_start_date', 'data_end_date',
+         'update_time'}，无有效缓存时为None
+    """
+    key = (subject_type, code, market_phase)
+    entry = _return_cache.get(key)
+    if entry is not None and _is_valid(entry, version):
+        _return_cache.move_to_end(key)
+        return entry['data']
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT avg_monthly_return, monthly_return_std, sample_months, data_start_date, data_end_date,
+                   cache_version, source_version, update_time
+            FROM va_return_cache
+            WHERE subject_type = ? AND subject_code = ? AND market_phase = ?
+        ''', key)
+        row = cursor.fetchone()
+    if row is None:
+        _return_cache.pop(key, None)
+        return None
+
+    entry = _make_entry(subject_type, dict(row))
+    if not _is_valid(entry, version):
+        _return_cache.pop(key, None)
+        return None
+    _remember(key, entry)
+    return entry['data']
+
+
+def _make_entry(subject_type: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    # update_time 为UTC时间
+    update_time = datetime.strptime(row['update_time'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return {
+        'cache_version': row['cache_version'],
+        'source_version': row['source_version'],
+        'expires_at': update_time + timedelta(days=_TTL_DAYS[subject_type]),
+        'data': {
+            'avg_monthly_return': row['avg_monthly_return'],
+            'monthly_return_std': row['monthly_return_std'],
+            'sample_months': row['sample_months'],
+            'data_start_date': row['data_start_date'],
+            'data_end_date': row['data_end_date'],
+            'update_time': row['update_time'],
+        }
+    }
+
+
+def _remember(key: tuple, entry: Dict[str, Any]):
+    _return_cache[key] = entry
+    _return_cache.move_to_end(key)
+    while len(_return_cache) > RETURN_CACHE_SIZE:
+        _return_cache.popitem(last=False)
+
+
+def save_cached_return(subject_type: str, code: str, market_phase: str, version: str,
+                       avg_monthly_return: float, monthly_return_std: float = None,
+                       sample_months: int = None, data_start_date: str = None,
+                       data_end_date: str = None, subject_name: str = None):
+    """写入（覆盖）阶段平均月收益率缓存"""
+    update_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    row = {
+        'avg_monthly_return': avg_monthly_return,
+        'monthly_return_std': monthly_return_std,
+        'sample_months': sample_months,
+        'data_start_date': data_start_date,
+        'data_end_date': data_end_date,
+        'cache_version': CACHE_VERSION,
+        'source_version': version,
+        'update_time': update_time,
+    }
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO va_return_cache
+            (subject_type, subject_code, market_phase, subject_name, avg_monthly_return, monthly_return_std,
+             sample_months, data_start_date, data_end_date, cache_version, source_version, update_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (subject_type, code, market_phase, subject_name, avg_monthly_return, monthly_return_std,
+              sample_months, data_start_date, data_end_date, CACHE_VERSION, version, update_time))
+        conn.commit()
+    _remember((subject_type, code, market_phase), _make_entry(subject_type, row))
+
+
+def invalidate_returns(subject_type: str = None, codes: List[str] = None, conn=None):
+    """
+    删除缓存（进程内和持久化）
+
+    Args:
+        subject_type: 对象类型，None表示全部
+        codes: 代码列表，None表示该类型全部
+    """
+    for key in list(_return_cache):
+        if (subject_type is None or key[0] == subject_type) and (codes is None or key[1] in codes):
+            del _return_cache[key]
+
+    if conn is None:
+        with get_db_connection() as new_conn:
+            invalidate_returns(subject_type, codes, new_conn)
+            new_conn.commit()
+        return
+
+    cursor = conn.cursor()
+    if subject_type is None:
+        cursor.execute("DELETE FROM va_return_cache")
+    elif codes is None:
+        cursor.execute("DELETE FROM va_return_cache WHERE subject_type = ?", (subject_type,))
+    else:
+        codes = list(codes)
+        for i in range(0, len(codes), SQL_IN_BATCH_SIZE):
+            batch = codes[i:i + SQL_IN_BATCH_SIZE]
+            placeholders = ','.join(['?' for _ in batch])
+            cursor.execute(f"DELETE FROM va_return_cache WHERE subject_type = ? AND subject_code IN ({placeholders})",
+                           [subject_type] + batch)
@@ -0,0 +1,266 @@
+"""
+市值定投蒙特卡洛模拟模块
+一次模拟成千上万条收益路径（月数 × 路径数的NumPy数组），给出投入金额、期末市值和收益率的分位数区间，
+替代 ValueAveragingCalculator.simulate_period 固定随机种子的单条路径
+
+每期规则与 simulate_period 一致：
+    目标市值_t = 当前持仓 + 目标增长额 × t
+    投入前市值 = 上期市值 × (1 + 当月收益率)
+    投入金额 = 目标市值_t - 投入前市值（正为买入，负为卖出）
+可选约束：单期买入/卖出上限（max_trade）、不允许卖出（allow_sell=False），
+受约束时期末市值不再等于目标市值，各路径结果因此不同
+
+收益率模型：
+    normal    - 正态分布 N(平均月收益率, 月收益率标准差)
+    bootstrap - 从基金历史月收益率中有放回抽样（保留真实分布的偏度和厚尾）
+"""
+import sys
+import os
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from funddb import get_db_connection
+from risk_metrics_calculator import load_nav_arrays
+
+
+# 默认模拟路径数
+DEFAULT_PATHS = 2000
+
+# 月收益率标准差缺省值（%），与 simulate_period 一致
+DEFAULT_MONTHLY_STD = 6.0
+
+# bootstrap至少需要的历史月数，不足时退回正态模型
+MIN_BOOTSTRAP_MONTHS = 12
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+RETURN_MODELS = ['normal', 'bootstrap']
+
+
+def load_monthly_returns(fund_code: str, years: int = 5, conn=None) -> np.ndarray:
+    """
+    从本地净值计算历史月收益率（%）
+
+    口径与 ValueAveragingCalculator.calculate_monthly_returns_from_nav 一致：月末净值 / 月初净值 - 1
+
+    Returns:
+        按月份升序的月收益率数组，无数据时为空数组
+    """
+    if conn is None:
+        with get_db_connection() as new_conn:
+            return load_monthly_returns(fund_code, years, new_conn)
+
+    dates, navs = load_nav_arrays(conn.cursor(), fund_code, limit=years * 252)
+    return monthly_returns(dates, navs)[1]
+
+
+def monthly_returns(dates: List[str], navs: np.ndarray) -> tuple:
+    """
+    由按日期升序的净值计算月收益率（%）：月末净值 / 月初净值 - 1
+
+    Returns:
+        (月份数组 'YYYY-MM', 月收益率数组)，有效净值不足2条时均为空
+    """
+    valid = ~np.isnan(navs) & (navs > 0)
+    if valid.sum() < 2:
+        return np.empty(0, dtype=str), np.empty(0, dtype=np.float64)
+
+    months = np.array([d[:7] for d in dates], dtype=str)[valid]
+    navs = navs[valid]
+    # 日期升序，每月首条和末条即月初/月末净值
+    labels, first = np.unique(months, return_index=True)
+    last = np.append(first[1:] - 1, months.size - 1)
+    return labels, (navs[last] / navs[first] - 1) * 100
+
+
+def draw_monthly_returns(months: int,
+                         n_paths: int,
+                         model: str = 'normal',
+                         mean: float = 0.0,
+                         std: float = DEFAULT_MONTHLY_STD,
+                         history: np.ndarray = None,
+                         seed: Optional[int] = 42) -> np.ndarray:
+    """
+    生成月收益率矩阵（%），shape=(months, n_paths)
+
+    Args:
+        model: 'normal' 或 'bootstrap'（需要history）
+        mean / std: 正态模型参数（%）
+        history: bootstrap抽样的历史月收益率（%）
+        seed: 随机种子，None表示不固定
+    """
+    rng = np.random.default_rng(seed)
+    if model == 'bootstrap':
+        history = np.asarray(history, dtype=np.float64)
+        return history[rng.integers(0, history.size, size=(months, n_paths))]
+    return rng.normal(mean, std, size=(months, n_paths))
+
+
+def simulate_paths(current_holding: float,
+                   target_growth: float,
+                   returns: np.ndarray,
+                   max_trade: float = None,
+                   allow_sell: bool = True) -> Dict[str, np.ndarray]:
+    """
+    在收益率矩阵上同时推演全部路径
+
+    Args:
+        current_holding: 当前持仓市值
+        target_growth: 每期目标市值增长额
+        returns: 月收益率矩阵（%），shape=(months, n_paths)
+        max_trade: 单期买入/卖出金额上限，None表示不限
+        allow_sell: 是否允许卖出
+
+    Returns:
+        values / invested / sold: 各期末市值、累计买入、累计卖出，shape=(months, n_paths)
+        targets: 各期目标市值，shape=(months,)
+    """
+    months, n_paths = returns.shape
+    targets = current_holding + target_growth * np.arange(1, months + 1)
+    growth = 1 + returns / 100
+
+    values = np.empty((months, n_paths))
+    trades = np.empty((months, n_paths))
+    value = np.full(n_paths, float(current_holding))
+    # 只对月份循环，每期对全部路径向量化
+    for t in range(months):
+        before = value * growth[t]
+        trade = targets[t] - before
+        if not allow_sell:
+            np.maximum(trade, 0.0, out=trade)
+        if max_trade is not None:
+            np.clip(trade, -max_trade, max_trade, out=trade)
+        value = before + trade
+        values[t] = value
+        trades[t] = trade
+
+    return {
+        'targets': targets,
+        'values': values,
+        'invested': np.cumsum(np.maximum(trades, 0.0), axis=0),
+        'sold': np.cumsum(np.maximum(-trades, 0.0), axis=0),
+    }
+
+
+def _bands(values: np.ndarray, axis: int = -1) -> Dict[str, Any]:
+    q = np.percentile(values, PERCENTILES, axis=axis)
+    return {f"p{p}": np.round(q[i], 2).tolist() for i, p in enumerate(PERCENTILES)}
+
+
+def profit_rates(current_holding: float, final_value: np.ndarray, net_invested: np.ndarray) -> np.ndarray:
+    """累计收益率（%），口径与 simulate_period 一致：(期末市值 - 持仓 - 净投入) / (持仓 + max(净投入, 0))"""
+    base = current_holding + np.maximum(net_invested, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(base > 0, (final_value - current_holding - net_invested) / base * 100, np.nan)
+
+
+def run_monte_carlo(current_holding: float,
+                    avg_monthly_return: float,
+                    target_growth: float = None,
+                    months: int = 12,
+                    n_paths: int = DEFAULT_PATHS,
+                    model: str = 'bootstrap',
+                    history: np.ndarray = None,
+                    std: float = None,
+                    max_trade: float = None,
+                    allow_sell: bool = True,
+                    seed: Optional[int] = 42) -> Dict[str, Any]:
+    """
+    市值定投蒙特卡洛模拟
+
+    Args:
+        current_holding: 当前持仓市值
+        avg_monthly_return: 平均月收益率（%），正态模型的均值，也用于缺省的目标增长额
+        target_growth: 每期目标增长额，None表示 当前持仓 × 平均月收益率
+        months: 模拟月数
+        n_paths: 路径数
+        model: 'bootstrap'（历史月收益率不足时退回 'normal'）或 'normal'
+        history: 历史月收益率（%）
+        std: 正态模型标准差（%），None时取历史标准差，无历史时为 DEFAULT_MONTHLY_STD
+        max_trade: 单期买入/卖出金额上限
+        allow_sell: 是否允许卖出
+        seed: 随机种子
+
+    Returns:
+        {'success': True, 'model', 'paths', 'months', 'target_growth',
+         'final': {各指标的分位数}, 'bands': {逐月分位数}, 'probability_of_loss', 'elapsed_ms'}
+    """
+    if model not in RETURN_MODELS:
+        return {'success': False, 'error': f'不支持的收益率模型: {model}'}
+    if months < 1 or n_paths < 1:
+        return {'success': False, 'error': '模拟月数和路径数必须大于0'}
+
+    start = time.perf_counter()
+    history = np.asarray(history if history is not None else [], dtype=np.float64)
+    history = history[~np.isnan(history)]
+    if model == 'bootstrap' and history.size < MIN_BOOTSTRAP_MONTHS:
+        model = 'normal'
+    if std is None:
+        std = float(np.std(history, ddof=1)) if history.size >= 2 else DEFAULT_MONTHLY_STD
+    if target_growth is None:
+        target_growth = current_holding * avg_monthly_return / 100
+
+    returns = draw_monthly_returns(months, n_paths, model, avg_monthly_return, std, history, seed)
+    sim = simulate_paths(current_holding, target_growth, returns, max_trade, allow_sell)
+
+    final_value = sim['values'][-1]
+    invested = sim['invested'][-1]
+    sold = sim['sold'][-1]
+    net_invested = invested - sold
+    rates = profit_rates(current_holding, final_value, net_invested)
+
+    return {
+        'success': True,
+        'model': model,
+        'paths': n_paths,
+        'months': months,
+        'history_months': int(history.size),
+        'monthly_mean': round(float(returns.mean()), 4),
+        'monthly_std': round(float(std), 4),
+        'target_growth': round(float(target_growth), 2),
+        'final_target': round(float(sim['targets'][-1]), 2),
+        'final': {
+            'total_invested': _bands(invested),
+            'total_sold': _bands(sold),
+            'net_invested': _bands(net_invested),
+            'final_value': _bands(final_value),
+            'profit_rate': _bands(rates[~np.isnan(rates)]) if np.any(~np.isnan(rates)) else None,
+        },
+        'bands': {
+            'month': list(range(1, months + 1)),
+            'value': _bands(sim['values'], axis=1),
+            'net_invested': _bands(sim['invested'] - sim['sold'], axis=1),
+        },
+        'probability_of_loss': round(float(np.mean(rates < 0)) * 100, 2),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+def simulate_fund_value_averaging(fund_code: str,
+                                  current_holding: float,
+                                  avg_monthly_return: float,
+                                  months: int = 12,
+                                  n_paths: int = DEFAULT_PATHS,
+                                  model: str = 'bootstrap',
+                                  years: int = 5,
+                                  **kwargs) -> Dict[str, Any]:
+    """
+    按基金本地历史月收益率做市值定投蒙特卡洛模拟
+
+    Args:
+        fund_code: 基金代码
+        current_holding: 当前持仓市值
+        avg_monthly_return: 平均月收益率（%）
+        months / n_paths / model: 见 run_monte_carlo
+        years: 历史月收益率回看年数
+        **kwargs: 透传给 run_monte_carlo（target_growth, max_trade, allow_sell, std, seed）
+    """
+    history = load_monthly_returns(fund_code, years)
+    result = run_monte_carlo(current_holding, avg_monthly_return, months=months, n_paths=n_paths,
+                             model=model, history=history, **kwargs)
+    result['fund_code'] = fund_code
+    return result
@@ -16,9 +16,9 @@
 
 新鲜度算法：
 - 指数参考基准有效期：1年
-- 每次计算前先确认当前市场阶段
-- 如果市场阶段变化，重新计算参考基准
-- 如果市场阶段未变化且数据在有效期内，使用缓存数据
+- 当前市场阶段取自阶段日历（market_phase 模块由沪深300行情自动识别）
+- 阶段日历重新识别后，重新计算参考基准
+- 如果市场阶段未变化且数据在有效期内，使用缓存数据（va_return_cache 表 + 进程内LRU，多进程共享）
 """
 
 import akshare as ak
@@ -31,17 +31,13 @@ import sys
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from funddb import get_db_connection
+from market_phase import PhaseCalendar, get_phase_calendar, DEFAULT_PHASE_RANGES, DEFAULT_CURRENT_PHASE
+from va_return_cache import (get_cached_return, save_cached_return, fund_data_version, index_data_version,
+                             SUBJECT_FUND, SUBJECT_INDEX)
 
 
-MARKET_PHASES = {
-    "牛市尾声": ("2021-01", "2021-02"),
-    "熊市": ("2021-03", "2023-12"),
-    "牛市": ("2024-01", "2025-12")
-}
-
-CURRENT_PHASE = "牛市"
-
-BENCHMARK_VALIDITY_DAYS = 365
+# 阶段日历为空时的默认划分（实际划分见 market_phase.get_phase_calendar）
+MARKET_PHASES = DEFAULT_PHASE_RANGES
 
 
 class ValueAveragingCalculator:
@@ -51,9 +47,6 @@ class ValueAveragingCalculator:
     提供目标市值增长额计算、定投模拟等功能
     """
     
-    # 类级别缓存：基金平均月收益率
-    _fund_return_cache = {}
-    
     def __init__(self):
         self.hs300_code = "510300"
         self.zz500_code = "510500"
@@ -61,94 +54,46 @@ class ValueAveragingCalculator:
     
     def _get_cached_fund_return(self, fund_code: str, market_phase: str) -> tuple:
         """
-        获取缓存的基金平均月收益率
+        获取缓存的基金平均月收益率（va_return_cache，有效期30天，阶段日历或月收益率变化即失效）
         
         Returns:
             (avg_return, is_fresh): 平均月收益率和是否新鲜
         """
-        cache_key = f"{fund_code}_{market_phase}"
-        if cache_key in self._fund_return_cache:
-            cached = self._fund_return_cache[cache_key]
-            # 缓存有效期：30天
-            days_since_cache = (datetime.now() - cached['cache_time']).days
-            if days_since_cache <= 30:
-                return cached['avg_return'], True
+        try:
+            version = fund_data_version(fund_code, self.phase_calendar)
+            cached = get_cached_return(SUBJECT_FUND, fund_code, market_phase, version)
+            if cached is not None:
+                return cached['avg_monthly_return'], True
+        except Exception as e:
+            print(f"[ValueAveraging] 获取缓存收益率失败: {e}")
         return None, False
     
-    def _cache_fund_return(self, fund_code: str, market_phase: str, avg_return: float):
+    def _cache_fund_return(self, fund_code: str, market_phase: str, avg_return: float,
+                           std_return: float = None, sample_months: int = None):
         """缓存基金平均月收益率"""
-        cache_key = f"{fund_code}_{market_phase}"
-        self._fund_return_cache[cache_key] = {
-            'avg_return': avg_return,
-            'cache_time': datetime.now()
-        }
-    
-    def _init_market_phase(self):
-        """初始化市场阶段"""
-        current_phase = self._get_current_market_phase()
-        if current_phase:
-            global CURRENT_PHASE
-            CURRENT_PHASE = current_phase
-    
-    def _get_current_market_phase(self) -> str:
-        """从数据库获取当前市场阶段"""
         try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT phase_name FROM market_phase_record
-                    WHERE is_current = 1
-                    ORDER BY update_time DESC
-                    LIMIT 1
-                ''')
-                row = cursor.fetchone()
-                if row:
-                    return row['phase_name']
-        except:
-            pass
-        return CURRENT_PHASE
+            version = fund_data_version(fund_code, self.phase_calendar)
+            save_cached_return(SUBJECT_FUND, fund_code, market_phase, version, avg_return,
+                               std_return, sample_months)
+        except Exception as e:
+            print(f"[ValueAveraging] 保存缓存收益率失败: {e}")
     
-    def _save_market_phase(self, phase_name: str, start_date: str, end_date: str = None):
-        """保存市场阶段到数据库"""
+    def _init_market_phase(self):
+        """加载阶段日历并确定当前市场阶段"""
         try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('UPDATE market_phase_record SET is_current = 0')
-                cursor.execute('''
-                    INSERT OR REPLACE INTO market_phase_record
-                    (phase_name, start_date, end_date, is_current, confirmed_date, update_time)
-                    VALUES (?, ?, ?, 1, date('now'), datetime('now'))
-                ''', (phase_name, start_date, end_date))
-                conn.commit()
+            self.phase_calendar = get_phase_calendar()
         except Exception as e:
-            print(f"[ValueAveraging] 保存市场阶段失败: {e}")
+            print(f"[ValueAveraging] 加载阶段日历失败: {e}")
+            self.phase_calendar = PhaseCalendar.from_ranges(DEFAULT_PHASE_RANGES, DEFAULT_CURRENT_PHASE)
+        self.current_phase = self.phase_calendar.current or DEFAULT_CURRENT_PHASE
     
     def _get_cached_benchmark(self, index_code: str, market_phase: str) -> dict:
-        """获取缓存的指数参考基准"""
+        """获取缓存的指数参考基准（va_return_cache，有效期1年，阶段日历重新识别即失效）"""
         try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT avg_monthly_return, monthly_return_std, sample_months,
-                           update_time, data_start_date, data_end_date
-                    FROM index_benchmark
-                    WHERE index_code = ? AND market_phase = ?
-                ''', (index_code, market_phase))
-                
-                row = cursor.fetchone()
-                if row:
-                    update_time = datetime.strptime(row['update_time'], '%Y-%m-%d %H:%M:%S')
-                    days_since_update = (datetime.now() - update_time).days
-                    
-                    return {
-                        'avg_monthly_return': row['avg_monthly_return'],
-                        'monthly_return_std': row['monthly_return_std'],
-                        'sample_months': row['sample_months'],
-                        'data_start_date': row['data_start_date'],
-                        'data_end_date': row['data_end_date'],
-                        'is_fresh': days_since_update <= BENCHMARK_VALIDITY_DAYS,
-                        'days_since_update': days_since_update
-                    }
+            cached = get_cached_return(SUBJECT_INDEX, index_code, market_phase,
+                                       index_data_version(self.phase_calendar))
+            if cached is not None:
+                return {**cached, 'is_fresh': True}
         except Exception as e:
             print(f"[ValueAveraging] 获取缓存基准失败: {e}")
         
@@ -157,39 +102,14 @@ class ValueAveragingCalculator:
     def _save_benchmark(self, index_code: str, index_name: str, market_phase: str,
                         avg_return: float, std_return: float, sample_months: int,
                         start_date: str, end_date: str):
-        """保存指数参考基准到数据库"""
+        """保存指数参考基准到缓存"""
         try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO index_benchmark
-                    (index_code, index_name, market_phase, avg_monthly_return, 
-                     monthly_return_std, sample_months, data_start_date, data_end_date, update_time)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-                ''', (index_code, index_name, market_phase, avg_return, 
-                      std_return, sample_months, start_date, end_date))
-                conn.commit()
+            save_cached_return(SUBJECT_INDEX, index_code, market_phase,
+                               index_data_version(self.phase_calendar), avg_return, std_return,
+                               sample_months, start_date, end_date, subject_name=index_name)
         except Exception as e:
             print(f"[ValueAveraging] 保存基准失败: {e}")
     
-    def _check_market_phase_changed(self) -> bool:
-        """检查市场阶段是否发生变化"""
-        try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT phase_name, update_time FROM market_phase_record
-                    WHERE is_current = 1
-                    ORDER BY update_time DESC
-                    LIMIT 1
-                ''')
-                row = cursor.fetchone()
-                if row:
-                    return row['phase_name'] != CURRENT_PHASE
-        except:
-            pass
-        return True
-    
     def get_fund_info(self, fund_code: str) -> dict:
         """
         获取基金基本信息，包括成立日期（从本地数据库查询）
@@ -301,10 +221,48 @@ class ValueAveragingCalculator:
         
         return latest.strftime('%Y-%m-%d')
     
+    def _is_index_stale(self, index_code: str, max_age_hours: int = 12) -> bool:
+        """
+        检查本地指数/ETF行情是否过期（最新日期早于最近工作日，且距上次同步超过max_age_hours）
+        """
+        try:
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT MAX(trade_date) as latest_date, MAX(update_time) as update_time
+                    FROM index_price
+                    WHERE index_code = ?
+                ''', (index_code,))
+                row = cursor.fetchone()
+                if not row or not row['latest_date']:
+                    return True
+                if row['latest_date'] >= self._get_latest_workday():
+                    return False
+                if row['update_time']:
+                    update_dt = datetime.strptime(row['update_time'], '%Y-%m-%d %H:%M:%S')
+                    return datetime.now() - update_dt > timedelta(hours=max_age_hours)
+                return True
+        except Exception as e:
+            print(f"[ValueAveraging] 检查指数行情新鲜度失败: {e}")
+            return True
+    
     def get_etf_history(self, etf_code: str, years: int = 3) -> pd.DataFrame:
         """
-        获取ETF历史行情数据
+        获取ETF历史行情数据（优先读取本地index_price，过期时增量同步，失败时直接从AKShare获取）
         """
+        try:
+            if self._is_index_stale(etf_code):
+                from syncers import sync_index_price
+                sync_index_price([etf_code])
+            
+            from benchmark_regression import load_index_prices
+            start_date = (datetime.now() - timedelta(days=years * 365)).strftime("%Y-%m-%d")
+            dates, closes = load_index_prices(etf_code, start_date=start_date)
+            if dates.size:
+                return pd.DataFrame({'日期': pd.to_datetime(dates), '收盘': closes})
+        except Exception as e:
+            print(f"[ValueAveraging] 读取本地ETF行情失败: {e}")
+        
         try:
             end_date = datetime.now().strftime("%Y%m%d")
             start_date = (datetime.now() - timedelta(days=years * 365)).strftime("%Y%m%d")
@@ -357,29 +315,46 @@ class ValueAveragingCalculator:
     
     def analyze_by_market_phase(self, monthly_df: pd.DataFrame) -> dict:
         """
-        按牛熊市阶段分析收益率
+        按牛熊市阶段分析收益率（月份按阶段日历归类）
         """
         results = {}
-        
-        for phase_name, (start, end) in MARKET_PHASES.items():
-            phase_df = monthly_df[
-                (monthly_df['月份'] >= start) & 
-                (monthly_df['月份'] <= end)
-            ]
-            
-            if len(phase_df) > 0:
-                avg_return = phase_df['月收益率'].mean()
-                std_return = phase_df['月收益率'].std()
-                count = len(phase_df)
-                
-                results[phase_name] = {
-                    "月数": count,
-                    "平均月收益率": avg_return,
-                    "月收益率标准差": std_return
-                }
+        if monthly_df is None or len(monthly_df) == 0:
+            return results
+        
+        phases = self.phase_calendar.month_phases(monthly_df['月份'].astype(str).tolist())
+        grouped = monthly_df['月收益率'].groupby(phases)
+        for phase_name, phase_returns in grouped:
+            if not phase_name:
+                continue
+            results[phase_name] = {
+                "月数": len(phase_returns),
+                "平均月收益率": phase_returns.mean(),
+                "月收益率标准差": phase_returns.std()
+            }
         
         return results
     
+    def get_fund_phase_stats(self, fund_code: str, years: int = 5, refresh: bool = False) -> dict:
+        """
+        基金近N年按市场阶段的月收益率统计（读取预先汇总的 fund_monthly_return）
+        
+        Args:
+            refresh: 是否先检查净值新鲜度，过期时同步净值（同步后增量更新月收益率）
+        
+        Returns:
+            {'phases': {阶段名: {'月数', '平均月收益率', '月收益率标准差'}}, 'overall', 'months'}，无数据时为None
+        """
+        if refresh and self._is_nav_stale(fund_code):
+            print(f"[ValueAveraging] 基金 {fund_code} 净值数据过期，正在更新...")
+            from fund_data_skill import FundDataSkill
+            FundDataSkill().sync_group_nav([fund_code])
+        try:
+            from monthly_return import get_fund_phase_stats
+            return get_fund_phase_stats(fund_code, self.phase_calendar, years)
+        except Exception as e:
+            print(f"[ValueAveraging] 读取月收益率失败: {e}")
+            return None
+    
     def calculate_target_growth(self, fund_code: str, current_holding: float) -> dict:
         """
         计算目标市值增长额
@@ -396,7 +371,7 @@ class ValueAveragingCalculator:
             "current_holding": current_holding,
             "calculation_method": "",
             "reference_source": "",
-            "market_phase": CURRENT_PHASE,
+            "market_phase": self.current_phase,
             "avg_monthly_return": 0,
             "target_growth": 0,
             "algorithm_details": []
@@ -425,23 +400,22 @@ class ValueAveragingCalculator:
             result["calculation_method"] = "基金自身历史数据"
             result["reference_source"] = f"基金{fund_code}历史净值（近5年）"
             
-            nav_df = self.get_fund_nav_history(fund_code, years=5)
-            if nav_df is None or len(nav_df) == 0:
+            stats = self.get_fund_phase_stats(fund_code, years=5, refresh=True)
+            if stats is None:
                 result["error"] = "无法获取基金净值数据"
                 return result
             
-            monthly_df = self.calculate_monthly_returns_from_nav(nav_df)
-            market_phases = self.analyze_by_market_phase(monthly_df)
+            market_phases = stats['phases']
             
             result["market_phases"] = market_phases
             
-            if CURRENT_PHASE in market_phases:
-                avg_monthly_return = market_phases[CURRENT_PHASE]['平均月收益率']
-                result["algorithm_details"].append(f"当前市场阶段: {CURRENT_PHASE}")
+            if self.current_phase in market_phases:
+                avg_monthly_return = market_phases[self.current_phase]['平均月收益率']
+                result["algorithm_details"].append(f"当前市场阶段: {self.current_phase}")
                 result["algorithm_details"].append(f"该阶段历史平均月收益率: {avg_monthly_return:.2f}%")
-                result["algorithm_details"].append(f"该阶段历史月收益率标准差: {market_phases[CURRENT_PHASE]['月收益率标准差']:.2f}%")
+                result["algorithm_details"].append(f"该阶段历史月收益率标准差: {market_phases[self.current_phase]['月收益率标准差']:.2f}%")
             else:
-                avg_monthly_return = monthly_df['月收益率'].mean()
+                avg_monthly_return = stats['overall']
                 result["algorithm_details"].append(f"使用全部历史平均月收益率: {avg_monthly_return:.2f}%")
             
             result["avg_monthly_return"] = avg_monthly_return
@@ -449,15 +423,12 @@ class ValueAveragingCalculator:
         else:
             result["calculation_method"] = "指数参考基准（按市场阶段）"
             result["algorithm_details"].append(f"基金成立年限({fund_age_years:.1f}年)不足5年，使用沪深300/中证500作为参考基准")
-            result["algorithm_details"].append(f"当前市场阶段: {CURRENT_PHASE}")
+            result["algorithm_details"].append(f"当前市场阶段: {self.current_phase}")
             
-            phase_changed = self._check_market_phase_changed()
+            hs300_cached = self._get_cached_benchmark(self.hs300_code, self.current_phase)
+            zz500_cached = self._get_cached_benchmark(self.zz500_code, self.current_phase)
             
-            hs300_cached = self._get_cached_benchmark(self.hs300_code, CURRENT_PHASE)
-            zz500_cached = self._get_cached_benchmark(self.zz500_code, CURRENT_PHASE)
-            
-            use_cache = (not phase_changed and 
-                        hs300_cached.get('is_fresh', False) and 
+            use_cache = (hs300_cached.get('is_fresh', False) and 
                         zz500_cached.get('is_fresh', False))
             
             if use_cache:
@@ -465,11 +436,11 @@ class ValueAveragingCalculator:
                 hs300_phase_return = hs300_cached['avg_monthly_return']
                 zz500_phase_return = zz500_cached['avg_monthly_return']
                 
-                result["algorithm_details"].append(f"沪深300ETF在{CURRENT_PHASE}阶段平均月收益率: {hs300_phase_return:.2f}% (缓存)")
-                result["algorithm_details"].append(f"中证500ETF在{CURRENT_PHASE}阶段平均月收益率: {zz500_phase_return:.2f}% (缓存)")
+                result["algorithm_details"].append(f"沪深300ETF在{self.current_phase}阶段平均月收益率: {hs300_phase_return:.2f}% (缓存)")
+                result["algorithm_details"].append(f"中证500ETF在{self.current_phase}阶段平均月收益率: {zz500_phase_return:.2f}% (缓存)")
                 
                 avg_monthly_return = (hs300_phase_return + zz500_phase_return) / 2
-                result["reference_source"] = f"沪深300ETF在{CURRENT_PHASE}阶段月收益率 {hs300_phase_return:.2f}% + 中证500ETF在{CURRENT_PHASE}阶段月收益率 {zz500_phase_return:.2f}% (缓存)"
+                result["reference_source"] = f"沪深300ETF在{self.current_phase}阶段月收益率 {hs300_phase_return:.2f}% + 中证500ETF在{self.current_phase}阶段月收益率 {zz500_phase_return:.2f}% (缓存)"
                 result["from_cache"] = True
             else:
                 result["algorithm_details"].append(f"重新计算参考基准（市场阶段变化或数据过期）")
@@ -486,41 +457,39 @@ class ValueAveragingCalculator:
                 result["hs300_phases"] = hs300_phases
                 result["zz500_phases"] = zz500_phases
                 
-                if CURRENT_PHASE in hs300_phases and CURRENT_PHASE in zz500_phases:
-                    hs300_phase_return = hs300_phases[CURRENT_PHASE]['平均月收益率']
-                    hs300_phase_std = hs300_phases[CURRENT_PHASE]['月收益率标准差']
-                    hs300_months = hs300_phases[CURRENT_PHASE]['月数']
+                if self.current_phase in hs300_phases and self.current_phase in zz500_phases:
+                    hs300_phase_return = hs300_phases[self.current_phase]['平均月收益率']
+                    hs300_phase_std = hs300_phases[self.current_phase]['月收益率标准差']
+                    hs300_months = hs300_phases[self.current_phase]['月数']
                     
-                    zz500_phase_return = zz500_phases[CURRENT_PHASE]['平均月收益率']
-                    zz500_phase_std = zz500_phases[CURRENT_PHASE]['月收益率标准差']
-                    zz500_months = zz500_phases[CURRENT_PHASE]['月数']
+                    zz500_phase_return = zz500_phases[self.current_phase]['平均月收益率']
+                    zz500_phase_std = zz500_phases[self.current_phase]['月收益率标准差']
+                    zz500_months = zz500_phases[self.current_phase]['月数']
                     
-                    phase_dates = MARKET_PHASES.get(CURRENT_PHASE, ("", ""))
+                    phase_dates = self.phase_calendar.span(self.current_phase)
                     
                     self._save_benchmark(
-                        self.hs300_code, "沪深300ETF", CURRENT_PHASE,
+                        self.hs300_code, "沪深300ETF", self.current_phase,
                         hs300_phase_return, hs300_phase_std, hs300_months,
                         phase_dates[0], phase_dates[1]
                     )
                     self._save_benchmark(
-                        self.zz500_code, "中证500ETF", CURRENT_PHASE,
+                        self.zz500_code, "中证500ETF", self.current_phase,
                         zz500_phase_return, zz500_phase_std, zz500_months,
                         phase_dates[0], phase_dates[1]
                     )
                     
-                    self._save_market_phase(CURRENT_PHASE, phase_dates[0], phase_dates[1])
-                    
-                    result["algorithm_details"].append(f"沪深300ETF在{CURRENT_PHASE}阶段平均月收益率: {hs300_phase_return:.2f}%")
-                    result["algorithm_details"].append(f"中证500ETF在{CURRENT_PHASE}阶段平均月收益率: {zz500_phase_return:.2f}%")
+                    result["algorithm_details"].append(f"沪深300ETF在{self.current_phase}阶段平均月收益率: {hs300_phase_return:.2f}%")
+                    result["algorithm_details"].append(f"中证500ETF在{self.current_phase}阶段平均月收益率: {zz500_phase_return:.2f}%")
                     
                     avg_monthly_return = (hs300_phase_return + zz500_phase_return) / 2
-                    result["reference_source"] = f"沪深300ETF在{CURRENT_PHASE}阶段月收益率 {hs300_phase_return:.2f}% + 中证500ETF在{CURRENT_PHASE}阶段月收益率 {zz500_phase_return:.2f}%"
+                    result["reference_source"] = f"沪深300ETF在{self.current_phase}阶段月收益率 {hs300_phase_return:.2f}% + 中证500ETF在{self.current_phase}阶段月收益率 {zz500_phase_return:.2f}%"
                 else:
                     hs300_avg = hs300_monthly['月收益率'].mean()
                     zz500_avg = zz500_monthly['月收益率'].mean()
                     avg_monthly_return = (hs300_avg + zz500_avg) / 2
                     result["reference_source"] = f"沪深300ETF近5年平均月收益率 {hs300_avg:.2f}% + 中证500ETF近5年平均月收益率 {zz500_avg:.2f}%"
-                    result["algorithm_details"].append(f"未找到{CURRENT_PHASE}阶段数据，使用近5年平均值")
+                    result["algorithm_details"].append(f"未找到{self.current_phase}阶段数据，使用近5年平均值")
                 
                 result["from_cache"] = False
             
@@ -646,7 +615,35 @@ class ValueAveragingCalculator:
             growth_result["simulation"]["profit_rate"] = round(profit_rate, 2)
         
         return growth_result
-    
+
+    def simulate_paths(self, fund_code: str, current_holding: float, months: int = 12,
+                       n_paths: int = 2000, model: str = "bootstrap", **kwargs) -> dict:
+        """
+        多路径蒙特卡洛模拟定投过程（见 va_simulation.run_monte_carlo）
+
+        Args:
+            fund_code: 基金代码
+            current_holding: 当前持仓市值
+            months: 模拟月数
+            n_paths: 模拟路径数
+            model: 收益率模型，'bootstrap'（历史月收益率抽样）或 'normal'
+
+        Returns:
+            目标增长额计算结果，附带 monte_carlo 分位数结果
+        """
+        from va_simulation import simulate_fund_value_averaging
+
+        growth_result = self.calculate_target_growth(fund_code, current_holding)
+
+        if "error" in growth_result:
+            return growth_result
+
+        growth_result["monte_carlo"] = simulate_fund_value_averaging(
+            fund_code, current_holding, growth_result["avg_monthly_return"],
+            months=months, n_paths=n_paths, model=model, **kwargs
+        )
+        return growth_result
+
     def format_report(self, result: dict) -> str:
         """
         格式化输出报告
@@ -794,7 +791,7 @@ def calculate_value_averaging_v2(
     # 如果没有传入平均月收益率，则自动计算
     if avg_monthly_return is None:
         # 首先检查缓存
-        cached_return, is_fresh = calc._get_cached_fund_return(fund_code, CURRENT_PHASE)
+        cached_return, is_fresh = calc._get_cached_fund_return(fund_code, calc.current_phase)
         if is_fresh:
             avg_monthly_return = cached_return
         else:
@@ -809,23 +806,25 @@ def calculate_value_averaging_v2(
                 fund_age_years = 0
             
             if fund_age_years >= 5:
-                # 使用基金自身历史数据
-                nav_df = calc.get_fund_nav_history(fund_code, years=5)
-                if nav_df is not None and len(nav_df) > 0:
-                    monthly_df = calc.calculate_monthly_returns_from_nav(nav_df)
-                    market_phases = calc.analyze_by_market_phase(monthly_df)
-                    if CURRENT_PHASE in market_phases:
-                        avg_monthly_return = market_phases[CURRENT_PHASE]['平均月收益率']
+                # 使用基金自身历史月收益率（fund_monthly_return，不读取日净值）
+                stats = calc.get_fund_phase_stats(fund_code, years=5)
+                if stats is not None:
+                    market_phases = stats['phases']
+                    phase_stats = market_phases.get(calc.current_phase)
+                    if phase_stats is not None:
+                        avg_monthly_return = phase_stats['平均月收益率']
+                        calc._cache_fund_return(fund_code, calc.current_phase, avg_monthly_return,
+                                                phase_stats['月收益率标准差'], phase_stats['月数'])
                     else:
-                        avg_monthly_return = monthly_df['月收益率'].mean()
-                    # 缓存结果
-                    calc._cache_fund_return(fund_code, CURRENT_PHASE, avg_monthly_return)
+                        avg_monthly_return = stats['overall']
+                        calc._cache_fund_return(fund_code, calc.current_phase, avg_monthly_return,
+                                                sample_months=stats['months'])
                 else:
                     avg_monthly_return = 1.0  # 默认值
             else:
                 # 使用指数参考基准
-                hs300_cached = calc._get_cached_benchmark(calc.hs300_code, CURRENT_PHASE)
-                zz500_cached = calc._get_cached_benchmark(calc.zz500_code, CURRENT_PHASE)
+                hs300_cached = calc._get_cached_benchmark(calc.hs300_code, calc.current_phase)
+                zz500_cached = calc._get_cached_benchmark(calc.zz500_code, calc.current_phase)
                 
                 if hs300_cached.get('is_fresh') and zz500_cached.get('is_fresh'):
                     avg_monthly_return = (hs300_cached['avg_monthly_return'] + zz500_cached['avg_monthly_return']) / 2
@@ -838,9 +837,18 @@ def calculate_value_averaging_v2(
                         zz500_monthly = calc.calculate_monthly_returns_from_price(zz500_df)
                         hs300_phases = calc.analyze_by_market_phase(hs300_monthly)
                         zz500_phases = calc.analyze_by_market_phase(zz500_monthly)
-                        if CURRENT_PHASE in hs300_phases and CURRENT_PHASE in zz500_phases:
-                            avg_monthly_return = (hs300_phases[CURRENT_PHASE]['平均月收益率'] + 
-                                                zz500_phases[CURRENT_PHASE]['平均月收益率']) / 2
+                        if calc.current_phase in hs300_phases and calc.current_phase in zz500_phases:
+                            avg_monthly_return = (hs300_phases[calc.current_phase]['平均月收益率'] + 
+                                                zz500_phases[calc.current_phase]['平均月收益率']) / 2
+                            # 写入共享缓存，其他进程/后续请求直接复用
+                            phase_start, phase_end = calc.phase_calendar.span(calc.current_phase)
+                            for code, name, phases in ((calc.hs300_code, "沪深300ETF", hs300_phases),
+                                                       (calc.zz500_code, "中证500ETF", zz500_phases)):
+                                calc._save_benchmark(code, name, calc.current_phase,
+                                                     phases[calc.current_phase]['平均月收益率'],
+                                                     phases[calc.current_phase]['月收益率标准差'],
+                                                     phases[calc.current_phase]['月数'],
+                                                     phase_start, phase_end)
                         else:
                             avg_monthly_return = 1.0
                     else:
@@ -881,7 +889,7 @@ def calculate_value_averaging_v2(
         "invest_action": "买入" if invest_amount > 0 else ("卖出" if invest_amount < 0 else "不操作"),
         "original_holding_value": original_holding_value,
         "original_holding_profit": original_holding_profit,
-        "market_phase": CURRENT_PHASE,
+        "market_phase": calc.current_phase,
         "algorithm_details": [
             f"基准日期: {base_date}",
             f"目标日期: {target_date}",
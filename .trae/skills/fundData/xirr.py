@@ -0,0 +1,110 @@
+"""
+批量内部收益率（XIRR）模块
+对多组不规则日期现金流同时求年化内部收益率：
+    Σ 金额_i × (1 + r)^(-年数_i) = 0
+
+实现：
+    现金流按行排成矩阵（不足的列补0），所有行同时做牛顿迭代；
+    未收敛或越界的行再在 [-0.9999, 100] 上做向量化二分
+"""
+from datetime import datetime
+from typing import List, Sequence
+
+import numpy as np
+
+
+# 收益率下界（-99.99%），避免 (1 + r) <= 0
+MIN_RATE = -0.9999
+
+# 二分上界（年化10000%）
+MAX_RATE = 100.0
+
+NEWTON_ITERATIONS = 50
+BISECTION_ITERATIONS = 100
+TOLERANCE = 1e-10
+
+
+def _npv(rates: np.ndarray, amounts: np.ndarray, years: np.ndarray) -> np.ndarray:
+    return np.sum(amounts * np.power(1 + rates[:, None], -years), axis=1)
+
+
+def xirr_batch(amounts: np.ndarray, years: np.ndarray, guess: float = 0.1) -> np.ndarray:
+    """
+    批量计算XIRR
+
+    Args:
+        amounts: 现金流矩阵 shape=(组数, 期数)，投入为负、收回为正，空位填0
+        years: 距首笔现金流的年数，shape 同 amounts（或可广播）
+        guess: 牛顿迭代初值
+
+    Returns:
+        各组年化收益率（小数），现金流不同时包含正负时为NaN
+    """
+    amounts = np.atleast_2d(np.asarray(amounts, dtype=np.float64))
+    years = np.broadcast_to(np.asarray(years, dtype=np.float64), amounts.shape)
+    n = amounts.shape[0]
+    valid = np.any(amounts > 0, axis=1) & np.any(amounts < 0, axis=1)
+
+    rates = np.full(n, guess)
+    done = ~valid
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for _ in range(NEWTON_ITERATIONS):
+            active = ~done
+            if not active.any():
+                break
+            r = rates[active]
+            a = amounts[active]
+            t = years[active]
+            disc = np.power(1 + r[:, None], -t)
+            npv = np.sum(a * disc, axis=1)
+            deriv = np.sum(-t * a * disc, axis=1) / (1 + r)
+            step = npv / deriv
+            new = r - step
+            bad = ~np.isfinite(new) | (new <= MIN_RATE)
+            new[bad] = np.nan
+            rates[active] = new
+            converged = np.abs(step) < TOLERANCE
+            idx = np.flatnonzero(active)
+            done[idx[converged | bad]] = True
+
+        # 牛顿失败（发散、越界或未收敛）的行改用二分
+        check = valid & np.isfinite(rates)
+        if check.any():
+            resid = np.abs(_npv(rates[check], amounts[check], years[check]))
+            scale = np.sum(np.abs(amounts[check]), axis=1)
+            idx = np.flatnonzero(check)
+            rates[idx[resid > 1e-6 * scale]] = np.nan
+        retry = valid & ~np.isfinite(rates)
+        if retry.any():
+            rates[retry] = _bisect(amounts[retry], years[retry])
+
+    rates[~valid] = np.nan
+    return rates
+
+
+def _bisect(amounts: np.ndarray, years: np.ndarray) -> np.ndarray:
+    lo = np.full(amounts.shape[0], MIN_RATE)
+    hi = np.full(amounts.shape[0], MAX_RATE)
+    f_lo = _npv(lo, amounts, years)
+    f_hi = _npv(hi, amounts, years)
+    ok = np.sign(f_lo) != np.sign(f_hi)
+    for _ in range(BISECTION_ITERATIONS):
+        mid = (lo + hi) / 2
+        f_mid = _npv(mid, amounts, years)
+        left = np.sign(f_mid) == np.sign(f_lo)
+        lo = np.where(left, mid, lo)
+        f_lo = np.where(left, f_mid, f_lo)
+        hi = np.where(left, hi, mid)
+    return np.where(ok, (lo + hi) / 2, np.nan)
+
+
+def year_fractions(dates: Sequence[str], start: str = None) -> np.ndarray:
+    """日期（YYYY-MM-DD）距起始日的年数（按365天）"""
+    days = np.array(dates, dtype='datetime64[D]')
+    origin = np.datetime64(start, 'D') if start else days.min()
+    return (days - origin).astype(np.int64) / 365.0
+
+
+def xirr(amounts: List[float], dates: List[str]) -> float:
+    """单组现金流的XIRR（小数），无解时为NaN"""
+    return float(xirr_batch(np.array([amounts]), year_fractions(dates)[None, :])[0])
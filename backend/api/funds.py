@@ -1,7 +1,7 @@
 """基金相关API - 从fundData skill数据库查询"""
 from fastapi import APIRouter, HTTPException, Query
 from database import get_db_connection
-from typing import Optional, List
+from typing import Optional, List, Any
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/funds", tags=["基金"])
@@ -25,6 +25,182 @@ class FundTagsUpdate(BaseModel):
     tag_ids: List[int]
 
 
+# ==================== 区间指标数据模型 ====================
+
+class RangeMetricsQuery(BaseModel):
+    fund_code: str
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+
+class RangeMetricsRequest(BaseModel):
+    queries: List[RangeMetricsQuery]
+
+
+class CorrelationRequest(BaseModel):
+    fund_codes: List[str]
+    window: int = 252
+    min_periods: int = 20
+
+
+class BenchmarkRegressionRequest(BaseModel):
+    fund_codes: List[str]
+    index_code: Optional[str] = None
+    window: int = 252
+    refresh: bool = False
+
+
+class ScreenFilter(BaseModel):
+    field: str
+    op: str
+    value: Any = None
+
+
+class ScreenRequest(BaseModel):
+    filters: List[ScreenFilter] = []
+    sort_by: Optional[str] = None
+    sort_dir: str = "desc"
+    page: int = 1
+    page_size: int = 50
+    fields: Optional[List[str]] = None
+
+
+class RollingAnalyticsRequest(BaseModel):
+    fund_codes: List[str]
+    window: int = 60
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    max_points: Optional[int] = None
+
+
+@router.post("/screen")
+async def screen_funds(data: ScreenRequest):
+    """多条件筛选基金（收益、回撤、夏普分位、评级、经理任职年限等，列式快照上向量化计算）"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from fund_screener import screen_funds as run_screen
+
+        result = run_screen(
+            filters=[f.model_dump() for f in data.filters],
+            sort_by=data.sort_by,
+            sort_dir=data.sort_dir,
+            page=data.page,
+            page_size=data.page_size,
+            fields=data.fields
+        )
+        if not result.get('success'):
+            return {"success": False, "message": result.get('error'), "data": None}
+        return {"success": True, "data": result}
+    except Exception as e:
+        return {"success": False, "message": str(e), "data": None}
+
+
+@router.get("/screen/fields")
+async def get_screen_fields():
+    """获取可用于筛选和排序的字段"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from fund_screener import get_screen_fields as list_fields
+
+        return {"success": True, "data": list_fields()}
+    except Exception as e:
+        return {"success": False, "message": str(e), "data": None}
+
+
+@router.get("/managers/ranking")
+async def get_manager_ranking(
+    sort_by: str = Query("composite_score", description="排序字段"),
+    ascending: bool = Query(False),
+    company: Optional[str] = None,
+    keyword: Optional[str] = None,
+    min_funds: int = Query(1, ge=0),
+    min_career_years: Optional[float] = Query(None, ge=0),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=200)
+):
+    """基金经理排名（读取批量计算的 manager_metrics）"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from manager_metrics import get_manager_ranking as query_ranking
+
+        result = query_ranking(
+            sort_by=sort_by,
+            ascending=ascending,
+            company=company,
+            keyword=keyword,
+            min_funds=min_funds,
+            min_career_years=min_career_years,
+            page=page,
+            page_size=page_size
+        )
+        if not result.get('success'):
+            return {"success": False, "message": result.get('error'), "data": None}
+        return {"success": True, "data": result}
+    except Exception as e:
+        return {"success": False, "message": str(e), "data": None}
+
+
+@router.get("/stocks/{stock_code}/buyers")
+async def get_stock_buyers(
+    stock_code: str,
+    quarter: Optional[str] = Query(None, description="季度，如 2024Q3，默认该股票最新季度"),
+    include_increased: bool = Query(True, description="是否包含增持"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """查询某季度新进/增持某只股票的基金（读取 holding_change）"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from holding_changes import get_stock_buyers as query_buyers
+
+        result = query_buyers(stock_code, quarter=quarter, include_increased=include_increased, limit=limit)
+        return {"success": True, "data": result}
+    except Exception as e:
+        return {"success": False, "message": str(e), "data": None}
+
+
+@router.get("/turnover/ranking")
+async def get_turnover_ranking(
+    quarter: Optional[str] = Query(None, description="季度，如 2024Q3，默认最新季度"),
+    fund_type: Optional[str] = None,
+    min_stocks: int = Query(1, ge=0),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """查询季度持仓换手率最高的基金（读取 holding_turnover）"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from holding_changes import get_top_turnover_funds
+
+        result = get_top_turnover_funds(quarter=quarter, fund_type=fund_type, min_stocks=min_stocks, limit=limit)
+        return {"success": True, "data": result}
+    except Exception as e:
+        return {"success": False, "message": str(e), "data": None}
+
+
 @router.get("")
 async def get_funds(
     page: int = Query(1, ge=1),
@@ -342,6 +518,116 @@ async def get_fund_performance(fund_code: str):
         return {"success": False, "message": str(e), "data": None}
 
 
+# ==================== 区间指标API ====================
+
+@router.post("/range-metrics")
+async def get_range_metrics(data: RangeMetricsRequest):
+    """
+    批量查询任意日期区间的收益率、年化波动率和最大回撤
+
+    每只基金的区间索引按净值版本缓存，同一基金的多个区间一次完成
+    """
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from range_index import query_range_metrics
+
+        results = query_range_metrics([q.model_dump() for q in data.queries])
+        return {"success": True, "data": results}
+    except Exception as e:
+        return {"success": False, "message": str(e), "data": None}
+
+
+# ==================== 滚动指标API ====================
+
+def _rolling_analytics(fund_codes, window, start_date, end_date, max_points):
+    import sys
+    import os
+    skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+    if skills_path not in sys.path:
+        sys.path.insert(0, skills_path)
+
+    from rolling_analytics import get_rolling_analytics
+
+    return get_rolling_analytics(fund_codes, window=window, start_date=start_date,
+                                 end_date=end_date, max_points=max_points)
+
+
+@router.post("/rolling-analytics")
+async def get_funds_rolling_analytics(data: RollingAnalyticsRequest):
+    """批量获取多只基金的滚动收益率、波动率、夏普比率和回撤序列"""
+    try:
+        result = _rolling_analytics(data.fund_codes, data.window, data.start_date,
+                                    data.end_date, data.max_points)
+        if not result.get('success'):
+            return {"success": False, "message": result.get('error'), "data": None}
+        return {"success": True, "data": result}
+    except Exception as e:
+        return {"success": False, "message": str(e), "data": None}
+
+
+@router.get("/{fund_code}/rolling")
+async def get_fund_rolling_analytics(
+    fund_code: str,
+    window: int = Query(60, ge=2, le=1260),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    max_points: Optional[int] = Query(None, ge=2, le=5000)
+):
+    """获取单只基金的滚动指标序列（max_points用于图表抽样）"""
+    try:
+        result = _rolling_analytics([fund_code], window, start_date, end_date, max_points)
+        if not result.get('success'):
+            return {"success": False, "message": result.get('error'), "data": None}
+        if fund_code not in result['funds']:
+            return {"success": False, "message": "无净值数据", "data": None}
+        return {"success": True, "data": {"window": window, **result['funds'][fund_code]}}
+    except Exception as e:
+        return {"success": False, "message": str(e), "data": None}
+
+
+@router.post("/correlation")
+async def get_funds_correlation(data: CorrelationRequest):
+    """计算指定基金集合（如筛选结果）的收益率相关系数/协方差矩阵"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from correlation_service import get_correlation_matrix
+
+        result = get_correlation_matrix(data.fund_codes, window=data.window, min_periods=data.min_periods)
+        if not result.get('success'):
+            return {"success": False, "message": result.get('error'), "data": None}
+        return {"success": True, "data": result}
+    except Exception as e:
+        return {"success": False, "message": str(e), "data": None}
+
+
+@router.post("/benchmark-regression")
+async def get_funds_benchmark_regression(data: BenchmarkRegressionRequest):
+    """批量获取基金相对基准指数的alpha/beta/R²/跟踪误差/信息比率（已保存结果优先）"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from benchmark_regression import get_benchmark_regression
+
+        result = get_benchmark_regression(data.fund_codes, index_code=data.index_code,
+                                          window=data.window, refresh=data.refresh)
+        return {"success": True, "data": result}
+    except Exception as e:
+        return {"success": False, "message": str(e), "data": None}
+
 # ==================== 标签管理API ====================
 
 @router.get("/tags/all")
@@ -273,6 +273,113 @@ async def get_transactions(
         return {"success": False, "message": str(e)}
 
 
+class TransactionUpdate(BaseModel):
+    transaction_date: Optional[str] = None
+    shares: Optional[float] = None
+    amount: Optional[float] = None
+    nav: Optional[float] = None
+    fee: Optional[float] = None
+    notes: Optional[str] = None
+
+
+@router.put("/groups/{group_id}/transactions/{transaction_id}")
+async def update_transaction(group_id: int, transaction_id: int, data: TransactionUpdate):
+    """
+    修改历史交易
+
+    修改后从最近的回放检查点重新回放该基金的交易流水，持仓份额、摊薄成本、持仓快照和组合现金随之更新
+    """
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from ledger import update_transaction as _update_transaction
+
+        result = _update_transaction(transaction_id, portfolio_id=group_id, **data.model_dump())
+
+        if result.get('success'):
+            return {"success": True, "data": result}
+        else:
+            return {"success": False, "message": result.get('error', '修改失败')}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "message": str(e)}
+
+
+@router.delete("/groups/{group_id}/transactions/{transaction_id}")
+async def delete_transaction(group_id: int, transaction_id: int):
+    """删除历史交易并重新回放（删除捡回买入时对应卖出记录恢复为未回收）"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from ledger import delete_transaction as _delete_transaction
+
+        result = _delete_transaction(transaction_id, portfolio_id=group_id)
+
+        if result.get('success'):
+            return {"success": True, "data": result}
+        else:
+            return {"success": False, "message": result.get('error', '删除失败')}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "message": str(e)}
+
+
+@router.get("/groups/{group_id}/ledger")
+async def get_group_ledger(group_id: int, fund_code: Optional[str] = None):
+    """获取由交易流水回放得到的持仓份额、摊薄成本和可用现金"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from ledger import get_ledger_state
+
+        result = get_ledger_state(group_id, fund_code)
+
+        if result.get('success'):
+            return {"success": True, "data": result}
+        else:
+            return {"success": False, "message": result.get('error', '查询失败')}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+
+@router.post("/groups/{group_id}/ledger/rebuild")
+async def rebuild_group_ledger(group_id: int):
+    """按全部交易流水重新回放组合持仓"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from ledger import rebuild_portfolio_ledger
+
+        result = rebuild_portfolio_ledger(group_id)
+
+        if result.get('success'):
+            return {"success": True, "data": result}
+        else:
+            return {"success": False, "message": result.get('error', '重建失败')}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "message": str(e)}
+
+
 @router.post("/groups/{group_id}/profit-import")
 async def import_profit_data(group_id: int, data: ProfitImportRequest):
     """
@@ -341,6 +448,80 @@ async def get_cash(group_id: int):
         return {"success": False, "message": str(e)}
 
 
+@router.post("/fund-cash/reconcile")
+async def reconcile_fund_cash(
+    group_id: Optional[int] = Query(None, description="组合ID，不传则对账全部组合"),
+    fix: bool = Query(True, description="是否修正不一致的余额")
+):
+    """按交易记录对账成分基金可用现金余额"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from fund_cash import reconcile_fund_cash as _reconcile
+
+        result = _reconcile(group_id, fix=fix)
+        return {"success": True, "data": result}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "message": str(e)}
+
+
+@router.get("/groups/{group_id}/correlation")
+async def get_group_correlation(
+    group_id: int,
+    window: int = Query(252, ge=20, le=1260),
+    min_periods: int = Query(20, ge=2)
+):
+    """获取组合成分基金的收益率相关系数/协方差矩阵（分散度检查）"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from correlation_service import get_portfolio_correlation
+
+        result = get_portfolio_correlation(group_id, window=window, min_periods=min_periods)
+
+        if result.get('success'):
+            return {"success": True, "data": result}
+        else:
+            return {"success": False, "message": result.get('error', '计算失败')}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+
+@router.get("/groups/{group_id}/look-through")
+async def get_group_look_through(
+    group_id: int,
+    quarter: Optional[str] = Query(None, description="目标季度，如 2024Q3，默认各基金最新一期")
+):
+    """获取组合穿透持仓：个股/行业敞口和成分基金持仓重叠度"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from holdings_lookthrough import get_portfolio_lookthrough
+
+        result = get_portfolio_lookthrough(group_id, quarter=quarter)
+
+        if result.get('success'):
+            return {"success": True, "data": result}
+        else:
+            return {"success": False, "message": result.get('error', '计算失败')}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+
 @router.put("/groups/{group_id}/cash")
 async def update_cash(group_id: int, cash: float):
     """更新组合现金余额"""
@@ -407,7 +588,10 @@ async def get_investment_advice(
     group_id: int,
     mode: str = Query("value_averaging", description="定投模式: value_averaging"),
     simulate: bool = Query(True, description="是否模拟多期"),
-    base_days: int = Query(30, description="基准日期回溯天数，默认30天")
+    base_days: int = Query(30, description="基准日期回溯天数，默认30天"),
+    sim_months: int = Query(12, ge=1, le=120, description="模拟月数"),
+    sim_paths: int = Query(2000, ge=100, le=20000, description="蒙特卡洛模拟路径数"),
+    sim_model: str = Query("bootstrap", description="收益率模型: bootstrap（历史月收益率抽样）/ normal")
 ):
     """
     获取组合的投资建议（使用修正版市值定投算法）
@@ -415,8 +599,11 @@ async def get_investment_advice(
     Args:
         group_id: 组合ID
         mode: 定投模式，目前仅支持 value_averaging（市值定投法）
-        simulate: 是否模拟12期定投过程
+        simulate: 是否做多期蒙特卡洛模拟（各基金附带分位数区间）
         base_days: 基准日期回溯天数，默认30天前
+        sim_months: 模拟月数
+        sim_paths: 模拟路径数
+        sim_model: 收益率模型
     
     Returns:
         投资建议数据，包含每只基金的定投方案
@@ -496,6 +683,10 @@ async def get_investment_advice(
                 import os
                 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
                 from value_averaging import calculate_value_averaging_v2, get_shares_at_date, get_nav_at_date
+                from va_simulation import simulate_fund_value_averaging, RETURN_MODELS
+                
+                if simulate and sim_model not in RETURN_MODELS:
+                    return {"success": False, "message": f"不支持的收益率模型: {sim_model}，可选: {', '.join(RETURN_MODELS)}"}
                 
                 # 市值定投法
                 for row in rows:
@@ -543,6 +734,15 @@ async def get_investment_advice(
                         suggested_invest = result["invest_amount"]
                         total_suggested_invest += suggested_invest
                         
+                        simulation = None
+                        if simulate and current_holding > 0:
+                            # 每期目标增长额与本次建议一致（基准市值 × 平均月收益率 × 月数因子）
+                            simulation = simulate_fund_value_averaging(
+                                fund_code, current_holding, result["avg_monthly_return"],
+                                months=sim_months, n_paths=sim_paths, model=sim_model,
+                                target_growth=result["target_growth"]
+                            )
+                        
                         funds_advice.append({
                             "fund_code": fund_code,
                             "fund_name": fund_name,
@@ -563,7 +763,8 @@ async def get_investment_advice(
                             "original_holding_value": result.get("original_holding_value", 0),
                             "original_holding_profit": result.get("original_holding_profit", 0),
                             "market_phase": result.get("market_phase", "未知"),
-                            "algorithm_details": result.get("algorithm_details", [])
+                            "algorithm_details": result.get("algorithm_details", []),
+                            "simulation": simulation
                         })
                     except Exception as e:
                         print(f"[投资建议] 基金 {fund_code} 计算失败: {e}")
@@ -604,6 +805,86 @@ async def get_investment_advice(
         return {"success": False, "message": str(e)}
 
 
+@router.get("/groups/{group_id}/value-averaging-backtest")
+async def backtest_group_value_averaging(
+    group_id: int,
+    start_date: Optional[str] = Query(None, description="回测开始日期 YYYY-MM-DD，默认近3年"),
+    end_date: Optional[str] = Query(None, description="回测结束日期 YYYY-MM-DD"),
+    interval: str = Query("month", description="再平衡频率: month/week/交易日数"),
+    initial_amount: float = Query(10000.0, gt=0, description="每只基金建仓金额"),
+    avg_monthly_return: Optional[float] = Query(None, description="统一的平均月收益率(%)，不传按市场阶段计算"),
+    allow_sell: bool = Query(True, description="是否允许卖出"),
+    max_trade: Optional[float] = Query(None, gt=0, description="单期买入/卖出金额上限"),
+    include_records: bool = Query(True, description="是否返回逐期交易明细")
+):
+    """
+    市值定投历史回测
+
+    在组合内每只基金的真实净值上按期执行目标市值规则，返回每期买卖记录、IRR、最大资金占用，
+    以及同等资金下一次性买入和定额定投的对比
+    """
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from va_backtest import backtest_portfolio_value_averaging
+
+        result = backtest_portfolio_value_averaging(
+            group_id,
+            start_date=start_date,
+            end_date=end_date,
+            interval=int(interval) if interval.isdigit() else interval,
+            initial_amount=initial_amount,
+            avg_monthly_return=avg_monthly_return,
+            allow_sell=allow_sell,
+            max_trade=max_trade,
+            include_records=include_records
+        )
+        if not result.get('success'):
+            return {"success": False, "message": result.get('error', '回测失败')}
+        return {"success": True, "data": result}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "message": str(e)}
+
+
+@router.get("/market-phases")
+async def get_market_phases(
+    date: Optional[str] = Query(None, description="查询该日期所处阶段 YYYY-MM-DD")
+):
+    """
+    获取市场阶段日历（由沪深300行情自动识别的牛市/熊市/震荡市划分）
+    """
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from market_phase import get_phase_calendar
+
+        calendar = get_phase_calendar()
+        data = {
+            "current_phase": calendar.current,
+            "auto_detected": calendar.updated_at is not None,
+            "updated_at": calendar.updated_at,
+            "phases": calendar.to_records()
+        }
+        if date:
+            data["date"] = date
+            data["phase"] = calendar.phase_at(date)
+        return {"success": True, "data": data}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "message": str(e)}
+
+
 @router.post("/groups")
 async def create_group(data: GroupCreate):
     """创建组合"""
@@ -879,6 +1160,35 @@ async def get_group_history(group_id: int, limit: int = Query(100)):
         return {"success": False, "message": str(e)}
 
 
+@router.get("/groups/{group_id}/value-series")
+async def get_group_value_series(
+    group_id: int,
+    start_date: Optional[str] = Query(None, description="开始日期 YYYY-MM-DD，默认首次持仓日"),
+    end_date: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD，默认最新净值日"),
+    include_funds: bool = Query(True, description="是否返回各基金市值序列")
+):
+    """获取组合逐日市值曲线（含剔除申购赎回的收益指数、最大回撤、年化波动率）"""
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from portfolio_value import get_portfolio_value_series
+
+        result = get_portfolio_value_series(group_id, start_date, end_date, include_funds)
+
+        if result.get('success'):
+            return {"success": True, "data": result}
+        else:
+            return {"success": False, "message": result.get('error', '计算失败')}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "message": str(e)}
+
+
 # ==================== 组合汇总API ====================
 
 @router.get("/summary")
@@ -953,8 +1263,33 @@ async def get_portfolio_summary(group_id: Optional[int] = Query(None)):
                 "total_profit": total_profit,
                 "total_profit_rate": total_profit_rate
             }
-            
-            return {"success": True, "data": summary}
+
+        # 时间加权收益率（TWR）和资金加权收益率（XIRR），计算失败不影响汇总
+        try:
+            import sys
+            import os
+            skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+            if skills_path not in sys.path:
+                sys.path.insert(0, skills_path)
+
+            from portfolio_return import get_portfolio_returns
+
+            returns = get_portfolio_returns([group_id] if group_id else None)
+            if group_id:
+                group_returns = returns['portfolios'][0]
+                summary["twr"] = group_returns.get("twr")
+                summary["xirr"] = group_returns.get("xirr")
+                summary["fund_returns"] = group_returns.get("funds", [])
+            else:
+                summary["group_returns"] = [
+                    {key: value for key, value in item.items() if key != "funds"}
+                    for item in returns['portfolios']
+                ]
+        except Exception:
+            import traceback
+            traceback.print_exc()
+
+        return {"success": True, "data": summary}
     except Exception as e:
         return {"success": False, "message": str(e)}
 
@@ -1038,6 +1373,19 @@ class TakeProfitTemplateUpdate(BaseModel):
     buy_back_threshold: Optional[float] = None
 
 
+class TakeProfitOptimizeRequest(BaseModel):
+    fund_codes: Optional[List[str]] = None
+    fund_type: Optional[str] = None
+    method: str = "grid"
+    n_samples: int = 200
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    use_adjusted_nav: bool = False
+    sort_by: str = "score"
+    top_n: int = 20
+    save_name: Optional[str] = None
+
+
 class FundTakeProfitConfigUpdate(BaseModel):
     template_id: Optional[int] = None
     use_custom: Optional[bool] = False
@@ -1127,6 +1475,56 @@ async def create_take_profit_template(data: TakeProfitTemplateCreate):
         return {"success": False, "message": str(e)}
 
 
+@router.post("/take-profit-templates/optimize")
+async def optimize_take_profit_template(data: TakeProfitOptimizeRequest):
+    """
+    止盈参数寻优
+
+    按基金或基金类型在历史净值上网格/随机搜索止盈参数，按收益回撤比等指标排名；
+    传入 save_name 时将排名第一的参数保存为新模板
+    """
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        import asyncio
+        from functools import partial
+        from take_profit_optimizer import optimize_take_profit, save_as_template, API_MAX_WORKERS
+
+        # 寻优为CPU密集计算（数秒级），放到线程池执行，避免阻塞事件循环
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, partial(
+            optimize_take_profit,
+            fund_codes=data.fund_codes,
+            fund_type=data.fund_type,
+            method=data.method,
+            n_samples=data.n_samples,
+            start_date=data.start_date,
+            end_date=data.end_date,
+            use_adjusted_nav=data.use_adjusted_nav,
+            sort_by=data.sort_by,
+            top_n=data.top_n,
+            workers=API_MAX_WORKERS
+        ))
+        if not result.get('success'):
+            return {"success": False, "message": result.get('error', '参数寻优失败')}
+
+        if data.save_name and result['ranking']:
+            saved = save_as_template(result['ranking'][0], data.save_name)
+            if not saved.get('success'):
+                return {"success": False, "message": saved.get('message', '模板保存失败')}
+            result['saved_template_id'] = saved['template_id']
+
+        return {"success": True, "data": result}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "message": str(e)}
+
+
 @router.put("/take-profit-templates/{template_id}")
 async def update_take_profit_template(template_id: int, data: TakeProfitTemplateUpdate):
     """更新止盈参数模板"""
@@ -1325,8 +1723,46 @@ async def get_take_profit_modes():
     }
 
 
+@router.get("/take-profit-backtest/{fund_code}")
+async def backtest_take_profit(
+    fund_code: str,
+    template_id: Optional[int] = Query(None, description="止盈模板ID，不传使用默认模板"),
+    start_date: Optional[str] = Query(None, description="回测开始日期 YYYY-MM-DD"),
+    end_date: Optional[str] = Query(None, description="回测结束日期 YYYY-MM-DD"),
+    initial_amount: float = Query(10000.0, gt=0, description="首日买入金额"),
+    initial_cash: float = Query(0.0, ge=0, description="初始现金（波段捡回可用）"),
+    use_adjusted_nav: bool = Query(False, description="是否使用复权净值"),
+    include_equity: bool = Query(False, description="是否返回逐日权益曲线")
+):
+    """
+    阶梯止盈策略历史回测
+
+    在基金本地日净值历史上重放止盈/波段捡回规则，返回收益率、最大回撤、交易次数和交易明细，
+    并与买入持有对比
+    """
+    try:
+        import sys
+        import os
+        skills_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.trae', 'skills', 'fundData'))
+        if skills_path not in sys.path:
+            sys.path.insert(0, skills_path)
+
+        from take_profit_backtest import backtest_take_profit as _backtest
+
+        result = _backtest(fund_code, template_id=template_id, start_date=start_date, end_date=end_date,
+                           initial_amount=initial_amount, initial_cash=initial_cash,
+                           use_adjusted_nav=use_adjusted_nav, include_equity=include_equity)
+        if not result.get('success'):
+            return {"success": False, "message": result.get('error', '回测失败')}
+        return {"success": True, "data": result}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"success": False, "message": str(e)}
+
+
 @router.get("/groups/{group_id}/take-profit-advice")
-async def get_take_profit_advice(group_id: int):
+async def get_take_profit_advice(group_id: int, refresh_nav: bool = True):
     """
     获取组合的止盈建议（支持波段捡回）
 
@@ -1334,6 +1770,8 @@ async def get_take_profit_advice(group_id: int):
     - 初次止盈：收益率 >= 首次止盈阈值 -> 卖出
     - 后续止盈：较上次卖出净值涨幅 >= 阶梯步长 -> 卖出
     - 波段捡回：净值低于最近一次卖出价格达到捡回阈值 -> 买入（高抛低吸）
+
+    数据批量加载，默认先同步过期净值；refresh_nav=false 时只使用本地净值（更快）
     """
     try:
         import sys
@@ -1344,7 +1782,7 @@ async def get_take_profit_advice(group_id: int):
 
         from smart_fund_data import get_take_profit_advice as _get_advice
 
-        result = _get_advice(group_id)
+        result = _get_advice(group_id, refresh_nav=refresh_nav)
 
         return {"success": True, "data": result}
     except Exception as e:
@@ -872,7 +872,225 @@ class FundAnalyzer:
                               fund_code: str = "",
                               fund_name: str = "") -> FundMetrics:
         """
-        计算所有指标
+        计算所有指标（单次遍历内核）
+        
+        日收益率、回撤序列、基准对齐收益率只计算一次，所有指标由这些中间结果导出，
+        结果与逐方法计算的 calculate_all_metrics_by_method 一致
+        
+        参数:
+            nav_series: 基金净值序列
+            benchmark_series: 基准指数序列（可选）
+            fund_code: 基金代码
+            fund_name: 基金名称
+        
+        返回:
+            FundMetrics对象，包含所有计算指标
+        """
+        benchmark = self._prepare_benchmark(benchmark_series) if benchmark_series is not None else None
+        return self._calculate_metrics_kernel(nav_series, benchmark, fund_code, fund_name)
+    
+    def calculate_all_metrics_batch(self, nav_frame: pd.DataFrame,
+                                    benchmark_series: Optional[pd.Series] = None,
+                                    fund_names: Optional[Dict[str, str]] = None) -> Dict[str, FundMetrics]:
+        """
+        批量计算多只基金的所有指标
+        
+        基准收益率和基准年化收益率只计算一次，各基金共用
+        
+        参数:
+            nav_frame: 净值DataFrame（日期索引，每列一只基金，列名为基金代码）
+            benchmark_series: 基准指数序列（可选）
+            fund_names: 基金代码到名称的映射（可选）
+        
+        返回:
+            {基金代码: FundMetrics}
+        """
+        fund_names = fund_names or {}
+        benchmark = self._prepare_benchmark(benchmark_series) if benchmark_series is not None else None
+        
+        results = {}
+        for code in nav_frame.columns:
+            nav_series = nav_frame[code].dropna()
+            if len(nav_series) < 2:
+                continue
+            results[code] = self._calculate_metrics_kernel(nav_series, benchmark, str(code),
+                                                           fund_names.get(code, ""))
+        return results
+    
+    def _prepare_benchmark(self, benchmark_series: pd.Series) -> Dict[str, Any]:
+        """预计算基准的日收益率和年化收益率"""
+        return {
+            'returns': benchmark_series.pct_change().dropna(),
+            'annual_return': self.calculate_annualized_return(benchmark_series)
+        }
+    
+    def _calculate_metrics_kernel(self, nav_series: pd.Series,
+                                  benchmark: Optional[Dict[str, Any]],
+                                  fund_code: str = "",
+                                  fund_name: str = "") -> FundMetrics:
+        """
+        单次遍历指标内核
+        
+        共享中间结果：
+            r        - 日收益率（pct_change().dropna()）
+            cum      - 复利累计净值（回撤计算用）
+            drawdown - 回撤序列
+            aligned  - 与基准按日期对齐的收益率
+        """
+        rf = self.risk_free_rate
+        periods = self.periods_per_year
+        sqrt_periods = np.sqrt(periods)
+        
+        metrics = FundMetrics()
+        metrics.fund_code = fund_code
+        metrics.fund_name = fund_name
+        metrics.analysis_date = datetime.now()
+        
+        index = nav_series.index
+        # 与逐方法计算一致：缺失净值当日及次日的收益率为 NaN，统计时剔除，回撤按 0 处理
+        raw = nav_series.pct_change().to_numpy(dtype=np.float64)[1:]
+        valid = ~np.isnan(raw)
+        r = raw[valid]
+        n = r.size
+        
+        # 收益率指标
+        if len(nav_series) < 2:
+            total_return = 0.0
+            annual_return = 0.0
+        else:
+            total_return = float(np.prod(1 + r) - 1)
+            annual_return = (1 + total_return) ** (periods / (len(nav_series) - 1)) - 1
+        metrics.total_return = total_return
+        metrics.total_return_pct = total_return * 100
+        metrics.annualized_return = annual_return
+        metrics.annualized_return_pct = annual_return * 100
+        
+        # 风险指标
+        volatility = float(np.std(r, ddof=1)) * sqrt_periods if n > 1 else np.nan
+        metrics.volatility = volatility
+        metrics.volatility_pct = volatility * 100
+        
+        drawdown_info = self._drawdown_from_returns(index, np.where(np.isnan(raw), 0.0, raw))
+        metrics.max_drawdown = drawdown_info.max_drawdown
+        metrics.max_drawdown_pct = drawdown_info.max_drawdown_pct
+        metrics.max_drawdown_start = drawdown_info.start_date
+        metrics.max_drawdown_end = drawdown_info.end_date
+        metrics.max_drawdown_days = drawdown_info.drawdown_days
+        metrics.recovery_days = drawdown_info.recovery_days
+        
+        negative = r[r < 0]
+        downside = float(np.sqrt(np.mean(negative ** 2))) * sqrt_periods if negative.size else 0.0
+        metrics.downside_deviation = downside
+        metrics.downside_deviation_pct = downside * 100
+        
+        if n:
+            var_threshold = np.percentile(r, 5)
+            metrics.var_95 = -var_threshold
+            metrics.cvar_95 = -float(np.mean(r[r <= var_threshold]))
+        else:
+            metrics.var_95 = np.nan
+            metrics.cvar_95 = np.nan
+        metrics.var_95_pct = metrics.var_95 * 100
+        metrics.cvar_95_pct = metrics.cvar_95 * 100
+        
+        # 风险调整收益指标
+        metrics.sharpe_ratio = 0.0 if volatility == 0 else (annual_return - rf) / volatility
+        if downside == 0:
+            metrics.sortino_ratio = np.inf if annual_return > rf else 0.0
+        else:
+            metrics.sortino_ratio = (annual_return - rf) / downside
+        max_dd = abs(drawdown_info.max_drawdown)
+        metrics.calmar_ratio = np.inf if max_dd == 0 else (annual_return - rf) / max_dd
+        
+        # 基准比较
+        if benchmark is not None:
+            fund_ret = pd.Series(r, index=index[1:][valid])
+            bench_ret = benchmark['returns']
+            common = fund_ret.index.intersection(bench_ret.index)
+            f = fund_ret.loc[common].to_numpy(dtype=np.float64)
+            b = bench_ret.loc[common].to_numpy(dtype=np.float64)
+            bench_annual = benchmark['annual_return']
+            
+            if f.size < 2:
+                beta, r_squared, correlation, tracking_error = 1.0, 0.0, 0.0, 0.0
+                alpha = 0.0
+            else:
+                cov = np.cov(f, b, ddof=1)
+                beta = 1.0 if cov[1, 1] == 0 else cov[0, 1] / cov[1, 1]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    correlation = cov[0, 1] / np.sqrt(cov[0, 0] * cov[1, 1])
+                r_squared = correlation ** 2
+                alpha = annual_return - rf - beta * (bench_annual - rf)
+                tracking_error = float(np.std(f - b, ddof=1)) * np.sqrt(252)
+            
+            metrics.alpha = alpha
+            metrics.alpha_pct = alpha * 100
+            metrics.beta = beta
+            metrics.r_squared = r_squared
+            metrics.correlation = correlation
+            metrics.tracking_error = tracking_error
+            metrics.tracking_error_pct = tracking_error * 100
+            
+            excess = annual_return - bench_annual
+            metrics.excess_return = excess
+            metrics.excess_return_pct = excess * 100
+            
+            if tracking_error == 0:
+                metrics.information_ratio = np.inf if excess > 0 else 0.0
+            else:
+                metrics.information_ratio = excess / tracking_error
+            
+            if beta == 0:
+                metrics.treynor_ratio = np.inf if annual_return > rf else 0.0
+            else:
+                metrics.treynor_ratio = (annual_return - rf) / beta
+        
+        # 其他指标
+        metrics.win_rate = float(np.mean(r > 0)) if n else np.nan
+        metrics.win_rate_pct = metrics.win_rate * 100
+        metrics.positive_ratio = metrics.win_rate
+        
+        return metrics
+    
+    def _drawdown_from_returns(self, index: pd.Index, returns: np.ndarray) -> DrawdownInfo:
+        """
+        由日收益率（缺失已填0）计算最大回撤信息，口径同 calculate_max_drawdown
+        """
+        cumulative = np.cumprod(np.concatenate(([1.0], 1 + returns)))
+        running_max = np.maximum.accumulate(cumulative)
+        drawdown = (cumulative - running_max) / running_max
+        
+        trough = int(np.argmin(drawdown))
+        peak = int(np.argmax(running_max[:trough + 1]))
+        end_date = index[trough]
+        start_date = index[peak]
+        
+        recovery_date = None
+        recovery_days = None
+        if trough < len(cumulative) - 1:
+            recovered = np.nonzero(cumulative[trough:] >= running_max[trough])[0]
+            if recovered.size:
+                recovery_date = index[trough + recovered[0]]
+                recovery_days = (recovery_date - end_date).days
+        
+        max_dd = float(drawdown[trough])
+        return DrawdownInfo(
+            max_drawdown=max_dd,
+            max_drawdown_pct=max_dd * 100,
+            start_date=start_date,
+            end_date=end_date,
+            drawdown_days=(end_date - start_date).days,
+            recovery_date=recovery_date,
+            recovery_days=recovery_days,
+            drawdown_series=pd.Series(drawdown, index=index)
+        )
+    
+    def calculate_all_metrics_by_method(self, nav_series: pd.Series,
+                                        benchmark_series: Optional[pd.Series] = None,
+                                        fund_code: str = "",
+                                        fund_name: str = "") -> FundMetrics:
+        """
+        逐方法计算所有指标（各方法独立重算中间结果，作为单次遍历内核的对照）
         
         参数:
             nav_series: 基金净值序列
@@ -1396,6 +1614,54 @@ def get_benchmark_name(benchmark_code: str) -> str:
     return benchmark_names.get(benchmark_code, benchmark_code)
 
 
+def benchmark_all_metrics(nav_series: pd.Series,
+                          benchmark_series: Optional[pd.Series] = None,
+                          repeat: int = 5,
+                          analyzer: Optional[FundAnalyzer] = None) -> Dict[str, Any]:
+    """
+    对比单次遍历内核与逐方法计算的耗时和结果差异
+    
+    参数:
+        nav_series: 基金净值序列
+        benchmark_series: 基准指数序列（可选）
+        repeat: 重复次数（取最短耗时）
+        analyzer: 分析器实例（默认新建）
+    
+    返回:
+        两种方式的耗时（秒）、加速比和各指标最大绝对差异
+    """
+    import time
+    
+    analyzer = analyzer or FundAnalyzer()
+    timings = {}
+    results = {}
+    for name, func in (('by_method', analyzer.calculate_all_metrics_by_method),
+                       ('kernel', analyzer.calculate_all_metrics)):
+        best = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results[name] = func(nav_series, benchmark_series)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+    
+    max_diff = 0.0
+    for key, value in results['by_method'].to_dict().items():
+        other = results['kernel'].to_dict()[key]
+        if not isinstance(value, (int, float, np.floating)):
+            continue
+        if np.isfinite(value) and np.isfinite(other):
+            max_diff = max(max_diff, abs(float(value) - float(other)))
+        elif not (value == other or (np.isnan(value) and np.isnan(other))):
+            max_diff = np.inf
+    
+    return {
+        'by_method_seconds': timings['by_method'],
+        'kernel_seconds': timings['kernel'],
+        'speedup': timings['by_method'] / timings['kernel'] if timings['kernel'] > 0 else np.inf,
+        'max_abs_diff': max_diff
+    }
+
+
 # =============================================================================
 # 使用示例
 # =============================================================================
@@ -1437,6 +1703,11 @@ if __name__ == "__main__":
     print(f"  最大回撤: {metrics.max_drawdown*100:.2f}%")
     print(f"  年化波动率: {metrics.volatility*100:.2f}%")
     
+    bench = benchmark_all_metrics(nav_series, benchmark_series, analyzer=analyzer)
+    print(f"\n单次遍历内核: 逐方法 {bench['by_method_seconds']*1000:.1f}ms, "
+          f"内核 {bench['kernel_seconds']*1000:.1f}ms, 加速 {bench['speedup']:.1f}x, "
+          f"最大差异 {bench['max_abs_diff']:.2e}")
+    
     # 持仓分析示例
     print("\n" + "="*70)
     print("持仓分析示例")